@@ -31,6 +31,7 @@ _version_ = "0.2i"
       - Обработка очереди статус‑сообщений"""
 
 
+import heapq
 import multiprocessing
 import queue
 import signal
@@ -43,9 +44,14 @@ import sys
 
 from modules.WebGrid_Socket_Polling import run_web_grid_process
 from modules.arbitrage_manager import (
+    ExchangeInstrument,
     calculate_worker_process_count,
     run_arbitrage_worker_process,
 )
+from modules.exchange_feed_process import run_exchange_feed_process
+from modules.latency_trace import TRACE_KEY, LatencyTracer
+from modules.shared_orderbook import SharedOrderbookTable
+from modules.symbol_rebalancer import SymbolRebalancer
 from modules.utils import to_decimal
 
 
@@ -53,6 +59,24 @@ WEB_GRID_TITLE = "Open Arbitrage Ratio"
 EXCHANGE_ID_LIST = ["okx", "htx", "gateio"]
 MAX_DEAL_SLOTS = to_decimal("2")
 WORKER_START_TIMEOUT_SEC = 30.0
+# "workers": каждый воркер сам подключается ко всем биржам;
+# "shared_feeds": процесс на биржу пишет стаканы в общую память, воркеры читают.
+TOPOLOGY_MODE = "workers"
+FEED_START_TIMEOUT_SEC = 60.0
+# Каталог записи сырого потока стаканов (`modules.orderbook_recorder`); None — не писать.
+ORDERBOOK_RECORD_DIR = None
+# Расчёт спреда в воркере: "per_symbol" — цикл каждого символа;
+# "vectorized" — общий `CrossSymbolSpreadEngine` по всем символам воркера.
+SPREAD_ENGINE_MODE = "vectorized"
+# Строк в таблице: каждый воркер отправляет агрегатору только свои лучшие
+# GRID_TOP_K строк, агрегатор показывает лучшие GRID_TOP_K из них.
+# None — все строки выше порога.
+GRID_TOP_K = 50
+# Период публикации задержек агрегатора таблицы на страницу статусов.
+LATENCY_PUBLISH_INTERVAL_SEC = 5.0
+# Перенос символов между воркерами по нагрузке из heartbeat
+# (`SymbolRebalancer`): период раунда, None — выключен.
+REBALANCE_INTERVAL_SEC: float | None = 60.0
 
 
 def _publish_status_message(
@@ -84,6 +108,8 @@ def _status_monitor_loop(
     stop_event: threading.Event,
     expected_workers: int,
     ready_event: threading.Event,
+    command_queues: list[multiprocessing.Queue] | None = None,
+    rebalancer: SymbolRebalancer | None = None,
 ) -> None:
     worker_states: dict[int, dict[str, Any]] = {
         idx: {"state": "starting"} for idx in range(expected_workers)
@@ -115,7 +141,25 @@ def _status_monitor_loop(
     except Exception:
         return
 
+    last_latency_publish = time.monotonic()
+    reported_rounds: set[int] = set()
     while not stop_event.is_set():
+        if rebalancer is not None and command_queues:
+            _rebalance_step(rebalancer, command_queues, status_queue, reported_rounds)
+
+        if time.monotonic() - last_latency_publish >= LATENCY_PUBLISH_INTERVAL_SEC:
+            last_latency_publish = time.monotonic()
+            status_queue.put(
+                {
+                    "status_event": "latency",
+                    "source": "aggregator",
+                    "latency": LatencyTracer.summary(),
+                    "ts": time.time(),
+                }
+            )
+            if rebalancer is not None:
+                _publish_rebalance_summary(status_queue, rebalancer)
+
         if shared_values["shutdown"].value:
             try:
                 status_queue.put(
@@ -205,15 +249,49 @@ def _status_monitor_loop(
             )
 
         elif event_type == "worker_heartbeat" and isinstance(worker_id, int):
+            if rebalancer is not None:
+                rebalancer.observe_heartbeat(worker_id, event.get("symbol_load"), event.get("cpu_load"))
             status_queue.put(
                 {
                     "status_event": "worker_heartbeat",
                     "worker_id": worker_id,
                     "pid": event.get("pid"),
+                    "symbols_active": event.get("symbols_active"),
+                    "orderbook_recompute": event.get("orderbook_recompute"),
+                    "orderbook_coalesced": event.get("orderbook_coalesced"),
+                    "latency": event.get("latency"),
+                    "feed_lag": event.get("feed_lag"),
+                    "clock_sync": event.get("clock_sync"),
+                    "reconnect": event.get("reconnect"),
+                    "subscription_depth": event.get("subscription_depth"),
+                    "spread_engine": event.get("spread_engine"),
+                    "cpu_load": event.get("cpu_load"),
                     "ts": event.get("ts") or time.time(),
                 }
             )
 
+        elif (event_type == "symbols_stopped" and isinstance(worker_id, int) and rebalancer is not None
+              and event.get("reason") == "rebalance"):
+            # Символы сняты со старого воркера — только теперь запускаем их
+            # на новом. Остановки по обновлению рынков переносом не считаются.
+            for to_worker, symbols in rebalancer.on_stopped(worker_id, event.get("symbols") or []).items():
+                _send_worker_command(command_queues, to_worker, {"command": "start_symbols", "symbols": symbols})
+
+        elif event_type == "symbols_started" and isinstance(worker_id, int) and rebalancer is not None:
+            rebalancer.on_started(worker_id, event.get("symbols") or [])
+
+        elif event_type == "markets_changed" and isinstance(worker_id, int):
+            started = event.get("started") or []
+            stopped = event.get("stopped") or []
+            if started or stopped:
+                _publish_status_message(
+                    status_queue,
+                    level="info",
+                    text=f"Воркер {worker_id}: рынки обновлены, запущено {len(started)}, "
+                         f"остановлено {len(stopped)} (символов в рынках: {event.get('symbols_total')}).",
+                    source="markets",
+                )
+
         elif event_type == "worker_error" and isinstance(worker_id, int):
             _publish_status_message(
                 status_queue,
@@ -240,11 +318,95 @@ def _status_monitor_loop(
             pass
 
 
-def _build_grid_snapshot(rows: dict[str, dict[str, Any]]) -> dict[Any, dict[int, dict[str, Any]]]:
-    sorted_rows = sorted(
-        rows.values(),
-        key=lambda row: (-row["open_ratio_value"], row["symbol"]),
+def _send_worker_command(
+    command_queues: list[multiprocessing.Queue] | None,
+    worker_id: int,
+    command: dict[str, Any],
+) -> None:
+    if not command_queues or not 0 <= worker_id < len(command_queues):
+        return
+    try:
+        command_queues[worker_id].put(command)
+    except Exception:
+        return
+
+
+def _rebalance_step(
+    rebalancer: SymbolRebalancer,
+    command_queues: list[multiprocessing.Queue],
+    status_queue: multiprocessing.Queue,
+    reported_rounds: set[int],
+) -> None:
+    """Раунд переноса символов, если пора, и публикация его результата.
+
+    Перенос начинается с `stop_symbols` старым воркерам; `start_symbols`
+    новым отправляет `_status_monitor_loop` по их `symbols_stopped`.
+    """
+    for symbol, migration in rebalancer.expire():
+        _publish_status_message(
+            status_queue,
+            level="warning",
+            text=f"Перенос {symbol} {migration['from']} → {migration['to']} без ответа ({migration['state']}).",
+            source="rebalance",
+        )
+        for worker_id, command in rebalancer.rollback_commands(symbol, migration):
+            _send_worker_command(command_queues, worker_id, command)
+
+    moves = rebalancer.plan()
+    if moves:
+        stop_dict: dict[int, list[str]] = {}
+        for symbol, from_worker, _ in moves:
+            stop_dict.setdefault(from_worker, []).append(symbol)
+        for from_worker, symbols in stop_dict.items():
+            _send_worker_command(
+                command_queues, from_worker, {"command": "stop_symbols", "symbols": symbols, "reason": "rebalance"}
+            )
+        last_round = rebalancer.last_round
+        _publish_status_message(
+            status_queue,
+            level="info",
+            text=f"Ребалансировка #{last_round['round']}: перенос {len(moves)} символов, "
+                 f"разброс CPU воркеров {last_round['spread_before']}% → "
+                 f"{last_round['spread_predicted']}% (прогноз).",
+            source="rebalance",
+        )
+
+    last_round = rebalancer.last_round
+    measured = (
+        last_round is not None and last_round["spread_after"] is not None
+        and last_round["round"] not in reported_rounds
     )
+    if measured:
+        reported_rounds.add(last_round["round"])
+        _publish_status_message(
+            status_queue,
+            level="info",
+            text=f"Ребалансировка #{last_round['round']}: разброс CPU воркеров "
+                 f"{last_round['spread_before']}% → {last_round['spread_after']}% (измерено).",
+            source="rebalance",
+        )
+    if moves or measured:
+        _publish_rebalance_summary(status_queue, rebalancer)
+
+
+def _publish_rebalance_summary(status_queue: multiprocessing.Queue, rebalancer: SymbolRebalancer) -> None:
+    try:
+        status_queue.put({"status_event": "rebalance", "rebalance": rebalancer.summary(), "ts": time.time()})
+    except Exception:
+        return
+
+
+def _build_grid_snapshot(
+    rows: dict[str, dict[str, Any]],
+    limit: int | None = None,
+) -> dict[Any, dict[int, dict[str, Any]]]:
+    def row_order(row: dict[str, Any]) -> tuple[float, str]:
+        return -row["open_ratio_value"], row["symbol"]
+
+    if limit is None:
+        sorted_rows = sorted(rows.values(), key=row_order)
+    else:
+        sorted_rows = heapq.nsmallest(limit, rows.values(), key=row_order)
 
     grid_data: dict[Any, dict[int, dict[str, Any]]] = {
         "header": {
@@ -254,7 +416,10 @@ def _build_grid_snapshot(rows: dict[str, dict[str, Any]]) -> dict[Any, dict[int,
             3: {"text": "ask_mean_dt", "align": "right"},
             4: {"text": "bid_ex", "align": "left"},
             5: {"text": "bid_mean_dt", "align": "right"},
-            6: {"text": "open_ratio", "align": "right"},
+            6: {"text": "deal_usdt", "align": "right"},
+            7: {"text": "net_ratio", "align": "right"},
+            8: {"text": "spread_z", "align": "right"},
+            9: {"text": "spread_ema", "align": "right"},
         }
     }
 
@@ -266,7 +431,10 @@ def _build_grid_snapshot(rows: dict[str, dict[str, Any]]) -> dict[Any, dict[int,
             3: {"text": row["ask_mean_dt"], "align": "right"},
             4: {"text": row["bid_exchange"], "align": "left"},
             5: {"text": row["bid_mean_dt"], "align": "right"},
-            6: {"text": row["open_ratio"], "align": "right"},
+            6: {"text": row.get("deal_notional", "-"), "align": "right"},
+            7: {"text": row["open_ratio"], "align": "right"},
+            8: {"text": row.get("spread_z", "-"), "align": "right"},
+            9: {"text": row.get("spread_ema", "-"), "align": "right"},
         }
 
     return grid_data
@@ -278,10 +446,18 @@ def _grid_aggregator_loop(
     web_grid_queue: multiprocessing.Queue,
     shared_values: dict[str, Any],
     stop_event: threading.Event,
+    top_k: int | None = GRID_TOP_K,
 ) -> None:
+    """Собрать строки воркеров и отправлять снимки таблицы веб-серверу.
+
+    Символы воркеров не пересекаются, поэтому строки хранятся одним
+    словарём. С `top_k` воркеры присылают только свои лучшие K строк, и
+    снимок — лучшие `top_k` из их объединения: его цена не зависит от числа
+    символов чуть выше порога.
+    """
     rows: dict[str, dict[str, Any]] = {}
     web_grid_queue.put({"title": WEB_GRID_TITLE})
-    web_grid_queue.put(_build_grid_snapshot(rows))
+    web_grid_queue.put(_build_grid_snapshot(rows, top_k))
 
     while not stop_event.is_set():
         if shared_values["shutdown"].value:
@@ -301,14 +477,19 @@ def _grid_aggregator_loop(
             row = item.get("row")
             if symbol and isinstance(row, dict):
                 rows[symbol] = row
-                web_grid_queue.put(_build_grid_snapshot(rows))
+                trace = item.get(TRACE_KEY)
+                LatencyTracer.mark(trace, "aggregator")
+                snapshot = _build_grid_snapshot(rows, top_k)
+                if trace is not None:
+                    snapshot[TRACE_KEY] = trace
+                web_grid_queue.put(snapshot)
             continue
 
         if grid_event == "remove_row":
             symbol = item.get("symbol")
             if symbol is not None:
                 rows.pop(symbol, None)
-                web_grid_queue.put(_build_grid_snapshot(rows))
+                web_grid_queue.put(_build_grid_snapshot(rows, top_k))
 
 
 def _install_signal_handlers(stop_event: threading.Event, shared_values: dict[str, Any]) -> None:
@@ -356,6 +537,9 @@ def _start_worker_processes(
     worker_grid_queue: multiprocessing.Queue,
     control_queue: multiprocessing.Queue,
     shared_values: dict[str, Any],
+    shared_orderbook_layout: dict[str, Any] | None = None,
+    shared_swap_raw_data_dict: dict[str, dict[str, dict[str, Any]]] | None = None,
+    command_queues: list[multiprocessing.Queue] | None = None,
 ) -> list[multiprocessing.Process]:
     processes: list[multiprocessing.Process] = []
 
@@ -370,6 +554,12 @@ def _start_worker_processes(
                 "web_grid_queue": worker_grid_queue,
                 "control_queue": control_queue,
                 "shared_values": shared_values,
+                "shared_orderbook_layout": shared_orderbook_layout,
+                "shared_swap_raw_data_dict": shared_swap_raw_data_dict,
+                "orderbook_record_dir": ORDERBOOK_RECORD_DIR,
+                "spread_engine_mode": SPREAD_ENGINE_MODE,
+                "grid_top_k": GRID_TOP_K,
+                "command_queue": command_queues[process_index] if command_queues else None,
             },
             daemon=False,
             name=f"arbitrage-worker-{process_index}",
@@ -380,6 +570,86 @@ def _start_worker_processes(
     return processes
 
 
+def _start_exchange_feeds(
+    *,
+    exchange_id_list: list[str],
+    max_deal_slots: Decimal,
+    shared_values: dict[str, Any],
+    status_queue: multiprocessing.Queue,
+) -> tuple[list[multiprocessing.Process], SharedOrderbookTable | None, dict[str, dict[str, dict[str, Any]]]]:
+    """Запустить процессы бирж и создать общую таблицу стаканов.
+
+    Returns:
+        Процессы бирж, таблицу (`None`, если общих символов нет) и рынки
+        свопов `{symbol: {exchange_id: swap_data}}` для воркеров.
+    """
+    layout_queue: multiprocessing.Queue = multiprocessing.Queue()
+    command_queue_dict: dict[str, multiprocessing.Queue] = {}
+    processes: list[multiprocessing.Process] = []
+    for exchange_id in exchange_id_list:
+        command_queue_dict[exchange_id] = multiprocessing.Queue()
+        process = multiprocessing.Process(
+            target=run_exchange_feed_process,
+            kwargs={
+                "exchange_id": exchange_id,
+                "max_deal_slots": max_deal_slots,
+                "layout_queue": layout_queue,
+                "command_queue": command_queue_dict[exchange_id],
+                "shared_values": shared_values,
+                "orderbook_record_dir": ORDERBOOK_RECORD_DIR,
+            },
+            daemon=False,
+            name=f"exchange-feed-{exchange_id}",
+        )
+        process.start()
+        processes.append(process)
+
+    swap_raw_data_dict: dict[str, dict[str, dict[str, Any]]] = {}
+    feed_exchange_ids: list[str] = []
+    deadline = time.monotonic() + FEED_START_TIMEOUT_SEC
+    pending = set(exchange_id_list)
+    while pending and time.monotonic() < deadline and not shared_values["shutdown"].value:
+        try:
+            event = layout_queue.get(timeout=0.5)
+        except queue.Empty:
+            continue
+        exchange_id = event.get("exchange_id")
+        pending.discard(exchange_id)
+        if event.get("event") == "feed_markets":
+            feed_exchange_ids.append(exchange_id)
+            for symbol, swap_data in event["swap_data"].items():
+                swap_raw_data_dict.setdefault(symbol, {})[exchange_id] = swap_data
+        else:
+            _publish_status_message(
+                status_queue,
+                level="error",
+                text=f"Процесс биржи {exchange_id} не запустился: {event.get('text')}",
+                source="feeds",
+            )
+
+    swap_raw_data_dict = {
+        symbol: exchange_data for symbol, exchange_data in swap_raw_data_dict.items() if len(exchange_data) >= 2
+    }
+    table = None
+    if swap_raw_data_dict:
+        table = SharedOrderbookTable.create(
+            symbols=sorted(swap_raw_data_dict),
+            exchange_ids=[exchange_id for exchange_id in exchange_id_list if exchange_id in feed_exchange_ids],
+            ladder_multipliers=ExchangeInstrument.VWAP_LADDER_MULTIPLIERS,
+        )
+    for exchange_id, command_queue in command_queue_dict.items():
+        command_queue.put(table.layout if table is not None and exchange_id in feed_exchange_ids else None)
+
+    _publish_status_message(
+        status_queue,
+        level="info" if table is not None else "error",
+        text=f"Процессы бирж: {len(feed_exchange_ids)}/{len(exchange_id_list)}, "
+             f"общих символов: {len(swap_raw_data_dict)}.",
+        source="feeds",
+    )
+    return processes, table, swap_raw_data_dict
+
+
 def _stop_processes(processes: list[multiprocessing.Process], timeout_sec: float = 10.0) -> None:
     deadline = time.monotonic() + timeout_sec
     for process in processes:
@@ -427,6 +697,11 @@ def main() -> None:
     aggregator_thread.start()
 
     process_count = min(calculate_worker_process_count(), 8)
+    command_queues: list[multiprocessing.Queue] = [multiprocessing.Queue() for _ in range(process_count)]
+    rebalancer = (
+        SymbolRebalancer(range(process_count), interval_sec=REBALANCE_INTERVAL_SEC)
+        if REBALANCE_INTERVAL_SEC is not None and process_count > 1 else None
+    )
     status_thread = threading.Thread(
         target=_status_monitor_loop,
         kwargs={
@@ -436,6 +711,8 @@ def main() -> None:
             "stop_event": stop_event,
             "expected_workers": process_count,
             "ready_event": ready_event,
+            "command_queues": command_queues,
+            "rebalancer": rebalancer,
         },
         daemon=True,
         name="status-monitor",
@@ -467,6 +744,17 @@ def main() -> None:
         except Exception:
             pass
 
+    feed_processes: list[multiprocessing.Process] = []
+    shared_table = None
+    shared_swap_raw_data_dict = None
+    if TOPOLOGY_MODE == "shared_feeds":
+        feed_processes, shared_table, shared_swap_raw_data_dict = _start_exchange_feeds(
+            exchange_id_list=EXCHANGE_ID_LIST,
+            max_deal_slots=MAX_DEAL_SLOTS,
+            shared_values=shared_values,
+            status_queue=status_queue,
+        )
+
     worker_processes = _start_worker_processes(
         process_count=process_count,
         exchange_id_list=EXCHANGE_ID_LIST,
@@ -474,6 +762,9 @@ def main() -> None:
         worker_grid_queue=worker_grid_queue,
         control_queue=control_queue,
         shared_values=shared_values,
+        shared_orderbook_layout=shared_table.layout if shared_table is not None else None,
+        shared_swap_raw_data_dict=shared_swap_raw_data_dict,
+        command_queues=command_queues,
     )
 
     print(f"Started {len(worker_processes)} arbitrage worker process(es)")
@@ -528,6 +819,10 @@ def main() -> None:
         shared_values["shutdown"].value = True
         stop_event.set()
         _stop_processes(worker_processes)
+        _stop_processes(feed_processes)
+        if shared_table is not None:
+            shared_table.close()
+            shared_table.unlink()
         aggregator_thread.join(timeout=3)
         status_thread.join(timeout=3)
         web_grid_process.join(timeout=5)
@@ -28,7 +28,8 @@ from modules.exception_classes import ( ReconnectLimitExceededError,
                                         BaseArbitrageCalcException,
                                         InsufficientOrderBookVolumeError)
 from modules import (cprint, round_down, get_average_orderbook_price, sync_time_with_exchange,  # is_valid_price,
-                     )
+                     get_average_orderbook_price_fast)
+from modules.compact_orderbook import OrderbookNormalizer
 
 # Установить нужную точность
 getcontext().prec = 16  # Общая точность вычислений
@@ -167,17 +168,22 @@ class ArbitrageRootClass:
                     ticks_total += 1
                     count += 1
 
+                    # Отпечаток снимается с исходных уровней; в массивы
+                    # (`CompactOrderbook`) стакан переводится только для
+                    # пересчёта средних цен.
+                    normalizer = OrderbookNormalizer.get_normalizer(self.exchange_id)
                     depth = min(5, len(orderbook['asks']), len(orderbook['bids']))
-                    new_ask = tuple(map(tuple, orderbook['asks'][:depth]))
-                    new_bid = tuple(map(tuple, orderbook['bids'][:depth]))
+                    new_ask = normalizer.fingerprint(orderbook['asks'], depth)
+                    new_bid = normalizer.fingerprint(orderbook['bids'], depth)
 
-                    if new_ask != old_ask or new_bid != old_bid:
+                    if new_ask is None or new_ask != old_ask or new_bid != old_bid:
                         ticks_changed += 1
                         new_count += 1
+                        book = normalizer.normalize(orderbook, symbol)
 
                         try:
-                            average_ask = get_average_orderbook_price(
-                                data=orderbook['asks'],
+                            average_ask = get_average_orderbook_price_fast(
+                                data=book.asks,
                                 money=min_usdt,
                                 is_ask=True,
                                 log=True,
@@ -185,8 +191,8 @@ class ArbitrageRootClass:
                                 symbol=symbol
                             )
 
-                            average_bid = get_average_orderbook_price(
-                                data=orderbook['bids'],
+                            average_bid = get_average_orderbook_price_fast(
+                                data=book.bids,
                                 money=min_usdt,
                                 is_ask=False,
                                 log=True,
@@ -19,10 +19,14 @@ import time
 from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from typing import Any, Optional
 
+from modules.latency_trace import TRACE_KEY, TRACE_STAGES, LatencyTracer
 from modules.logger import LoggerFactory
 
 logger = LoggerFactory.get_logger("app." + __name__)
 
+# Период обновления задержек стадии `sse` этого процесса на странице статусов.
+LATENCY_REFRESH_INTERVAL_SEC = 5.0
+
 
 HTML_TEMPLATE = """<!doctype html>
 <html lang="ru">
@@ -240,6 +244,7 @@ STATUS_HTML_TEMPLATE = """<!doctype html>
     .status-ok { background: var(--ok); }
     .status-warn { background: var(--warn); }
     .status-bad { background: var(--bad); }
+    .latency { margin-top: 12px; }
     .log { margin-top: 12px; }
     .log-item { border: 1px solid var(--line); background: var(--panel); border-radius: 8px; padding: 8px 10px; margin-bottom: 6px; }
     .log-item .meta { font-size: 12px; color: var(--muted); }
@@ -270,6 +275,10 @@ STATUS_HTML_TEMPLATE = """<!doctype html>
         <h3>Last Update</h3>
         <div class="value" id="lastUpdate">-</div>
       </div>
+      <div class="card">
+        <h3>Worker CPU spread</h3>
+        <div class="value" id="cpuSpread">-</div>
+      </div>
     </div>
 
     <div class="table-card">
@@ -284,10 +293,40 @@ STATUS_HTML_TEMPLATE = """<!doctype html>
               <th>Exchanges OK</th>
               <th>Exchanges Failed</th>
               <th>Активные символы</th>
+              <th>VWAP skip/total</th>
+              <th>Coalesced</th>
+              <th>Feed lag p99 (ms)</th>
+              <th>Reconnect (TTR s)</th>
+              <th>Depth limit / KB/s (base)</th>
+              <th>Spread tick µs (max) / rows</th>
+              <th>CPU %</th>
             </tr>
           </thead>
           <tbody id="workerTableBody">
-            <tr><td colspan="7" class="empty">Ожидание данных...</td></tr>
+            <tr><td colspan="14" class="empty">Ожидание данных...</td></tr>
+          </tbody>
+        </table>
+      </div>
+    </div>
+
+    <div class="table-card latency">
+      <div class="table-scroll">
+        <table>
+          <thead>
+            <tr>
+              <th>Источник</th>
+              <th>Стадия</th>
+              <th>Count</th>
+              <th>p50, ms</th>
+              <th>p90, ms</th>
+              <th>p99, ms</th>
+              <th>p99.9, ms</th>
+              <th>Max, ms</th>
+              <th>p99 от receive, ms</th>
+            </tr>
+          </thead>
+          <tbody id="latencyTableBody">
+            <tr><td colspan="9" class="empty">Нет данных трассировки</td></tr>
           </tbody>
         </table>
       </div>
@@ -310,6 +349,112 @@ STATUS_HTML_TEMPLATE = """<!doctype html>
       return `${age}s`;
     }
 
+    function fmtRecompute(stats) {
+      if (!stats) return '-';
+      const parts = Object.keys(stats).sort().map((ex) => {
+        const skipped = stats[ex].skipped ?? 0;
+        const total = skipped + (stats[ex].recomputed ?? 0);
+        return `${ex} ${skipped}/${total}`;
+      });
+      return parts.length ? parts.join(', ') : '-';
+    }
+
+    function fmtCoalesced(stats) {
+      if (!stats) return '-';
+      const symbols = Object.keys(stats).sort((a, b) => stats[b] - stats[a]);
+      if (!symbols.length) return '0';
+      const total = symbols.reduce((acc, symbol) => acc + stats[symbol], 0);
+      const top = symbols.slice(0, 3).map((symbol) => `${symbol} ${stats[symbol]}`).join(', ');
+      return `${total} (${top})`;
+    }
+
+    function fmtFeedLag(stats, clock) {
+      if (!stats) return '-';
+      const parts = Object.keys(stats).sort().map((ex) => {
+        const s = stats[ex];
+        const stale = s.stale_dropped ? ` stale ${s.stale_dropped}` : '';
+        const c = clock && clock[ex];
+        const unc = c && c.uncertainty_ms !== null && c.uncertainty_ms !== undefined ? ` ±${c.uncertainty_ms}` : '';
+        return `${ex} ${s.p99 ?? '-'}${unc}${stale}`;
+      });
+      return parts.length ? parts.join(', ') : '-';
+    }
+
+    function fmtReconnect(stats) {
+      if (!stats) return '-';
+      const parts = Object.keys(stats).sort().map((ex) => {
+        const s = stats[ex];
+        if (s.state === 'reconnecting') return `${ex} RECONNECTING #${s.attempt} ${s.outage_sec}s`;
+        if (!s.outages) return `${ex} ok`;
+        return `${ex} ${s.outages}x last ${s.last_ttr_sec ?? '-'} max ${s.max_ttr_sec ?? '-'}`;
+      });
+      return parts.length ? parts.join(', ') : '-';
+    }
+
+    function fmtDepth(stats) {
+      if (!stats) return '-';
+      const kb = (rate) => rate ? (rate.bytes_per_sec / 1024).toFixed(1) : '-';
+      const parts = Object.keys(stats).sort().map((ex) => {
+        const s = stats[ex];
+        const limits = Object.keys(s.limits || {}).map((limit) => `${limit}×${s.limits[limit]}`).join(' ');
+        const t = s.traffic;
+        const traffic = t ? ` ${kb(t.current)} (${kb(t.baseline)})` : '';
+        return `${ex} ${limits || '-'}${traffic}`;
+      });
+      return parts.length ? parts.join(', ') : '-';
+    }
+
+    function fmtRebalance(stats) {
+      if (!stats || stats.spread === null || stats.spread === undefined) return '-';
+      const r = stats.last_round;
+      if (!r) return `${stats.spread}%`;
+      const after = r.spread_after ?? `~${r.spread_predicted}`;
+      return `${stats.spread}% (#${r.round}: ${r.spread_before} → ${after}, ${r.moves} sym)`;
+    }
+
+    function fmtSpreadEngine(stats) {
+      if (!stats || !stats.ticks) return '-';
+      return `${stats.tick_us_mean} (${stats.tick_us_max}) / ${stats.rows_per_tick}, sent ${stats.emitted}`;
+    }
+
+    const TRACE_STAGES = __TRACE_STAGES__;
+
+    function fmtMs(value) {
+      return value === null || value === undefined ? '-' : String(value);
+    }
+
+    function renderLatency(workers, latency) {
+      const sources = [];
+      for (const key of Object.keys(workers).sort((a, b) => Number(a) - Number(b))) {
+        if (workers[key] && workers[key].latency) sources.push([`worker ${key}`, workers[key].latency]);
+      }
+      for (const source of Object.keys(latency).sort()) {
+        sources.push([source, latency[source]]);
+      }
+      let rows = '';
+      for (const [source, stages] of sources) {
+        for (const stage of TRACE_STAGES) {
+          const s = stages[stage];
+          if (!s) continue;
+          rows += `
+            <tr>
+              <td>${source}</td>
+              <td>${stage}</td>
+              <td>${s.count}</td>
+              <td>${fmtMs(s.p50)}</td>
+              <td>${fmtMs(s.p90)}</td>
+              <td>${fmtMs(s.p99)}</td>
+              <td>${fmtMs(s.p999)}</td>
+              <td>${fmtMs(s.max)}</td>
+              <td>${fmtMs(s.since_receive_p99)}</td>
+            </tr>
+          `;
+        }
+      }
+      document.getElementById('latencyTableBody').innerHTML =
+        rows || '<tr><td colspan="9" class="empty">Нет данных трассировки</td></tr>';
+    }
+
     function fmtTime(tsSec) {
       if (!tsSec) return '-';
       return new Date(tsSec * 1000).toLocaleTimeString();
@@ -325,6 +470,7 @@ STATUS_HTML_TEMPLATE = """<!doctype html>
       const meta = status.meta || {};
       const workers = status.workers || {};
       const messages = status.messages || [];
+      renderLatency(workers, status.latency || {});
 
       const uptimeEl = document.getElementById('uptime');
       const workersReadyEl = document.getElementById('workersReady');
@@ -338,11 +484,12 @@ STATUS_HTML_TEMPLATE = """<!doctype html>
       workersReadyEl.textContent = `${ready}/${expected}`;
       shutdownEl.textContent = meta.shutdown ? 'TRUE' : 'FALSE';
       lastUpdateEl.textContent = fmtTime(meta.last_update_ts);
+      document.getElementById('cpuSpread').textContent = fmtRebalance(status.rebalance);
 
       const tbody = document.getElementById('workerTableBody');
       const keys = Object.keys(workers).sort((a, b) => Number(a) - Number(b));
       if (!keys.length) {
-        tbody.innerHTML = '<tr><td colspan="7" class="empty">Ожидание данных...</td></tr>';
+        tbody.innerHTML = '<tr><td colspan="14" class="empty">Ожидание данных...</td></tr>';
       } else {
         let rows = '';
         for (const key of keys) {
@@ -361,6 +508,13 @@ STATUS_HTML_TEMPLATE = """<!doctype html>
               <td>${w.exchanges_ok ?? '-'}</td>
               <td>${w.exchanges_failed ?? '-'}</td>
               <td>${w.symbols_active ?? '-'}</td>
+              <td>${fmtRecompute(w.orderbook_recompute)}</td>
+              <td>${fmtCoalesced(w.orderbook_coalesced)}</td>
+              <td>${fmtFeedLag(w.feed_lag, w.clock_sync)}</td>
+              <td>${fmtReconnect(w.reconnect)}</td>
+              <td>${fmtDepth(w.subscription_depth)}</td>
+              <td>${fmtSpreadEngine(w.spread_engine)}</td>
+              <td>${w.cpu_load ?? '-'}</td>
             </tr>
           `;
         }
@@ -467,6 +621,7 @@ class WebGridSocketPolling:
         self.status_queue: Optional[multiprocessing.Queue] = None
 
         self.grid_data: dict[str, Any] = {}
+        self.grid_trace: Optional[list[float]] = None
         self.version: int = 0
         self.status_state: dict[str, Any] = {
             "meta": {
@@ -479,6 +634,8 @@ class WebGridSocketPolling:
             },
             "workers": {},
             "messages": [],
+            "latency": {},
+            "rebalance": None,
         }
         self.status_version: int = 0
         self.status_max_messages: int = 200
@@ -503,9 +660,10 @@ class WebGridSocketPolling:
             STATUS_HTML_TEMPLATE
             .replace("__TRANSPORT_MODE__", self.transport)
             .replace("__POLL_INTERVAL_MS__", str(self.client_poll_interval_ms))
+            .replace("__TRACE_STAGES__", json.dumps(TRACE_STAGES))
         )
 
-    def update_grid_data(self, grid_data: Optional[dict] = None) -> None:
+    def update_grid_data(self, grid_data: Optional[dict] = None, trace: Optional[list[float]] = None) -> None:
         if grid_data is None:
             grid_data = {"header": {0: {"text": "test"}}}
         if not isinstance(grid_data, dict):
@@ -513,6 +671,7 @@ class WebGridSocketPolling:
 
         with self._lock:
             self.grid_data = grid_data
+            self.grid_trace = trace
             self.version += 1
 
     def _append_status_message(self, message: dict[str, Any]) -> None:
@@ -553,9 +712,16 @@ class WebGridSocketPolling:
             if worker_id:
                 worker = self.status_state["workers"].setdefault(worker_id, {})
                 worker["pid"] = event.get("pid", worker.get("pid"))
-                if "symbols_active" in event:
-                    worker["symbols_active"] = event.get("symbols_active")
+                for key in ("symbols_active", "orderbook_recompute", "orderbook_coalesced", "latency", "feed_lag", "clock_sync", "reconnect", "subscription_depth", "spread_engine", "cpu_load"):
+                    if key in event:
+                        worker[key] = event.get(key)
                 worker["last_heartbeat_ts"] = now_ts
+        elif event_type == "rebalance":
+            self.status_state["rebalance"] = event.get("rebalance")
+        elif event_type == "latency":
+            source = str(event.get("source") or "app")
+            if event.get("latency"):
+                self.status_state["latency"][source] = event["latency"]
         elif event_type == "summary":
             meta = self.status_state["meta"]
             for key in ("expected_workers", "started_workers", "ready_workers", "shutdown"):
@@ -590,10 +756,22 @@ class WebGridSocketPolling:
                 with self._lock:
                     self._apply_status_event(raw_item)
 
+    def _refresh_own_latency(self) -> None:
+        """Положить задержки стадий этого процесса (`sse`) в статус."""
+        with self._lock:
+            latency = LatencyTracer.summary()
+            if latency and latency != self.status_state["latency"].get("web"):
+                self.status_state["latency"]["web"] = latency
+                self.status_version += 1
+
     def _status_queue_worker(self) -> None:
+        last_latency_refresh = time.monotonic()
         while not self._stop_event.is_set():
             try:
                 self.process_status_queue_once()
+                if time.monotonic() - last_latency_refresh >= LATENCY_REFRESH_INTERVAL_SEC:
+                    last_latency_refresh = time.monotonic()
+                    self._refresh_own_latency()
             except Exception as exc:
                 logger.exception(f"[WebGridSocketPolling] status queue error: {exc}")
             time.sleep(self.queue_poll_interval)
@@ -639,7 +817,8 @@ class WebGridSocketPolling:
                     self.version += 1
                 continue
 
-            self.update_grid_data(item)
+            trace = item.pop(TRACE_KEY, None)
+            self.update_grid_data(item, trace=trace)
 
     def _queue_worker(self) -> None:
         while not self._stop_event.is_set():
@@ -668,6 +847,12 @@ class WebGridSocketPolling:
                 "version": self.version,
             }
 
+    def _mark_sse_sent(self, version: int) -> None:
+        """Отметить стадию `sse` для трассировки отправленной версии таблицы."""
+        with self._lock:
+            if version == self.version and self.grid_trace is not None:
+                LatencyTracer.mark(list(self.grid_trace), "sse")
+
     def _status_snapshot(self) -> dict[str, Any]:
         with self._lock:
             return {
@@ -764,6 +949,7 @@ class WebGridSocketPolling:
                                 data = f"data: {payload}\n\n".encode("utf-8")
                                 self.wfile.write(data)
                                 self.wfile.flush()
+                                grid._mark_sse_sent(version)
                                 last_sent_version = version
                                 last_sent_ts = now
                             else:
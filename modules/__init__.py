@@ -27,6 +27,7 @@ from .utils import (get_average_orderbook_price,
                     timestamp_to_print,
                     get_current_iso_and_timestamp
                     )
+from .orderbook_vwap import get_average_orderbook_price_fast, get_average_orderbook_price_ladder
 
 
 """
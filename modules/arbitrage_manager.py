@@ -7,19 +7,30 @@ __version__ = "0.9i"
 - координацию расчёта арбитражного спреда на уровне одного торгового символа.
 
 Основные сущности:
-- `ExchangeInstrument`: слушает `watchOrderBook` для пары
-  `(exchange_id, symbol)` и публикует в единую торговую очередь либо
-  валидный стакан, либо изменение состояния источника;
+- `ExchangeInstrument`: обрабатывает стаканы пары `(exchange_id, symbol)`
+  (из собственного `watchOrderBook` или из `ExchangeOrderbookFeed`) и
+  публикует в единую торговую очередь либо валидный стакан, либо изменение
+  состояния источника;
 - `ArbitrageManager`: получает события от всех `ExchangeInstrument` этого
   символа, хранит локальный кэш средних цен и считает лучшие `ask` и `bid`
   между биржами.
 
 Архитектурная модель:
 - на каждый символ создаётся отдельная задача `_ArbitrageTask|{symbol}`;
-- внутри символа создаются задачи `_OrderbookTask|{symbol}|{exchange_id}`;
-- задачи ордербуков пишут события в общую очередь символа;
+- биржи с `watchOrderBookForSymbols` обслуживаются мультиплексором
+  `ExchangeOrderbookFeed`: символы биржи делятся на батчи, на батч одна
+  задача `_OrderbookFeedTask|{exchange_id}|{batch_index}`;
+- для остальных бирж внутри символа создаются задачи
+  `_OrderbookTask|{symbol}|{exchange_id}`;
+- `ExchangeInstrument` пишет события в общую очередь символа;
+- в топологии `shared_feeds` подписки держат процессы бирж
+  (`modules.exchange_feed_process`), а воркер получает те же события из
+  общей памяти задачей `_SharedOrderbookReaderTask`;
 - символ-менеджер читает эту очередь и решает, можно ли учитывать биржу в
   поиске сигнала прямо сейчас.
+- в режиме `spread_engine_mode="vectorized"` символ-менеджер только пишет
+  цены в общий `CrossSymbolSpreadEngine` воркера, а лучшую ступень по всем
+  изменённым символам считает задача `_SpreadEngineTask` раз в 5 мс.
 
 Notes:
     Арбитражный расчёт имеет смысл только при наличии минимум двух активных
@@ -33,8 +44,10 @@ Notes:
 import signal
 import multiprocessing
 import os
+import queue
+import zlib
 
-from modules import (cprint, round_down, get_average_orderbook_price, sync_time_with_exchange)
+from modules import (cprint, round_down, get_average_orderbook_price_ladder, sync_time_with_exchange)
 from pprint import pprint
 import time
 import ccxt.pro as ccxt
@@ -44,12 +57,26 @@ from typing import Any
 from modules.exchange_instance import ExchangeInstance
 from modules.task_manager import TaskManager
 from modules.balance_manager import BalanceManager
+from collections import deque
 from contextlib import AsyncExitStack
 from modules.utils import to_decimal
+from modules.latency_trace import TRACE_KEY, LatencyTracer
+from modules.time_sync import ClockSyncService, exchange_clock_uncertainty_ms, exchange_time_offset_ms
 from modules.orderbook_interval_stats import OrderbookIntervalStatsWindow
+from modules.orderbook_feed import ExchangeOrderbookFeed, is_transient_stream_error
+from modules.exchange_reconnect import ExchangeConnectionSupervisor
+from modules.orderbook_depth import ExchangeTrafficMeter, OrderbookDepthPolicy, unwatch_orderbook
+from modules.compact_orderbook import CompactOrderbookSide, OrderbookNormalizer
+from modules.orderbook_mailbox import OrderbookMailbox
+from modules.spread_engine import CrossSymbolSpreadEngine
+from modules.top_opportunities import TopOpportunityBook
+from modules.arbitrage_pair import ArbitragePair
+from modules.symbol_rebalancer import SymbolLoadMeter
+from modules.fixed_point import PriceScaleChanged, SymbolFixedPoint, price_tick_decimals, ratio_to_decimal, truncated_ratio
+from modules.orderbook_recorder import OrderbookRecorder
+from modules.shared_orderbook import SharedOrderbookTable, SharedOrderbookReader
 from modules.WebGrid_Socket_Polling import run_web_grid_process
-from modules.exception_classes import (ReconnectLimitExceededError,
-                                       InsufficientOrderBookVolumeError)
+from modules.exception_classes import ReconnectLimitExceededError
 
 
 class ExchangeInstrument:
@@ -74,7 +101,8 @@ class ExchangeInstrument:
     balance_manager = None
     task_manager = None
     # Реестр экземпляров ExchangeInstrument:
-    # {symbol: {exchange_id: {"obj": ExchangeInstrument, "task_name": str, "symbol_task_name": Task}}}
+    # {symbol: {exchange_id: {"obj": ExchangeInstrument, "task_name": str,
+    #                         "feed": ExchangeOrderbookFeed | None, "symbol_task_name": Task}}}
     exchange_instruments_obj_dict: dict[str, dict[str, dict[str, Any]]] = {}
     swap_processed_data_dict = None
     swap_raw_data_dict = None
@@ -84,6 +112,16 @@ class ExchangeInstrument:
     # Счётчики принятых обновлений стакана:
     # {exchange_id: {symbol: int}}
     get_ex_orderbook_data_count: dict[str, dict[str, int]] = {}
+    # Счётчики пересчёта средних цен по биржам:
+    # {exchange_id: {"recomputed": int, "skipped": int}}
+    # `skipped` — стакан пришёл, но уровни, влияющие на лестницу цен,
+    # не изменились, и пересчёт не понадобился.
+    orderbook_recompute_stats_dict: dict[str, dict[str, int]] = {}
+    # Задержка потока по биржевому `timestamp` стакана:
+    # {exchange_id: deque[lag_ms]} — последние `FEED_LAG_WINDOW_SIZE` значений;
+    # {exchange_id: {"stale_dropped": int, "lagging": int, "no_timestamp": int}}.
+    feed_lag_window_dict: dict[str, deque] = {}
+    feed_lag_stats_dict: dict[str, dict[str, int]] = {}
     _configured = False
 
     _lock: asyncio.Lock | None = None
@@ -133,14 +171,17 @@ class ExchangeInstrument:
     # STREAM_PAUSE_TIMEOUT_SEC:
     #   Сколько секунд можно не получать новый стакан, прежде чем источник
     #   считается подвисшим и переводится в `exchange_paused(stream_timeout)`.
+    #   Действует, пока в окне интервалов меньше `STREAM_POLICY_MIN_INTERVALS`.
     #
     # STREAM_TIMEOUT_RESUME_COOLDOWN_SEC:
     #   Минимальная выдержка после `stream_timeout`, в течение которой биржа
     #   не может вернуться в поиск сигнала, даже если пришёл одиночный тик.
+    #   Значение до набора статистики и потолок адаптивной выдержки.
     #
     # STREAM_TIMEOUT_RESUME_WINDOW_SEC:
     #   Длина окна наблюдения после cooldown. Внутри этого окна считаются
     #   валидные стаканы, подтверждающие восстановление потока.
+    #   Значение до набора статистики.
     #
     # STREAM_TIMEOUT_RESUME_TICKS_REQUIRED:
     #   Минимум валидных стаканов в окне наблюдения, после которого источник
@@ -150,6 +191,72 @@ class ExchangeInstrument:
     STREAM_TIMEOUT_RESUME_WINDOW_SEC = 30.0
     STREAM_TIMEOUT_RESUME_TICKS_REQUIRED = 5
 
+    # Адаптивная политика `stream_timeout` по интервалам между тиками связки
+    # `(exchange_id, symbol)` (`OrderbookIntervalStatsWindow`, p99 окна):
+    #
+    # STREAM_POLICY_MIN_INTERVALS:
+    #   Сколько интервалов нужно в окне, чтобы перейти на адаптивные значения.
+    #
+    # STREAM_PAUSE_TIMEOUT_P99_FACTOR, STREAM_PAUSE_TIMEOUT_MIN_SEC/MAX_SEC:
+    #   Таймаут тишины = k × p99 интервала в пределах [MIN, MAX]. Ликвидный
+    #   символ с тиками 20 раз в секунду уходит в паузу за секунды, неликвидный
+    #   с тиком раз в минуту не "дребезжит" на фиксированных 30 секундах.
+    #
+    # STREAM_TIMEOUT_RESUME_COOLDOWN_FACTOR, STREAM_TIMEOUT_RESUME_COOLDOWN_MIN_SEC:
+    #   Выдержка после паузы = k × таймаут тишины в пределах
+    #   [MIN, `STREAM_TIMEOUT_RESUME_COOLDOWN_SEC`].
+    #
+    # STREAM_TIMEOUT_RESUME_WINDOW_P99_FACTOR, STREAM_TIMEOUT_RESUME_WINDOW_MIN_SEC/MAX_SEC:
+    #   Окно подтверждения = k × p99 × `STREAM_TIMEOUT_RESUME_TICKS_REQUIRED`
+    #   в пределах [MIN, MAX]: за окно должно успевать прийти нужное число тиков.
+    STREAM_POLICY_MIN_INTERVALS = 20
+    STREAM_PAUSE_TIMEOUT_P99_FACTOR = 5.0
+    STREAM_PAUSE_TIMEOUT_MIN_SEC = 2.0
+    STREAM_PAUSE_TIMEOUT_MAX_SEC = 300.0
+    STREAM_TIMEOUT_RESUME_COOLDOWN_FACTOR = 10.0
+    STREAM_TIMEOUT_RESUME_COOLDOWN_MIN_SEC = 10.0
+    STREAM_TIMEOUT_RESUME_WINDOW_P99_FACTOR = 2.0
+    STREAM_TIMEOUT_RESUME_WINDOW_MIN_SEC = 2.0
+    STREAM_TIMEOUT_RESUME_WINDOW_MAX_SEC = 900.0
+
+    # Политика свежести стакана по биржевому `timestamp`:
+    #
+    # ORDERBOOK_MAX_AGE_MS:
+    #   Стакан старше этого возраста (время биржи сейчас минус `timestamp`,
+    #   с поправкой часов `time_sync`) отбрасывается до расчёта VWAP, а биржа
+    #   уходит в `exchange_paused(stale_orderbook)` до первого свежего стакана.
+    #
+    # ORDERBOOK_LAG_WARN_MS:
+    #   Начиная с этой задержки стакан считается отстающим: событие получает
+    #   `lagging=True`, и отметка попадает в `symbol_average_price_dict`.
+    #
+    # FEED_LAG_WINDOW_SIZE:
+    #   Сколько последних значений задержки на биржу держать для
+    #   перцентилей в heartbeat воркера.
+    ORDERBOOK_MAX_AGE_MS = 2000.0
+    ORDERBOOK_LAG_WARN_MS = 500.0
+    FEED_LAG_WINDOW_SIZE = 1024
+
+    # Лестница объёмов сделки, для которых на каждом изменении стакана
+    # считаются средние цены (множители к `BalanceManager.max_deal_volume`).
+    # Все ступени считаются за один проход по стакану. Ступень `1` обязательна:
+    # по ней публикуются `average_ask`/`average_bid` и решается пауза
+    # `insufficient_volume`. Нехватка ликвидности на остальных ступенях паузу
+    # не вызывает — цена такой ступени просто равна `None`.
+    VWAP_LADDER_MULTIPLIERS = (Decimal('0.25'), Decimal('0.5'), Decimal('1'), Decimal('2'))
+    # Сколько уровней стакана каждой стороны прикладывать к `orderbook_update`
+    # (поля `asks`/`bids`). `0` — не прикладывать. Включается в процессах бирж
+    # топологии `shared_feeds`: там событие сразу копируется в общую память,
+    # поэтому срезы уровней не успевают измениться ccxt на месте.
+    PUBLISH_TOP_LEVELS = 0
+    # Сколько верхних уровней стакана минимум переводить в `CompactOrderbook`.
+    # Окно растёт до двойной глубины исполнения последнего расчёта.
+    COMPACT_MIN_LEVELS = 8
+    # Запись сырого потока стаканов (`OrderbookRecorder`); `None` — выключена.
+    # Каждый полученный стакан пишется до валидации, в том виде, в каком его
+    # вернул `watchOrderBook`/`watchOrderBookForSymbols`.
+    orderbook_recorder = None
+
     def __init__(self, exchange_instance, symbol, orderbook_queue: asyncio.Queue):
         """Инициализировать подписку на ордербук конкретной биржи.
 
@@ -157,7 +264,9 @@ class ExchangeInstrument:
             exchange_instance: Экземпляр биржи, через который идёт подписка.
             symbol: Торговый символ, для которого слушается ордербук.
             orderbook_queue: Очередь публикации событий `orderbook_update` и
-                служебных событий состояния источника.
+                служебных событий состояния источника. Достаточно интерфейса
+                `put_nowait`/`put` (см. `OrderbookMailbox`,
+                `SharedOrderbookPublisher`).
 
         Notes:
             Текущий контракт событий в `orderbook_queue`:
@@ -169,11 +278,27 @@ class ExchangeInstrument:
                 "exchange_id": str,
                 "average_ask": Decimal,
                 "average_bid": Decimal,
+                # Цены по ступеням `VWAP_LADDER_MULTIPLIERS`, в том же порядке:
+                "ladder": [
+                    {
+                        "multiplier": Decimal,
+                        "notional": Decimal,
+                        "average_ask": Decimal | None,
+                        "average_bid": Decimal | None,
+                    },
+                    ...
+                ],
                 "stream_status": "ok",
                 "mean_dt": float | None,
                 "count": int,
                 "new_count": int,
                 "ts": float,
+                # Задержка по биржевому `timestamp` (None — биржа его не дала):
+                "feed_lag_ms": float | None,
+                "lagging": bool,
+                # Только при PUBLISH_TOP_LEVELS > 0 — top-N уровней стакана:
+                "asks": list,
+                "bids": list,
             }
 
             `exchange_paused`:
@@ -185,6 +310,7 @@ class ExchangeInstrument:
                 "reason": str,
                 "ts": float,
                 # Опционально для timeout-паузы:
+                "pause_timeout_sec": float,
                 "last_interval_stats": dict | None,
             }
 
@@ -207,19 +333,22 @@ class ExchangeInstrument:
         self.min_amount = None
         self.contract_size = None
         self.precision_amount = None
+        self._feed_lag_window = self.feed_lag_window_dict.setdefault(
+            self.exchange_id, deque(maxlen=self.FEED_LAG_WINDOW_SIZE)
+        )
+        self._feed_lag_stats = self.feed_lag_stats_dict.setdefault(
+            self.exchange_id, {"stale_dropped": 0, "lagging": 0, "no_timestamp": 0}
+        )
         if self.swap_raw_data_dict:
             self.update_swap_data()
 
     async def _publish_orderbook_event(self, event: dict[str, Any]) -> None:
-        """Положить торговое событие в основную очередь символа."""
-        try:
-            self.orderbook_queue.put_nowait(event)
-        except asyncio.QueueFull:
-            try:
-                _ = self.orderbook_queue.get_nowait()
-            except asyncio.QueueEmpty:
-                pass
-            await self.orderbook_queue.put(event)
+        """Положить торговое событие в основную очередь символа.
+
+        Очередь символа (`OrderbookMailbox`) не ограничена по размеру и сама
+        объединяет непрочитанные `orderbook_update` биржи.
+        """
+        self.orderbook_queue.put_nowait(event)
 
     def update_swap_data(self):
         """Обновить кэш параметров инструмента из `swap_raw_data_dict`.
@@ -236,22 +365,533 @@ class ExchangeInstrument:
         taker = swap_data.get('taker', None)
         self.fee = taker_fee if taker_fee is not None else taker
 
+    def _reset_stream_state(self) -> None:
+        """Сбросить состояние потока стакана перед началом подписки."""
+        self.count = 0
+        self.new_count = 0
+        # Отпечатки уровней, до которых дошёл последний расчёт лестницы
+        # (`OrderbookNormalizer.fingerprint`), и глубина этого расчёта по
+        # каждой стороне.
+        self._old_ask: tuple | None = None
+        self._old_bid: tuple | None = None
+        self._ask_fill_depth = 0
+        self._bid_fill_depth = 0
+        # Нормализатор биржи и число верхних уровней, переводимых в
+        # `CompactOrderbook` (не меньше двойной глубины исполнения).
+        self._normalizer = OrderbookNormalizer.get_normalizer(self.exchange_id)
+        self._compact_levels = max(self.COMPACT_MIN_LEVELS, self.PUBLISH_TOP_LEVELS)
+        self._old_ladder_notionals: list[Decimal] | None = None
+        # Последний увиденный `BalanceSnapshot.version` и лестница объёмов,
+        # пересобираемая только при смене `max_deal_volume`.
+        self._balance_version: int | None = None
+        self._max_deal_volume: Decimal | None = None
+        self._ladder_notionals: list[Decimal] | None = None
+        self._base_ladder_index = self.VWAP_LADDER_MULTIPLIERS.index(Decimal('1'))
+        self._recompute_stats: dict[str, int] | None = None
+
+        self.interval_stats = OrderbookIntervalStatsWindow(max_intervals=50, emit_timeout_sec=30.0)
+        self.latest_interval_stats = None
+        self.mean_dt = None
+        self.pause_reason: str | None = None
+        self.stream_timeout_paused_at: float | None = None
+        self.stream_timeout_resume_window_start: float | None = None
+        self.stream_timeout_resume_valid_ticks = 0
+        # Текущая политика `stream_timeout` (см. `_update_stream_policy`).
+        self.stream_pause_timeout_sec = self.STREAM_PAUSE_TIMEOUT_SEC
+        self.stream_resume_cooldown_sec = self.STREAM_TIMEOUT_RESUME_COOLDOWN_SEC
+        self.stream_resume_window_sec = self.STREAM_TIMEOUT_RESUME_WINDOW_SEC
+        # Момент последнего полученного стакана (`time.monotonic()`), по нему
+        # мультиплексор бирж отслеживает `stream_timeout` по каждому символу.
+        self.last_orderbook_ts: float | None = None
+        # Символ поставлен на паузу обрывом биржи и ждёт первого стакана.
+        self._awaiting_reconnect = False
+
+    async def start_stream(self) -> None:
+        """Подготовить источник к приёму стаканов.
+
+        Дожидается инициализации баланса биржи и регистрирует связку
+        `(exchange_id, symbol)` в class-level реестрах активности и счётчиков.
+        Вызывается один раз перед первым `process_orderbook`: из
+        `watch_orderbook` или из мультиплексора `ExchangeOrderbookFeed`.
+        """
+        self._reset_stream_state()
+        print(f"[{self.exchange_id}] START watch_orderbook for {self.symbol}")
+
+        await self.balance_manager.get_balance_instance(self.exchange_id).wait_initialized()
+
+        self.__class__.orderbook_updating_status_dict.setdefault(self.exchange_id, {})[self.symbol] = True
+        self.get_ex_orderbook_data_count.setdefault(self.exchange_id, {})[self.symbol] = 0
+        self._recompute_stats = self.__class__.orderbook_recompute_stats_dict.setdefault(
+            self.exchange_id, {"recomputed": 0, "skipped": 0}
+        )
+        self.connection_supervisor = ExchangeConnectionSupervisor.get_supervisor(self.exchange)
+        self.connection_supervisor.register(self)
+        # Глубина подписки по глубине исполнения лестницы и счётчик трафика биржи.
+        self.depth_policy = OrderbookDepthPolicy.get_policy(self.exchange_id, self.symbol)
+        ExchangeTrafficMeter.attach(self.exchange)
+        self.last_orderbook_ts = time.monotonic()
+
+    def is_streaming(self) -> bool:
+        """Проверить, что источник запущен и не остановлен."""
+        return self.__class__.orderbook_updating_status_dict.get(self.exchange_id, {}).get(self.symbol, False)
+
+    async def stop_stream(self, reason: str | None = None) -> None:
+        """Остановить источник.
+
+        Args:
+            reason: Если задана, символ-менеджер получает `exchange_stopped`
+                с этой причиной. Без причины источник просто помечается
+                неактивным (штатная отмена).
+        """
+        supervisor = getattr(self, "connection_supervisor", None)
+        if supervisor is not None:
+            supervisor.unregister(self)
+        depth_policy = getattr(self, "depth_policy", None)
+        if depth_policy is not None:
+            OrderbookDepthPolicy.remove_policy(self.exchange_id, self.symbol, depth_policy)
+        if reason is not None:
+            await self._publish_orderbook_event({
+                "type": "exchange_stopped",
+                "ts": time.monotonic(),
+                "symbol": self.symbol,
+                "exchange_id": self.exchange_id,
+                "reason": reason,
+            })
+        print(f"[{self.exchange_id}][STOPPED] watch_orderbook finished")
+        self.__class__.orderbook_updating_status_dict.setdefault(self.exchange_id, {})[self.symbol] = False
+
+    async def process_orderbook(self, orderbook: Any) -> None:
+        """Обработать стакан (`_process_orderbook`) и учесть время в `SymbolLoadMeter`."""
+        started = time.thread_time()
+        try:
+            await self._process_orderbook(orderbook)
+        finally:
+            SymbolLoadMeter.record(self.symbol, time.thread_time() - started)
+
+    async def _process_orderbook(self, orderbook: Any) -> None:
+        """Обработать очередной стакан и опубликовать событие для символа.
+
+        Валидирует структуру данных, при изменении уровней, до которых дошёл
+        последний расчёт, пересчитывает лестницу средних цен, ведёт состояние
+        паузы/восстановления источника и публикует `orderbook_update`.
+
+        Args:
+            orderbook: Стакан в формате ccxt (`{"asks": [...], "bids": [...], ...}`).
+        """
+        trace = LatencyTracer.start()
+        recorder = self.__class__.orderbook_recorder
+        if recorder is not None:
+            recorder.record(self.exchange_id, self.symbol, orderbook)
+
+        # Баланс читается из неизменяемого снимка: без блокировки и `await`,
+        # а при неизменной версии — без какой-либо работы.
+        balance_snapshot = self.balance_manager.get_balance_snapshot(self.exchange_id)
+        if balance_snapshot.version != self._balance_version:
+            self._apply_balance_snapshot(balance_snapshot)
+        max_deal_volume = self._max_deal_volume
+        self.last_orderbook_ts = time.monotonic()
+
+        # Проверки и отпечаток уровней работают с исходными списками; в
+        # `CompactOrderbook` стакан переводится только для пересчёта цен.
+        if not (
+            isinstance(orderbook, dict)
+            and isinstance(orderbook.get('asks'), list)
+            and isinstance(orderbook.get('bids'), list)
+        ):
+            print(f"[{self.exchange_id}] invalid orderbook {self.symbol}: no asks/bids lists")
+            await self._pause_invalid_orderbook()
+            return
+        asks = orderbook['asks']
+        bids = orderbook['bids']
+
+        if self._awaiting_reconnect:
+            self._awaiting_reconnect = False
+            self.connection_supervisor.report_recovered(self.symbol)
+
+        self.get_ex_orderbook_data_count[self.exchange_id][self.symbol] += 1
+        self.count += 1
+
+        self.latest_interval_stats = self.interval_stats.observe()
+        if self.latest_interval_stats is not None:
+            self._update_stream_policy()
+
+        # Свежесть по биржевому времени проверяется до сравнения уровней:
+        # неизменившийся, но устаревший стакан тоже должен снять биржу с расчёта.
+        feed_lag_ms = self._measure_feed_lag(orderbook.get('timestamp'))
+        # Отбрасываем только заведомо устаревший стакан: с учётом погрешности
+        # смещения часов, опубликованной `ClockSyncService`.
+        if (
+            feed_lag_ms is not None
+            and feed_lag_ms - exchange_clock_uncertainty_ms(self.exchange_id) > self.ORDERBOOK_MAX_AGE_MS
+        ):
+            self._feed_lag_stats["stale_dropped"] += 1
+            if self.pause_reason != "stale_orderbook":
+                self.pause_reason = "stale_orderbook"
+                await self._publish_orderbook_event({
+                    "type": "exchange_paused",
+                    "ts": time.monotonic(),
+                    "symbol": self.symbol,
+                    "exchange_id": self.exchange_id,
+                    "stream_status": "paused",
+                    "reason": self.pause_reason,
+                    "feed_lag_ms": feed_lag_ms,
+                })
+            return
+        lagging = feed_lag_ms is not None and feed_lag_ms > self.ORDERBOOK_LAG_WARN_MS
+        if lagging:
+            self._feed_lag_stats["lagging"] += 1
+
+        if not asks or not bids:
+            if self.pause_reason != "empty_orderbook":
+                self.pause_reason = "empty_orderbook"
+                await self._publish_orderbook_event({
+                    "type": "exchange_paused",
+                    "ts": time.monotonic(),
+                    "symbol": self.symbol,
+                    "exchange_id": self.exchange_id,
+                    "stream_status": "paused",
+                    "reason": self.pause_reason,
+                })
+            return
+
+        # Сравниваем только уровни, до которых дошёл последний
+        # расчёт лестницы: изменения глубже не влияют ни на одну
+        # цену, а изменения внутри всегда дают пересчёт.
+        ladder_notionals = self._ladder_notionals
+        new_ask = self._normalizer.fingerprint(asks, self._ask_fill_depth)
+        new_bid = self._normalizer.fingerprint(bids, self._bid_fill_depth)
+
+        # В обычном режиме пересчитываем только при реальном
+        # изменении этих уровней или объёма сделки. После паузы
+        # делаем принудительный пересчёт на первом же валидном
+        # сообщении, даже если уровни совпали с последним
+        # состоянием до паузы.
+        #
+        # Это нужно по двум причинам:
+        # 1. Для non-timeout пауз можно быстро понять, что источник
+        #    снова пригоден к торговому расчёту.
+        # 2. Для timeout-паузы это сообщение участвует в счётчике
+        #    подтверждения восстановления потока.
+        if (
+            self.pause_reason is None
+            and new_ask is not None
+            and new_ask == self._old_ask
+            and new_bid == self._old_bid
+            and ladder_notionals is self._old_ladder_notionals
+        ):
+            self._recompute_stats["skipped"] += 1
+            return
+
+        try:
+            book = self._normalizer.normalize(orderbook, self.symbol, self._compact_levels)
+        except ValueError as e:
+            print(f"[{self.exchange_id}] invalid orderbook {self.symbol}: {e}")
+            await self._pause_invalid_orderbook()
+            return
+
+        self.new_count += 1
+        self._recompute_stats["recomputed"] += 1
+
+        # Вся лестница объёмов считается за один проход
+        # по стакану на каждую сторону.
+        ladder_asks, new_ask_fill_depth = self._compute_ladder_side(book.asks, ladder_notionals, is_ask=True)
+        ladder_bids, new_bid_fill_depth = self._compute_ladder_side(book.bids, ladder_notionals, is_ask=False)
+        if (
+            (new_ask_fill_depth > len(book.asks) and book.asks.truncated)
+            or (new_bid_fill_depth > len(book.bids) and book.bids.truncated)
+        ):
+            # Исполнению не хватило переведённых уровней, а исходный стакан
+            # глубже: переводим его целиком и считаем заново.
+            self._normalizer.expand(book, orderbook)
+            ladder_asks, new_ask_fill_depth = self._compute_ladder_side(book.asks, ladder_notionals, is_ask=True)
+            ladder_bids, new_bid_fill_depth = self._compute_ladder_side(book.bids, ladder_notionals, is_ask=False)
+        average_ask = ladder_asks[self._base_ladder_index]
+        average_bid = ladder_bids[self._base_ladder_index]
+
+        # Глубина исполнения выбирает лимит подписки: стакан, обрезанный
+        # лимитом и не покрывший объём, поднимает лимит до паузы ниже.
+        if self.depth_policy.observe(
+            new_ask_fill_depth, new_bid_fill_depth, book.asks.total_levels, book.bids.total_levels
+        ):
+            print(
+                f"[{self.exchange_id}][DEPTH] {self.symbol}: subscription limit -> "
+                f"{self.depth_policy.limit or 'default'} "
+                f"(fill depth ask={new_ask_fill_depth}, bid={new_bid_fill_depth})"
+            )
+
+        # Публикуем только полные данные:
+        # обе стороны (ask и bid) должны быть рассчитаны.
+        if average_ask is None or average_bid is None:
+            if self.pause_reason != "insufficient_volume":
+                print(
+                    f"[{self.exchange_id}] PAUSE insufficient volume: "
+                    f"symbol={self.symbol}, money={max_deal_volume}"
+                )
+                self.pause_reason = "insufficient_volume"
+                await self._publish_orderbook_event({
+                    "type": "exchange_paused",
+                    "ts": time.monotonic(),
+                    "symbol": self.symbol,
+                    "exchange_id": self.exchange_id,
+                    "stream_status": "paused",
+                    "reason": self.pause_reason,
+                })
+            return
+
+        if self.pause_reason is not None:
+            now = time.monotonic()
+            if self.pause_reason == "stream_timeout":
+                # Resume после timeout делаем с гистерезисом:
+                # сначала cooldown, затем окно подтверждения
+                # потока с минимумом валидных стаканов.
+                if self.stream_timeout_paused_at is None:
+                    self.stream_timeout_paused_at = now
+
+                if now - self.stream_timeout_paused_at < self.stream_resume_cooldown_sec:
+                    return
+
+                if (
+                    self.stream_timeout_resume_window_start is None
+                    or now - self.stream_timeout_resume_window_start > self.stream_resume_window_sec
+                ):
+                    self.stream_timeout_resume_window_start = now
+                    self.stream_timeout_resume_valid_ticks = 0
+
+                self.stream_timeout_resume_valid_ticks += 1
+                if self.stream_timeout_resume_valid_ticks < self.STREAM_TIMEOUT_RESUME_TICKS_REQUIRED:
+                    return
+
+                resume_reason = "stream_recovered"
+            elif self.pause_reason == "connection_lost":
+                resume_reason = "connection_recovered"
+            else:
+                resume_reason = "data_recovered"
+
+            self.pause_reason = None
+            self.stream_timeout_paused_at = None
+            self.stream_timeout_resume_window_start = None
+            self.stream_timeout_resume_valid_ticks = 0
+            await self._publish_orderbook_event({
+                "type": "exchange_resumed",
+                "ts": now,
+                "symbol": self.symbol,
+                "exchange_id": self.exchange_id,
+                "stream_status": "ok",
+                "reason": resume_reason,
+            })
+
+        if self.latest_interval_stats:
+            self.mean_dt = self.latest_interval_stats["mean_dt"]
+
+        output_data = {
+            "type": "orderbook_update",
+            "ts": time.monotonic(),
+            "symbol": self.symbol,
+            "exchange_id": self.exchange_id,
+            "count": self.count,
+            "new_count": self.new_count,
+            "average_ask": average_ask,
+            "average_bid": average_bid,
+            "ladder": [
+                {
+                    "multiplier": multiplier,
+                    "notional": notional,
+                    "average_ask": ladder_ask,
+                    "average_bid": ladder_bid,
+                }
+                for multiplier, notional, ladder_ask, ladder_bid in zip(
+                    self.VWAP_LADDER_MULTIPLIERS, ladder_notionals, ladder_asks, ladder_bids
+                )
+            ],
+            "stream_status": "ok",
+            "mean_dt": self.mean_dt,
+            "feed_lag_ms": feed_lag_ms,
+            "lagging": lagging,
+        }
+        if self.PUBLISH_TOP_LEVELS:
+            output_data["asks"] = book.asks.to_levels(self.PUBLISH_TOP_LEVELS)
+            output_data["bids"] = book.bids.to_levels(self.PUBLISH_TOP_LEVELS)
+
+        # Глубина исполнения могла сместиться, поэтому
+        # отпечаток снимаем заново по новой глубине.
+        self._ask_fill_depth = new_ask_fill_depth
+        self._bid_fill_depth = new_bid_fill_depth
+        self._old_ask = self._normalizer.fingerprint(asks, self._ask_fill_depth)
+        self._old_bid = self._normalizer.fingerprint(bids, self._bid_fill_depth)
+        self._compact_levels = max(
+            self.COMPACT_MIN_LEVELS, self.PUBLISH_TOP_LEVELS, 2 * max(new_ask_fill_depth, new_bid_fill_depth)
+        )
+        self._old_ladder_notionals = ladder_notionals
+
+        if trace is not None:
+            LatencyTracer.mark(trace, "vwap")
+            output_data[TRACE_KEY] = trace
+        await self._publish_orderbook_event(output_data)
+
+    async def _pause_invalid_orderbook(self) -> None:
+        """Поставить биржу символа на паузу `invalid_orderbook` (один раз)."""
+        if self.pause_reason != "invalid_orderbook":
+            self.pause_reason = "invalid_orderbook"
+            await self._publish_orderbook_event({
+                "type": "exchange_paused",
+                "ts": time.monotonic(),
+                "symbol": self.symbol,
+                "exchange_id": self.exchange_id,
+                "stream_status": "paused",
+                "reason": self.pause_reason,
+            })
+
+    def _compute_ladder_side(
+            self, side: CompactOrderbookSide, ladder_notionals: list[Decimal], *, is_ask: bool
+    ) -> tuple[list[Decimal | None], int]:
+        """Лестница средних цен одной стороны и глубина её исполнения."""
+        return get_average_orderbook_price_ladder(
+            side, ladder_notionals,
+            is_ask=is_ask, log=True,
+            exchange=self.exchange_id, symbol=self.symbol, with_depth=True
+        )
+
+    def _measure_feed_lag(self, timestamp: int | None) -> float | None:
+        """Задержка стакана в мс: время биржи сейчас минус его `timestamp`.
+
+        Время биржи — локальные часы ccxt плюс смещение, найденное
+        `time_sync` (`options['timeDifference']`). Значение попадает в окно
+        перцентилей биржи.
+
+        Returns:
+            `None`, если биржа не передала `timestamp`.
+        """
+        if timestamp is None:
+            self._feed_lag_stats["no_timestamp"] += 1
+            return None
+        feed_lag_ms = float(self.exchange.milliseconds() + exchange_time_offset_ms(self.exchange) - timestamp)
+        self._feed_lag_window.append(feed_lag_ms)
+        return feed_lag_ms
+
+    @classmethod
+    def feed_lag_summary(cls) -> dict[str, dict[str, Any]]:
+        """Перцентили задержки потока и счётчики свежести по биржам (мс)."""
+        result = {}
+        for exchange_id, window in cls.feed_lag_window_dict.items():
+            values = sorted(window)
+            summary: dict[str, Any] = dict(cls.feed_lag_stats_dict.get(exchange_id, {}))
+            summary["count"] = len(values)
+            for name, q in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99)):
+                summary[name] = round(values[min(len(values) - 1, int(q * len(values)))], 1) if values else None
+            summary["max"] = round(values[-1], 1) if values else None
+            result[exchange_id] = summary
+        return result
+
+    def _apply_balance_snapshot(self, snapshot) -> None:
+        """Принять новую версию `BalanceSnapshot`.
+
+        Лестница объёмов пересобирается (и тем самым вызывает пересчёт VWAP)
+        только при смене `max_deal_volume`, а не на любом изменении баланса.
+        """
+        self._balance_version = snapshot.version
+        if not snapshot.is_valid:
+            # НЕ останавливаем обработку — только предупреждаем один раз на версию.
+            cprint.warning_r(
+                f"[{self.exchange_id}] balance invalid, but continuing; current_balance={snapshot.balance}"
+            )
+        if snapshot.max_deal_volume != self._max_deal_volume or self._ladder_notionals is None:
+            self._max_deal_volume = snapshot.max_deal_volume
+            if snapshot.max_deal_volume is None:
+                self._ladder_notionals = None
+            else:
+                self._ladder_notionals = [snapshot.max_deal_volume * m for m in self.VWAP_LADDER_MULTIPLIERS]
+
+    def _update_stream_policy(self) -> None:
+        """Пересчитать таймаут тишины и параметры resume по p99 интервалов окна.
+
+        Вызывается при публикации снимка статистики интервалов, а не на каждом
+        тике. Пока интервалов в окне меньше `STREAM_POLICY_MIN_INTERVALS`,
+        действуют фиксированные значения по умолчанию.
+        """
+        if self.interval_stats.size < self.STREAM_POLICY_MIN_INTERVALS:
+            return
+        p99_dt = self.interval_stats.percentile(0.99)
+        if p99_dt is None:
+            return
+        self.stream_pause_timeout_sec = min(
+            self.STREAM_PAUSE_TIMEOUT_MAX_SEC,
+            max(self.STREAM_PAUSE_TIMEOUT_MIN_SEC, self.STREAM_PAUSE_TIMEOUT_P99_FACTOR * p99_dt),
+        )
+        self.stream_resume_cooldown_sec = min(
+            self.STREAM_TIMEOUT_RESUME_COOLDOWN_SEC,
+            max(
+                self.STREAM_TIMEOUT_RESUME_COOLDOWN_MIN_SEC,
+                self.STREAM_TIMEOUT_RESUME_COOLDOWN_FACTOR * self.stream_pause_timeout_sec,
+            ),
+        )
+        self.stream_resume_window_sec = min(
+            self.STREAM_TIMEOUT_RESUME_WINDOW_MAX_SEC,
+            max(
+                self.STREAM_TIMEOUT_RESUME_WINDOW_MIN_SEC,
+                self.STREAM_TIMEOUT_RESUME_WINDOW_P99_FACTOR * p99_dt * self.STREAM_TIMEOUT_RESUME_TICKS_REQUIRED,
+            ),
+        )
+
+    async def handle_connection_lost(self) -> None:
+        """Пауза `connection_lost` на время обрыва биржи (`ExchangeConnectionSupervisor`).
+
+        Пауза `stream_timeout` не перекрывается: её восстановление остаётся
+        с гистерезисом. Первый стакан после обрыва снимает паузу
+        `connection_lost` сразу (`connection_recovered`).
+        """
+        self._awaiting_reconnect = True
+        if self.pause_reason in ("connection_lost", "stream_timeout"):
+            return
+        self.pause_reason = "connection_lost"
+        await self._publish_orderbook_event({
+            "type": "exchange_paused",
+            "ts": time.monotonic(),
+            "symbol": self.symbol,
+            "exchange_id": self.exchange_id,
+            "stream_status": "paused",
+            "reason": self.pause_reason,
+        })
+
+    async def handle_stream_timeout(self) -> None:
+        """Перевести источник в паузу `stream_timeout`, если он ещё не в ней."""
+        if self.pause_reason == "stream_timeout":
+            return
+        self.stream_timeout_paused_at = time.monotonic()
+        self.stream_timeout_resume_window_start = None
+        self.stream_timeout_resume_valid_ticks = 0
+        self.pause_reason = "stream_timeout"
+        timeout_event = {
+            "type": "exchange_paused",
+            "ts": self.stream_timeout_paused_at,
+            "symbol": self.symbol,
+            "exchange_id": self.exchange_id,
+            "stream_status": "paused",
+            "reason": self.pause_reason,
+            "pause_timeout_sec": self.stream_pause_timeout_sec,
+        }
+        if self.latest_interval_stats is not None:
+            timeout_event["last_interval_stats"] = self.latest_interval_stats
+        await self._publish_orderbook_event(timeout_event)
+
     async def watch_orderbook(self):
         """Непрерывно читать ордербук, считать средние цены и публиковать события.
 
         Метод работает как основной цикл подписки для одной связки
-        `(exchange_id, symbol)`.
+        `(exchange_id, symbol)`. Используется, когда биржа не обслуживается
+        мультиплексором `ExchangeOrderbookFeed`.
 
         Поток работы:
         1. Дождаться инициализации баланса биржи.
-        2. В цикле получать очередной ордербук из `watchOrderBook`.
-        3. Валидировать структуру данных.
-        4. Если top-N ордербук изменился, пересчитать `average_ask` и
-           `average_bid`.
-        5. Отправить событие `orderbook_update` в `orderbook_queue`.
-        6. При деградации источника публиковать `exchange_paused`.
-        7. При восстановлении потока публиковать `exchange_resumed`.
-        8. При временных сетевых ошибках пробовать reconnect с backoff.
+        2. В цикле получать очередной ордербук из `watchOrderBook` с лимитом
+           глубины `OrderbookDepthPolicy` связки.
+        3. Передать его в `process_orderbook`: валидация, пересчёт лестницы
+           `VWAP_LADDER_MULTIPLIERS` при изменении уровней, до которых дошёл
+           последний расчёт, публикация `orderbook_update`.
+        4. При деградации источника публиковать `exchange_paused`.
+        5. При восстановлении потока публиковать `exchange_resumed`.
+        6. При временных сетевых ошибках переподписываться через
+           `ExchangeConnectionSupervisor` биржи: общий backoff с jitter и
+           слоты переподписки батчами.
 
         Notes:
             Метод не считает арбитраж напрямую. Он только поставляет валидные
@@ -261,225 +901,48 @@ class ExchangeInstrument:
             интервалов. Это вспомогательное поле для downstream-логики и
             диагностики, но не отдельный event stream.
             Для причины `stream_timeout` восстановление делается с гистерезисом:
-            после паузы выдерживается cooldown 5 минут, затем в окне 30 секунд
-            должно прийти минимум 3 валидных стакана.
+            после паузы выдерживается cooldown, затем в окне подтверждения
+            должно прийти `STREAM_TIMEOUT_RESUME_TICKS_REQUIRED` валидных
+            стаканов. Таймаут тишины, cooldown и окно считаются по p99
+            интервалов между тиками связки (`_update_stream_policy`).
             Это нормальная идея для торговой логики, если важнее не скорость
             возврата биржи, а защита от "дребезга" paused/resumed на рваном
             потоке. Цена такого решения: источник будет возвращаться в расчёт
             медленнее даже после честного восстановления канала.
         """
-        max_reconnect_attempts = 5
+        stop_reason = None
+        subscribed_limit = None
         reconnect_attempts = 0
-        count = 0
-        new_count = 0
-        old_ask = tuple()
-        old_bid = tuple()
-
-        interval_stats = OrderbookIntervalStatsWindow(max_intervals=50, emit_timeout_sec=30.0)
-        latest_interval_stats = None
-        mean_dt = None
-        pause_reason: str | None = None
-        stream_timeout_paused_at: float | None = None
-        stream_timeout_resume_window_start: float | None = None
-        stream_timeout_resume_valid_ticks = 0
 
         try:
-            print(f"[{self.exchange_id}] START watch_orderbook for {self.symbol}")
-
-            await self.balance_manager.get_balance_instance(self.exchange_id).wait_initialized()
+            await self.start_stream()
 
-            self.__class__.orderbook_updating_status_dict.setdefault(self.exchange_id, {})[self.symbol] = True
-            self.get_ex_orderbook_data_count.setdefault(self.exchange_id, {})[self.symbol] = 0
+            while self.is_streaming():
 
-            while self.__class__.orderbook_updating_status_dict[self.exchange_id][self.symbol]:
+                # Лимит сменился (`OrderbookDepthPolicy`): старая подписка
+                # снимается, следующий вызов подписывается с новым лимитом.
+                limit = self.depth_policy.limit
+                if limit != subscribed_limit:
+                    await unwatch_orderbook(self.exchange, [self.symbol], subscribed_limit)
+                    subscribed_limit = limit
 
                 try:
-                    bm = self.balance_manager.get_balance_instance(self.exchange_id)
-
-                    if not await bm.is_balance_valid():
-                        bal = await bm.get_balance()
-                        cprint.warning_r(
-                            f"[{self.exchange_id}] balance invalid, but continuing; current_balance={bal}"
-                        )
-                        # НЕ continue — просто читаем стакан дальше
-
-                    max_deal_volume = self.balance_manager.max_deal_volume
-
                     # --- WebSocket ---
                     # Блокирующее ожидание нового стакана с контролем таймаута
                     # деградации канала. Если данных нет слишком долго, биржа
                     # временно исключается из поиска сигнала.
-                    orderbook = await asyncio.wait_for(
-                        self.exchange.watchOrderBook(self.symbol),
-                        timeout=self.STREAM_PAUSE_TIMEOUT_SEC,
-                    )
-
-                    #
-                    if not isinstance(orderbook, dict) or 'asks' not in orderbook or 'bids' not in orderbook:
-                        if pause_reason != "invalid_orderbook":
-                            pause_reason = "invalid_orderbook"
-                            await self._publish_orderbook_event({
-                                "type": "exchange_paused",
-                                "ts": time.monotonic(),
-                                "symbol": self.symbol,
-                                "exchange_id": self.exchange_id,
-                                "stream_status": "paused",
-                                "reason": pause_reason,
-                            })
-                        continue
-
-                    self.get_ex_orderbook_data_count[self.exchange_id][self.symbol] += 1
-                    reconnect_attempts = 0
-                    count += 1
-
-                    latest_interval_stats = interval_stats.observe()
-
-                    depth = min(10, len(orderbook['asks']), len(orderbook['bids']))
-                    if depth == 0:
-                        if pause_reason != "empty_orderbook":
-                            pause_reason = "empty_orderbook"
-                            await self._publish_orderbook_event({
-                                "type": "exchange_paused",
-                                "ts": time.monotonic(),
-                                "symbol": self.symbol,
-                                "exchange_id": self.exchange_id,
-                                "stream_status": "paused",
-                                "reason": pause_reason,
-                            })
-                        continue
-
-                    new_ask = tuple(map(tuple, orderbook['asks'][:depth]))
-                    new_bid = tuple(map(tuple, orderbook['bids'][:depth]))
-
-                    # В обычном режиме пересчитываем только при реальном
-                    # изменении top-N стакана. После паузы делаем принудительный
-                    # пересчёт на первом же валидном сообщении, даже если top-N
-                    # совпал с последним состоянием до паузы.
-                    #
-                    # Это нужно по двум причинам:
-                    # 1. Для non-timeout пауз можно быстро понять, что источник
-                    #    снова пригоден к торговому расчёту.
-                    # 2. Для timeout-паузы это сообщение участвует в счётчике
-                    #    подтверждения восстановления потока.
-                    if pause_reason is not None or new_ask != old_ask or new_bid != old_bid:
-                        # print(f"[{self.exchange_id}] CHANGE depth10")
-                        new_count += 1
-
-                        try:
-                            average_ask = get_average_orderbook_price(
-                                orderbook['asks'], money=max_deal_volume,
-                                is_ask=True, log=True,
-                                exchange=self.exchange_id, symbol=self.symbol
-                            )
-                            average_bid = get_average_orderbook_price(
-                                orderbook['bids'], money=max_deal_volume,
-                                is_ask=False, log=True,
-                                exchange=self.exchange_id, symbol=self.symbol
-                            )
-                        except InsufficientOrderBookVolumeError as e:
-                            if pause_reason != "insufficient_volume":
-                                print(f"[{self.exchange_id}] PAUSE insufficient volume: {e}")
-                                pause_reason = "insufficient_volume"
-                                await self._publish_orderbook_event({
-                                    "type": "exchange_paused",
-                                    "ts": time.monotonic(),
-                                    "symbol": self.symbol,
-                                    "exchange_id": self.exchange_id,
-                                    "stream_status": "paused",
-                                    "reason": pause_reason,
-                                })
-                            continue
-
-                        # Публикуем только полные данные:
-                        # обе стороны (ask и bid) должны быть рассчитаны.
-                        if average_ask is not None and average_bid is not None:
-                            if pause_reason is not None:
-                                now = time.monotonic()
-                                if pause_reason == "stream_timeout":
-                                    # Resume после timeout делаем с гистерезисом:
-                                    # сначала cooldown, затем окно подтверждения
-                                    # потока с минимумом валидных стаканов.
-                                    if stream_timeout_paused_at is None:
-                                        stream_timeout_paused_at = now
-
-                                    if now - stream_timeout_paused_at < self.STREAM_TIMEOUT_RESUME_COOLDOWN_SEC:
-                                        continue
-
-                                    if (
-                                        stream_timeout_resume_window_start is None
-                                        or now - stream_timeout_resume_window_start > self.STREAM_TIMEOUT_RESUME_WINDOW_SEC
-                                    ):
-                                        stream_timeout_resume_window_start = now
-                                        stream_timeout_resume_valid_ticks = 0
-
-                                    stream_timeout_resume_valid_ticks += 1
-                                    if stream_timeout_resume_valid_ticks < self.STREAM_TIMEOUT_RESUME_TICKS_REQUIRED:
-                                        continue
-
-                                    pause_reason = None
-                                    stream_timeout_paused_at = None
-                                    stream_timeout_resume_window_start = None
-                                    stream_timeout_resume_valid_ticks = 0
-                                    await self._publish_orderbook_event({
-                                        "type": "exchange_resumed",
-                                        "ts": now,
-                                        "symbol": self.symbol,
-                                        "exchange_id": self.exchange_id,
-                                        "stream_status": "ok",
-                                        "reason": "stream_recovered",
-                                    })
-                                else:
-                                    pause_reason = None
-                                    stream_timeout_paused_at = None
-                                    stream_timeout_resume_window_start = None
-                                    stream_timeout_resume_valid_ticks = 0
-                                    await self._publish_orderbook_event({
-                                        "type": "exchange_resumed",
-                                        "ts": now,
-                                        "symbol": self.symbol,
-                                        "exchange_id": self.exchange_id,
-                                        "stream_status": "ok",
-                                        "reason": "data_recovered",
-                                    })
-
-                            if latest_interval_stats:
-                                mean_dt = latest_interval_stats["mean_dt"]
-
-                            output_data = {
-                                "type": "orderbook_update",
-                                "ts": time.monotonic(),
-                                "symbol": self.symbol,
-                                "exchange_id": self.exchange_id,
-                                "count": count,
-                                "new_count": new_count,
-                                "average_ask": average_ask,
-                                "average_bid": average_bid,
-                                "stream_status": "ok",
-                                "mean_dt": mean_dt,
-                            }
-
-                            old_ask = new_ask
-                            old_bid = new_bid
-
-                            await self._publish_orderbook_event(output_data)
+                    # `asyncio.timeout`, а не `wait_for`: в Python 3.11
+                    # `wait_for` теряет отмену, если стакан пришёл в момент
+                    # отмены задачи, и остановка воркера зависает.
+                    async with asyncio.timeout(self.stream_pause_timeout_sec):
+                        orderbook = await self.exchange.watchOrderBook(self.symbol, limit)
+                    if reconnect_attempts:
+                        reconnect_attempts = 0
+                        self.connection_supervisor.report_resubscribed(self)
+                    await self.process_orderbook(orderbook)
 
                 except TimeoutError:
-                    if pause_reason != "stream_timeout":
-                        stream_timeout_paused_at = time.monotonic()
-                        stream_timeout_resume_window_start = None
-                        stream_timeout_resume_valid_ticks = 0
-                        pause_reason = "stream_timeout"
-                        timeout_event = {
-                            "type": "exchange_paused",
-                            "ts": stream_timeout_paused_at,
-                            "symbol": self.symbol,
-                            "exchange_id": self.exchange_id,
-                            "stream_status": "paused",
-                            "reason": pause_reason,
-                        }
-                        if latest_interval_stats is not None:
-                            timeout_event["last_interval_stats"] = latest_interval_stats
-                        await self._publish_orderbook_event(timeout_event)
+                    await self.handle_stream_timeout()
                     continue
 
                 except Exception as e:
@@ -489,20 +952,18 @@ class ExchangeInstrument:
                     import traceback
                     traceback.print_exc()
 
-                    transient_errors = [
-                        '1000', 'closed by remote server', 'Cannot write to closing transport',
-                        'Connection closed', 'WebSocket is already closing', 'Transport closed',
-                        'broken pipe', 'reset by peer'
-                    ]
-
-                    is_transient = any(x in str(e) for x in transient_errors)
+                    is_transient = is_transient_stream_error(e)
                     print(f"[{self.exchange_id}][TRANSIENT_MATCH] {is_transient}")
 
                     if is_transient:
-                        reconnect_attempts += 1
+                        # Backoff общий на биржу: супервизор ставит на паузу
+                        # все символы биржи один раз и раздаёт слоты
+                        # переподписки батчами.
+                        supervisor = self.connection_supervisor
+                        reconnect_attempts = await supervisor.report_failure(self, e)
                         print(f"[{self.exchange_id}][RECONNECT] attempt {reconnect_attempts}")
 
-                        if reconnect_attempts > max_reconnect_attempts:
+                        if reconnect_attempts > supervisor.MAX_RECONNECT_ATTEMPTS:
                             print(f"[{self.exchange_id}][RECONNECT_LIMIT] exceeded")
                             raise ReconnectLimitExceededError(
                                 exchange_id=self.exchange.id,
@@ -510,7 +971,7 @@ class ExchangeInstrument:
                                 attempts=reconnect_attempts
                             )
 
-                        await asyncio.sleep(4 + (2 ** reconnect_attempts))
+                        await supervisor.wait_for_resubscribe(self)
                         continue
 
                     print(f"[{self.exchange_id}][FATAL_ERROR] stopping")
@@ -520,17 +981,10 @@ class ExchangeInstrument:
             print(f"[{self.exchange_id}][FATAL] watch_orderbook crashed: {repr(e)}")
             import traceback
             traceback.print_exc()
-            await self._publish_orderbook_event({
-                "type": "exchange_stopped",
-                "ts": time.monotonic(),
-                "symbol": self.symbol,
-                "exchange_id": self.exchange_id,
-                "reason": "fatal_watch_orderbook_error",
-            })
+            stop_reason = "fatal_watch_orderbook_error"
 
         finally:
-            print(f"[{self.exchange_id}][STOPPED] watch_orderbook finished")
-            self.__class__.orderbook_updating_status_dict.setdefault(self.exchange_id, {})[self.symbol] = False
+            await self.stop_stream(stop_reason)
 
 
 class ArbitrageManager:
@@ -561,6 +1015,41 @@ class ArbitrageManager:
     web_grid_process = None
     web_grid_rows: dict[str, dict[str, Any]] = {}
     web_grid_event_mode = "snapshot"
+    # Таблица стаканов в общей памяти (топология `shared_feeds`). Если задана,
+    # символ-менеджер не запускает свои подписки: события приходят из
+    # `_shared_orderbook_reader_loop`.
+    shared_orderbook_table = None
+    # Опрос таблицы символов воркера (`_shared_orderbook_reader_loop`);
+    # `start_symbol`/`stop_symbol` меняют его набор строк.
+    shared_orderbook_reader: SharedOrderbookReader | None = None
+    # Векторный расчёт спреда по всем символам воркера (режим
+    # `spread_engine_mode="vectorized"`). Если задан, символ-менеджер только
+    # пишет цены в движок, а строки таблицы отправляет `run_spread_engine`.
+    spread_engine: CrossSymbolSpreadEngine | None = None
+    # Лучшие K строк воркера (режим `web_grid_event_mode="event"`). Если
+    # задан, в агрегатор уходят только события по строкам, входящим в
+    # лучшие K; остальные строки хранятся в `web_grid_rows`.
+    top_opportunities: TopOpportunityBook | None = None
+    # Строка символа видна в таблице, пока `open_ratio` (%) выше порога.
+    # `open_ratio` — чистый: после taker-комиссий обеих ног (`_fee_factors`).
+    MIN_OPEN_RATIO = Decimal("0.1")
+    # Окно (в тиках пары) и коэффициент EMA статистик спреда пары бирж
+    # (`ArbitragePair`), по которым в строке таблицы `spread_z`/`spread_ema`.
+    SPREAD_WINDOW_SIZE = 120
+    SPREAD_EMA_ALPHA = 0.15
+    # Учитывать в чистом `open_ratio` ставку финансирования за один период
+    # (в топологии `shared_feeds` ставки не загружаются).
+    INCLUDE_FUNDING = False
+    # Символы, остановленные циклом символа (`_shutdown_symbol_arbitrage`,
+    # например, после остановки потоков бирж): {symbol: {"retired_at",
+    # "retries", "reason"}}. `readmit_due_symbols` возвращает их в работу
+    # через `SYMBOL_READMIT_COOLDOWN_SEC`; повторная остановка вскоре после
+    # допуска удваивает паузу (не больше `SYMBOL_READMIT_MAX_COOLDOWN_SEC`).
+    retired_symbol_dict: dict[str, dict[str, Any]] = {}
+    # {symbol: (время допуска, retries)} — для удвоения паузы.
+    _readmitted_symbol_dict: dict[str, tuple[float, int]] = {}
+    SYMBOL_READMIT_COOLDOWN_SEC = 300.0
+    SYMBOL_READMIT_MAX_COOLDOWN_SEC = 3600.0
 
     _configured = False
 
@@ -571,7 +1060,7 @@ class ArbitrageManager:
         return f"{float(mean_dt):.3f}"
 
     @classmethod
-    def _push_web_grid_snapshot(cls) -> None:
+    def _push_web_grid_snapshot(cls, trace: list[float] | None = None) -> None:
         if cls.web_grid_event_mode != "snapshot":
             return
         sorted_rows = sorted(
@@ -587,7 +1076,10 @@ class ArbitrageManager:
                 3: {"text": "ask_mean_dt", "align": "right"},
                 4: {"text": "bid_ex", "align": "left"},
                 5: {"text": "bid_mean_dt", "align": "right"},
-                6: {"text": "open_ratio", "align": "right"},
+                6: {"text": "deal_usdt", "align": "right"},
+                7: {"text": "net_ratio", "align": "right"},
+                8: {"text": "spread_z", "align": "right"},
+                9: {"text": "spread_ema", "align": "right"},
             }
         }
 
@@ -599,8 +1091,13 @@ class ArbitrageManager:
                 3: {"text": row["ask_mean_dt"], "align": "right"},
                 4: {"text": row["bid_exchange"], "align": "left"},
                 5: {"text": row["bid_mean_dt"], "align": "right"},
-                6: {"text": row["open_ratio"], "align": "right"},
+                6: {"text": row.get("deal_notional", "-"), "align": "right"},
+                7: {"text": row["open_ratio"], "align": "right"},
+                8: {"text": row.get("spread_z", "-"), "align": "right"},
+                9: {"text": row.get("spread_ema", "-"), "align": "right"},
             }
+        if trace is not None:
+            grid_data[TRACE_KEY] = trace
 
         cls.web_grid_table_queue.put(grid_data)
 
@@ -614,27 +1111,135 @@ class ArbitrageManager:
         bid_exchange: str,
         bid_mean_dt: float | None,
         open_ratio: Decimal,
-    ) -> None:
+        deal_notional: Decimal | None = None,
+        spread_zscore: float | None = None,
+        spread_ema: float | None = None,
+        trace: list[float] | None = None,
+        only_changed: bool = False,
+    ) -> bool:
+        """Записать строку символа и отправить её в таблицу.
+
+        С `top_opportunities` строка уходит в агрегатор, только если она в
+        лучших K; вытесненная ею строка убирается из агрегатора.
+
+        Args:
+            spread_zscore: z-score последнего спреда направления в окне
+                `SPREAD_WINDOW_SIZE`.
+            spread_ema: EMA спреда направления, %.
+            only_changed: Не отправлять строку, совпадающую с уже
+                отправленной.
+
+        Returns:
+            `True`, если строка записана.
+        """
         row_data = {
             "symbol": symbol,
             "ask_exchange": ask_exchange,
             "ask_mean_dt": cls._format_mean_dt(ask_mean_dt),
             "bid_exchange": bid_exchange,
             "bid_mean_dt": cls._format_mean_dt(bid_mean_dt),
+            "deal_notional": "-" if deal_notional is None else f"{round_down(deal_notional, 2)}",
             "open_ratio": f"{open_ratio}%",
             "open_ratio_value": float(open_ratio),
+            "spread_z": "-" if spread_zscore is None else f"{spread_zscore:.1f}",
+            "spread_ema": "-" if spread_ema is None else f"{spread_ema:.2f}%",
         }
+        if only_changed and cls.web_grid_rows.get(symbol) == row_data:
+            return False
         cls.web_grid_rows[symbol] = row_data
+        LatencyTracer.mark(trace, "upsert")
 
         if cls.web_grid_event_mode == "event":
-            cls.web_grid_table_queue.put({
-                "grid_event": "upsert_row",
-                "symbol": symbol,
-                "row": row_data,
-            })
-            return
+            book = cls.top_opportunities
+            if book is None:
+                cls._put_web_grid_event("upsert_row", symbol, trace=trace)
+                return True
+            entered, left = book.upsert(symbol, row_data["open_ratio_value"])
+            cls._forward_top_changes([key for key in entered if key != symbol], left)
+            if book.is_top(symbol):
+                cls._put_web_grid_event("upsert_row", symbol, trace=trace)
+            return True
+
+        cls._push_web_grid_snapshot(trace=trace)
+        return True
 
-        cls._push_web_grid_snapshot()
+    @classmethod
+    def _put_web_grid_event(
+        cls, grid_event: str, symbol: str, *, trace: list[float] | None = None, promoted: bool = False,
+    ) -> None:
+        item = {
+            "grid_event": grid_event,
+            "symbol": symbol,
+        }
+        if grid_event == "upsert_row":
+            item["row"] = cls.web_grid_rows[symbol]
+        if promoted:
+            # Строка не менялась, а вошла в лучшие K после чужого изменения.
+            item["promoted"] = True
+        if trace is not None:
+            item[TRACE_KEY] = trace
+        cls.web_grid_table_queue.put(item)
+
+    @classmethod
+    def _forward_top_changes(cls, entered: list[str], left: list[str]) -> None:
+        """Отправить агрегатору выход и вход строк в лучшие K."""
+        for symbol in left:
+            cls._put_web_grid_event("remove_row", symbol)
+        for symbol in entered:
+            cls._put_web_grid_event("upsert_row", symbol, promoted=True)
+
+    @classmethod
+    def _apply_best_step(
+        cls,
+        symbol: str,
+        best_step: dict[str, Any] | None,
+        *,
+        trace: list[float] | None = None,
+        only_changed: bool = False,
+    ) -> bool:
+        """Отправить строку символа по лучшей ступени либо убрать её.
+
+        Строка показывается, пока `open_ratio` выше `MIN_OPEN_RATIO`;
+        `best_step=None` (меньше двух бирж) убирает строку.
+
+        Returns:
+            `True`, если строка отправлена.
+        """
+        if best_step is None or best_step["open_ratio"] <= cls.MIN_OPEN_RATIO:
+            cls._remove_web_grid_row(symbol)
+            return False
+        instance = cls.arbitrage_obj_dict.get(symbol)
+        spread_zscore, spread_ema = (
+            instance.spread_stats(best_step["ask_exchange"], best_step["bid_exchange"])
+            if instance is not None else (None, None)
+        )
+        return cls._update_web_grid_row(
+            symbol=symbol,
+            ask_exchange=best_step["ask_exchange"],
+            ask_mean_dt=best_step["ask_mean_dt"],
+            bid_exchange=best_step["bid_exchange"],
+            bid_mean_dt=best_step["bid_mean_dt"],
+            open_ratio=best_step["open_ratio"],
+            deal_notional=best_step["notional"],
+            spread_zscore=spread_zscore,
+            spread_ema=spread_ema,
+            trace=trace,
+            only_changed=only_changed,
+        )
+
+    @classmethod
+    async def run_spread_engine(cls) -> None:
+        """Цикл `spread_engine`: раз в тик пересчитать изменённые символы.
+
+        В таблицу уходят только строки, которые изменились с прошлой
+        отправки.
+        """
+        engine = cls.spread_engine
+        while True:
+            await asyncio.sleep(engine.tick_interval_sec)
+            for symbol, best_step, trace in engine.tick():
+                if cls._apply_best_step(symbol, best_step, trace=trace, only_changed=True):
+                    engine.stats["emitted"] += 1
 
     @classmethod
     def _remove_web_grid_row(cls, symbol: str) -> None:
@@ -642,10 +1247,10 @@ class ArbitrageManager:
             return
 
         if cls.web_grid_event_mode == "event":
-            cls.web_grid_table_queue.put({
-                "grid_event": "remove_row",
-                "symbol": symbol,
-            })
+            if cls.top_opportunities is None:
+                cls._put_web_grid_event("remove_row", symbol)
+                return
+            cls._forward_top_changes(*cls.top_opportunities.remove(symbol))
             return
 
         cls._push_web_grid_snapshot()
@@ -678,11 +1283,106 @@ class ArbitrageManager:
         запускает отдельную задачу `_ArbitrageTask|{symbol}`.
         """
         for symbol, deal_data in cls.swap_processed_data_dict.items():
-            instance = cls(symbol, deal_data)
-            cls.arbitrage_obj_dict[symbol] = instance
-            task_name = f"_ArbitrageTask|{symbol}"
-            # Для каждого символа-экземпляра своя задача
-            cls.task_manager.add_task(name=task_name, coro_func=instance.symbol_arbitrage)
+            cls._start_symbol_task(symbol, deal_data)
+
+    @classmethod
+    def _start_symbol_task(cls, symbol: str, deal_data: dict[str, dict[str, Any]]) -> "ArbitrageManager":
+        instance = cls(symbol, deal_data)
+        cls.arbitrage_obj_dict[symbol] = instance
+        task_name = f"_ArbitrageTask|{symbol}"
+        # Для каждого символа-экземпляра своя задача
+        cls.task_manager.add_task(name=task_name, coro_func=instance.symbol_arbitrage)
+        return instance
+
+    @classmethod
+    def start_symbol(
+            cls, symbol: str, raw_exchange_data: dict[str, dict[str, Any]], deal_data: dict[str, dict[str, Any]],
+    ) -> bool:
+        """Начать арбитраж символа в работающем воркере (перенос символа).
+
+        Данные символа добавляются в `swap_raw_data_dict`/
+        `swap_processed_data_dict` (общие с `ExchangeInstrument`), подписки
+        запускает `symbol_arbitrage`, как при старте воркера.
+
+        Args:
+            raw_exchange_data: `{exchange_id: swap_data}` символа.
+            deal_data: `{exchange_id: данные сделки}` символа
+                (`_process_swap_raw_data`).
+
+        Returns:
+            `False`, если символ уже ведётся этим воркером.
+        """
+        if symbol in cls.arbitrage_obj_dict:
+            return False
+        cls.swap_raw_data_dict[symbol] = raw_exchange_data
+        cls.swap_processed_data_dict[symbol] = deal_data
+        instance = cls._start_symbol_task(symbol, deal_data)
+        if cls.spread_engine is not None:
+            cls.spread_engine.fee_factor_dict[symbol] = instance.fee_factor_dict
+        if cls.shared_orderbook_reader is not None:
+            cls.shared_orderbook_reader.add_symbol(symbol)
+        return True
+
+    @classmethod
+    async def stop_symbol(cls, symbol: str, *, reason: str) -> bool:
+        """Остановить арбитраж символа и забыть его данные (перенос символа).
+
+        Подписки символа снимаются (`_shutdown_symbol_arbitrage`) до
+        возврата, поэтому после него символ можно запускать на другом воркере.
+
+        Returns:
+            `False`, если символ не ведётся этим воркером.
+        """
+        # Остановленный циклом символ больше не допускается на этом воркере.
+        cls.retired_symbol_dict.pop(symbol, None)
+        instance = cls.arbitrage_obj_dict.get(symbol)
+        if instance is None:
+            return False
+        if cls.shared_orderbook_reader is not None:
+            cls.shared_orderbook_reader.remove_symbol(symbol)
+        await instance._shutdown_symbol_arbitrage(
+            reason=reason,
+            active_exchange_ids=set(instance.symbol_average_price_dict),
+            retire=False,
+        )
+        cls.swap_raw_data_dict.pop(symbol, None)
+        cls.swap_processed_data_dict.pop(symbol, None)
+        if cls.spread_engine is not None:
+            cls.spread_engine.fee_factor_dict.pop(symbol, None)
+        SymbolLoadMeter.load_dict.pop(symbol, None)
+        return True
+
+    @classmethod
+    def _retire_symbol(cls, symbol: str, reason: str) -> None:
+        now = time.monotonic()
+        retries = 0
+        readmitted = cls._readmitted_symbol_dict.pop(symbol, None)
+        if readmitted is not None and now - readmitted[0] < cls.SYMBOL_READMIT_MAX_COOLDOWN_SEC:
+            retries = readmitted[1] + 1
+        cls.retired_symbol_dict[symbol] = {"retired_at": now, "retries": retries, "reason": reason}
+
+    @classmethod
+    def readmit_due_symbols(cls, now: float | None = None) -> list[str]:
+        """Снять с `retired_symbol_dict` символы, чья пауза истекла.
+
+        Пауза — `SYMBOL_READMIT_COOLDOWN_SEC * 2 ** retries`, не больше
+        `SYMBOL_READMIT_MAX_COOLDOWN_SEC`.
+
+        Returns:
+            Символы для `start_symbol`.
+        """
+        now = time.monotonic() if now is None else now
+        due = []
+        for symbol, retired in list(cls.retired_symbol_dict.items()):
+            cooldown = min(
+                cls.SYMBOL_READMIT_COOLDOWN_SEC * 2 ** retired["retries"], cls.SYMBOL_READMIT_MAX_COOLDOWN_SEC
+            )
+            if now - retired["retired_at"] < cooldown:
+                continue
+            del cls.retired_symbol_dict[symbol]
+            cls._readmitted_symbol_dict[symbol] = (now, retired["retries"])
+            due.append(symbol)
+        return due
 
     # init символа-экземпляра
     def __init__(self, symbol, deal_data):
@@ -690,8 +1390,10 @@ class ArbitrageManager:
         self.symbol = symbol
         self.deal_data = deal_data
         self.task_manager = self.__class__.task_manager
-        self.orderbook_queue = asyncio.Queue()
+        self.orderbook_queue = OrderbookMailbox()
         # Важно: торговая логика живёт на одной очереди `orderbook_queue`.
+        # Непрочитанный `orderbook_update` биржи замещается более свежим,
+        # управляющие события доставляются все и по порядку.
         # В неё попадают только торгово значимые события по источнику:
         #
         # `orderbook_update`:
@@ -701,6 +1403,8 @@ class ArbitrageManager:
         #     "exchange_id": str,
         #     "average_ask": Decimal,
         #     "average_bid": Decimal,
+        #     "ladder": [{"multiplier": Decimal, "notional": Decimal,
+        #                 "average_ask": Decimal | None, "average_bid": Decimal | None}, ...],
         #     "stream_status": "ok",
         #     "mean_dt": float | None,
         #     "count": int,
@@ -729,16 +1433,39 @@ class ArbitrageManager:
         # Локальный кэш последних торгуемых цен по биржам.
         # В словаре находятся только биржи, которые в данный момент можно
         # учитывать в поиске сигнала.
-        # {exchange_id: {"average_ask": Decimal, "average_bid": Decimal, "mean_dt": float | None}}
+        # {exchange_id: {"average_ask": Decimal, "average_bid": Decimal, "ladder": list[dict], "mean_dt": float | None,
+        #                "fee_prices": (ask, bid) float с комиссией | None,
+        #                "fixed_ladder" / "fixed_base": (price_decimals, [(ask, bid), ...]) —
+        #                 целые цены с комиссией (`_fixed_prices`), заполняются при расчёте}}
         self.symbol_average_price_dict: dict[str, dict[str, Decimal | float | None]] = {}
         self.min_ask = Decimal('+Infinity')
         self.min_ask_exchange = ""
         self.max_bid = Decimal('-Infinity')
         self.max_bid_exchange = ""
+        # Множители комиссии по биржам символа (`_fee_factors`):
+        # {exchange_id: (ask_fee_factor, bid_fee_factor)}
+        self.fee_factor_dict: dict[str, tuple[Decimal, Decimal]] = {
+            exchange_id: (data.get('ask_fee_factor', Decimal(1)), data.get('bid_fee_factor', Decimal(1)))
+            for exchange_id, data in deal_data.items()
+        }
+        self._fee_factor_float_dict: dict[str, tuple[float, float]] = {
+            exchange_id: (float(ask_fee_factor), float(bid_fee_factor))
+            for exchange_id, (ask_fee_factor, bid_fee_factor) in self.fee_factor_dict.items()
+        }
+        # Целочисленный масштаб цен и комиссий для `_select_best_ladder_step`.
+        self.fixed_point = SymbolFixedPoint(
+            self.fee_factor_dict,
+            price_decimals=max((data.get('price_decimals', 0) for data in deal_data.values()), default=0),
+        )
+        # Статистики спреда по парам бирж символа (`_update_spread_pairs`):
+        # {(exchange1, exchange2): ArbitragePair}, exchange1 < exchange2.
+        self.spread_pair_dict: dict[tuple[str, str], ArbitragePair] = {}
         self.best_close_ask = Decimal('+Infinity')
         self.best_close_bid = Decimal('-Infinity')
 
-    async def _shutdown_symbol_arbitrage(self, *, reason: str, active_exchange_ids: set[str]) -> None:
+    async def _shutdown_symbol_arbitrage(
+            self, *, reason: str, active_exchange_ids: set[str], retire: bool = True,
+    ) -> None:
         """
         Полностью останавливает арбитраж по символу:
         - выключает флаг цикла;
@@ -750,6 +1477,10 @@ class ArbitrageManager:
         Почему отдельный метод:
         - остановка символа включает несколько шагов и должна выполняться единообразно;
         - в будущем сюда удобно добавить дополнительный cleanup (метрики, отчёты и т.д.).
+
+        Args:
+            retire: Запомнить символ в `retired_symbol_dict` для повторного
+                допуска; `stop_symbol` (перенос, делистинг) передаёт `False`.
         """
         print(
             f"[{self.symbol}] SHUTDOWN start | reason={reason} | "
@@ -761,7 +1492,13 @@ class ArbitrageManager:
         # Сначала останавливаем задачи по стаканам для этого символа.
         for exchange_id, data in ExchangeInstrument.exchange_instruments_obj_dict.get(self.symbol, {}).items():
             task_name = data.get("task_name")
-            if task_name:
+            feed = data.get("feed")
+            if feed is not None:
+                # Задача батча общая для нескольких символов — отключаем
+                # только этот символ.
+                print(f"[{self.symbol}] unregistering from orderbook feed: {task_name}")
+                await feed.unregister(self.symbol)
+            elif task_name:
                 print(f"[{self.symbol}] cancelling orderbook task: {task_name}")
                 await self.task_manager.cancel_task(
                     name=task_name,
@@ -785,11 +1522,15 @@ class ArbitrageManager:
             )
 
         # Затем чистим внутренние структуры символа.
+        if type(self).spread_engine is not None:
+            type(self).spread_engine.remove_symbol(self.symbol)
         type(self)._remove_web_grid_row(self.symbol)
         self.symbol_average_price_dict.clear()
         ExchangeInstrument.exchange_instruments_obj_dict.pop(self.symbol, None)
         type(self).symbol_arbitrage_enable_flag_dict.pop(self.symbol, None)
         type(self).arbitrage_obj_dict.pop(self.symbol, None)
+        if retire:
+            type(self)._retire_symbol(self.symbol, reason)
 
         print(f"[{self.symbol}] SHUTDOWN complete | arbitrage instance closed")
 
@@ -807,7 +1548,8 @@ class ArbitrageManager:
         5. Когда есть минимум 2 биржи, ищем:
            - минимальный ask (где дешевле купить),
            - максимальный bid (где дороже продать).
-        6. Считаем `open_ratio`.
+        6. Считаем `open_ratio` на каждой ступени лестницы объёмов и берём
+           ступень с лучшим `open_ratio`.
         7. Если бирж стало < 2 из-за `exchange_stopped`, делаем shutdown символа.
 
         Notes:
@@ -829,15 +1571,28 @@ class ArbitrageManager:
 
         # Запуск задач ордербуков.
         # active_exchange_ids отражает "кто ещё участвует" в текущем символе.
+        # В топологии `shared_feeds` подписки держат процессы бирж, поэтому
+        # здесь ничего не запускается.
         active_exchange_ids = set(self.__class__.swap_processed_data_dict[self.symbol].keys())
-        for exchange_id in self.__class__.swap_processed_data_dict[self.symbol].keys():
+        own_exchange_ids = (
+            [] if type(self).shared_orderbook_table is not None
+            else list(self.__class__.swap_processed_data_dict[self.symbol].keys())
+        )
+        for exchange_id in own_exchange_ids:
             exchange_instance = self.exchanges_instances_dict.get(exchange_id)
             _obj = ExchangeInstrument(
                 exchange_instance=exchange_instance,
                 symbol=self.symbol,
                 orderbook_queue=self.orderbook_queue,
             )
-            task_name = f"_OrderbookTask|{self.symbol}|{exchange_id}"
+            # Биржа с `watchOrderBookForSymbols` слушается общей задачей
+            # батча, иначе — отдельной задачей на пару.
+            feed = ExchangeOrderbookFeed.get_feed(exchange_instance)
+            if feed is not None:
+                task_name = feed.register(_obj)
+            else:
+                task_name = f"_OrderbookTask|{self.symbol}|{exchange_id}"
+                self.task_manager.add_task(name=task_name, coro_func=_obj.watch_orderbook)
 
             ExchangeInstrument.exchange_instruments_obj_dict.setdefault(self.symbol, {}) \
                 .setdefault(exchange_id, {})
@@ -845,25 +1600,31 @@ class ArbitrageManager:
             ExchangeInstrument.exchange_instruments_obj_dict[self.symbol][exchange_id] = {
                 "obj": _obj,
                 "task_name": task_name,
+                "feed": feed,
                 "symbol_task_name": symbol_task_name,
             }
 
-            self.task_manager.add_task(name=task_name, coro_func=_obj.watch_orderbook)
-
         # Основной цикл событий символа.
         # Работает, пока флаг symbol_arbitrage_enable_flag_dict[self.symbol] == True.
+        # Время обработки события символа учитывается перед чтением
+        # следующего (`SymbolLoadMeter`), поэтому ветки цикла могут
+        # заканчиваться `continue`.
+        load_started = None
+        load_ticks = 0
         while type(self).symbol_arbitrage_enable_flag_dict[self.symbol]:
+            if load_started is not None:
+                SymbolLoadMeter.record(self.symbol, time.thread_time() - load_started, load_ticks)
 
             orderbook_queue_data = await self.orderbook_queue.get()
+            load_started = time.thread_time()
 
             event_type = orderbook_queue_data.get("type")
+            load_ticks = 1 if event_type == "orderbook_update" else 0
             if event_type == "exchange_paused":
                 paused_exchange_id = orderbook_queue_data.get("exchange_id")
                 reason = orderbook_queue_data.get("reason")
                 if paused_exchange_id:
-                    self.symbol_average_price_dict.pop(paused_exchange_id, None)
-                    if len(self.symbol_average_price_dict) < 2:
-                        type(self)._remove_web_grid_row(self.symbol)
+                    self._drop_exchange_prices(paused_exchange_id)
                 print(
                     f"[{self.symbol}] exchange paused: {paused_exchange_id}, "
                     f"reason={reason}"
@@ -882,9 +1643,7 @@ class ArbitrageManager:
 
                 if stopped_exchange_id in active_exchange_ids:
                     active_exchange_ids.remove(stopped_exchange_id)
-                self.symbol_average_price_dict.pop(stopped_exchange_id, None)
-                if len(self.symbol_average_price_dict) < 2:
-                    type(self)._remove_web_grid_row(self.symbol)
+                self._drop_exchange_prices(stopped_exchange_id)
 
                 print(
                     f"[{self.symbol}] exchange stopped: {stopped_exchange_id}, "
@@ -911,69 +1670,211 @@ class ArbitrageManager:
             queue_exchange_id = orderbook_queue_data.get("exchange_id")
             if not queue_exchange_id:
                 continue
+            trace = orderbook_queue_data.get(TRACE_KEY)
+            LatencyTracer.mark(trace, "dequeue")
             if orderbook_queue_data.get("stream_status") != "ok":
-                self.symbol_average_price_dict.pop(queue_exchange_id, None)
-                if len(self.symbol_average_price_dict) < 2:
-                    type(self)._remove_web_grid_row(self.symbol)
+                self._drop_exchange_prices(queue_exchange_id)
                 continue
 
             # Обновляем локальный кэш последних цен от конкретной биржи.
             self.symbol_average_price_dict[queue_exchange_id] = {
                 "average_ask": orderbook_queue_data["average_ask"],
                 "average_bid": orderbook_queue_data["average_bid"],
+                "ladder": orderbook_queue_data.get("ladder") or [],
                 "mean_dt": orderbook_queue_data.get("mean_dt"),
+                "feed_lag_ms": orderbook_queue_data.get("feed_lag_ms"),
+                "lagging": orderbook_queue_data.get("lagging", False),
             }
+            self._update_spread_pairs(queue_exchange_id)
 
             # print(queue_exchange_id, orderbook_queue_data)
 
+            # В режиме `spread_engine` расчёт и отправку строки делает
+            # общий тик движка по всем изменённым символам.
+            spread_engine = type(self).spread_engine
+            if spread_engine is not None:
+                spread_engine.update(
+                    self.symbol,
+                    queue_exchange_id,
+                    ladder=orderbook_queue_data.get("ladder") or [],
+                    average_ask=orderbook_queue_data["average_ask"],
+                    average_bid=orderbook_queue_data["average_bid"],
+                    mean_dt=orderbook_queue_data.get("mean_dt"),
+                    trace=trace,
+                )
+                continue
+
             # Нужно минимум 2 биржи
             if len(self.symbol_average_price_dict) < 2:
                 type(self)._remove_web_grid_row(self.symbol)
                 continue
 
-            # Инициализация временных переменных для поиска лучших цен.
-            min_ask = Decimal('+Infinity')
-            max_bid = Decimal('-Infinity')
-            min_ask_ex = None
-            max_bid_ex = None
-            min_ask_mean_dt = None
-            max_bid_mean_dt = None
-
-            # Поиск лучших цен
-            for ex_id, data in self.symbol_average_price_dict.items():
-                ask = data["average_ask"]
-                bid = data["average_bid"]
-                mean_dt = data.get("mean_dt")
-
-                if ask < min_ask:
-                    min_ask = ask
-                    min_ask_ex = ex_id
-                    min_ask_mean_dt = mean_dt
+            best_step = self._select_best_ladder_step()
+            if best_step is None:
+                continue
+            type(self)._apply_best_step(self.symbol, best_step, trace=trace)
 
-                if bid > max_bid:
-                    max_bid = bid
-                    max_bid_ex = ex_id
-                    max_bid_mean_dt = mean_dt
+    def _drop_exchange_prices(self, exchange_id: str) -> None:
+        """Исключить биржу из поиска сигнала символа.
 
-            # Если что-то не определилось — пропускаем
-            if not min_ask_ex or not max_bid_ex:
+        Если бирж с ценами осталось меньше двух, строка символа убирается из
+        таблицы (в режиме `spread_engine` — на ближайшем тике движка).
+        """
+        self.symbol_average_price_dict.pop(exchange_id, None)
+        if type(self).spread_engine is not None:
+            type(self).spread_engine.remove(self.symbol, exchange_id)
+        elif len(self.symbol_average_price_dict) < 2:
+            type(self)._remove_web_grid_row(self.symbol)
+
+    def _update_spread_pairs(self, exchange_id: str) -> None:
+        """Добавить тик спреда во все пары `exchange_id` с биржами символа.
+
+        Спред направления — чистый `open_ratio` на базовом объёме
+        (`average_ask`/`average_bid` с `fee_factor_dict`), без округления.
+        Участвуют только биржи из `symbol_average_price_dict`: пауза биржи
+        останавливает её пары, история окна сохраняется.
+        """
+        price_dict = self.symbol_average_price_dict
+        prices = price_dict[exchange_id]
+        ask = prices["average_ask"]
+        bid = prices["average_bid"]
+        if ask is None or bid is None:
+            prices["fee_prices"] = None
+            return
+        ask_fee_factor, bid_fee_factor = self._fee_factor_float_dict.get(exchange_id, (1.0, 1.0))
+        fee_prices = prices["fee_prices"] = (float(ask) * ask_fee_factor, float(bid) * bid_fee_factor)
+        for other_exchange_id, other_prices in price_dict.items():
+            other_fee_prices = other_prices.get("fee_prices")
+            if other_exchange_id == exchange_id or other_fee_prices is None:
                 continue
-
-            # Расчёт процента "бумажного" спреда между лучшим bid и лучшим ask.
-            open_ratio = round_down(100 * (max_bid - min_ask) / min_ask, 2)
-
-            if open_ratio > 0.1:
-                type(self)._update_web_grid_row(
-                    symbol=self.symbol,
-                    ask_exchange=min_ask_ex,
-                    ask_mean_dt=min_ask_mean_dt,
-                    bid_exchange=max_bid_ex,
-                    bid_mean_dt=max_bid_mean_dt,
-                    open_ratio=open_ratio,
-                )
-                print(open_ratio, min_ask_ex, max_bid_ex, self.symbol, "%")
+            if exchange_id < other_exchange_id:
+                key = (exchange_id, other_exchange_id)
+                pair_prices = fee_prices + other_fee_prices
             else:
-                type(self)._remove_web_grid_row(self.symbol)
+                key = (other_exchange_id, exchange_id)
+                pair_prices = other_fee_prices + fee_prices
+            pair = self.spread_pair_dict.get(key)
+            if pair is None:
+                pair = self.spread_pair_dict[key] = ArbitragePair(
+                    *key,
+                    window_size=type(self).SPREAD_WINDOW_SIZE,
+                    ema_alpha=type(self).SPREAD_EMA_ALPHA,
+                    ratio=True,
+                )
+            pair.push_prices(*pair_prices)
+
+    def spread_stats(self, ask_exchange: str, bid_exchange: str) -> tuple[float | None, float | None]:
+        """z-score и EMA спреда направления "купить на ask_exchange, продать на bid_exchange".
+
+        Returns:
+            `(zscore, ema)`; `(None, None)`, если пары ещё нет.
+        """
+        key = (ask_exchange, bid_exchange) if ask_exchange < bid_exchange else (bid_exchange, ask_exchange)
+        pair = self.spread_pair_dict.get(key)
+        if pair is None:
+            return None, None
+        state = pair.direction_state(ask_exchange)
+        return state.spread_window.zscore_last(), state.ema.value
+
+    def _fixed_prices(self, exchange_id: str, data: dict[str, Any], use_ladder: bool) -> list[tuple]:
+        """Целые цены биржи с комиссией по ступеням: `[(ask, bid), ...]`.
+
+        Args:
+            use_ladder: Ступени лестницы; иначе одна ступень
+                `average_ask`/`average_bid`.
+
+        Перевод кэшируется в записи `symbol_average_price_dict` до смены
+        масштаба, поэтому на `orderbook_update` переводится только биржа
+        события.
+
+        Raises:
+            PriceScaleChanged: См. `SymbolFixedPoint.ticks`.
+        """
+        fixed_point = self.fixed_point
+        key = "fixed_ladder" if use_ladder else "fixed_base"
+        cached = data.get(key)
+        if cached is not None and cached[0] == fixed_point.price_decimals:
+            return cached[1]
+        prices = fixed_point.fee_prices(exchange_id, data["ladder"] if use_ladder else (data,))
+        data[key] = (fixed_point.price_decimals, prices)
+        return prices
+
+    def _select_best_ladder_step(self) -> dict[str, Any] | None:
+        """Найти ступень лестницы объёмов с лучшим чистым `open_ratio`.
+
+        На каждой ступени ищутся минимальный ask и максимальный bid между
+        биржами из `symbol_average_price_dict` по ценам с комиссией
+        (`fee_factor_dict`): `open_ratio` — доход продажи за вычетом taker
+        минус стоимость покупки с taker, в процентах от стоимости покупки,
+        округлённый к нулю до двух знаков. Цены уже посчитаны в
+        `ExchangeInstrument` за один проход по стакану, поэтому выбор объёма
+        не требует повторного обхода ордербуков.
+
+        Расчёт идёт в целых числах (`modules.fixed_point`): цены с комиссией
+        сравниваются как целые общего масштаба, `open_ratio` — одно
+        целочисленное деление, `Decimal` создаётся только для результата.
+        Паритет с `Decimal`-расчётом — `test_fixed_point.py`.
+
+        Returns:
+            Словарь `open_ratio`, `notional`, `ask_exchange`, `ask_mean_dt`,
+            `bid_exchange`, `bid_mean_dt` или `None`, если ни на одной ступени
+            не нашлось пары цен. При равном `open_ratio` выбирается больший
+            объём. Если какая-то биржа прислала событие без `ladder`, расчёт
+            идёт по одной ступени — `average_ask`/`average_bid`.
+        """
+        price_items = list(self.symbol_average_price_dict.items())
+        if all(data["ladder"] for _, data in price_items):
+            step_count = min(len(data["ladder"]) for _, data in price_items)
+            use_ladder = True
+        else:
+            step_count = 1
+            use_ladder = False
+        while True:
+            try:
+                fixed_items = [
+                    (ex_id, data, self._fixed_prices(ex_id, data, use_ladder)) for ex_id, data in price_items
+                ]
+                break
+            except PriceScaleChanged:
+                # Масштаб вырос: записи со старым масштабом переводятся заново.
+                continue
+
+        best_ratio = None
+        best_step = None
+        for step in range(step_count):
+            min_ask = max_bid = None
+            min_ask_item = max_bid_item = None
+            # Тот же порядок бирж и строгие сравнения, что в `Decimal`-пути:
+            # при равных ценах остаётся первая биржа.
+            for item in fixed_items:
+                ask, bid = item[2][step]
+                if ask is not None and (min_ask is None or ask < min_ask):
+                    min_ask = ask
+                    min_ask_item = item
+                if bid is not None and (max_bid is None or bid > max_bid):
+                    max_bid = bid
+                    max_bid_item = item
+            if min_ask_item is None or max_bid_item is None:
+                continue
+
+            ratio = truncated_ratio(min_ask, max_bid)
+            # Ступени идут по возрастанию объёма, поэтому `>=` при равном
+            # `open_ratio` оставляет больший объём.
+            if best_ratio is None or ratio >= best_ratio:
+                best_ratio = ratio
+                first_data = price_items[0][1]
+                best_step = {
+                    "notional": (first_data["ladder"][step] if use_ladder else first_data).get("notional"),
+                    "ask_exchange": min_ask_item[0],
+                    "ask_mean_dt": min_ask_item[1].get("mean_dt"),
+                    "bid_exchange": max_bid_item[0],
+                    "bid_mean_dt": max_bid_item[1].get("mean_dt"),
+                }
+
+        if best_step is None:
+            return None
+        return {"open_ratio": ratio_to_decimal(best_ratio), **best_step}
+
 
 def calculate_worker_process_count(cpu_count: int | None = None) -> int:
     cpu_total = cpu_count or os.cpu_count() or 1
@@ -1002,8 +1903,22 @@ def _reset_runtime_state(*, web_grid_queue=None, shared_values=None, web_grid_ev
     ExchangeInstrument.swap_raw_data_dict = None
     ExchangeInstrument.orderbook_updating_status_dict = {}
     ExchangeInstrument.get_ex_orderbook_data_count = {}
+    ExchangeInstrument.orderbook_recompute_stats_dict = {}
+    ExchangeInstrument.feed_lag_window_dict = {}
+    ExchangeInstrument.feed_lag_stats_dict = {}
+    ClockSyncService.reset()
+    ExchangeConnectionSupervisor.reset()
+    OrderbookDepthPolicy.reset()
+    OrderbookNormalizer.reset()
     ExchangeInstrument._configured = False
     ExchangeInstrument._lock = None
+    ExchangeInstrument.PUBLISH_TOP_LEVELS = 0
+    ExchangeInstrument.orderbook_recorder = None
+    LatencyTracer.reset()
+    SymbolLoadMeter.reset()
+
+    ExchangeOrderbookFeed.feeds_dict = {}
+    ExchangeOrderbookFeed.task_manager = None
 
     ArbitrageManager.exchanges_instances_dict = {}
     ArbitrageManager.arbitrage_obj_dict = {}
@@ -1014,22 +1929,37 @@ def _reset_runtime_state(*, web_grid_queue=None, shared_values=None, web_grid_ev
     ArbitrageManager.free_deals_slots = None
     ArbitrageManager.swap_processed_data_dict = {}
     ArbitrageManager.swap_raw_data_dict = {}
+    ArbitrageManager.retired_symbol_dict = {}
+    ArbitrageManager._readmitted_symbol_dict = {}
     ArbitrageManager.web_grid_table_queue = web_grid_queue
     ArbitrageManager.web_grid_shared_values = shared_values or {"shutdown": multiprocessing.Value('b', False)}
     ArbitrageManager.web_grid_process = None
     ArbitrageManager.web_grid_rows = {}
     ArbitrageManager.web_grid_event_mode = web_grid_event_mode
+    ArbitrageManager.shared_orderbook_table = None
+    ArbitrageManager.shared_orderbook_reader = None
+    ArbitrageManager.spread_engine = None
+    ArbitrageManager.top_opportunities = None
     ArbitrageManager._configured = False
     ArbitrageManager._lock = asyncio.Lock()
 
 
+# Модуль бирж для `ExchangeInstance`: `ccxt.pro` либо офлайн-замена
+# `modules.replay_exchange.ReplayCcxtModule` для повтора и бенчмарков.
+EXCHANGE_CCXT_MODULE = ccxt
+
+
 async def _open_exchange_instances(
     stack: AsyncExitStack,
     exchange_id_list: list[str],
 ) -> tuple[dict[str, ExchangeInstance], list[tuple[str, Exception]]]:
     async def open_exchange(exchange_id: str):
         try:
-            exchange = await stack.enter_async_context(ExchangeInstance(ccxt, exchange_id, log=True))
+            exchange = await stack.enter_async_context(
+                ExchangeInstance(
+                    EXCHANGE_CCXT_MODULE, exchange_id, update_interval=MARKETS_UPDATE_INTERVAL_SEC, log=True
+                )
+            )
             return exchange_id, exchange, None
         except Exception as exc:
             return exchange_id, None, exc
@@ -1053,12 +1983,56 @@ async def _open_exchange_instances(
     return exchange_instance_dict, failed
 
 
+def _start_clock_sync(exchange_instance_dict: dict[str, ExchangeInstance], task_manager: TaskManager) -> None:
+    """Запустить `ClockSyncService` для каждой открытой биржи процесса."""
+    for exchange_id, exchange in exchange_instance_dict.items():
+        service = ClockSyncService(exchange)
+        task_manager.add_task(name=f"_ClockSyncTask|{exchange_id}", coro_func=service.run)
+
+
+def _collect_linear_usdt_swaps(exchange: ExchangeInstance) -> dict[str, dict[str, Any]]:
+    """Вернуть линейные USDT-свопы биржи: {symbol: swap_data}."""
+    swap_dict: dict[str, dict[str, Any]] = {}
+    for pair_data in exchange.spot_swap_pair_data_dict.values():
+        swap_data = pair_data.get("swap")
+        if not swap_data or swap_data.get("settle") != "USDT":
+            continue
+        if swap_data.get('linear') and not swap_data.get('inverse'):
+            swap_dict[swap_data["symbol"]] = swap_data
+    return swap_dict
+
+
+async def _load_funding_rates(
+    exchange_instance_dict: dict[str, ExchangeInstance],
+    swap_raw_data_dict: dict[str, dict[str, dict[str, Any]]],
+) -> None:
+    """Дописать `funding_rate` в данные свопов (`fetchFundingRates` биржи).
+
+    Ставка читается один раз при старте. Биржа без `fetchFundingRates` или
+    с ошибкой запроса пропускается: её множители считаются без
+    финансирования.
+    """
+    for exchange_id, exchange in exchange_instance_dict.items():
+        if not exchange.exchange.has.get('fetchFundingRates'):
+            continue
+        symbols = [symbol for symbol, exchange_data in swap_raw_data_dict.items() if exchange_id in exchange_data]
+        try:
+            funding_rate_dict = await exchange.exchange.fetch_funding_rates(symbols)
+        except Exception as exc:
+            cprint.warning_r(f"[{exchange_id}] fetch_funding_rates failed: {exc!r}")
+            continue
+        for symbol, funding in funding_rate_dict.items():
+            swap_data = swap_raw_data_dict.get(symbol, {}).get(exchange_id)
+            if swap_data is not None and funding.get('fundingRate') is not None:
+                swap_data['funding_rate'] = funding['fundingRate']
+
+
 async def _build_swap_data(
     exchange_instance_dict: dict[str, ExchangeInstance],
     task_manager: TaskManager,
+    include_funding: bool = False,
 ) -> tuple[dict[str, dict[str, dict[str, Any]]], dict[str, dict[str, dict[str, Any]]]]:
     swap_raw_data_dict: dict[str, dict[str, dict[str, Any]]] = {}
-    swap_processed_data_dict: dict[str, dict[str, dict[str, Any]]] = {}
     started_balance_managers: list[BalanceManager] = []
 
     for exchange_id, exchange in exchange_instance_dict.items():
@@ -1067,16 +2041,52 @@ async def _build_swap_data(
         task_manager.add_task(name=task_name, coro_func=balance_manager_obj._watch_balance)
         started_balance_managers.append(balance_manager_obj)
 
-        for pair_data in exchange.spot_swap_pair_data_dict.values():
-            swap_data = pair_data.get("swap")
-            if not swap_data or swap_data.get("settle") != "USDT":
-                continue
-            if swap_data.get('linear') and not swap_data.get('inverse'):
-                symbol = swap_data["symbol"]
-                swap_raw_data_dict.setdefault(symbol, {})[exchange_id] = swap_data
+        for symbol, swap_data in _collect_linear_usdt_swaps(exchange).items():
+            swap_raw_data_dict.setdefault(symbol, {})[exchange_id] = swap_data
 
     await asyncio.gather(*(bm.wait_initialized() for bm in started_balance_managers))
+    if include_funding:
+        await _load_funding_rates(exchange_instance_dict, swap_raw_data_dict)
+
+    return _process_swap_raw_data(swap_raw_data_dict, include_funding)
+
+
+def _fee_factors(swap_data: dict[str, Any], include_funding: bool = False) -> tuple[Decimal, Decimal]:
+    """Множители цен ask и bid биржи с учётом taker-комиссии.
+
+    Покупка по `ask` стоит `ask * (1 + taker)`, продажа по `bid` приносит
+    `bid * (1 - taker)`. С `include_funding` к обоим множителям добавляется
+    ставка финансирования за один период (`funding_rate`, если она есть):
+    при положительной ставке лонг на бирже ask платит, шорт на бирже bid
+    получает.
 
+    Returns:
+        `(ask_fee_factor, bid_fee_factor)`.
+    """
+    taker = swap_data.get('taker_fee')
+    if taker is None:
+        taker = swap_data.get('taker')
+    taker = to_decimal(taker) if taker is not None else Decimal(0)
+    funding = swap_data.get('funding_rate') if include_funding else None
+    funding = to_decimal(funding) if funding is not None else Decimal(0)
+    return 1 + taker + funding, 1 - taker + funding
+
+
+def _process_swap_raw_data(
+    swap_raw_data_dict: dict[str, dict[str, dict[str, Any]]],
+    include_funding: bool = False,
+) -> tuple[dict[str, dict[str, dict[str, Any]]], dict[str, dict[str, dict[str, Any]]]]:
+    """Оставить символы минимум с двумя биржами и собрать данные для арбитража.
+
+    Args:
+        include_funding: Учитывать `funding_rate` в множителях комиссии
+            (`_fee_factors`).
+
+    Notes:
+        `swap_raw_data_dict` изменяется на месте: символы с одной биржей
+        удаляются.
+    """
+    swap_processed_data_dict: dict[str, dict[str, dict[str, Any]]] = {}
     for symbol, exchange_data in list(swap_raw_data_dict.items()):
         if len(exchange_data) < 2:
             swap_raw_data_dict.pop(symbol)
@@ -1087,6 +2097,10 @@ async def _build_swap_data(
             swap_processed_data_dict.setdefault(symbol, {}).setdefault(exchange_id, {})
             swap_processed_data_dict[symbol][exchange_id]['contractSize'] = data.get('contractSize')
             swap_processed_data_dict[symbol][exchange_id]['max_contractSize'] = max_contract_size
+            ask_fee_factor, bid_fee_factor = _fee_factors(data, include_funding)
+            swap_processed_data_dict[symbol][exchange_id]['ask_fee_factor'] = ask_fee_factor
+            swap_processed_data_dict[symbol][exchange_id]['bid_fee_factor'] = bid_fee_factor
+            swap_processed_data_dict[symbol][exchange_id]['price_decimals'] = price_tick_decimals(data)
 
     return swap_raw_data_dict, swap_processed_data_dict
 
@@ -1149,6 +2163,7 @@ async def _worker_heartbeat(
         symbols_active = sum(
             1 for enabled in ArbitrageManager.symbol_arbitrage_enable_flag_dict.values() if enabled
         )
+        symbol_load, cpu_load = SymbolLoadMeter.collect(ArbitrageManager.arbitrage_obj_dict)
         _send_control_event(
             control_queue,
             {
@@ -1156,12 +2171,320 @@ async def _worker_heartbeat(
                 "worker_id": process_index,
                 "pid": pid,
                 "symbols_active": symbols_active,
+                "symbol_load": symbol_load,
+                "cpu_load": cpu_load,
+                "orderbook_recompute": {
+                    exchange_id: dict(stats)
+                    for exchange_id, stats in ExchangeInstrument.orderbook_recompute_stats_dict.items()
+                },
+                "orderbook_coalesced": {
+                    symbol: arbitrage_obj.orderbook_queue.coalesced_count
+                    for symbol, arbitrage_obj in ArbitrageManager.arbitrage_obj_dict.items()
+                    if arbitrage_obj.orderbook_queue.coalesced_count
+                },
+                "latency": LatencyTracer.summary(),
+                "feed_lag": ExchangeInstrument.feed_lag_summary(),
+                "reconnect": ExchangeConnectionSupervisor.summary(),
+                "subscription_depth": OrderbookDepthPolicy.summary(),
+                "spread_engine": (
+                    ArbitrageManager.spread_engine.summary()
+                    if ArbitrageManager.spread_engine is not None else None
+                ),
+                "clock_sync": ClockSyncService.summary(),
                 "ts": time.time(),
             },
         )
         await asyncio.sleep(interval_sec)
 
 
+# Период опроса очереди команд главного процесса воркером.
+WORKER_COMMAND_POLL_INTERVAL_SEC = 0.2
+
+
+async def _worker_command_loop(
+    *,
+    command_queue,
+    control_queue,
+    process_index: int,
+    pid: int,
+    swap_raw_data_dict: dict[str, dict[str, dict[str, Any]]],
+    swap_processed_data_dict: dict[str, dict[str, dict[str, Any]]],
+    poll_interval_sec: float = WORKER_COMMAND_POLL_INTERVAL_SEC,
+) -> None:
+    """Выполнять команды переноса символов от главного процесса.
+
+    Команды (`modules.symbol_rebalancer`) выполняет `_execute_worker_command`.
+
+    Args:
+        swap_raw_data_dict: Данные свопов всех символов (не только воркера).
+        swap_processed_data_dict: Данные сделок всех символов.
+    """
+    while True:
+        try:
+            command = command_queue.get_nowait()
+        except queue.Empty:
+            await asyncio.sleep(poll_interval_sec)
+            continue
+        if not isinstance(command, dict):
+            continue
+        await _execute_worker_command(
+            command,
+            control_queue=control_queue,
+            process_index=process_index,
+            pid=pid,
+            swap_raw_data_dict=swap_raw_data_dict,
+            swap_processed_data_dict=swap_processed_data_dict,
+        )
+
+
+async def _execute_worker_command(
+    command: dict[str, Any],
+    *,
+    control_queue,
+    process_index: int,
+    pid: int,
+    swap_raw_data_dict: dict[str, dict[str, dict[str, Any]]],
+    swap_processed_data_dict: dict[str, dict[str, dict[str, Any]]],
+) -> list[str]:
+    """Выполнить команду запуска или остановки символов воркера.
+
+    Команды:
+    - `{"command": "stop_symbols", "symbols": [...], "reason": str}` —
+      остановить символы, ответ `symbols_stopped` со списком остановленных;
+    - `{"command": "start_symbols", "symbols": [...]}` — запустить символы
+      по данным рынков воркера, ответ `symbols_started`.
+
+    Returns:
+        Остановленные или запущенные символы.
+    """
+    command_type = command.get("command")
+    symbols = command.get("symbols") or []
+    if command_type == "stop_symbols":
+        done = []
+        for symbol in symbols:
+            if await ArbitrageManager.stop_symbol(symbol, reason=command.get("reason") or "rebalance"):
+                done.append(symbol)
+        event_type = "symbols_stopped"
+    elif command_type == "start_symbols":
+        done = [
+            symbol for symbol in symbols
+            if symbol in swap_processed_data_dict and ArbitrageManager.start_symbol(
+                symbol, swap_raw_data_dict.get(symbol, {}), swap_processed_data_dict[symbol]
+            )
+        ]
+        event_type = "symbols_started"
+    else:
+        return []
+    print(f"[worker:{process_index}] {event_type}: {len(done)}/{len(symbols)}")
+    _send_control_event(
+        control_queue,
+        {
+            "event": event_type,
+            "worker_id": process_index,
+            "pid": pid,
+            "symbols": done,
+            "requested": symbols,
+            "reason": command.get("reason"),
+            "ts": time.time(),
+        },
+    )
+    return done
+
+
+# Период обновления рынков `ExchangeInstance` воркера и период проверки
+# обновлений и повторного допуска символов (`_market_watch_loop`).
+MARKETS_UPDATE_INTERVAL_SEC = 600
+MARKET_WATCH_POLL_INTERVAL_SEC = 5.0
+
+
+def market_symbol_owner(symbol: str, process_count: int) -> int:
+    """Воркер нового символа, появившегося после старта.
+
+    Распределение по кругу (`split_symbols_between_processes`) зависит от
+    места символа в отсортированном списке и сдвигается с каждым листингом,
+    поэтому новый символ назначается по `crc32` имени: все воркеры приходят
+    к одному владельцу без обмена сообщениями. Неравномерную нагрузку
+    выравнивает `SymbolRebalancer`.
+    """
+    return zlib.crc32(symbol.encode()) % process_count
+
+
+def diff_market_symbols(
+    old_processed_data_dict: dict[str, dict[str, dict[str, Any]]],
+    new_processed_data_dict: dict[str, dict[str, dict[str, Any]]],
+) -> tuple[list[str], list[str], list[str]]:
+    """Сравнить наборы символов до и после обновления рынков.
+
+    Returns:
+        `(added, removed, changed)`; `changed` — символы, у которых
+        изменился набор бирж (нужны новые подписки).
+    """
+    added = sorted(set(new_processed_data_dict) - set(old_processed_data_dict))
+    removed = sorted(set(old_processed_data_dict) - set(new_processed_data_dict))
+    changed = sorted(
+        symbol for symbol in set(old_processed_data_dict) & set(new_processed_data_dict)
+        if set(old_processed_data_dict[symbol]) != set(new_processed_data_dict[symbol])
+    )
+    return added, removed, changed
+
+
+async def _market_watch_loop(
+    *,
+    exchange_instance_dict: dict[str, ExchangeInstance],
+    control_queue,
+    process_index: int,
+    process_count: int,
+    pid: int,
+    swap_raw_data_dict: dict[str, dict[str, dict[str, Any]]],
+    swap_processed_data_dict: dict[str, dict[str, dict[str, Any]]],
+    poll_interval_sec: float = MARKET_WATCH_POLL_INTERVAL_SEC,
+) -> None:
+    """Применять обновления рынков к символам воркера без перезапуска.
+
+    Фоновое обновление `ExchangeInstance` увеличивает `upload_counter`
+    биржи при изменении пар. Тогда данные свопов собираются заново
+    (`_collect_linear_usdt_swaps`, `_process_swap_raw_data`), а разница
+    (`diff_market_symbols`) превращается в команды `_execute_worker_command`:
+    - снятый символ, который ведёт воркер, — `stop_symbols` (`delisted`);
+    - символ с изменённым набором бирж — `stop_symbols` и `start_symbols`
+      с новыми подписками;
+    - новый символ — `start_symbols` на воркере `market_symbol_owner`.
+
+    Символы из `ArbitrageManager.retired_symbol_dict` запускаются снова по
+    истечении паузы (`readmit_due_symbols`), если ещё торгуются. Без бирж
+    воркера (`exchange_instance_dict` пуст, топология `shared_feeds`)
+    обновления рынков не проверяются, остаётся только повторный допуск.
+
+    Args:
+        swap_raw_data_dict: Данные свопов всех символов; обновляются на
+            месте (их же читает `_worker_command_loop`).
+        swap_processed_data_dict: Данные сделок всех символов; обновляются
+            на месте.
+    """
+    command_kwargs = {
+        "control_queue": control_queue,
+        "process_index": process_index,
+        "pid": pid,
+        "swap_raw_data_dict": swap_raw_data_dict,
+        "swap_processed_data_dict": swap_processed_data_dict,
+    }
+    upload_counter_dict = {
+        exchange_id: getattr(exchange, "upload_counter", 0) for exchange_id, exchange in exchange_instance_dict.items()
+    }
+    while True:
+        await asyncio.sleep(poll_interval_sec)
+        counters = {
+            exchange_id: getattr(exchange, "upload_counter", 0)
+            for exchange_id, exchange in exchange_instance_dict.items()
+        }
+        if exchange_instance_dict and counters != upload_counter_dict:
+            upload_counter_dict = counters
+            await _apply_market_update(
+                exchange_instance_dict, process_count=process_count, command_kwargs=command_kwargs
+            )
+
+        readmit = [
+            symbol for symbol in ArbitrageManager.readmit_due_symbols()
+            if symbol in swap_processed_data_dict
+        ]
+        if readmit:
+            await _execute_worker_command(
+                {"command": "start_symbols", "symbols": readmit, "reason": "readmit"}, **command_kwargs
+            )
+
+
+async def _apply_market_update(
+    exchange_instance_dict: dict[str, ExchangeInstance],
+    *,
+    process_count: int,
+    command_kwargs: dict[str, Any],
+) -> None:
+    """Собрать данные свопов заново и выполнить команды по разнице рынков."""
+    process_index = command_kwargs["process_index"]
+    swap_raw_data_dict = command_kwargs["swap_raw_data_dict"]
+    swap_processed_data_dict = command_kwargs["swap_processed_data_dict"]
+    new_raw_data_dict: dict[str, dict[str, dict[str, Any]]] = {}
+    for exchange_id, exchange in exchange_instance_dict.items():
+        for symbol, swap_data in _collect_linear_usdt_swaps(exchange).items():
+            new_raw_data_dict.setdefault(symbol, {})[exchange_id] = swap_data
+    if ArbitrageManager.INCLUDE_FUNDING:
+        await _load_funding_rates(exchange_instance_dict, new_raw_data_dict)
+    new_raw_data_dict, new_processed_data_dict = _process_swap_raw_data(
+        new_raw_data_dict, ArbitrageManager.INCLUDE_FUNDING
+    )
+    added, removed, changed = diff_market_symbols(swap_processed_data_dict, new_processed_data_dict)
+    swap_raw_data_dict.clear()
+    swap_raw_data_dict.update(new_raw_data_dict)
+    swap_processed_data_dict.clear()
+    swap_processed_data_dict.update(new_processed_data_dict)
+    # Биржи обновляются не одновременно: пары могли измениться без смены
+    # набора символов.
+    if not (added or removed or changed):
+        return
+
+    owned = ArbitrageManager.arbitrage_obj_dict
+    for symbol in removed:
+        ArbitrageManager.retired_symbol_dict.pop(symbol, None)
+    stop_removed = [symbol for symbol in removed if symbol in owned]
+    restart = [symbol for symbol in changed if symbol in owned]
+    start_added = [symbol for symbol in added if market_symbol_owner(symbol, process_count) == process_index]
+    stopped, started = [], []
+    if stop_removed:
+        stopped = await _execute_worker_command(
+            {"command": "stop_symbols", "symbols": stop_removed, "reason": "delisted"}, **command_kwargs
+        )
+    if restart:
+        await _execute_worker_command(
+            {"command": "stop_symbols", "symbols": restart, "reason": "markets changed"}, **command_kwargs
+        )
+    if restart or start_added:
+        started = await _execute_worker_command(
+            {"command": "start_symbols", "symbols": restart + start_added, "reason": "markets changed"},
+            **command_kwargs,
+        )
+    print(
+        f"[worker:{process_index}] markets changed: added={len(added)} removed={len(removed)} "
+        f"changed={len(changed)} started={len(started)} stopped={len(stopped)}"
+    )
+    _send_control_event(
+        command_kwargs["control_queue"],
+        {
+            "event": "markets_changed",
+            "worker_id": process_index,
+            "pid": command_kwargs["pid"],
+            "added": added,
+            "removed": removed,
+            "changed": changed,
+            "started": started,
+            "stopped": stopped,
+            "symbols_total": len(swap_processed_data_dict),
+            "ts": time.time(),
+        },
+    )
+
+
+# Период опроса общей таблицы стаканов воркером (топология `shared_feeds`).
+SHARED_ORDERBOOK_POLL_INTERVAL_SEC = 0.005
+
+
+async def _shared_orderbook_reader_loop(
+    *,
+    reader: SharedOrderbookReader,
+    poll_interval_sec: float = SHARED_ORDERBOOK_POLL_INTERVAL_SEC,
+) -> None:
+    """Раздавать события из общей таблицы стаканов символ-менеджерам воркера.
+
+    Опрашивает строки символов воркера и кладёт восстановленные события
+    в `orderbook_queue` соответствующего `ArbitrageManager`.
+    """
+    while True:
+        for event in reader.poll():
+            arbitrage_obj = ArbitrageManager.arbitrage_obj_dict.get(event["symbol"])
+            if arbitrage_obj is not None:
+                arbitrage_obj.orderbook_queue.put_nowait(event)
+        await asyncio.sleep(poll_interval_sec)
+
+
 async def run_arbitrage_worker(
     *,
     process_index: int,
@@ -1171,7 +2494,31 @@ async def run_arbitrage_worker(
     web_grid_queue,
     control_queue,
     shared_values: dict[str, Any],
+    shared_orderbook_layout: dict[str, Any] | None = None,
+    shared_swap_raw_data_dict: dict[str, dict[str, dict[str, Any]]] | None = None,
+    orderbook_record_dir: str | None = None,
+    spread_engine_mode: str = "per_symbol",
+    grid_top_k: int | None = None,
+    command_queue=None,
 ) -> None:
+    """Запустить арбитражный воркер.
+
+    Args:
+        shared_orderbook_layout: Описание таблицы стаканов в общей памяти
+            (топология `shared_feeds`). Если задано, воркер не открывает
+            биржи и читает события из таблицы.
+        shared_swap_raw_data_dict: Данные свопов по биржам, собранные
+            процессами бирж; используется вместе с `shared_orderbook_layout`.
+        orderbook_record_dir: Каталог записи сырого потока стаканов
+            (`OrderbookRecorder`); `None` — не записывать.
+        spread_engine_mode: `"per_symbol"` — спред считает цикл каждого
+            символа; `"vectorized"` — общий `CrossSymbolSpreadEngine`
+            воркера с тиком `TICK_INTERVAL_SEC`.
+        grid_top_k: Отправлять агрегатору только лучшие K строк воркера
+            (`TopOpportunityBook`); `None` — все строки выше порога.
+        command_queue: Очередь команд переноса символов от главного
+            процесса (`_worker_command_loop`); `None` — без переноса.
+    """
     task_manager = TaskManager()
     pid = os.getpid()
     _send_control_event(
@@ -1188,8 +2535,14 @@ async def run_arbitrage_worker(
         shared_values=shared_values,
         web_grid_event_mode="event",
     )
+    if grid_top_k:
+        ArbitrageManager.top_opportunities = TopOpportunityBook(grid_top_k)
     BalanceManager.task_manager = task_manager
     BalanceManager.max_deal_slots = max_deal_slots
+    ExchangeOrderbookFeed.task_manager = task_manager
+    shared_table = None
+    if orderbook_record_dir is not None:
+        ExchangeInstrument.orderbook_recorder = OrderbookRecorder(orderbook_record_dir, prefix=f"worker{process_index}")
 
     try:
         async with AsyncExitStack() as stack:
@@ -1201,8 +2554,14 @@ async def run_arbitrage_worker(
                     shared_values=shared_values,
                 )
             )
-            exchange_instance_dict, failed_exchanges = await _open_exchange_instances(stack, exchange_id_list)
-            if len(exchange_instance_dict) < 2:
+            if shared_orderbook_layout is not None:
+                shared_table = SharedOrderbookTable.attach(shared_orderbook_layout)
+                exchange_instance_dict = {}
+                failed_exchanges = []
+            else:
+                exchange_instance_dict, failed_exchanges = await _open_exchange_instances(stack, exchange_id_list)
+                _start_clock_sync(exchange_instance_dict, task_manager)
+            if shared_table is None and len(exchange_instance_dict) < 2:
                 cprint.warning_r(
                     f"[worker:{process_index}] not enough exchanges to run arbitrage: "
                     f"{list(exchange_instance_dict.keys())}"
@@ -1223,7 +2582,14 @@ async def run_arbitrage_worker(
                 )
                 await _wait_for_shared_shutdown(shared_values)
                 return
-            swap_raw_data_dict, swap_processed_data_dict = await _build_swap_data(exchange_instance_dict, task_manager)
+            if shared_table is not None:
+                swap_raw_data_dict, swap_processed_data_dict = _process_swap_raw_data(
+                    dict(shared_swap_raw_data_dict or {}), ArbitrageManager.INCLUDE_FUNDING
+                )
+            else:
+                swap_raw_data_dict, swap_processed_data_dict = await _build_swap_data(
+                    exchange_instance_dict, task_manager, ArbitrageManager.INCLUDE_FUNDING
+                )
             worker_raw_data_dict, worker_processed_data_dict = split_symbols_between_processes(
                 swap_raw_data_dict=swap_raw_data_dict,
                 swap_processed_data_dict=swap_processed_data_dict,
@@ -1231,23 +2597,90 @@ async def run_arbitrage_worker(
                 process_index=process_index,
             )
 
-            if worker_processed_data_dict and worker_raw_data_dict:
-                ArbitrageManager.get_configure(
-                    exchanges_instances_dict=exchange_instance_dict,
-                    balance_manager=BalanceManager,
-                    task_manager=task_manager,
-                    max_deal_slots=max_deal_slots,
-                    swap_raw_data_dict=worker_raw_data_dict,
-                    swap_processed_data_dict=worker_processed_data_dict,
+            # Воркер настраивается и без символов (своих или вообще в
+            # рынках): символы могут появиться листингом
+            # (`_market_watch_loop`) или переносом (`_worker_command_loop`).
+            ArbitrageManager.get_configure(
+                exchanges_instances_dict=exchange_instance_dict,
+                balance_manager=BalanceManager,
+                task_manager=task_manager,
+                max_deal_slots=max_deal_slots,
+                swap_raw_data_dict=worker_raw_data_dict,
+                swap_processed_data_dict=worker_processed_data_dict,
+            )
+            ExchangeInstrument.get_configure(
+                exchanges_instances_dict=exchange_instance_dict,
+                balance_manager=BalanceManager,
+                task_manager=task_manager,
+                swap_raw_data_dict=worker_raw_data_dict,
+                swap_processed_data_dict=worker_processed_data_dict,
+            )
+            if shared_table is not None:
+                ArbitrageManager.shared_orderbook_table = shared_table
+            if spread_engine_mode == "vectorized":
+                # Столбцы — биржи воркера и всех символов: перенесённый или
+                # новый символ может торговаться на бирже, которой нет у
+                # символов воркера.
+                worker_exchange_ids = set(exchange_instance_dict) | {
+                    exchange_id
+                    for exchange_data in swap_processed_data_dict.values()
+                    for exchange_id in exchange_data
+                }
+                ArbitrageManager.spread_engine = CrossSymbolSpreadEngine(
+                    exchange_ids=sorted(worker_exchange_ids),
+                    step_count=len(ExchangeInstrument.VWAP_LADDER_MULTIPLIERS),
+                    symbols=list(worker_processed_data_dict),
+                    min_open_ratio=float(ArbitrageManager.MIN_OPEN_RATIO),
+                    fee_factor_dict={
+                        symbol: {
+                            exchange_id: (
+                                data.get('ask_fee_factor', Decimal(1)),
+                                data.get('bid_fee_factor', Decimal(1)),
+                            )
+                            for exchange_id, data in exchange_data.items()
+                        }
+                        for symbol, exchange_data in worker_processed_data_dict.items()
+                    },
+                )
+                task_manager.add_task(name="_SpreadEngineTask", coro_func=ArbitrageManager.run_spread_engine)
+            await ArbitrageManager.create_all_arbitrage_objects()
+            if shared_table is not None:
+                ArbitrageManager.shared_orderbook_reader = SharedOrderbookReader(
+                    shared_table, list(worker_processed_data_dict)
+                )
+                task_manager.add_task(
+                    name="_SharedOrderbookReaderTask",
+                    coro_func=_shared_orderbook_reader_loop,
+                    reader=ArbitrageManager.shared_orderbook_reader,
                 )
-                ExchangeInstrument.get_configure(
-                    exchanges_instances_dict=exchange_instance_dict,
-                    balance_manager=BalanceManager,
-                    task_manager=task_manager,
-                    swap_raw_data_dict=worker_raw_data_dict,
-                    swap_processed_data_dict=worker_processed_data_dict,
+            # Повторный допуск остановленных символов работает в обеих
+            # топологиях. Обновления рынков применяются только в режиме
+            # `workers`: воркер сам держит подписки бирж. В `shared_feeds`
+            # бирж у воркера нет (`exchange_instance_dict` пуст), набор
+            # символов зафиксирован раскладкой общей таблицы стаканов
+            # (`SharedOrderbookTable`) и меняется только при перезапуске.
+            task_manager.add_task(
+                name="_MarketWatchTask",
+                coro_func=_market_watch_loop,
+                exchange_instance_dict=exchange_instance_dict,
+                control_queue=control_queue,
+                process_index=process_index,
+                process_count=process_count,
+                pid=pid,
+                swap_raw_data_dict=swap_raw_data_dict,
+                swap_processed_data_dict=swap_processed_data_dict,
+            )
+            if command_queue is not None:
+                task_manager.add_task(
+                    name="_WorkerCommandTask",
+                    coro_func=_worker_command_loop,
+                    command_queue=command_queue,
+                    control_queue=control_queue,
+                    process_index=process_index,
+                    pid=pid,
+                    swap_raw_data_dict=swap_raw_data_dict,
+                    swap_processed_data_dict=swap_processed_data_dict,
                 )
-                await ArbitrageManager.create_all_arbitrage_objects()
 
             print(
                 f"[worker:{process_index}] symbols={len(worker_processed_data_dict)} "
@@ -1289,11 +2722,23 @@ async def run_arbitrage_worker(
             pass
         for balance_manager in BalanceManager.exchange_balance_instance_dict.values():
             balance_manager.enable = False
-
-        for symbol in list(ArbitrageManager.web_grid_rows):
+        for clock_sync in ClockSyncService.clock_sync_instance_dict.values():
+            clock_sync.enable = False
+
+        # От худшей строки к лучшей: убранная строка не из лучших K не
+        # вызывает подъёма следующей в агрегатор.
+        for symbol in sorted(
+            ArbitrageManager.web_grid_rows,
+            key=lambda row_symbol: ArbitrageManager.web_grid_rows[row_symbol]["open_ratio_value"],
+        ):
             ArbitrageManager._remove_web_grid_row(symbol)
 
         await task_manager.cancel_all()
+        if shared_table is not None:
+            # Закрывать сегмент только после остановки задачи-читателя.
+            shared_table.close()
+        if ExchangeInstrument.orderbook_recorder is not None:
+            ExchangeInstrument.orderbook_recorder.close()
 
 
 def run_arbitrage_worker_process(
@@ -1305,6 +2750,12 @@ def run_arbitrage_worker_process(
     web_grid_queue,
     control_queue,
     shared_values: dict[str, Any],
+    shared_orderbook_layout: dict[str, Any] | None = None,
+    shared_swap_raw_data_dict: dict[str, dict[str, dict[str, Any]]] | None = None,
+    orderbook_record_dir: str | None = None,
+    spread_engine_mode: str = "per_symbol",
+    grid_top_k: int | None = None,
+    command_queue=None,
 ) -> None:
     asyncio.run(
         run_arbitrage_worker(
@@ -1315,5 +2766,11 @@ def run_arbitrage_worker_process(
             web_grid_queue=web_grid_queue,
             control_queue=control_queue,
             shared_values=shared_values,
+            shared_orderbook_layout=shared_orderbook_layout,
+            shared_swap_raw_data_dict=shared_swap_raw_data_dict,
+            orderbook_record_dir=orderbook_record_dir,
+            spread_engine_mode=spread_engine_mode,
+            grid_top_k=grid_top_k,
+            command_queue=command_queue,
         )
     )
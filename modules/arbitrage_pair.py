@@ -15,7 +15,7 @@ from collections import deque
 from math import sqrt
 from typing import Any
 
-_version_ = "1.1"
+_version_ = "1.2"
 
 
 class SpreadWindow:
@@ -24,62 +24,163 @@ class SpreadWindow:
     Класс отвечает только за аналитику (не за торговые решения):
     хранит последние значения спреда и возвращает статистики по всему окну
     или по последним `period` точкам.
+
+    Окно — кольцевой буфер фиксированного размера. Для всего окна
+    статистики считаются за O(1): сумма и сумма квадратов отклонений от
+    сдвига `_shift` ведутся при `append`, min/max — по монотонным очередям
+    номеров тиков. Раз в `size` добавлений (и при смене уровня, см.
+    `RESUM_RATIO`) суммы пересчитываются заново со сдвигом на текущее
+    среднее, чтобы ошибка float не накапливалась. Срез по
+    `period` короче окна считается проходом по хвосту буфера.
     """
+
+    # Суммы пересчитываются и раньше, если окно ушло от сдвига так далеко,
+    # что `mean^2 / variance` (в единицах сдвига) больше этого числа: иначе
+    # дисперсия теряет точность при вычитании (смена уровня спреда).
+    RESUM_RATIO = 1e6
         # Инициализация размера окна в тиках
     def __init__(self, size: int) -> None:
         if size < 2:
             raise ValueError("size должен быть >= 2")
-        self._window: deque[float] = deque(maxlen=size)
+        self.size = size
+        self._values: list[float] = [0.0] * size
+        # Позиция следующей записи, число значений, номер следующего тика.
+        self._head = 0
+        self._count = 0
+        self._seq = 0
+        self._shift = 0.0
+        self._sum = 0.0
+        self._sumsq = 0.0
+        self._appends_since_resum = 0
+        # Номера тиков-кандидатов: значения по возрастанию (min) и по
+        # убыванию (max); в голове — экстремум окна.
+        self._min_seqs: deque[int] = deque()
+        self._max_seqs: deque[int] = deque()
 
     def append(self, value: float) -> None:
         """Добавить следующий тик спреда в окно."""
-        self._window.append(float(value))
+        x = float(value)
+        size = self.size
+        values = self._values
+        seq = self._seq
+        expired = seq - size
+        if self._count == size:
+            d = values[self._head] - self._shift
+            self._sum -= d
+            self._sumsq -= d * d
+        else:
+            if not self._count:
+                self._shift = x
+            self._count += 1
+        values[self._head] = x
+        d = x - self._shift
+        self._sum += d
+        self._sumsq += d * d
+
+        min_seqs = self._min_seqs
+        if min_seqs and min_seqs[0] <= expired:
+            min_seqs.popleft()
+        while min_seqs and values[min_seqs[-1] % size] >= x:
+            min_seqs.pop()
+        min_seqs.append(seq)
+        max_seqs = self._max_seqs
+        if max_seqs and max_seqs[0] <= expired:
+            max_seqs.popleft()
+        while max_seqs and values[max_seqs[-1] % size] <= x:
+            max_seqs.pop()
+        max_seqs.append(seq)
+
+        self._head = (self._head + 1) % size
+        self._seq = seq + 1
+        self._appends_since_resum += 1
+        mean_shifted = self._sum / self._count
+        if (
+            self._appends_since_resum >= size
+            or mean_shifted * mean_shifted * self._count > self.RESUM_RATIO * (self._sumsq - mean_shifted * self._sum)
+        ):
+            self._resum()
+
+    def _resum(self) -> None:
+        """Пересчитать суммы окна со сдвигом на текущее среднее."""
+        self._appends_since_resum = 0
+        values = self._ordered()
+        shift = sum(values) / len(values)
+        self._shift = shift
+        self._sum = sum(x - shift for x in values)
+        self._sumsq = sum((x - shift) ** 2 for x in values)
+
+    def _ordered(self) -> list[float]:
+        """Значения окна от старого к новому (копия)."""
+        if self._count < self.size:
+            return self._values[:self._count]
+        return self._values[self._head:] + self._values[:self._head]
 
     def get_all(self) -> list[float]:
         """Вернуть копию всех значений, которые сейчас есть в окне."""
-        return list(self._window)
+        return self._ordered()
 
     def count(self) -> int:
         """Вернуть текущее количество тиков в окне."""
-        return len(self._window)
+        return self._count
 
     def is_ready(self) -> bool:
         """Вернуть True, когда окно полностью заполнено."""
-        return len(self._window) == self._window.maxlen
-
-    def _tail(self, period: int | None = None) -> list[float]:
-        """Вернуть хвост выборки для расчётов по периоду."""
-        data = list(self._window)
-        if not data:
-            return []
+        return self._count == self.size
 
+    def _is_full_period(self, period: int | None) -> bool:
         if period is None:
-            return data
+            return True
         if period <= 0:
             raise ValueError("period должен быть > 0")
-        if period >= len(data):
+        return period >= self._count
+
+    def _tail(self, period: int | None = None) -> list[float]:
+        """Вернуть хвост выборки для расчётов по периоду."""
+        data = self._ordered()
+        if not data or self._is_full_period(period):
             return data
         return data[-period:]
 
+    def _moments(self) -> tuple[float, float]:
+        """Среднее и дисперсия (population) всего окна за O(1)."""
+        n = self._count
+        mean_shifted = self._sum / n
+        variance = self._sumsq / n - mean_shifted * mean_shifted
+        # Плоское окно после сдвига даёт ровно 0; отрицательный остаток —
+        # погрешность вычитания.
+        return self._shift + mean_shifted, variance if variance > 0.0 else 0.0
+
     def min(self, period: int | None = None) -> float | None:
         """Минимум по всему окну или по последним `period` тикам."""
-        data = self._tail(period)
-        return min(data) if data else None
+        if not self._count:
+            return None
+        if self._is_full_period(period):
+            return self._values[self._min_seqs[0] % self.size]
+        return min(self._tail(period))
 
     def max(self, period: int | None = None) -> float | None:
         """Максимум по всему окну или по последним `period` тикам."""
-        data = self._tail(period)
-        return max(data) if data else None
+        if not self._count:
+            return None
+        if self._is_full_period(period):
+            return self._values[self._max_seqs[0] % self.size]
+        return max(self._tail(period))
 
     def mean(self, period: int | None = None) -> float | None:
         """Среднее арифметическое по окну или по последним `period` тикам."""
-        data = self._tail(period)
-        if not data:
+        if not self._count:
             return None
+        if self._is_full_period(period):
+            return self._moments()[0]
+        data = self._tail(period)
         return sum(data) / len(data)
 
     def std(self, period: int | None = None) -> float | None:
         """Стандартное отклонение (population) по окну или периоду."""
+        if self._count < 2:
+            return None
+        if self._is_full_period(period):
+            return sqrt(self._moments()[1])
         data = self._tail(period)
         if len(data) < 2:
             return None
@@ -89,7 +190,7 @@ class SpreadWindow:
 
     def last(self) -> float | None:
         """Вернуть последнее значение спреда или None, если окно пустое."""
-        return self._window[-1] if self._window else None
+        return self._values[self._head - 1] if self._count else None
 
     def zscore_last(self, period: int | None = None) -> float | None:
         """Вернуть z-score последней точки для выбранной выборки.
@@ -98,21 +199,18 @@ class SpreadWindow:
         - None, если точек меньше 2
         - 0.0, если sigma равна 0 (плоская выборка)
         """
-        data = self._tail(period)
-        if len(data) < 2:
+        mu = self.mean(period)
+        sigma = self.std(period)
+        if sigma is None:
             return None
-
-        mu = sum(data) / len(data)
-        variance = sum((x - mu) ** 2 for x in data) / len(data)
-        sigma = sqrt(variance)
         if sigma == 0:
             return 0.0
-        return (data[-1] - mu) / sigma
+        return (self.last() - mu) / sigma
 
     def snapshot(self, period: int | None = None) -> dict[str, float | int | None]:
         """Вернуть компактный срез статистик для логов/сигнального пайплайна."""
-        data = self._tail(period)
-        if not data:
+        count = self._count if self._is_full_period(period) else period
+        if not count:
             return {
                 "count": 0,
                 "mean": None,
@@ -122,27 +220,16 @@ class SpreadWindow:
                 "last": None,
                 "zscore_last": None,
             }
-
-        mu = sum(data) / len(data)
-        if len(data) >= 2:
-            variance = sum((x - mu) ** 2 for x in data) / len(data)
-            sigma = sqrt(variance)
-            zscore_last = 0.0 if sigma == 0 else (data[-1] - mu) / sigma
-        else:
-            sigma = None
-            zscore_last = None
-
         return {
-            "count": len(data),
-            "mean": mu,
-            "std": sigma,
-            "min": min(data),
-            "max": max(data),
-            "last": data[-1],
-            "zscore_last": zscore_last,
+            "count": count,
+            "mean": self.mean(period),
+            "std": self.std(period),
+            "min": self.min(period),
+            "max": self.max(period),
+            "last": self.last(),
+            "zscore_last": self.zscore_last(period),
         }
 
-
 class EMA:
     """EMA (экспоненциальное среднее) для сглаживания спреда."""
 
@@ -175,13 +262,17 @@ class ArbitrageDirectionState:
         self.ema = EMA(ema_alpha)
         self.last_spread: float | None = None
 
-    def update(self, spread_value: float, period: int | None = None) -> dict[str, float | int | None]:
-        """Добавить тик спреда и вернуть актуальный срез статистик."""
+    def push(self, spread_value: float) -> None:
+        """Добавить тик спреда без расчёта среза (горячий путь сканера)."""
         self.last_spread = float(spread_value)
         self.spread_window.append(self.last_spread)
-        ema_value = self.ema.update(self.last_spread)
+        self.ema.update(self.last_spread)
+
+    def update(self, spread_value: float, period: int | None = None) -> dict[str, float | int | None]:
+        """Добавить тик спреда и вернуть актуальный срез статистик."""
+        self.push(spread_value)
         stats = self.spread_window.snapshot(period=period)
-        stats["ema"] = ema_value
+        stats["ema"] = self.ema.value
         return stats
 
     def tick_count(self) -> int:
@@ -194,7 +285,9 @@ class ArbitragePair:
 
     Важно:
     - один экземпляр представляет ровно одну комбинацию бирж;
-    - оба направления обновляются вместе, когда есть цены обеих бирж.
+    - оба направления обновляются вместе, когда есть цены обеих бирж;
+    - при `ratio=True` спред направления — `100 * (bid - ask) / ask`, %
+      (как `open_ratio` сканера), иначе разница цен `bid - ask`.
     """
 
     def __init__(
@@ -203,9 +296,11 @@ class ArbitragePair:
         exchange2: str,
         window_size: int = 120,
         ema_alpha: float = 0.15,
+        ratio: bool = False,
     ) -> None:
         self.exchange1 = exchange1
         self.exchange2 = exchange2
+        self.ratio = ratio
 
         # Последние известные средние цены (ask/bid) по обеим биржам.
         self.average_price_dict: dict[str, dict[str, float | None]] = {
@@ -282,18 +377,16 @@ class ArbitragePair:
         if not self._is_prices_ready():
             return None
 
-        ask1 = float(self.average_price_dict[self.exchange1]["average_ask"])
-        bid1 = float(self.average_price_dict[self.exchange1]["average_bid"])
-        ask2 = float(self.average_price_dict[self.exchange2]["average_ask"])
-        bid2 = float(self.average_price_dict[self.exchange2]["average_bid"])
-
-        # Direct:  покупка ex1 по ask1, продажа ex2 по bid2.
-        self.direct_spread = bid2 - ask1
-        # Reverse: покупка ex2 по ask2, продажа ex1 по bid1.
-        self.reverse_spread = bid1 - ask2
-
-        direct_stats = self.direct_state.update(self.direct_spread, period=stats_period)
-        reverse_stats = self.reverse_state.update(self.reverse_spread, period=stats_period)
+        self.push_prices(
+            float(self.average_price_dict[self.exchange1]["average_ask"]),
+            float(self.average_price_dict[self.exchange1]["average_bid"]),
+            float(self.average_price_dict[self.exchange2]["average_ask"]),
+            float(self.average_price_dict[self.exchange2]["average_bid"]),
+        )
+        direct_stats = self.direct_state.spread_window.snapshot(period=stats_period)
+        direct_stats["ema"] = self.direct_state.ema.value
+        reverse_stats = self.reverse_state.spread_window.snapshot(period=stats_period)
+        reverse_stats["ema"] = self.reverse_state.ema.value
 
         return {
             "pair": (self.exchange1, self.exchange2),
@@ -302,3 +395,24 @@ class ArbitragePair:
             "direct_spread": self.direct_spread,
             "reverse_spread": self.reverse_spread,
         }
+
+    def push_prices(self, ask1: float, bid1: float, ask2: float, bid2: float) -> None:
+        """Добавить тик обоих направлений по ценам бирж (без словарей).
+
+        Кэш `average_price_dict` не обновляется: горячий путь сканера держит
+        цены сам.
+        """
+        if self.ratio:
+            # Direct:  покупка ex1 по ask1, продажа ex2 по bid2.
+            self.direct_spread = 100.0 * (bid2 - ask1) / ask1
+            # Reverse: покупка ex2 по ask2, продажа ex1 по bid1.
+            self.reverse_spread = 100.0 * (bid1 - ask2) / ask2
+        else:
+            self.direct_spread = bid2 - ask1
+            self.reverse_spread = bid1 - ask2
+        self.direct_state.push(self.direct_spread)
+        self.reverse_state.push(self.reverse_spread)
+
+    def direction_state(self, ask_exchange: str) -> ArbitrageDirectionState:
+        """Состояние направления с покупкой на `ask_exchange`."""
+        return self.direct_state if ask_exchange == self.exchange1 else self.reverse_state
@@ -3,7 +3,7 @@ __version__ = '4.0'
 import asyncio
 import sys
 from decimal import Decimal
-from typing import Dict, Optional
+from typing import Dict, NamedTuple, Optional
 from contextlib import AsyncExitStack
 import ccxt.pro as ccxt
 from modules import cprint
@@ -11,10 +11,25 @@ from modules.utils import to_decimal
 from modules.exchange_instance import ExchangeInstance
 from modules.task_manager import TaskManager
 
+class BalanceSnapshot(NamedTuple):
+    """Неизменяемый снимок баланса биржи для горячего цикла стаканов.
+
+    Публикуется заменой `BalanceManager.snapshot` целиком при каждом изменении
+    баланса или объёма сделки. Читателю достаточно сравнить `version` с
+    последней увиденной — без `asyncio.Lock` и `await`.
+    """
+    version: int
+    balance: Optional[Decimal]
+    is_valid: bool
+    max_deal_volume: Optional[Decimal]
+
+
 class BalanceManager:
     task_manager = None
     exchange_balance_instance_dict = {}
     _lock: asyncio.Lock | None = None
+    # Сквозной счётчик версий снимков всех бирж процесса.
+    _snapshot_version: int = 0
 
     RETRY_DELAY: float = 3.0
 
@@ -43,6 +58,14 @@ class BalanceManager:
             cprint.error_w(msg)
             raise RuntimeError(msg)
 
+    @classmethod
+    def get_balance_snapshot(cls, exchange_id) -> BalanceSnapshot:
+        """Вернуть текущий `BalanceSnapshot` биржи без блокировок."""
+        obj = cls.exchange_balance_instance_dict.get(exchange_id)
+        if obj is None:
+            return cls.get_balance_instance(exchange_id).snapshot
+        return obj.snapshot
+
     async def wait_initialized(self):
         await self._initialized_event.wait()
         if self.__class__._volume_ready_event is not None:
@@ -72,8 +95,23 @@ class BalanceManager:
         self._lock = asyncio.Lock()
         self._initialized_event = asyncio.Event()
 
+        self.snapshot: BalanceSnapshot
+        self._publish_snapshot()
+
         self.__class__.exchange_balance_instance_dict[exchange.id] = self
 
+    def _publish_snapshot(self) -> None:
+        """Собрать новый `BalanceSnapshot` и подменить им текущий одним присваиванием."""
+        cls = self.__class__
+        cls._snapshot_version += 1
+        balance = self.exchange_balance
+        self.snapshot = BalanceSnapshot(
+            version=cls._snapshot_version,
+            balance=balance,
+            is_valid=balance is not None and balance > 0,
+            max_deal_volume=self.max_deal_volume,
+        )
+
 
     async def _fetch_balance(self) -> None:
         while self.enable:
@@ -145,6 +183,7 @@ class BalanceManager:
         async with self._lock:
             if self.exchange_balance != dec_value:
                 self.exchange_balance = dec_value
+                self._publish_snapshot()
                 cprint.success_w(
                     f"[BalanceManager][{self.exchange_id}] Balance updated: {dec_value}"
                 )
@@ -191,7 +230,9 @@ class BalanceManager:
             for obj in cls.exchange_balance_instance_dict.values():
                 obj.min_balance = cls.min_balance
                 obj.exchange_min_balance = cls.exchange_min_balance
-                obj.max_deal_volume = cls.max_deal_volume
+                if obj.max_deal_volume != cls.max_deal_volume:
+                    obj.max_deal_volume = cls.max_deal_volume
+                    obj._publish_snapshot()
 
         return min_exchange_id, min_balance
 
@@ -0,0 +1,220 @@
+_version_ = "1.0"
+"""Компактное представление стакана на границе приёма.
+
+Стакан ccxt — словарь со списками уровней `[price, size, ...]`, у части бирж
+с лишними полями (Exmo `[price, size, count]`, Coincatch
+`[price, size, [str, str]]`, см. readme.txt). Раньше каждый потребитель сам
+проверял и резал эти списки: отпечаток уровней в `process_orderbook`,
+скалярный и векторный проходы VWAP, `ArbitrageRootClass.watch_orderbook`.
+
+`OrderbookNormalizer` биржи один раз переводит стакан в `CompactOrderbook`:
+- стороны `CompactOrderbookSide` с плоским `array('d')`
+  `[price0, size0, price1, size1, ...]` (без кортежей на уровень);
+- `exchange_ts` (биржевой `timestamp`, мс), `local_ts` (`time.monotonic()`
+  приёма) и `seq` — номер стакана символа у нормализатора.
+
+Нормализатор переводит только верхние `max_levels` уровней: расчёт цен
+обычно исполняется на первых уровнях, а `total_levels` стороны хранит
+исходную длину, чтобы отличать обрезанный стакан от тонкого.
+`OrderbookNormalizer.fingerprint` снимает отпечаток уровней с исходных
+списков, поэтому неизменившийся стакан отбрасывается без перевода.
+
+Notes:
+    Цены хранятся как float64. ccxt отдаёт уровни float, поэтому число
+    знаков цены (`repr`) и округление средней цены совпадают с расчётом по
+    исходным спискам. Если среди цен стороны есть не float (строки с
+    незначащими нулями `"0.10"`, int, `Decimal`), исходные цены сохраняются
+    в `source_prices`: число знаков и округление берутся по ним.
+"""
+
+from array import array
+from itertools import chain
+import time
+from typing import Any, Optional, Sequence
+
+# Типы цен, для которых `source_prices` не нужны: число знаков даёт `repr`.
+_FLOAT_TYPES = {float}
+
+class CompactOrderbookSide:
+    """Сторона стакана: плоский массив `[price, size, ...]` от лучшей цены."""
+
+    __slots__ = ("levels", "total_levels", "source_prices")
+
+    def __init__(self, levels: array, total_levels: int, source_prices: Optional[list[Any]] = None):
+        self.levels = levels
+        # Уровней в исходной стороне (может быть больше переведённых).
+        self.total_levels = total_levels
+        # Исходные цены переведённых уровней, если не все они float
+        # (иначе `None`): по ним считается число знаков цены.
+        self.source_prices = source_prices
+
+    def __len__(self) -> int:
+        return len(self.levels) >> 1
+
+    @property
+    def truncated(self) -> bool:
+        """В исходной стороне есть уровни глубже переведённых."""
+        return self.total_levels > len(self.levels) >> 1
+
+    @property
+    def prices(self) -> array:
+        return self.levels[0::2]
+
+    @property
+    def sizes(self) -> array:
+        return self.levels[1::2]
+
+    def to_levels(self, limit: Optional[int] = None, original_prices: bool = False) -> list[list[Any]]:
+        """Уровни в формате ccxt `[[price, size], ...]` (первые `limit`).
+
+        Args:
+            original_prices: Взять исходные цены (`source_prices`), если они
+                сохранены, — для расчёта с тем же округлением, что по
+                исходным спискам.
+        """
+        levels = self.levels if limit is None else self.levels[:limit << 1]
+        if original_prices and self.source_prices is not None:
+            prices = self.source_prices
+            return [[prices[i >> 1], levels[i + 1]] for i in range(0, len(levels), 2)]
+        return [[levels[i], levels[i + 1]] for i in range(0, len(levels), 2)]
+
+
+class CompactOrderbook:
+    """Стакан после нормализации: две стороны и метки времени."""
+
+    __slots__ = ("symbol", "asks", "bids", "exchange_ts", "local_ts", "seq")
+
+    def __init__(
+            self, symbol: str, asks: CompactOrderbookSide, bids: CompactOrderbookSide,
+            exchange_ts: Optional[int], local_ts: float, seq: int,
+    ):
+        self.symbol = symbol
+        self.asks = asks
+        self.bids = bids
+        self.exchange_ts = exchange_ts
+        self.local_ts = local_ts
+        self.seq = seq
+
+
+class OrderbookNormalizer:
+    """Перевод стаканов одной биржи в `CompactOrderbook`.
+
+    Экземпляры хранятся в `normalizers_dict` по `exchange_id`. Уровни-списки
+    из двух чисел склеиваются в один список и переводятся одним `array('d')`.
+    Если у биржи уровни с лишними полями (или не списки), нормализатор один
+    раз переключается на разбор по уровню (`level_format = "extra_fields"`)
+    и остаётся на нём.
+    """
+
+    # До этого числа уровней стороны склеиваются `sum(top, [])`: на коротком
+    # окне это быстрее `chain`, но растёт квадратично.
+    SUM_FLATTEN_MAX_LEVELS = 32
+
+    normalizers_dict: dict[str, "OrderbookNormalizer"] = {}
+
+    @classmethod
+    def get_normalizer(cls, exchange_id: str) -> "OrderbookNormalizer":
+        normalizer = cls.normalizers_dict.get(exchange_id)
+        if normalizer is None:
+            normalizer = cls.normalizers_dict[exchange_id] = cls(exchange_id)
+        return normalizer
+
+    @classmethod
+    def reset(cls) -> None:
+        cls.normalizers_dict = {}
+
+    def __init__(self, exchange_id: str):
+        self.exchange_id = exchange_id
+        self.level_format = "plain"
+        # {symbol: номер последнего стакана}
+        self._seq_dict: dict[str, int] = {}
+
+    def _side(self, side: Sequence[Any], max_levels: Optional[int]) -> CompactOrderbookSide:
+        top = side if max_levels is None or max_levels >= len(side) else side[:max_levels]
+        if self.level_format == "plain":
+            try:
+                if len(top) <= self.SUM_FLATTEN_MAX_LEVELS:
+                    flat = sum(top, [])
+                else:
+                    flat = list(chain.from_iterable(top))
+                levels = array("d", flat)
+            except (TypeError, ValueError):
+                levels = None
+            if levels is not None and len(levels) == len(top) << 1:
+                prices = flat[0::2]
+                return CompactOrderbookSide(levels, len(side), None if set(map(type, prices)) <= _FLOAT_TYPES else prices)
+            self.level_format = "extra_fields"
+            print(f"[{self.exchange_id}][NORMALIZER] orderbook levels with extra fields, parsing per level")
+
+        levels = array("d")
+        prices = []
+        for item in top:
+            if not isinstance(item, (list, tuple)) or len(item) < 2:
+                raise ValueError(f"Ордер должен быть списком/кортежем из минимум двух элементов: {item}")
+            try:
+                levels.append(float(item[0]))
+                levels.append(float(item[1]))
+            except (TypeError, ValueError) as e:
+                raise ValueError(
+                    f"Не удалось преобразовать цену или объём: price={item[0]}, volume={item[1]}, ошибка: {e}"
+                )
+            prices.append(item[0])
+        return CompactOrderbookSide(levels, len(side), None if set(map(type, prices)) <= _FLOAT_TYPES else prices)
+
+    def fingerprint(self, side: Sequence[Any], depth: int) -> Optional[tuple[int, list[Any]]]:
+        """Отпечаток первых `depth` уровней исходной стороны стакана.
+
+        Снимается до `normalize`: неизменившийся стакан отбрасывается без
+        перевода. Значения уровней копируются в плоский список — ccxt
+        обновляет списки уровней на месте.
+
+        Returns:
+            `(marker, [price0, size0, ...])`, где `marker` равен длине
+            стороны, если `depth` больше неё (на расчёт влияет появление
+            новых уровней), иначе `-1`. `None`, если уровни не разбираются:
+            такой отпечаток не совпадает ни с одним.
+        """
+        marker = len(side) if depth > len(side) else -1
+        top = side[:depth]
+        try:
+            if self.level_format == "plain":
+                return marker, list(chain.from_iterable(top))
+            return marker, [value for item in top for value in item[:2]]
+        except TypeError:
+            return None
+
+    def normalize(self, orderbook: dict[str, Any], symbol: str, max_levels: Optional[int] = None) -> CompactOrderbook:
+        """Перевести стакан ccxt в `CompactOrderbook`.
+
+        Args:
+            orderbook: Стакан `{"asks": [...], "bids": [...], "timestamp": ...}`.
+            symbol: Символ стакана (ключ счётчика `seq`).
+            max_levels: Сколько верхних уровней перевести. `None` — все.
+
+        Raises:
+            ValueError: Если сторона не список или уровень не приводится к
+                двум числам.
+        """
+        asks = orderbook["asks"]
+        bids = orderbook["bids"]
+        if not isinstance(asks, list) or not isinstance(bids, list):
+            raise ValueError(f"Стакан должен содержать списки asks/bids: {type(asks)}, {type(bids)}")
+        seq = self._seq_dict.get(symbol, 0) + 1
+        self._seq_dict[symbol] = seq
+        return CompactOrderbook(
+            symbol,
+            self._side(asks, max_levels),
+            self._side(bids, max_levels),
+            orderbook.get("timestamp"),
+            time.monotonic(),
+            seq,
+        )
+
+    def expand(self, book: CompactOrderbook, orderbook: dict[str, Any]) -> None:
+        """Перевести стороны `book` из `orderbook` целиком (без `max_levels`).
+
+        Нужен, когда исполнению не хватило переведённых уровней, а исходный
+        стакан глубже. Метки времени и `seq` не меняются.
+        """
+        book.asks = self._side(orderbook["asks"], None)
+        book.bids = self._side(orderbook["bids"], None)
@@ -0,0 +1,245 @@
+_version_ = "1.0"
+"""Процесс биржи для топологии `shared_feeds`.
+
+Процесс держит единственное подключение к своей бирже, слушает стаканы всех
+общих символов (через `ExchangeOrderbookFeed` либо задачами на пару) и пишет
+события `ExchangeInstrument` в таблицу `SharedOrderbookTable`. Арбитражные
+воркеры читают таблицу и собственных подписок не открывают: число
+WebSocket-подключений равно числу бирж, а не `воркеры × биржи`.
+
+Протокол с главным процессом:
+1. процесс открывает биржу и отправляет в `layout_queue`
+   `{"event": "feed_markets", "exchange_id", "swap_data": {symbol: swap_data}}`
+   или `{"event": "feed_failed", "exchange_id", "text"}`;
+2. главный процесс собирает рынки всех бирж, создаёт таблицу и кладёт её
+   `layout` в `command_queue` процесса (`None` — завершиться без запуска);
+3. процесс публикует баланс биржи в таблицу и запускает стаканы символов,
+   присутствующих в `layout`, до установки флага `shutdown`.
+"""
+
+import asyncio
+from contextlib import AsyncExitStack
+from decimal import Decimal
+import time
+from typing import Any, Optional
+
+from modules import cprint
+from modules.arbitrage_manager import (
+    ExchangeInstrument,
+    _collect_linear_usdt_swaps,
+    _open_exchange_instances,
+    _reset_runtime_state,
+    _start_clock_sync,
+    _wait_for_shared_shutdown,
+)
+from modules.balance_manager import BalanceManager, BalanceSnapshot
+from modules.orderbook_feed import ExchangeOrderbookFeed
+from modules.orderbook_recorder import OrderbookRecorder
+from modules.shared_orderbook import SharedOrderbookPublisher, SharedOrderbookTable
+from modules.task_manager import TaskManager
+from modules.time_sync import ClockSyncService
+from modules.utils import to_decimal
+
+
+# Период публикации баланса биржи в общую таблицу.
+BALANCE_PUBLISH_INTERVAL_SEC = 1.0
+
+
+class SharedDealVolume:
+    """Объём сделки по минимальному балансу всех бирж из общей таблицы.
+
+    Подставляется в `ExchangeInstrument.balance_manager` процесса биржи:
+    `BalanceManager` процесса знает только свою биржу, а объём сделки
+    считается по минимальному балансу среди всех бирж топологии.
+    """
+
+    def __init__(self, table: SharedOrderbookTable, max_deal_slots: Decimal):
+        self.table = table
+        self.max_deal_slots = max_deal_slots
+        self._version: Optional[int] = None
+        self._max_deal_volume: Optional[Decimal] = None
+        # {exchange_id: ((версия снимка биржи, версия балансов таблицы), BalanceSnapshot)}
+        self._snapshot_dict: dict[str, tuple[tuple[int, int], BalanceSnapshot]] = {}
+        self._snapshot_version = 0
+
+    @staticmethod
+    def get_balance_instance(exchange_id: str) -> BalanceManager:
+        return BalanceManager.get_balance_instance(exchange_id)
+
+    def get_balance_snapshot(self, exchange_id: str) -> BalanceSnapshot:
+        """Снимок баланса биржи с объёмом сделки по общей таблице.
+
+        Новый снимок (и новая версия) собирается только при смене снимка
+        `BalanceManager` биржи или версии балансов таблицы.
+        """
+        own = BalanceManager.get_balance_snapshot(exchange_id)
+        source_versions = (own.version, self.table.balances_version())
+        cached = self._snapshot_dict.get(exchange_id)
+        if cached is not None and cached[0] == source_versions:
+            return cached[1]
+        self._snapshot_version += 1
+        snapshot = own._replace(version=self._snapshot_version, max_deal_volume=self.max_deal_volume)
+        self._snapshot_dict[exchange_id] = (source_versions, snapshot)
+        return snapshot
+
+    @property
+    def max_deal_volume(self) -> Optional[Decimal]:
+        """`0.9 * min(balance) / max_deal_slots`, пересчёт только при смене балансов."""
+        version = self.table.balances_version()
+        if version != self._version:
+            self._version = version
+            balances = self.table.read_balances()
+            if balances and self.max_deal_slots:
+                self._max_deal_volume = to_decimal('0.9') * min(balances.values()) / self.max_deal_slots
+            else:
+                self._max_deal_volume = None
+        if self._max_deal_volume is None:
+            return BalanceManager.max_deal_volume
+        return self._max_deal_volume
+
+
+async def _publish_balance_loop(
+    *,
+    table: SharedOrderbookTable,
+    balance_manager: BalanceManager,
+    interval_sec: float = BALANCE_PUBLISH_INTERVAL_SEC,
+) -> None:
+    """Публиковать баланс биржи в таблицу при его изменении."""
+    last_balance: Optional[Decimal] = None
+    while True:
+        balance = await balance_manager.get_balance()
+        if balance is not None and balance != last_balance:
+            table.write_balance(balance_manager.exchange_id, balance)
+            last_balance = balance
+        await asyncio.sleep(interval_sec)
+
+
+def _put_feed_event(layout_queue, payload: dict[str, Any]) -> None:
+    try:
+        layout_queue.put(payload)
+    except Exception:
+        return
+
+
+async def run_exchange_feed(
+    *,
+    exchange_id: str,
+    max_deal_slots: Decimal,
+    layout_queue,
+    command_queue,
+    shared_values: dict[str, Any],
+    orderbook_record_dir: Optional[str] = None,
+) -> None:
+    """Запустить процесс биржи.
+
+    Args:
+        exchange_id: Биржа, которую обслуживает процесс.
+        max_deal_slots: Число слотов сделки для расчёта объёма.
+        layout_queue: Очередь событий процесса в главный процесс.
+        command_queue: Очередь главного процесса в этот процесс (`layout`).
+        shared_values: Общие флаги (`shutdown`).
+        orderbook_record_dir: Каталог записи сырого потока стаканов; `None` —
+            не записывать.
+    """
+    task_manager = TaskManager()
+    _reset_runtime_state(shared_values=shared_values)
+    BalanceManager.task_manager = task_manager
+    BalanceManager.max_deal_slots = max_deal_slots
+    ExchangeOrderbookFeed.task_manager = task_manager
+    table: Optional[SharedOrderbookTable] = None
+    if orderbook_record_dir is not None:
+        ExchangeInstrument.orderbook_recorder = OrderbookRecorder(orderbook_record_dir, prefix=f"feed-{exchange_id}")
+
+    try:
+        async with AsyncExitStack() as stack:
+            exchange_instance_dict, failed = await _open_exchange_instances(stack, [exchange_id])
+            exchange = exchange_instance_dict.get(exchange_id)
+            if exchange is None:
+                error = failed[0][1] if failed else Exception("unknown error")
+                _put_feed_event(
+                    layout_queue,
+                    {"event": "feed_failed", "exchange_id": exchange_id, "text": str(error), "ts": time.time()},
+                )
+                return
+
+            _start_clock_sync(exchange_instance_dict, task_manager)
+            swap_data_dict = _collect_linear_usdt_swaps(exchange)
+            _put_feed_event(
+                layout_queue,
+                {
+                    "event": "feed_markets",
+                    "exchange_id": exchange_id,
+                    "swap_data": swap_data_dict,
+                    "ts": time.time(),
+                },
+            )
+            layout = await asyncio.to_thread(command_queue.get)
+            if layout is None:
+                return
+
+            table = SharedOrderbookTable.attach(layout)
+            balance_manager = BalanceManager(exchange)
+            task_manager.add_task(name=f"_BalanceTask|{exchange_id}", coro_func=balance_manager._watch_balance)
+            task_manager.add_task(
+                name=f"_SharedBalanceTask|{exchange_id}",
+                coro_func=_publish_balance_loop,
+                table=table,
+                balance_manager=balance_manager,
+            )
+
+            ExchangeInstrument.get_configure(
+                exchanges_instances_dict=exchange_instance_dict,
+                balance_manager=SharedDealVolume(table, max_deal_slots),
+                task_manager=task_manager,
+            )
+            ExchangeInstrument.PUBLISH_TOP_LEVELS = layout["top_levels"]
+
+            feed = ExchangeOrderbookFeed.get_feed(exchange)
+            symbols = [symbol for symbol in layout["symbols"] if symbol in swap_data_dict]
+            for symbol in symbols:
+                instrument = ExchangeInstrument(
+                    exchange_instance=exchange,
+                    symbol=symbol,
+                    orderbook_queue=SharedOrderbookPublisher(table, symbol, exchange_id),
+                )
+                if feed is not None:
+                    feed.register(instrument)
+                else:
+                    task_manager.add_task(
+                        name=f"_OrderbookTask|{symbol}|{exchange_id}",
+                        coro_func=instrument.watch_orderbook,
+                    )
+            cprint.success_w(f"[feed:{exchange_id}] streaming symbols={len(symbols)}")
+
+            await _wait_for_shared_shutdown(shared_values)
+    finally:
+        for balance_manager in BalanceManager.exchange_balance_instance_dict.values():
+            balance_manager.enable = False
+        for clock_sync in ClockSyncService.clock_sync_instance_dict.values():
+            clock_sync.enable = False
+        await task_manager.cancel_all()
+        if table is not None:
+            table.close()
+        if ExchangeInstrument.orderbook_recorder is not None:
+            ExchangeInstrument.orderbook_recorder.close()
+
+
+def run_exchange_feed_process(
+    *,
+    exchange_id: str,
+    max_deal_slots: Decimal,
+    layout_queue,
+    command_queue,
+    shared_values: dict[str, Any],
+    orderbook_record_dir: Optional[str] = None,
+) -> None:
+    asyncio.run(
+        run_exchange_feed(
+            exchange_id=exchange_id,
+            max_deal_slots=max_deal_slots,
+            layout_queue=layout_queue,
+            command_queue=command_queue,
+            shared_values=shared_values,
+            orderbook_record_dir=orderbook_record_dir,
+        )
+    )
@@ -160,7 +160,8 @@ class ExchangeInstance:
                 'timeout': 30000,
             })
 
-            if self.exchange_id == 'gateio':
+            # Офлайн-модуль бирж (повтор, `OFFLINE = True`) ключи API не использует.
+            if self.exchange_id == 'gateio' and not getattr(self.ccxt_module, 'OFFLINE', False):
                 uid = self.api_keys.get('uid')
                 if not uid:
                     logger.error("[gateio] РѕС‚СЃСѓС‚СЃС‚РІСѓРµС‚ uid РІ api_keys.json")
@@ -399,16 +400,17 @@ class ExchangeInstance:
     # Р¤РћРќРћР’Р«Р™ РћР‘РќРћР’РРўР•Р›Р¬ MARKETS
     # ===============================================================
     async def _background_markets_updater(self, interval: int, updating: bool):
+        # Рынки уже загружены в `__aenter__`; без `force_reload` ccxt
+        # вернул бы их из кэша, и новые листинги не были бы видны.
         while True:
+            await asyncio.sleep(interval)
             try:
                 if not updating:
                     return
-                await self.load_markets_data()
+                await self.load_markets_data(force_reload=True)
             except Exception as e:
                 logger.error(f"[{self.exchange_id}] РѕС€РёР±РєР° С„РѕРЅРѕРІРѕРіРѕ РѕР±РЅРѕРІР»РµРЅРёСЏ markets: {e}")
 
-            await asyncio.sleep(interval)
-
 
     def start_background_market_updater(self) -> None:
         if not self.exchange:
@@ -0,0 +1,298 @@
+_version_ = "1.0"
+"""Супервизор переподключения стаканов одной биржи.
+
+Когда биржа рвёт сокет, все подписки биржи (задачи `_OrderbookTask` на пару
+или батчи `ExchangeOrderbookFeed`) получают временную сетевую ошибку почти
+одновременно. Без координации каждая подписка спит свой `4 + 2**n` и все
+переподписываются в один момент, упираясь в лимиты биржи.
+
+`ExchangeConnectionSupervisor` координирует переподключение по бирже:
+1. первая ошибка открывает обрыв (`outage`): одна запись в лог и пауза
+   `connection_lost` сразу для всех зарегистрированных символов биржи;
+2. подписки ждут общую выдержку обрыва (экспоненциальный backoff с jitter) и
+   получают слоты переподписки батчами по `RESUBSCRIBE_BATCH_SIZE` раз в
+   `RESUBSCRIBE_BATCH_INTERVAL_SEC` (с jitter внутри интервала);
+3. ошибка подписки, уже переподписанной в текущем раунде, начинает новый
+   раунд с удвоенной выдержкой (один раз на раунд, а не на каждую подписку);
+4. обрыв закрывается, когда стакан снова пришёл по `RECOVERED_RATIO`
+   символов, попавших под паузу, или через `OUTAGE_STRAGGLER_TIMEOUT_SEC`
+   после первых данных: молчащий символ (неликвид, делистинг) не держит
+   обрыв открытым, и следующий обрыв снова ставит символы на паузу. Время
+   восстановления (time-to-recover) попадает в `summary()`.
+
+Счётчик попыток у каждой подписки свой: `report_failure` возвращает число
+ошибок подписки подряд, первый стакан после переподписки
+(`report_resubscribed`) его обнуляет. Подписка сдаётся, когда счётчик больше
+`MAX_RECONNECT_ATTEMPTS`.
+
+Контракт символа (его реализует `ExchangeInstrument`):
+- `symbol`: торговый символ;
+- `async handle_connection_lost()`: пауза источника на время обрыва.
+Символ сообщает о первом стакане после обрыва через `report_recovered`,
+подписка (задача пары или батч) — о первом стакане после переподписки через
+`report_resubscribed`.
+"""
+
+import asyncio
+import random
+import time
+from typing import Any, Optional
+
+from modules import cprint
+
+
+class _Outage:
+    """Состояние текущего обрыва биржи."""
+
+    __slots__ = (
+        "started_at", "attempt", "round_ready_at", "next_slot", "granted",
+        "affected", "recovered", "first_data_at",
+    )
+
+    def __init__(self, started_at: float):
+        self.started_at = started_at
+        self.attempt = 0
+        self.round_ready_at = started_at
+        self.next_slot = 0
+        # {id(подписки): раунд (attempt), в котором ей выдан слот}
+        self.granted: dict[int, int] = {}
+        self.affected: set[str] = set()
+        self.recovered: set[str] = set()
+        self.first_data_at: Optional[float] = None
+
+
+class ExchangeConnectionSupervisor:
+    """Общий backoff, jitter и батчевая переподписка для одной биржи.
+
+    Экземпляры хранятся в `supervisors_dict` по `exchange_id` и создаются
+    через `get_supervisor`.
+    """
+
+    # Выдержка раунда: `BASE * 2 ** (attempt - 1)`, не больше `MAX`,
+    # умноженная на случайный множитель из `[1 - JITTER, 1 + JITTER]`.
+    BASE_BACKOFF_SEC = 2.0
+    MAX_BACKOFF_SEC = 60.0
+    BACKOFF_JITTER_RATIO = 0.5
+    # Сколько подписок переподписывается за раз и как часто.
+    RESUBSCRIBE_BATCH_SIZE = 10
+    RESUBSCRIBE_BATCH_INTERVAL_SEC = 1.0
+    # После этого числа ошибок подряд подписка сдаётся (`ReconnectLimitExceededError`).
+    MAX_RECONNECT_ATTEMPTS = 5
+    # Обрыв закрыт, когда восстановилась эта доля символов обрыва или прошло
+    # столько секунд после первых данных.
+    RECOVERED_RATIO = 0.9
+    OUTAGE_STRAGGLER_TIMEOUT_SEC = 30.0
+
+    supervisors_dict: dict[str, "ExchangeConnectionSupervisor"] = {}
+
+    @classmethod
+    def get_supervisor(cls, exchange_instance: Any) -> "ExchangeConnectionSupervisor":
+        """Вернуть супервизор биржи, создав его при первом обращении."""
+        supervisor = cls.supervisors_dict.get(exchange_instance.id)
+        if supervisor is None:
+            supervisor = cls(exchange_instance.id)
+            cls.supervisors_dict[exchange_instance.id] = supervisor
+        return supervisor
+
+    @classmethod
+    def summary(cls) -> dict[str, dict[str, Any]]:
+        """`{exchange_id: snapshot()}` по всем супервизорам процесса."""
+        return {exchange_id: supervisor.snapshot() for exchange_id, supervisor in cls.supervisors_dict.items()}
+
+    @classmethod
+    def reset(cls) -> None:
+        cls.supervisors_dict = {}
+
+    def __init__(self, exchange_id: str, *, rng: Optional[random.Random] = None):
+        self.exchange_id = exchange_id
+        self.instruments: dict[str, Any] = {}
+        self.outage: Optional[_Outage] = None
+        # {id(подписки): ошибок подряд}
+        self._attempt_dict: dict[int, int] = {}
+        self._rng = rng or random.Random()
+        self.stats = {
+            "outages": 0,
+            "recovered": 0,
+            "waiting_at_close": 0,
+            "rounds": 0,
+            "last_ttr_sec": None,
+            "max_ttr_sec": None,
+            "last_first_data_sec": None,
+        }
+
+    def register(self, instrument: Any) -> None:
+        self.instruments[instrument.symbol] = instrument
+
+    def unregister(self, instrument: Any) -> None:
+        """Убрать символ; остановленный символ не держит обрыв открытым."""
+        if self.instruments.get(instrument.symbol) is instrument:
+            del self.instruments[instrument.symbol]
+        self._attempt_dict.pop(id(instrument), None)
+        outage = self.outage
+        if outage is not None and instrument.symbol in outage.affected:
+            outage.affected.discard(instrument.symbol)
+            outage.recovered.discard(instrument.symbol)
+            self._maybe_finish(time.monotonic())
+
+    def _backoff_sec(self, attempt: int) -> float:
+        delay = min(self.MAX_BACKOFF_SEC, self.BASE_BACKOFF_SEC * 2 ** (attempt - 1))
+        return delay * self._rng.uniform(1.0 - self.BACKOFF_JITTER_RATIO, 1.0 + self.BACKOFF_JITTER_RATIO)
+
+    def _start_round(self, outage: _Outage, now: float) -> None:
+        outage.attempt += 1
+        outage.round_ready_at = now + self._backoff_sec(outage.attempt)
+        outage.next_slot = 0
+        self.stats["rounds"] += 1
+
+    async def report_failure(self, subscriber: Any, error: BaseException) -> int:
+        """Сообщить о временной ошибке подписки.
+
+        Первая ошибка открывает обрыв и ставит на паузу все символы биржи.
+        Повторная ошибка подписки, уже переподписанной в текущем раунде,
+        начинает следующий раунд.
+
+        Args:
+            subscriber: Подписка, получившая ошибку (задача пары или батч).
+            error: Исключение подписки.
+
+        Returns:
+            Номер попытки подписки: ошибок подряд с её последнего стакана
+            (с единицы).
+        """
+        now = time.monotonic()
+        attempt = self._attempt_dict[id(subscriber)] = self._attempt_dict.get(id(subscriber), 0) + 1
+        # Обрыв с молчащими символами закрывается по сроку и здесь: новая
+        # ошибка после него — новый обрыв с паузой всех символов.
+        self._expire_stragglers(now)
+        outage = self.outage
+        if outage is None:
+            outage = self.outage = _Outage(now)
+            self.stats["outages"] += 1
+            self._start_round(outage, now)
+            cprint.warning_r(
+                f"[{self.exchange_id}][RECONNECT] connection lost: {repr(error)}; "
+                f"pausing {len(self.instruments)} symbols"
+            )
+            outage.affected = set(self.instruments)
+            for instrument in list(self.instruments.values()):
+                await instrument.handle_connection_lost()
+        elif outage.granted.get(id(subscriber)) == outage.attempt:
+            self._start_round(outage, now)
+            print(f"[{self.exchange_id}][RECONNECT] round {outage.attempt} after {repr(error)}")
+        return attempt
+
+    def report_resubscribed(self, subscriber: Any) -> None:
+        """Первый стакан подписки после ошибки: счётчик попыток обнуляется."""
+        self._attempt_dict.pop(id(subscriber), None)
+
+    async def wait_for_resubscribe(self, subscriber: Any) -> None:
+        """Дождаться выдержки раунда и своего слота переподписки."""
+        outage = self.outage
+        if outage is None:
+            return
+        slot = outage.next_slot
+        outage.next_slot += 1
+        outage.granted[id(subscriber)] = outage.attempt
+        release_at = (
+            outage.round_ready_at
+            + (slot // self.RESUBSCRIBE_BATCH_SIZE) * self.RESUBSCRIBE_BATCH_INTERVAL_SEC
+            + self._rng.uniform(0.0, self.RESUBSCRIBE_BATCH_INTERVAL_SEC)
+        )
+        delay = release_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def report_recovered(self, symbol: str) -> None:
+        """Первый стакан символа после обрыва."""
+        outage = self.outage
+        if outage is None:
+            return
+        now = time.monotonic()
+        if outage.first_data_at is None:
+            outage.first_data_at = now
+        if symbol in outage.affected:
+            outage.recovered.add(symbol)
+        self._maybe_finish(now)
+
+    def _expire_stragglers(self, now: float) -> None:
+        """Проверить срок обрыва, по которому уже пошли данные."""
+        if self.outage is not None and self.outage.first_data_at is not None:
+            self._maybe_finish(now)
+
+    def _maybe_finish(self, now: float) -> None:
+        """Закрыть обрыв по доле восстановившихся символов или по сроку."""
+        outage = self.outage
+        if outage is None:
+            return
+        waiting = len(outage.affected) - len(outage.recovered)
+        if waiting > 0 and (
+                outage.first_data_at is None
+                or (len(outage.recovered) < self.RECOVERED_RATIO * len(outage.affected)
+                    and now - outage.first_data_at < self.OUTAGE_STRAGGLER_TIMEOUT_SEC)
+        ):
+            return
+        self.outage = None
+        if outage.first_data_at is None:
+            # Все символы обрыва остановлены, ни один не восстановился.
+            return
+        ttr_sec = now - outage.started_at
+        self.stats["recovered"] += 1
+        self.stats["last_ttr_sec"] = round(ttr_sec, 3)
+        self.stats["max_ttr_sec"] = round(max(ttr_sec, self.stats["max_ttr_sec"] or 0.0), 3)
+        self.stats["last_first_data_sec"] = round(outage.first_data_at - outage.started_at, 3)
+        self.stats["waiting_at_close"] += waiting
+        cprint.success_w(
+            f"[{self.exchange_id}][RECONNECT] recovered {len(outage.recovered)}/{len(outage.affected)} symbols "
+            f"in {ttr_sec:.2f}s (rounds={outage.attempt})"
+        )
+
+    def snapshot(self) -> dict[str, Any]:
+        """Состояние подключения и статистика восстановлений биржи."""
+        self._expire_stragglers(time.monotonic())
+        result = dict(self.stats)
+        outage = self.outage
+        if outage is None:
+            result["state"] = "ok"
+        else:
+            result.update({
+                "state": "reconnecting",
+                "attempt": outage.attempt,
+                "outage_sec": round(time.monotonic() - outage.started_at, 3),
+                "waiting_symbols": len(outage.affected - outage.recovered),
+            })
+        return result
+
+
+if __name__ == "__main__":
+    # Демонстрация: 200 подписок одной биржи получают обрыв одновременно.
+    class _DemoInstrument:
+        def __init__(self, symbol: str):
+            self.symbol = symbol
+
+        async def handle_connection_lost(self) -> None:
+            pass
+
+    async def _demo() -> None:
+        ExchangeConnectionSupervisor.BASE_BACKOFF_SEC = 0.2
+        ExchangeConnectionSupervisor.RESUBSCRIBE_BATCH_INTERVAL_SEC = 0.1
+        supervisor = ExchangeConnectionSupervisor("demo", rng=random.Random(1))
+        instruments = [_DemoInstrument(f"S{i:03d}/USDT:USDT") for i in range(200)]
+        for instrument in instruments:
+            supervisor.register(instrument)
+        started = time.monotonic()
+        resubscribed_at: list[float] = []
+
+        async def subscription(instrument: _DemoInstrument) -> None:
+            await supervisor.report_failure(instrument, ConnectionError("socket closed"))
+            await supervisor.wait_for_resubscribe(instrument)
+            resubscribed_at.append(time.monotonic() - started)
+            supervisor.report_recovered(instrument.symbol)
+
+        await asyncio.gather(*(subscription(instrument) for instrument in instruments))
+        per_100ms: dict[int, int] = {}
+        for ts in resubscribed_at:
+            per_100ms[int(ts * 10)] = per_100ms.get(int(ts * 10), 0) + 1
+        print(f"resubscribes per 100 ms: max={max(per_100ms.values())}, spread={max(resubscribed_at):.2f}s")
+        print(supervisor.snapshot())
+
+    asyncio.run(_demo())
@@ -0,0 +1,206 @@
+_version_ = "1.0"
+"""Сквозная трассировка задержки тика: от приёма стакана до отправки SSE.
+
+Событие `orderbook_update` несёт контекст трассировки `trace` — список
+отметок `time.monotonic()` по стадиям `TRACE_STAGES`:
+
+1. `receive`: стакан получен из `watchOrderBook` (`process_orderbook`);
+2. `vwap`: лестница средних цен посчитана, событие публикуется;
+3. `dequeue`: событие забрано из очереди в `symbol_arbitrage`;
+4. `upsert`: строка таблицы отправлена в очередь таблицы воркера;
+5. `aggregator`: строка принята в `app._grid_aggregator_loop`;
+6. `sse`: снимок таблицы с этой строкой отправлен клиенту SSE.
+
+Каждая стадия добавляет отметку через `LatencyTracer.mark` и пишет в
+гистограммы процесса задержку от предыдущей стадии и от `receive`.
+`CLOCK_MONOTONIC` на Linux общий для процессов хоста, поэтому отметки
+сравнимы между воркером, главным процессом и процессом веб-сервера.
+
+Гистограммы (`LatencyHistogram`) устроены как HDR: логарифмические
+интервалы с линейным делением внутри, фиксированная память и
+относительная погрешность около 3% при диапазоне от 1 мкс до ~35 минут.
+"""
+
+from array import array
+import time
+from typing import Any, Optional
+
+
+TRACE_STAGES = ("receive", "vwap", "dequeue", "upsert", "aggregator", "sse")
+TRACE_KEY = "trace"
+SUMMARY_QUANTILES = (("p50", 0.5), ("p90", 0.9), ("p99", 0.99), ("p999", 0.999))
+
+
+class LatencyHistogram:
+    """Гистограмма задержек в микросекундах с фиксированной памятью.
+
+    Значения меньше `2 ** SUB_BUCKET_BITS` мкс хранятся точно; дальше каждый
+    интервал `[2^e, 2^(e+1))` делится на `2 ** (SUB_BUCKET_BITS - 1)` равных
+    частей. Значения выше `MAX_VALUE_US` попадают в последний интервал.
+    """
+
+    SUB_BUCKET_BITS = 6
+    MAX_VALUE_US = 2 ** 31 - 1
+
+    _SUB_COUNT = 1 << SUB_BUCKET_BITS
+    _HALF_COUNT = _SUB_COUNT >> 1
+    _BUCKET_COUNT = _SUB_COUNT + (MAX_VALUE_US.bit_length() - SUB_BUCKET_BITS) * _HALF_COUNT
+
+    __slots__ = ("counts", "total", "max_us")
+
+    def __init__(self):
+        self.counts = array("q", bytes(8 * self._BUCKET_COUNT))
+        self.total = 0
+        self.max_us = 0
+
+    @classmethod
+    def _index(cls, value_us: int) -> int:
+        if value_us < cls._SUB_COUNT:
+            return value_us
+        shift = value_us.bit_length() - cls.SUB_BUCKET_BITS
+        return cls._SUB_COUNT + (shift - 1) * cls._HALF_COUNT + (value_us >> shift) - cls._HALF_COUNT
+
+    @classmethod
+    def _upper_bound(cls, index: int) -> int:
+        """Наибольшее значение (мкс), попадающее в интервал `index`."""
+        if index < cls._SUB_COUNT:
+            return index
+        shift = (index - cls._SUB_COUNT) // cls._HALF_COUNT + 1
+        mantissa = (index - cls._SUB_COUNT) % cls._HALF_COUNT + cls._HALF_COUNT
+        return ((mantissa + 1) << shift) - 1
+
+    def record(self, value_sec: float) -> None:
+        value_us = int(value_sec * 1_000_000)
+        if value_us < 0:
+            value_us = 0
+        elif value_us > self.MAX_VALUE_US:
+            value_us = self.MAX_VALUE_US
+        if value_us < self._SUB_COUNT:
+            index = value_us
+        else:
+            # То же, что `_index`, без вызова метода на горячем пути.
+            shift = value_us.bit_length() - self.SUB_BUCKET_BITS
+            index = self._SUB_COUNT + (shift - 2) * self._HALF_COUNT + (value_us >> shift)
+        self.counts[index] += 1
+        self.total += 1
+        if value_us > self.max_us:
+            self.max_us = value_us
+
+    def percentile_us(self, q: float) -> Optional[int]:
+        """Верхняя граница интервала, в котором лежит квантиль `q`."""
+        if not self.total:
+            return None
+        rank = max(1, int(q * self.total + 0.5))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count:
+                seen += count
+                if seen >= rank:
+                    return min(self._upper_bound(index), self.max_us)
+        return self.max_us
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        counts = self.counts
+        for index, count in enumerate(other.counts):
+            if count:
+                counts[index] += count
+        self.total += other.total
+        self.max_us = max(self.max_us, other.max_us)
+
+    def reset(self) -> None:
+        self.counts = array("q", bytes(8 * self._BUCKET_COUNT))
+        self.total = 0
+        self.max_us = 0
+
+    def summary(self) -> dict[str, Any]:
+        """Сводка в миллисекундах: `count`, `p50`, `p90`, `p99`, `p999`, `max`."""
+        result: dict[str, Any] = {"count": self.total}
+        for name, q in SUMMARY_QUANTILES:
+            value = self.percentile_us(q)
+            result[name] = None if value is None else round(value / 1000.0, 3)
+        result["max"] = round(self.max_us / 1000.0, 3) if self.total else None
+        return result
+
+
+class LatencyTracer:
+    """Гистограммы стадий трассировки текущего процесса.
+
+    `stage_histogram_dict[stage]` — задержка от предыдущей стадии,
+    `since_receive_histogram_dict[stage]` — от `receive` до стадии.
+    """
+
+    enabled = True
+    stage_histogram_dict: dict[str, LatencyHistogram] = {}
+    since_receive_histogram_dict: dict[str, LatencyHistogram] = {}
+
+    @classmethod
+    def start(cls) -> Optional[list[float]]:
+        """Новый контекст с отметкой `receive` или `None`, если трассировка выключена."""
+        if not cls.enabled:
+            return None
+        return [time.monotonic()]
+
+    @classmethod
+    def mark(cls, trace: Optional[list[float]], stage: str) -> None:
+        """Добавить отметку стадии `stage` и записать задержки.
+
+        Контекст, в котором уже есть эта или более поздняя стадия (например,
+        снимок повторно отправляется другому клиенту SSE), не изменяется.
+        """
+        if trace is None:
+            return
+        position = TRACE_STAGES.index(stage)
+        if len(trace) != position:
+            return
+        now = time.monotonic()
+        trace.append(now)
+        histogram = cls.stage_histogram_dict.get(stage)
+        if histogram is None:
+            histogram = cls.stage_histogram_dict[stage] = LatencyHistogram()
+            cls.since_receive_histogram_dict[stage] = LatencyHistogram()
+        histogram.record(now - trace[-2])
+        cls.since_receive_histogram_dict[stage].record(now - trace[0])
+
+    @classmethod
+    def summary(cls) -> dict[str, dict[str, Any]]:
+        """`{stage: {..., "since_receive_p99": ms}}` по стадиям этого процесса."""
+        result = {}
+        for stage in TRACE_STAGES:
+            histogram = cls.stage_histogram_dict.get(stage)
+            if histogram is None:
+                continue
+            stage_summary = histogram.summary()
+            since_receive = cls.since_receive_histogram_dict[stage].percentile_us(0.99)
+            stage_summary["since_receive_p99"] = None if since_receive is None else round(since_receive / 1000.0, 3)
+            result[stage] = stage_summary
+        return result
+
+    @classmethod
+    def reset(cls) -> None:
+        cls.stage_histogram_dict = {}
+        cls.since_receive_histogram_dict = {}
+
+
+if __name__ == "__main__":
+    import random
+
+    histogram = LatencyHistogram()
+    rng = random.Random(1)
+    samples = sorted(rng.lognormvariate(-6.0, 1.0) for _ in range(100_000))
+    started = time.perf_counter()
+    for sample in samples:
+        histogram.record(sample)
+    elapsed = time.perf_counter() - started
+    print(f"record: {elapsed / len(samples) * 1e9:.0f} ns/value, buckets={len(histogram.counts)}")
+    for name, q in SUMMARY_QUANTILES:
+        exact = samples[int(q * len(samples)) - 1] * 1000.0
+        approx = histogram.percentile_us(q) / 1000.0
+        print(f"{name}: exact={exact:.4f} ms hist={approx:.4f} ms err={(approx - exact) / exact * 100:+.2f}%")
+        assert abs(approx - exact) / exact < 0.04
+
+    trace = LatencyTracer.start()
+    for stage in TRACE_STAGES[1:]:
+        LatencyTracer.mark(trace, stage)
+    LatencyTracer.mark(trace, "sse")
+    assert len(trace) == len(TRACE_STAGES)
+    print(LatencyTracer.summary()["sse"])
@@ -0,0 +1,604 @@
+_version_ = "1.0"
+"""Синтетическая вселенная рынков для нагрузочных прогонов.
+
+Источник `MarketUniverseSource` (вид `"market"` в реестре
+`ReplaySource.source_class_dict`) подаёт в поддельный слой
+`modules.replay_exchange` настраиваемую вселенную:
+
+- `symbols × exchanges`: биржи задаются числом (`ex00`, `ex01`, ...) или
+  списком id; каждый символ листится на бирже с вероятностью
+  `listing_ratio`, но не меньше чем на двух биржах;
+- темп тиков: пуассоновский поток на пару символ/биржа, средний темп символа
+  берётся из распределения `rate_distribution` (`uniform`, `lognormal`,
+  `zipf`) со средним `rate_hz` и перекосом `rate_skew`;
+- профиль глубины `depth_profile`: `flat`, `linear`, `exponential`, `thin`
+  (тонкая вершина стакана);
+- эпизоды: сдвиги цены символа на одной бирже (`dislocations_per_min`),
+  остановки потока пары (`stalls_per_min`) и обрывы соединения биржи
+  (`disconnects_per_min`).
+
+Поток детерминирован при одинаковом `seed`: каждый процесс воркера строит
+источник из той же конфигурации и получает те же события.
+
+CLI прогоняет `run_replay_benchmark` при разном числе процессов и печатает
+кривую масштабирования. С `--grid` события воркеров дополнительно проходят
+через агрегатор таблицы `app._grid_aggregator_loop` и веб-сервер
+`run_web_grid_process`, а `--web-clients` опрашивают `/api/state`:
+
+    python -m modules.market_generator --symbols 2000 --exchanges 8 --processes 1,2,4 --grid
+"""
+
+import argparse
+import heapq
+import math
+import multiprocessing
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+from typing import Any, Iterator, Optional
+
+from modules.replay_exchange import (
+    BOOK_EVENT,
+    DISCONNECT_EVENT,
+    ReplaySource,
+    _ms,
+    _parse_speed,
+    _percentile,
+    print_replay_report,
+    run_replay_benchmark,
+)
+from modules.spread_engine import SPREAD_ENGINE_MODES
+
+
+# Шаг общей для бирж траектории середины цены символа.
+MID_STEP_SEC = 1.0
+# Задержка биржевого `timestamp` относительно времени получения (мс).
+DEFAULT_TS_LAG_MS = -5.0
+RATE_DISTRIBUTIONS = ("uniform", "lognormal", "zipf")
+DEPTH_PROFILES = ("flat", "linear", "exponential", "thin")
+
+
+class MarketUniverseSource(ReplaySource):
+    """Настраиваемая синтетическая вселенная символов и бирж."""
+
+    kind = "market"
+
+    def __init__(
+            self,
+            symbols: int = 500,
+            exchanges: int | list[str] = 6,
+            duration_sec: float = 60.0,
+            rate_hz: float = 2.0,
+            rate_distribution: str = "lognormal",
+            rate_skew: float = 1.0,
+            depth: int = 20,
+            depth_profile: str = "linear",
+            level_notional: float = 500.0,
+            listing_ratio: float = 0.7,
+            volatility: float = 0.0005,
+            noise: float = 0.0005,
+            dislocations_per_min: float = 2.0,
+            dislocation_size: float = 0.01,
+            dislocation_sec: float = 3.0,
+            stalls_per_min: float = 2.0,
+            stall_sec: float = 10.0,
+            disconnects_per_min: float = 0.2,
+            seed: int = 1,
+    ):
+        """
+        Args:
+            symbols: Число символов вселенной.
+            exchanges: Число бирж либо список их id.
+            duration_sec: Длительность потока при скорости 1x.
+            rate_hz: Средний темп тиков пары символ/биржа.
+            rate_distribution: Распределение темпа по символам.
+            rate_skew: СКО логарифма для `lognormal`, показатель для `zipf`.
+            depth: Число уровней стакана.
+            depth_profile: Профиль объёма по уровням.
+            level_notional: Номинал верхнего уровня (USDT) для `flat`/`linear`.
+            listing_ratio: Вероятность листинга символа на бирже.
+            volatility: СКО шага середины цены за `MID_STEP_SEC`.
+            noise: Относительное СКО собственного шума цены биржи.
+            dislocations_per_min: Частота сдвигов цены на всю вселенную.
+            dislocation_size: Относительная величина сдвига.
+            dislocation_sec: Длительность сдвига.
+            stalls_per_min: Частота остановок потока пары.
+            stall_sec: Длительность остановки.
+            disconnects_per_min: Частота обрывов соединения на биржу.
+            seed: Зерно генератора.
+        """
+        if rate_distribution not in RATE_DISTRIBUTIONS:
+            raise ValueError(f"unknown rate_distribution: {rate_distribution!r}")
+        if depth_profile not in DEPTH_PROFILES:
+            raise ValueError(f"unknown depth_profile: {depth_profile!r}")
+        if isinstance(exchanges, int):
+            exchanges = [f"ex{index:02d}" for index in range(exchanges)]
+        self.exchange_ids = list(exchanges)
+        self.symbols = [f"M{index:05d}/USDT:USDT" for index in range(symbols)]
+        self._duration_sec = float(duration_sec)
+        self.rate_hz = float(rate_hz)
+        self.depth = int(depth)
+        self.depth_profile = depth_profile
+        self.level_notional = float(level_notional)
+        self.volatility = float(volatility)
+        self.noise = float(noise)
+        self.seed = int(seed)
+
+        rng = random.Random(self.seed)
+        exchange_count = len(self.exchange_ids)
+        self.base_prices = [math.exp(rng.uniform(math.log(0.01), math.log(50_000.0))) for _ in self.symbols]
+        self.symbol_rates = self._draw_rates(rng, len(self.symbols), rate_distribution, float(rate_skew))
+        self.exchange_rate_factors = {exchange_id: rng.uniform(0.5, 1.5) for exchange_id in self.exchange_ids}
+
+        self.listing: dict[str, list[int]] = {exchange_id: [] for exchange_id in self.exchange_ids}
+        for symbol_index in range(len(self.symbols)):
+            listed = [exchange_id for exchange_id in self.exchange_ids if rng.random() < listing_ratio]
+            if len(listed) < min(2, exchange_count):
+                listed = rng.sample(self.exchange_ids, min(2, exchange_count))
+            for exchange_id in listed:
+                self.listing[exchange_id].append(symbol_index)
+
+        # Эпизоды: {exchange_id: {symbol_index: [(start, end, value), ...]}}.
+        self.dislocations = self._draw_windows(
+            rng, dislocations_per_min, dislocation_sec, values=(dislocation_size, -dislocation_size),
+        )
+        self.stalls = self._draw_windows(rng, stalls_per_min, stall_sec)
+        self.disconnects: dict[str, list[float]] = {}
+        for exchange_id in self.exchange_ids:
+            count = self._poisson(rng, disconnects_per_min * self._duration_sec / 60.0)
+            self.disconnects[exchange_id] = sorted(rng.uniform(0.0, self._duration_sec) for _ in range(count))
+
+    # --- построение вселенной ---
+    @staticmethod
+    def _draw_rates(rng: random.Random, count: int, distribution: str, skew: float) -> list[float]:
+        """Относительные темпы символов со средним 1."""
+        if distribution == "uniform":
+            weights = [1.0] * count
+        elif distribution == "lognormal":
+            weights = [rng.lognormvariate(-skew * skew / 2.0, skew) for _ in range(count)]
+        else:
+            ranks = list(range(count))
+            rng.shuffle(ranks)
+            weights = [1.0 / (rank + 1) ** skew for rank in ranks]
+        mean = sum(weights) / count if count else 1.0
+        return [weight / mean for weight in weights]
+
+    @staticmethod
+    def _poisson(rng: random.Random, lam: float) -> int:
+        if lam <= 0:
+            return 0
+        count, total = 0, rng.expovariate(1.0)
+        while total < lam:
+            count += 1
+            total += rng.expovariate(1.0)
+        return count
+
+    def _draw_windows(
+            self,
+            rng: random.Random,
+            per_min: float,
+            window_sec: float,
+            values: tuple[float, ...] = (0.0,),
+    ) -> dict[str, dict[int, list[tuple[float, float, float]]]]:
+        """Случайные окна `(start, end, value)` на парах биржа/символ."""
+        windows: dict[str, dict[int, list[tuple[float, float, float]]]] = {ex: {} for ex in self.exchange_ids}
+        count = self._poisson(rng, per_min * self._duration_sec / 60.0)
+        for _ in range(count):
+            exchange_id = rng.choice(self.exchange_ids)
+            if not self.listing[exchange_id]:
+                continue
+            symbol_index = rng.choice(self.listing[exchange_id])
+            start = rng.uniform(0.0, self._duration_sec)
+            windows[exchange_id].setdefault(symbol_index, []).append((start, start + window_sec, rng.choice(values)))
+        for symbol_windows in windows.values():
+            for window_list in symbol_windows.values():
+                window_list.sort()
+        return windows
+
+    # --- контракт ReplaySource ---
+    @property
+    def exchange_symbols(self) -> dict[str, list[str]]:
+        return {
+            exchange_id: [self.symbols[index] for index in indexes]
+            for exchange_id, indexes in self.listing.items()
+        }
+
+    @property
+    def duration_sec(self) -> float:
+        return self._duration_sec
+
+    @property
+    def offered_rate(self) -> float:
+        """Средний суммарный темп стаканов вселенной (событий/с при 1x)."""
+        return sum(
+            self.rate_hz * self.exchange_rate_factors[exchange_id] * self.symbol_rates[index]
+            for exchange_id, indexes in self.listing.items()
+            for index in indexes
+        )
+
+    def iter_exchange(self, exchange_id: str, symbol_filter=None) -> Iterator[tuple]:
+        return self._iter_events(exchange_id, symbol_filter, build_books=True)
+
+    def iter_schedule(self) -> Iterator[tuple[float, str]]:
+        for exchange_id in self.exchange_ids:
+            for offset, symbol, _asks, _bids, _lag, kind in self._iter_events(exchange_id, None, build_books=False):
+                if kind == BOOK_EVENT:
+                    yield offset, symbol
+
+    # --- генерация ---
+    @staticmethod
+    def _window_value(window_list: Optional[list], offset: float) -> Optional[tuple[float, float, float]]:
+        if window_list:
+            for window in window_list:
+                if window[0] <= offset < window[1]:
+                    return window
+        return None
+
+    def _iter_events(self, exchange_id: str, symbol_filter, build_books: bool) -> Iterator[tuple]:
+        exchange_index = self.exchange_ids.index(exchange_id)
+        rng = random.Random(self.seed * 1_000_003 + exchange_index + 1)
+        rate_factor = self.rate_hz * self.exchange_rate_factors[exchange_id]
+        stall_dict = self.stalls[exchange_id]
+        dislocation_dict = self.dislocations[exchange_id]
+        disconnects = self.disconnects[exchange_id]
+        disconnect_position = 0
+        duration = self._duration_sec
+        # Состояние траектории середины символа: [шаг, середина, генератор].
+        mid_state_dict: dict[int, list] = {}
+
+        heap = []
+        for symbol_index in self.listing[exchange_id]:
+            rate = rate_factor * self.symbol_rates[symbol_index]
+            if rate > 0:
+                heap.append((rng.expovariate(rate), symbol_index, rate))
+        heapq.heapify(heap)
+
+        while heap:
+            offset, symbol_index, rate = heapq.heappop(heap)
+            if offset >= duration:
+                continue
+            while disconnect_position < len(disconnects) and disconnects[disconnect_position] <= offset:
+                yield disconnects[disconnect_position], "", [], [], None, DISCONNECT_EVENT
+                disconnect_position += 1
+
+            stall = self._window_value(stall_dict.get(symbol_index), offset)
+            if stall is not None:
+                heapq.heappush(heap, (stall[1] + rng.expovariate(rate), symbol_index, rate))
+                continue
+            heapq.heappush(heap, (offset + rng.expovariate(rate), symbol_index, rate))
+
+            symbol = self.symbols[symbol_index]
+            noise = rng.gauss(0.0, self.noise)
+            if not build_books:
+                yield offset, symbol, None, None, None, BOOK_EVENT
+                continue
+            if symbol_filter is not None and symbol not in symbol_filter:
+                continue
+            mid = self._mid(mid_state_dict, symbol_index, offset) * (1.0 + noise)
+            dislocation = self._window_value(dislocation_dict.get(symbol_index), offset)
+            if dislocation is not None:
+                mid *= 1.0 + dislocation[2]
+            asks, bids = self._build_book(mid, exchange_index)
+            yield offset, symbol, asks, bids, DEFAULT_TS_LAG_MS, BOOK_EVENT
+
+        while disconnect_position < len(disconnects):
+            if disconnects[disconnect_position] < duration:
+                yield disconnects[disconnect_position], "", [], [], None, DISCONNECT_EVENT
+            disconnect_position += 1
+
+    def _mid(self, mid_state_dict: dict[int, list], symbol_index: int, offset: float) -> float:
+        """Середина символа в момент `offset`, общая для всех бирж."""
+        state = mid_state_dict.get(symbol_index)
+        if state is None:
+            state = [0, self.base_prices[symbol_index], random.Random(self.seed * 7919 + symbol_index)]
+            mid_state_dict[symbol_index] = state
+        target_step = int(offset / MID_STEP_SEC)
+        step, mid, mid_rng = state
+        while step < target_step:
+            mid *= 1.0 + mid_rng.gauss(0.0, self.volatility)
+            step += 1
+        state[0] = step
+        state[1] = mid
+        return mid
+
+    def _build_book(self, mid: float, exchange_index: int) -> tuple[list, list]:
+        half_spread = mid * 0.0001 * (1 + exchange_index % 3)
+        tick_size = mid * 0.00005
+        top_amount = self.level_notional / mid
+        profile = self.depth_profile
+        asks = []
+        bids = []
+        for level in range(self.depth):
+            if profile == "flat":
+                amount = top_amount
+            elif profile == "linear":
+                amount = top_amount * (1 + level)
+            elif profile == "exponential":
+                amount = top_amount * 1.5 ** level
+            else:
+                amount = top_amount * (0.05 if level < 3 else level)
+            offset = half_spread + level * tick_size
+            asks.append([mid + offset, amount])
+            bids.append([mid - offset, amount])
+        return asks, bids
+
+
+class GridPipelineProbe:
+    """Агрегатор таблицы и веб-сервер приложения под нагрузкой повтора.
+
+    `sink` передаётся в `run_replay_benchmark(grid_sink=...)`: события воркеров
+    идут в `app._grid_aggregator_loop` (поток), снимки таблицы — в процесс
+    `run_web_grid_process`, а потоки-клиенты опрашивают `/api/state`.
+
+    Потоки агрегатора и клиентов стартуют на первом событии: к этому моменту
+    процессы воркеров уже созданы, и `fork` не копирует чужие блокировки.
+    """
+
+    def __init__(
+            self, port: int = 8799, web_clients: int = 1, client_interval_sec: float = 0.5,
+            top_k: Optional[int] = None,
+    ):
+        self.port = port
+        self.top_k = top_k
+        self.web_clients = web_clients
+        self.client_interval_sec = client_interval_sec
+        self.forwarded = 0
+        self.aggregator_cpu_sec = 0.0
+        self.fetch_latencies: list[float] = []
+        self.fetch_bytes: list[int] = []
+        self.fetch_errors = 0
+        self._input_queue: queue.Queue = queue.Queue()
+        self._web_grid_queue: multiprocessing.Queue = multiprocessing.Queue()
+        self._shared_values = {"shutdown": multiprocessing.Value('b', False)}
+        self._stop_event = threading.Event()
+        self._threads: list[threading.Thread] = []
+        self._web_process: Optional[multiprocessing.Process] = None
+
+    def sink(self, item: dict[str, Any]) -> None:
+        if not self._threads:
+            self._start_threads()
+        self.forwarded += 1
+        self._input_queue.put(item)
+
+    def start(self) -> None:
+        """Запустить процесс веб-сервера (до создания процессов воркеров)."""
+        from modules.WebGrid_Socket_Polling import run_web_grid_process
+
+        self._web_process = multiprocessing.Process(
+            target=run_web_grid_process,
+            kwargs={
+                "table_queue_data": self._web_grid_queue,
+                "shared_values": self._shared_values,
+                "host": "127.0.0.1",
+                "port": self.port,
+                "title": "Market generator",
+                "transport": "polling",
+                "max_fps": 2.0,
+            },
+            daemon=True,
+            name="market-generator-web",
+        )
+        self._web_process.start()
+
+    def _start_threads(self) -> None:
+        self._threads.append(threading.Thread(target=self._run_aggregator, daemon=True, name="probe-aggregator"))
+        for index in range(self.web_clients):
+            self._threads.append(threading.Thread(target=self._run_client, daemon=True, name=f"probe-client-{index}"))
+        for thread in self._threads:
+            thread.start()
+
+    def _run_aggregator(self) -> None:
+        from app import _grid_aggregator_loop
+
+        cpu_started = time.thread_time()
+        try:
+            _grid_aggregator_loop(
+                worker_grid_queue=self._input_queue,
+                web_grid_queue=self._web_grid_queue,
+                shared_values=self._shared_values,
+                stop_event=self._stop_event,
+                top_k=self.top_k,
+            )
+        finally:
+            self.aggregator_cpu_sec = time.thread_time() - cpu_started
+
+    def _run_client(self) -> None:
+        url = f"http://127.0.0.1:{self.port}/api/state"
+        while not self._stop_event.is_set():
+            started = time.monotonic()
+            try:
+                with urllib.request.urlopen(url, timeout=5.0) as response:
+                    size = len(response.read())
+            except Exception:
+                self.fetch_errors += 1
+            else:
+                self.fetch_latencies.append(time.monotonic() - started)
+                self.fetch_bytes.append(size)
+            self._stop_event.wait(self.client_interval_sec)
+
+    @staticmethod
+    def _process_cpu_sec(pid: Optional[int]) -> Optional[float]:
+        """CPU процесса по `/proc/<pid>/stat` (только Linux)."""
+        try:
+            with open(f"/proc/{pid}/stat", "rb") as stat_file:
+                fields = stat_file.read().rsplit(b")", 1)[1].split()
+            return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+        except (OSError, ValueError, IndexError):
+            return None
+
+    def stop(self) -> dict[str, Any]:
+        """Остановить агрегатор, клиентов и веб-сервер; вернуть замеры."""
+        backlog = self._input_queue.qsize()
+        web_cpu_sec = self._process_cpu_sec(self._web_process.pid if self._web_process else None)
+        self._stop_event.set()
+        self._shared_values["shutdown"].value = True
+        for thread in self._threads:
+            thread.join(timeout=5)
+        if self._web_process is not None:
+            self._web_process.join(timeout=5)
+            if self._web_process.is_alive():
+                self._web_process.terminate()
+                self._web_process.join(timeout=3)
+        latencies = sorted(self.fetch_latencies)
+        return {
+            "forwarded": self.forwarded,
+            "aggregator_backlog": backlog,
+            "aggregator_cpu_sec": self.aggregator_cpu_sec,
+            "web_cpu_sec": web_cpu_sec,
+            "fetches": len(latencies),
+            "fetch_errors": self.fetch_errors,
+            "fetch_p50_ms": _ms(_percentile(latencies, 0.5)),
+            "fetch_p99_ms": _ms(_percentile(latencies, 0.99)),
+            "fetch_kb": round(max(self.fetch_bytes) / 1024.0, 1) if self.fetch_bytes else None,
+        }
+
+
+def run_scaling_sweep(
+        *,
+        source_config: dict[str, Any],
+        process_counts: list[int],
+        speed: Optional[float],
+        duration_sec: Optional[float],
+        grid: bool = False,
+        web_clients: int = 1,
+        port: int = 8799,
+        multi_symbol: bool = False,
+        log: bool = False,
+        spread_engine_mode: str = "per_symbol",
+        grid_top_k: Optional[int] = None,
+        rebalance_interval_sec: Optional[float] = None,
+) -> list[dict[str, Any]]:
+    """Прогнать `run_replay_benchmark` для каждого числа процессов.
+
+    Returns:
+        Отчёты прогонов; при `grid` в отчёте есть ключ `grid` с замерами
+        `GridPipelineProbe`, а также `imbalance` — отношение максимального
+        темпа воркера к среднему (качество `split_symbols_between_processes`).
+    """
+    results = []
+    for process_count in process_counts:
+        probe = GridPipelineProbe(port=port, web_clients=web_clients, top_k=grid_top_k) if grid else None
+        if probe is not None:
+            probe.start()
+        try:
+            report = run_replay_benchmark(
+                source_config=source_config,
+                process_count=process_count,
+                speed=speed,
+                duration_sec=duration_sec,
+                multi_symbol=multi_symbol,
+                grid_sink=probe.sink if probe is not None else None,
+                log=log,
+                spread_engine_mode=spread_engine_mode,
+                grid_top_k=grid_top_k,
+                rebalance_interval_sec=rebalance_interval_sec,
+            )
+        finally:
+            grid_report = probe.stop() if probe is not None else None
+        rates = [worker["ticks_per_sec"] for worker in report["workers"].values()]
+        report["imbalance"] = max(rates) / (sum(rates) / len(rates)) if rates and sum(rates) else None
+        report["grid"] = grid_report
+        results.append(report)
+        print_replay_report(report)
+        if grid_report is not None:
+            print(f"  grid: {grid_report}")
+    return results
+
+
+def print_scaling_curve(results: list[dict[str, Any]], offered_rate: Optional[float] = None) -> None:
+    if not results:
+        return
+    if offered_rate is not None:
+        print(f"\noffered rate at 1x: {offered_rate:.0f} orderbooks/s")
+    base = results[0]["ticks_per_sec"] / results[0]["process_count"] if results[0]["ticks_per_sec"] else None
+    peak = max(result["ticks_per_sec"] for result in results) or 1.0
+    print(
+        f"{'procs':>5} {'ticks/s':>9} {'speedup':>8} {'eff':>5} {'cpu%':>5} {'imbal':>6} "
+        f"{'p50ms':>8} {'p99ms':>8} {'agg_backlog':>11} {'web_p99ms':>9}  curve"
+    )
+    for result in results:
+        process_count = result["process_count"]
+        ticks = result["ticks_per_sec"]
+        speedup = ticks / base if base else 0.0
+        cpu_values = [worker["cpu_util"] for worker in result["workers"].values()]
+        cpu = 100.0 * sum(cpu_values) / len(cpu_values) if cpu_values else 0.0
+        latency = result["latency_ms"]
+        grid_report = result.get("grid") or {}
+        imbalance = result.get("imbalance")
+        print(
+            f"{process_count:>5} {ticks:>9.0f} {speedup:>8.2f} {speedup / process_count:>5.2f} {cpu:>5.0f} "
+            f"{imbalance if imbalance is None else round(imbalance, 2)!s:>6} "
+            f"{latency['p50']!s:>8} {latency['p99']!s:>8} "
+            f"{grid_report.get('aggregator_backlog', '-')!s:>11} {grid_report.get('fetch_p99_ms', '-')!s:>9}  "
+            f"{'#' * max(1, int(40 * ticks / peak))}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Synthetic market scaling sweep for arbitrage workers")
+    parser.add_argument("--symbols", type=int, default=500)
+    parser.add_argument("--exchanges", default="6", help="count or comma separated ids")
+    parser.add_argument("--rate", type=float, default=2.0, help="mean orderbooks per second per symbol and exchange")
+    parser.add_argument("--rate-distribution", choices=RATE_DISTRIBUTIONS, default="lognormal")
+    parser.add_argument("--rate-skew", type=float, default=1.0)
+    parser.add_argument("--depth", type=int, default=20)
+    parser.add_argument("--depth-profile", choices=DEPTH_PROFILES, default="linear")
+    parser.add_argument("--listing-ratio", type=float, default=0.7)
+    parser.add_argument("--dislocations", type=float, default=2.0, help="per minute")
+    parser.add_argument("--stalls", type=float, default=2.0, help="per minute")
+    parser.add_argument("--disconnects", type=float, default=0.2, help="per minute and exchange")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--source-duration", type=float, default=30.0)
+    parser.add_argument("--speed", type=_parse_speed, default=1.0, help="1, 10, ... or max")
+    parser.add_argument("--duration", type=float, default=None)
+    parser.add_argument("--processes", default="1,2,4", help="comma separated process counts")
+    parser.add_argument("--grid", action="store_true", help="route rows through the grid aggregator and web server")
+    parser.add_argument("--web-clients", type=int, default=1)
+    parser.add_argument("--port", type=int, default=8799)
+    parser.add_argument("--multi-symbol", action="store_true", help="expose watchOrderBookForSymbols")
+    parser.add_argument("--verbose", action="store_true", help="keep worker console output")
+    parser.add_argument("--spread-engine", choices=SPREAD_ENGINE_MODES, default="per_symbol")
+    parser.add_argument("--grid-top-k", type=int, default=None, help="best rows per worker and in the grid")
+    parser.add_argument("--rebalance-interval", type=float, default=None, help="seconds between symbol rebalances")
+    args = parser.parse_args()
+
+    exchanges: int | list[str] = int(args.exchanges) if args.exchanges.isdigit() else args.exchanges.split(",")
+    source_config = {
+        "kind": MarketUniverseSource.kind,
+        "symbols": args.symbols,
+        "exchanges": exchanges,
+        "duration_sec": args.source_duration,
+        "rate_hz": args.rate,
+        "rate_distribution": args.rate_distribution,
+        "rate_skew": args.rate_skew,
+        "depth": args.depth,
+        "depth_profile": args.depth_profile,
+        "listing_ratio": args.listing_ratio,
+        "dislocations_per_min": args.dislocations,
+        "stalls_per_min": args.stalls,
+        "disconnects_per_min": args.disconnects,
+        "seed": args.seed,
+    }
+    source = ReplaySource.from_config(source_config)
+    results = run_scaling_sweep(
+        source_config=source_config,
+        process_counts=[int(value) for value in args.processes.split(",")],
+        speed=args.speed,
+        duration_sec=args.duration,
+        grid=args.grid,
+        web_clients=args.web_clients,
+        port=args.port,
+        multi_symbol=args.multi_symbol,
+        log=args.verbose,
+        spread_engine_mode=args.spread_engine,
+        grid_top_k=args.grid_top_k,
+        rebalance_interval_sec=args.rebalance_interval,
+    )
+    print_scaling_curve(results, offered_rate=source.offered_rate)
+
+
+if __name__ == "__main__":
+    main()
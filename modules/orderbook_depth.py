@@ -0,0 +1,307 @@
+_version_ = "1.0"
+"""Выбор глубины подписки на стакан по фактической глубине исполнения.
+
+Лестница средних цен (`VWAP_LADDER_MULTIPLIERS` от `max_deal_volume`) обычно
+исполняется на первых уровнях стакана, а подписка по умолчанию тянет полный
+стакан биржи (okx `books` — 400 уровней, htx — 150, gate — 100). Лишние
+уровни стоят трафика и времени разбора ccxt на каждом сообщении.
+
+`OrderbookDepthPolicy` ведёт глубину подписки одной связки
+`(exchange_id, symbol)`:
+1. первые `WARMUP_BOOKS` пересчётов лестницы идут на глубине биржи по
+   умолчанию;
+2. по окну из `DOWNSHIFT_WINDOW` пересчётов выбирается наименьший лимит из
+   `SUPPORTED_LIMITS_DICT`, покрывающий максимальную глубину исполнения окна
+   с запасом `DEPTH_MARGIN`;
+3. если исполнение подошло к лимиту (`ESCALATE_FILL_RATIO`) или стакан,
+   обрезанный лимитом, не покрыл объём (то же, что
+   `InsufficientOrderBookVolumeError` на ступени лестницы), лимит сразу
+   поднимается на следующий; понижение после этого откладывается на
+   `DOWNSHIFT_COOLDOWN_SEC`.
+
+`ExchangeTrafficMeter` считает сообщения и байты, полученные сокетами
+биржи, и фиксирует базовую скорость (до первого понижения глубины на
+бирже), чтобы сравнить трафик до и после.
+"""
+
+import time
+from typing import Any, Optional
+
+
+class ExchangeTrafficMeter:
+    """Счётчики сообщений и байт, полученных сокетами одной биржи.
+
+    Экземпляры хранятся в `meters_dict` по `exchange_id`. Сокеты ccxt.pro
+    подключаются через `attach`: каждый новый `Client` биржи считает
+    `message.data` входящих TEXT/BINARY сообщений (байты до распаковки).
+    Источники без `Client` (повтор) сообщают трафик через `record`.
+    """
+
+    meters_dict: dict[str, "ExchangeTrafficMeter"] = {}
+
+    @classmethod
+    def get_meter(cls, exchange_id: str) -> "ExchangeTrafficMeter":
+        meter = cls.meters_dict.get(exchange_id)
+        if meter is None:
+            meter = cls.meters_dict[exchange_id] = cls(exchange_id)
+        return meter
+
+    @classmethod
+    def record(cls, exchange_id: str, nbytes: int) -> None:
+        meter = cls.get_meter(exchange_id)
+        meter.messages += 1
+        meter.bytes += nbytes
+
+    @classmethod
+    def attach(cls, exchange_instance: Any) -> None:
+        """Подключить счётчик к сокетам биржи (повторный вызов ничего не делает).
+
+        Оборачивает `exchange.client(url)`: у каждого `Client` биржи, и уже
+        открытого, и созданного позже, заменяется `handle_message`.
+        """
+        create_client = getattr(exchange_instance, "client", None)
+        if create_client is None or getattr(create_client, "traffic_meter", None) is not None:
+            return
+        meter = cls.get_meter(exchange_instance.id)
+
+        def client(url):
+            return meter._wrap_client(create_client(url))
+
+        client.traffic_meter = meter
+        exchange_instance.client = client
+        for ws_client in list((getattr(exchange_instance, "clients", None) or {}).values()):
+            meter._wrap_client(ws_client)
+
+    def _wrap_client(self, ws_client: Any) -> Any:
+        if getattr(ws_client, "traffic_metered", False):
+            return ws_client
+        handle_message = ws_client.handle_message
+
+        def counted_handle_message(message):
+            data = getattr(message, "data", None)
+            if isinstance(data, (bytes, str)):
+                self.messages += 1
+                self.bytes += len(data)
+            return handle_message(message)
+
+        ws_client.handle_message = counted_handle_message
+        ws_client.traffic_metered = True
+        return ws_client
+
+    @classmethod
+    def reset(cls) -> None:
+        cls.meters_dict = {}
+
+    def __init__(self, exchange_id: str):
+        self.exchange_id = exchange_id
+        self.messages = 0
+        self.bytes = 0
+        self.started_at = time.monotonic()
+        # Скорость до первого понижения глубины на бирже.
+        self.baseline: Optional[dict[str, float]] = None
+        # Последняя точка для скорости "сейчас": (ts, messages, bytes).
+        self._last_sample = (self.started_at, 0, 0)
+
+    def _rate(self, since: tuple[float, int, int], now: float) -> dict[str, float]:
+        elapsed = max(now - since[0], 1e-9)
+        return {
+            "messages_per_sec": round((self.messages - since[1]) / elapsed, 2),
+            "bytes_per_sec": round((self.bytes - since[2]) / elapsed, 1),
+        }
+
+    def freeze_baseline(self) -> None:
+        """Зафиксировать скорость с начала измерения как базовую (один раз)."""
+        if self.baseline is None:
+            now = time.monotonic()
+            self.baseline = self._rate((self.started_at, 0, 0), now)
+            self.baseline["sec"] = round(now - self.started_at, 1)
+            # Скорость "после" считается с этого момента.
+            self._last_sample = (now, self.messages, self.bytes)
+
+    def snapshot(self) -> dict[str, Any]:
+        """Сводка: всего, базовая скорость и скорость с прошлого снимка."""
+        now = time.monotonic()
+        result = {
+            "messages": self.messages,
+            "bytes": self.bytes,
+            "baseline": self.baseline,
+            "current": self._rate(self._last_sample, now),
+        }
+        self._last_sample = (now, self.messages, self.bytes)
+        return result
+
+
+class OrderbookDepthPolicy:
+    """Глубина подписки на стакан для одной связки `(exchange_id, symbol)`.
+
+    `limit` — текущий лимит подписки (`None` — глубина биржи по умолчанию).
+    Политики хранятся в `policies_dict[exchange_id][symbol]`.
+    """
+
+    # Лимиты `watchOrderBook` линейных свопов по биржам, по возрастанию.
+    # Последний — глубина подписки по умолчанию. Биржи без записи остаются
+    # на глубине по умолчанию.
+    SUPPORTED_LIMITS_DICT: dict[str, tuple[int, ...]] = {
+        "okx": (5, 400),
+        "htx": (5, 20, 150),
+        "gateio": (20, 50, 100),
+    }
+    # Лимит должен покрывать глубину исполнения с этим запасом.
+    DEPTH_MARGIN = 2.0
+    # Исполнение глубже этой доли лимита поднимает лимит.
+    ESCALATE_FILL_RATIO = 0.75
+    WARMUP_BOOKS = 50
+    DOWNSHIFT_WINDOW = 50
+    DOWNSHIFT_COOLDOWN_SEC = 300.0
+
+    policies_dict: dict[str, dict[str, "OrderbookDepthPolicy"]] = {}
+
+    @classmethod
+    def get_policy(cls, exchange_id: str, symbol: str) -> "OrderbookDepthPolicy":
+        """Новая политика связки; заменяет прежнюю политику символа."""
+        policy = cls(exchange_id)
+        cls.policies_dict.setdefault(exchange_id, {})[symbol] = policy
+        return policy
+
+    @classmethod
+    def remove_policy(cls, exchange_id: str, symbol: str, policy: "OrderbookDepthPolicy") -> None:
+        exchange_policies = cls.policies_dict.get(exchange_id, {})
+        if exchange_policies.get(symbol) is policy:
+            del exchange_policies[symbol]
+
+    @classmethod
+    def summary(cls) -> dict[str, dict[str, Any]]:
+        """`{exchange_id: {"limits": {limit: symbols}, "escalations", "downshifts", "traffic"}}`."""
+        result: dict[str, dict[str, Any]] = {}
+        exchange_ids = set(cls.policies_dict) | set(ExchangeTrafficMeter.meters_dict)
+        for exchange_id in sorted(exchange_ids):
+            limits: dict[str, int] = {}
+            escalations = downshifts = 0
+            for policy in cls.policies_dict.get(exchange_id, {}).values():
+                key = "default" if policy.limit is None else str(policy.limit)
+                limits[key] = limits.get(key, 0) + 1
+                escalations += policy.escalations
+                downshifts += policy.downshifts
+            meter = ExchangeTrafficMeter.meters_dict.get(exchange_id)
+            result[exchange_id] = {
+                "limits": limits,
+                "escalations": escalations,
+                "downshifts": downshifts,
+                "traffic": meter.snapshot() if meter is not None else None,
+            }
+        return result
+
+    @classmethod
+    def reset(cls) -> None:
+        cls.policies_dict = {}
+        ExchangeTrafficMeter.reset()
+
+    def __init__(self, exchange_id: str):
+        self.exchange_id = exchange_id
+        self.supported_limits = self.SUPPORTED_LIMITS_DICT.get(exchange_id, ())
+        self.limit: Optional[int] = None
+        self.books = 0
+        self.escalations = 0
+        self.downshifts = 0
+        self._window_max_depth = 0
+        self._window_books = 0
+        self._escalated_at: Optional[float] = None
+
+    def _next_limit(self, effective: int) -> Optional[int]:
+        for limit in self.supported_limits:
+            if limit > effective:
+                return limit
+        return None
+
+    def observe(self, ask_fill_depth: int, bid_fill_depth: int, ask_levels: int, bid_levels: int) -> bool:
+        """Учесть глубину исполнения очередного пересчёта лестницы.
+
+        Args:
+            ask_fill_depth: Глубина исполнения asks (больше `ask_levels`,
+                если объёма не хватило хотя бы на одной ступени).
+            bid_fill_depth: То же для bids.
+            ask_levels: Уровней asks в стакане.
+            bid_levels: Уровней bids в стакане.
+
+        Returns:
+            `True`, если `limit` изменился и подписку нужно переоформить.
+        """
+        if not self.supported_limits:
+            return False
+        self.books += 1
+        effective = self.limit if self.limit is not None else self.supported_limits[-1]
+        fill_depth = max(ask_fill_depth, bid_fill_depth)
+
+        if self.limit is not None:
+            truncated = (
+                (ask_fill_depth > ask_levels and ask_levels >= effective)
+                or (bid_fill_depth > bid_levels and bid_levels >= effective)
+            )
+            if truncated or fill_depth > effective * self.ESCALATE_FILL_RATIO:
+                next_limit = self._next_limit(effective)
+                self.limit = None if next_limit is None or next_limit == self.supported_limits[-1] else next_limit
+                self.escalations += 1
+                self._escalated_at = time.monotonic()
+                self._window_max_depth = 0
+                self._window_books = 0
+                return True
+
+        if self.books <= self.WARMUP_BOOKS:
+            return False
+        # Окно без перекрытия: максимум глубины без хранения истории.
+        if fill_depth > self._window_max_depth:
+            self._window_max_depth = fill_depth
+        self._window_books += 1
+        if self._window_books < self.DOWNSHIFT_WINDOW:
+            return False
+        need = int(self._window_max_depth * self.DEPTH_MARGIN + 0.999)
+        self._window_max_depth = 0
+        self._window_books = 0
+        if self._escalated_at is not None and time.monotonic() - self._escalated_at < self.DOWNSHIFT_COOLDOWN_SEC:
+            return False
+        target = next((limit for limit in self.supported_limits if limit >= need), None)
+        if target is None or target >= effective:
+            return False
+        self.limit = target
+        self.downshifts += 1
+        ExchangeTrafficMeter.get_meter(self.exchange_id).freeze_baseline()
+        return True
+
+
+async def unwatch_orderbook(exchange_instance: Any, symbols: list[str], limit: Optional[int]) -> None:
+    """Снять подписку на стакан с прежним лимитом (если биржа это умеет).
+
+    Без отписки ccxt продолжает получать поток старого канала (у okx
+    `books` и `books5` — разные каналы), и понижение глубины не уменьшает
+    трафик. Ошибка отписки не мешает новой подписке.
+    """
+    params = {} if limit is None else {"limit": limit}
+    try:
+        if len(symbols) > 1 and hasattr(exchange_instance, "un_watch_order_book_for_symbols"):
+            await exchange_instance.un_watch_order_book_for_symbols(symbols, params)
+            return
+        un_watch = getattr(exchange_instance, "un_watch_order_book", None)
+        if un_watch is None:
+            return
+        for symbol in symbols:
+            await un_watch(symbol, params)
+    except Exception as e:
+        print(f"[{exchange_instance.id}][DEPTH] unwatch {symbols[:3]} limit={limit} failed: {repr(e)}")
+
+
+if __name__ == "__main__":
+    import random
+
+    # Лестница исполняется на 2-4 уровнях, затем рынок редеет до 30 уровней.
+    policy = OrderbookDepthPolicy("htx")
+    rng = random.Random(1)
+    history = []
+    for step in range(400):
+        levels = policy.limit or 150
+        depth = rng.randint(2, 4) if step < 250 else rng.randint(20, 30)
+        # Стакан, обрезанный лимитом, не покрывает объём: depth > levels.
+        ask_depth = depth if depth <= levels else levels + 1
+        if policy.observe(ask_depth, 2, levels, levels):
+            history.append((step, policy.limit))
+    print(f"limit changes: {history}; escalations={policy.escalations} downshifts={policy.downshifts}")
+    assert history[0][1] == 20 and history[-1][1] is None
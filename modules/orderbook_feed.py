@@ -0,0 +1,553 @@
+from __future__ import annotations
+
+_version_ = "1.0"
+"""Мультиплексор подписок на ордербуки одной биржи.
+
+Модуль заменяет схему "одна задача на пару `(symbol, exchange_id)`" на схему
+"несколько задач на биржу": символы биржи делятся на батчи, каждый батч
+слушается одной задачей через `watchOrderBookForSymbols`, а пришедший стакан
+передаётся в обработчик своего символа.
+
+Основные сущности:
+- `ExchangeOrderbookFeed`: подписка биржи, батчи символов и раздача стаканов
+  обработчикам;
+- `is_transient_stream_error`: общий для всех подписок признак временной
+  сетевой ошибки, после которой имеет смысл reconnect;
+- `run_feed_benchmark`: сравнение числа задач, CPU и задержки доставки между
+  раскладкой "задача на пару" и мультиплексором.
+
+Контракт обработчика символа (его реализует `ExchangeInstrument`):
+- `symbol`: торговый символ;
+- `start_stream()`: подготовка к приёму стаканов, вызывается один раз;
+- `process_orderbook(orderbook)`: обработка очередного стакана;
+- `handle_stream_timeout()`: символ слишком долго не получал стаканов;
+- `stop_stream(reason)`: остановка, при `reason` — с `exchange_stopped`;
+- `last_orderbook_ts`: `time.monotonic()` последнего стакана;
+- `stream_pause_timeout_sec`: таймаут тишины символа, после которого
+  вызывается `handle_stream_timeout()`;
+- `depth_policy.limit` (необязательно): лимит глубины подписки символа
+  (`OrderbookDepthPolicy`), батч подписывается с наибольшим из лимитов.
+
+Notes:
+    Модуль не считает цены и не знает про очереди символов: вся торговая
+    логика остаётся в обработчике. Биржи без `watchOrderBookForSymbols`
+    (или с размером батча `0`) мультиплексором не обслуживаются — для них
+    остаётся задача на пару `_OrderbookTask|{symbol}|{exchange_id}`.
+"""
+
+import asyncio
+import random
+import time
+import traceback
+from typing import Any, Optional
+
+import ccxt.pro as ccxt
+
+from modules.exchange_reconnect import ExchangeConnectionSupervisor
+from modules.orderbook_depth import unwatch_orderbook
+from modules.task_manager import TaskManager
+
+
+# Подстроки текста исключения, по которым ошибка подписки считается временной.
+TRANSIENT_STREAM_ERRORS = (
+    '1000', 'closed by remote server', 'Cannot write to closing transport',
+    'Connection closed', 'WebSocket is already closing', 'Transport closed',
+    'broken pipe', 'reset by peer'
+)
+
+
+def is_transient_stream_error(error: BaseException) -> bool:
+    """Проверить, что ошибка подписки временная и допускает reconnect."""
+    text = str(error)
+    return any(marker in text for marker in TRANSIENT_STREAM_ERRORS)
+
+
+class ExchangeOrderbookFeed:
+    """Подписка на ордербуки всех символов одной биржи в пределах воркера.
+
+    Символы регистрируются по мере запуска символ-менеджеров и раскладываются
+    по батчам размера `batch_size`. На каждый батч запускается одна задача
+    `_OrderbookFeedTask|{exchange_id}|{batch_index}`, которая слушает
+    `watchOrderBookForSymbols(batch)` и раздаёт стаканы обработчикам.
+
+    `stream_timeout` отслеживается по каждому символу отдельно, со своим
+    таймаутом тишины `stream_pause_timeout_sec`: после каждого стакана (не
+    чаще `TIMEOUT_CHECK_INTERVAL_SEC`) и при тишине во всём батче дольше
+    `TIMEOUT_CHECK_INTERVAL_SEC` проверяется `last_orderbook_ts` каждого
+    символа батча.
+
+    Лимит глубины батча — наибольший `depth_policy.limit` его символов
+    (`None`, глубина по умолчанию, если хоть у одного символа лимита нет);
+    пересчитывается при изменении состава и вместе с проверкой таймаутов.
+    """
+    # Размер батча по умолчанию для бирж, не перечисленных в BATCH_SIZE_DICT.
+    DEFAULT_BATCH_SIZE = 20
+    # Размер батча по биржам: {exchange_id: int}. `0` отключает мультиплексор
+    # для биржи — она остаётся на задачах `_OrderbookTask` на каждую пару.
+    BATCH_SIZE_DICT: dict[str, int] = {}
+    # Таймаут тишины для обработчиков без `stream_pause_timeout_sec`.
+    STREAM_PAUSE_TIMEOUT_SEC = 30.0
+    # Как часто проверять `stream_timeout` символов батча (и живого, и молчащего).
+    TIMEOUT_CHECK_INTERVAL_SEC = 1.0
+
+    # Реестр мультиплексоров воркера: {exchange_id: ExchangeOrderbookFeed}
+    feeds_dict: dict[str, "ExchangeOrderbookFeed"] = {}
+    task_manager = None
+
+    @classmethod
+    def get_batch_size(cls, exchange_id: str) -> int:
+        """Вернуть размер батча для биржи."""
+        return int(cls.BATCH_SIZE_DICT.get(exchange_id, cls.DEFAULT_BATCH_SIZE))
+
+    @classmethod
+    def is_supported(cls, exchange_instance: Any) -> bool:
+        """Проверить, что биржу можно обслуживать мультиплексором."""
+        has = getattr(exchange_instance, "has", None) or {}
+        return bool(has.get("watchOrderBookForSymbols")) and cls.get_batch_size(exchange_instance.id) > 0
+
+    @classmethod
+    def get_feed(cls, exchange_instance: Any) -> Optional["ExchangeOrderbookFeed"]:
+        """Вернуть мультиплексор биржи, создав его при первом обращении.
+
+        Returns:
+            `ExchangeOrderbookFeed` или `None`, если биржа не поддерживает
+            `watchOrderBookForSymbols` или мультиплексор для неё выключен.
+        """
+        if exchange_instance is None or not cls.is_supported(exchange_instance):
+            return None
+        feed = cls.feeds_dict.get(exchange_instance.id)
+        if feed is None:
+            feed = cls(exchange_instance, batch_size=cls.get_batch_size(exchange_instance.id))
+            cls.feeds_dict[exchange_instance.id] = feed
+        return feed
+
+    def __init__(self, exchange_instance: Any, batch_size: int):
+        """Создать мультиплексор биржи.
+
+        Args:
+            exchange_instance: Экземпляр ccxt.pro биржи.
+            batch_size: Максимум символов в одной подписке
+                `watchOrderBookForSymbols`.
+        """
+        self.exchange = exchange_instance
+        self.exchange_id = exchange_instance.id
+        self.batch_size = batch_size
+        # {symbol: обработчик}
+        self.instruments: dict[str, Any] = {}
+        # Батчи символов:
+        # [{"symbols": list[str], "version": int, "task_name": str, "running": bool,
+        #   "limit": Optional[int]}]
+        # `version` растёт при каждом изменении состава батча, `limit` — лимит
+        # глубины текущей подписки батча.
+        self.batches: list[dict[str, Any]] = []
+        # {symbol: индекс батча}
+        self.symbol_batch_dict: dict[str, int] = {}
+        self.stats = {"messages": 0, "dispatched": 0, "unknown_symbol": 0, "reconnects": 0, "failed_symbols": 0}
+
+    def register(self, instrument: Any) -> str:
+        """Подключить обработчик символа к подписке биржи.
+
+        Символ попадает в первый неполный батч. Если у батча нет работающей
+        задачи, она запускается через `task_manager`.
+
+        Returns:
+            Имя задачи батча, обслуживающей символ.
+        """
+        symbol = instrument.symbol
+        if symbol in self.symbol_batch_dict:
+            batch = self.batches[self.symbol_batch_dict[symbol]]
+            if self.instruments.get(symbol) is not instrument:
+                # Новый обработчик того же символа запускается задачей
+                # батча при пересборке состава.
+                self.instruments[symbol] = instrument
+                batch["version"] += 1
+            return batch["task_name"]
+
+        batch_index = next(
+            (i for i, batch in enumerate(self.batches) if len(batch["symbols"]) < self.batch_size),
+            None,
+        )
+        if batch_index is None:
+            batch_index = len(self.batches)
+            self.batches.append({
+                "symbols": [],
+                "version": 0,
+                "task_name": f"_OrderbookFeedTask|{self.exchange_id}|{batch_index}",
+                "running": False,
+                "limit": None,
+            })
+
+        batch = self.batches[batch_index]
+        self.instruments[symbol] = instrument
+        self.symbol_batch_dict[symbol] = batch_index
+        batch["symbols"].append(symbol)
+        batch["version"] += 1
+
+        if not batch["running"]:
+            batch["running"] = True
+            self.task_manager.add_task(name=batch["task_name"], coro_func=self._watch_batch, batch=batch)
+        return batch["task_name"]
+
+    async def unregister(self, symbol: str, reason: Optional[str] = None) -> None:
+        """Отключить символ от подписки и остановить его обработчик.
+
+        Подписка на стакан символа снимается (`unwatch_orderbook`, с лимитом
+        батча), как при смене глубины: иначе ccxt продолжает принимать поток
+        снятого символа. Батч без символов завершает свою задачу на следующей
+        итерации.
+
+        Args:
+            symbol: Торговый символ.
+            reason: Причина для `stop_stream(reason)`; без неё — штатная
+                остановка без `exchange_stopped`.
+        """
+        instrument = self.instruments.pop(symbol, None)
+        batch_index = self.symbol_batch_dict.pop(symbol, None)
+        if batch_index is not None:
+            batch = self.batches[batch_index]
+            if symbol in batch["symbols"]:
+                batch["symbols"].remove(symbol)
+                batch["version"] += 1
+                if batch["running"]:
+                    await unwatch_orderbook(self.exchange, [symbol], batch["limit"])
+        if instrument is not None:
+            await instrument.stop_stream(reason)
+
+    def _batch_limit(self, symbols: list[str]) -> Optional[int]:
+        """Лимит подписки батча: наибольший лимит символов или `None`."""
+        batch_limit = 0
+        for symbol in symbols:
+            depth_policy = getattr(self.instruments.get(symbol), "depth_policy", None)
+            limit = None if depth_policy is None else depth_policy.limit
+            if limit is None:
+                return None
+            batch_limit = max(batch_limit, limit)
+        return batch_limit or None
+
+    async def _check_stream_timeouts(self, symbols: list[str]) -> None:
+        """Перевести в `stream_timeout` символы батча, которые давно молчат."""
+        now = time.monotonic()
+        for symbol in symbols:
+            instrument = self.instruments.get(symbol)
+            if instrument is None or instrument.last_orderbook_ts is None:
+                continue
+            timeout_sec = getattr(instrument, "stream_pause_timeout_sec", self.STREAM_PAUSE_TIMEOUT_SEC)
+            if now - instrument.last_orderbook_ts > timeout_sec:
+                await instrument.handle_stream_timeout()
+
+    async def _drop_failed_symbol(self, symbol: str, instrument: Any, error: Exception) -> None:
+        """Отключить символ, обработчик которого упал, не останавливая батч."""
+        print(f"[{self.exchange_id}][FEED] {symbol} handler crashed: {repr(error)}")
+        traceback.print_exc()
+        self.stats["failed_symbols"] += 1
+        if self.instruments.get(symbol) is not instrument:
+            # Символ уже перерегистрирован с новым обработчиком.
+            return
+        try:
+            await self.unregister(symbol, "fatal_watch_orderbook_error")
+        except Exception as e:
+            print(f"[{self.exchange_id}][FEED] {symbol} stop failed: {repr(e)}")
+
+    async def _watch_batch(self, batch: dict[str, Any]) -> None:
+        """Слушать батч символов и раздавать стаканы обработчикам.
+
+        Args:
+            batch: Батч из `self.batches`. Список символов может меняться
+                во время работы: новые символы подписываются на следующем
+                вызове `watchOrderBookForSymbols`.
+
+        Notes:
+            Временные сетевые ошибки обрабатываются переподпиской через
+            `ExchangeConnectionSupervisor` биржи, как в
+            `ExchangeInstrument.watch_orderbook`. Ошибка обработчика символа
+            (`start_stream`/`process_orderbook`) отключает только этот символ
+            с `exchange_stopped`; фатальная ошибка подписки останавливает
+            все символы батча. Число попыток переподписки ограничивает
+            только супервизор (`MAX_RECONNECT_ATTEMPTS`). `UnsubscribeError`
+            после `unregister` символа батча — не ошибка подписки: батч
+            пересобирается с новым составом.
+        """
+        # {symbol: обработчик, для которого уже вызван `start_stream()`}.
+        # Сравнение по объекту, а не по символу: символ, снятый через
+        # `unregister` и зарегистрированный заново (рестарт, readmit,
+        # миграция между воркерами), приходит с новым обработчиком.
+        started_dict: dict[str, Any] = {}
+        symbols: list[str] = []
+        batch_version = None
+        batch_limit = subscribed_limit = None
+        reconnect_attempts = 0
+        last_timeout_check = time.monotonic()
+
+        try:
+            while batch["symbols"]:
+                # Состав батча пересобираем только после его изменения,
+                # а не на каждом сообщении.
+                if batch_version != batch["version"]:
+                    batch_version = batch["version"]
+                    symbols = list(batch["symbols"])
+                    for symbol in set(started_dict).difference(symbols):
+                        del started_dict[symbol]
+                    for symbol in symbols:
+                        instrument = self.instruments.get(symbol)
+                        if instrument is None or started_dict.get(symbol) is instrument:
+                            continue
+                        try:
+                            await instrument.start_stream()
+                        except Exception as e:
+                            await self._drop_failed_symbol(symbol, instrument, e)
+                            continue
+                        started_dict[symbol] = instrument
+                    if batch_version != batch["version"]:
+                        # Состав изменился во время запуска обработчиков.
+                        continue
+                    batch_limit = self._batch_limit(symbols)
+
+                if batch_limit != subscribed_limit:
+                    await unwatch_orderbook(self.exchange, symbols, subscribed_limit)
+                    print(f"[{self.exchange_id}][DEPTH] batch {batch['task_name']}: limit -> {batch_limit or 'default'}")
+                    subscribed_limit = batch["limit"] = batch_limit
+
+                try:
+                    # `asyncio.timeout` дешевле `wait_for`: не создаёт
+                    # промежуточную задачу на каждое сообщение. Таймауты
+                    # символов свои, поэтому молчащий батч проверяется
+                    # раз в `TIMEOUT_CHECK_INTERVAL_SEC`.
+                    async with asyncio.timeout(self.TIMEOUT_CHECK_INTERVAL_SEC):
+                        orderbook = await self.exchange.watchOrderBookForSymbols(symbols, subscribed_limit)
+                except TimeoutError:
+                    await self._check_stream_timeouts(symbols)
+                    batch_limit = self._batch_limit(symbols)
+                    last_timeout_check = time.monotonic()
+                    continue
+                except ccxt.UnsubscribeError:
+                    if batch_version == batch["version"]:
+                        raise
+                    # Символ снят `unregister`: ожидание отменено отпиской.
+                    continue
+                except Exception as e:
+                    if not is_transient_stream_error(e):
+                        raise
+                    # Backoff и слоты переподписки общие для всех батчей и
+                    # задач пар биржи (`ExchangeConnectionSupervisor`).
+                    supervisor = ExchangeConnectionSupervisor.get_supervisor(self.exchange)
+                    reconnect_attempts = await supervisor.report_failure(batch, e)
+                    self.stats["reconnects"] += 1
+                    print(f"[{self.exchange_id}][FEED_RECONNECT] attempt {reconnect_attempts}: {repr(e)}")
+                    if reconnect_attempts > supervisor.MAX_RECONNECT_ATTEMPTS:
+                        raise
+                    await supervisor.wait_for_resubscribe(batch)
+                    continue
+
+                if reconnect_attempts:
+                    reconnect_attempts = 0
+                    ExchangeConnectionSupervisor.get_supervisor(self.exchange).report_resubscribed(batch)
+                self.stats["messages"] += 1
+                instrument = self.instruments.get(orderbook.get("symbol")) if isinstance(orderbook, dict) else None
+                if instrument is None:
+                    self.stats["unknown_symbol"] += 1
+                else:
+                    try:
+                        if started_dict.get(instrument.symbol) is not instrument:
+                            # Символ перерегистрирован, пока батч ждал
+                            # стакан: запускаем до пересборки состава.
+                            await instrument.start_stream()
+                            started_dict[instrument.symbol] = instrument
+                        await instrument.process_orderbook(orderbook)
+                        self.stats["dispatched"] += 1
+                    except Exception as e:
+                        await self._drop_failed_symbol(instrument.symbol, instrument, e)
+
+                now = time.monotonic()
+                if now - last_timeout_check >= self.TIMEOUT_CHECK_INTERVAL_SEC:
+                    await self._check_stream_timeouts(symbols)
+                    batch_limit = self._batch_limit(symbols)
+                    last_timeout_check = now
+
+        except Exception as e:
+            print(f"[{self.exchange_id}][FATAL] orderbook feed crashed: {repr(e)}")
+            traceback.print_exc()
+            for symbol in list(batch["symbols"]):
+                instrument = self.instruments.pop(symbol, None)
+                self.symbol_batch_dict.pop(symbol, None)
+                if instrument is not None:
+                    await instrument.stop_stream("fatal_watch_orderbook_error")
+            batch["symbols"].clear()
+
+        finally:
+            batch["running"] = False
+
+
+class _BenchmarkExchange:
+    """Имитация ccxt.pro биржи для бенчмарка: стаканы приходят по `publish`.
+
+    Как и в ccxt, ожидающие future хранятся по набору символов подписки:
+    повторный вызов с тем же набором ждёт тот же future, а стакан, пришедший
+    без ожидающих, не копится в очереди.
+    """
+
+    def __init__(self, exchange_id: str):
+        self.id = exchange_id
+        self.has = {"watchOrderBookForSymbols": True}
+        self._futures: dict[tuple[str, ...], asyncio.Future] = {}
+        self._symbol_keys: dict[str, list[tuple[str, ...]]] = {}
+
+    def _wait(self, symbols: list[str]) -> asyncio.Future:
+        key = tuple(symbols)
+        future = self._futures.get(key)
+        if future is None or future.done():
+            if key not in self._futures:
+                for symbol in key:
+                    self._symbol_keys.setdefault(symbol, []).append(key)
+            future = asyncio.get_running_loop().create_future()
+            self._futures[key] = future
+        return future
+
+    async def watchOrderBook(self, symbol: str, limit=None) -> dict[str, Any]:
+        return await self._wait([symbol])
+
+    async def watchOrderBookForSymbols(self, symbols: list[str], limit=None) -> dict[str, Any]:
+        return await self._wait(symbols)
+
+    def publish(self, symbol: str, orderbook: dict[str, Any]) -> None:
+        for key in self._symbol_keys.get(symbol, ()):
+            future = self._futures[key]
+            if not future.done():
+                future.set_result(orderbook)
+
+
+class _BenchmarkInstrument:
+    """Обработчик символа для бенчмарка: только меряет задержку доставки."""
+
+    def __init__(self, symbol: str, latencies: list[float]):
+        self.symbol = symbol
+        self.last_orderbook_ts: float | None = None
+        self._latencies = latencies
+        self._streaming = False
+
+    async def start_stream(self) -> None:
+        self._streaming = True
+        self.last_orderbook_ts = time.monotonic()
+
+    async def process_orderbook(self, orderbook: dict[str, Any]) -> None:
+        self.last_orderbook_ts = time.monotonic()
+        self._latencies.append(time.perf_counter() - orderbook["sent_ts"])
+
+    async def handle_stream_timeout(self) -> None:
+        pass
+
+    async def stop_stream(self, reason: str | None = None) -> None:
+        self._streaming = False
+
+    async def watch_orderbook(self, exchange: _BenchmarkExchange) -> None:
+        # Повторяет цикл `ExchangeInstrument.watch_orderbook`, включая
+        # `wait_for` с таймаутом тишины.
+        await self.start_stream()
+        while self._streaming:
+            orderbook = await asyncio.wait_for(
+                exchange.watchOrderBook(self.symbol),
+                timeout=ExchangeOrderbookFeed.STREAM_PAUSE_TIMEOUT_SEC,
+            )
+            await self.process_orderbook(orderbook)
+
+
+async def _run_feed_layout(
+        layout: str, symbols: list[str], exchange_ids: list[str], updates: int, batch_size: int, seed: int
+) -> dict[str, Any]:
+    """Прогнать одну раскладку подписок на синтетическом потоке стаканов."""
+    rng = random.Random(seed)
+    task_manager = TaskManager()
+    latencies: list[float] = []
+    exchanges = {exchange_id: _BenchmarkExchange(exchange_id) for exchange_id in exchange_ids}
+    instruments: list[_BenchmarkInstrument] = []
+    feeds: list[ExchangeOrderbookFeed] = []
+    task_names: list[str] = []
+    tasks_before = len(asyncio.all_tasks())
+
+    for exchange_id, exchange in exchanges.items():
+        feed = ExchangeOrderbookFeed(exchange, batch_size=batch_size) if layout == "feed" else None
+        if feed is not None:
+            feed.task_manager = task_manager
+            feeds.append(feed)
+        for symbol in symbols:
+            instrument = _BenchmarkInstrument(symbol, latencies)
+            instruments.append(instrument)
+            if feed is not None:
+                task_name = feed.register(instrument)
+                if task_name not in task_names:
+                    task_names.append(task_name)
+            else:
+                task_name = f"_OrderbookTask|{symbol}|{exchange_id}"
+                task_manager.add_task(name=task_name, coro_func=instrument.watch_orderbook, exchange=exchange)
+                task_names.append(task_name)
+
+    await asyncio.sleep(0)
+    task_count = len(asyncio.all_tasks()) - tasks_before
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    published = 0
+    for i in range(updates):
+        exchange = exchanges[exchange_ids[i % len(exchange_ids)]]
+        symbol = symbols[rng.randrange(len(symbols))]
+        exchange.publish(symbol, {"symbol": symbol, "asks": [], "bids": [], "sent_ts": time.perf_counter()})
+        published += 1
+        # Между "сообщениями сокета" даём циклу событий разобрать
+        # доставленные стаканы, как это происходит в живом потоке.
+        await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    for instrument in instruments:
+        await instrument.stop_stream()
+    for feed in feeds:
+        for batch in feed.batches:
+            batch["symbols"].clear()
+    for task_name in task_names:
+        await task_manager.cancel_task(name=task_name, reason="benchmark finished")
+
+    latencies.sort()
+    return {
+        "layout": layout,
+        "tasks": task_count,
+        "published": published,
+        "delivered": len(latencies),
+        "cpu_sec": cpu,
+        "wall_sec": wall,
+        "latency_p50_us": latencies[len(latencies) // 2] * 1e6 if latencies else None,
+        "latency_p99_us": latencies[int(len(latencies) * 0.99)] * 1e6 if latencies else None,
+    }
+
+
+def run_feed_benchmark(
+        symbols_count: int = 400,
+        exchange_ids: tuple[str, ...] = ("okx", "htx", "gateio"),
+        updates: int = 50_000,
+        batch_size: int = ExchangeOrderbookFeed.DEFAULT_BATCH_SIZE,
+        seed: int = 42,
+) -> list[dict[str, Any]]:
+    """Сравнить раскладку "задача на пару" с мультиплексором по биржам.
+
+    Обе раскладки получают одинаковый синтетический поток стаканов (без сети),
+    поэтому разница в CPU и задержке — это накладные расходы самих подписок:
+    количество задач, future и переключений цикла событий.
+
+    Returns:
+        Список словарей с метриками `tasks`, `delivered`, `cpu_sec`,
+        `latency_p50_us`, `latency_p99_us` для каждой раскладки.
+    """
+    symbols = [f"SYM{i}/USDT:USDT" for i in range(symbols_count)]
+    return [
+        asyncio.run(_run_feed_layout(layout, symbols, list(exchange_ids), updates, batch_size, seed))
+        for layout in ("per_pair", "feed")
+    ]
+
+
+if __name__ == '__main__':
+    for result in run_feed_benchmark():
+        print(
+            f"{result['layout']:>8}: tasks={result['tasks']} "
+            f"delivered={result['delivered']}/{result['published']} "
+            f"cpu={result['cpu_sec']:.3f}s wall={result['wall_sec']:.3f}s "
+            f"p50={result['latency_p50_us']:.1f}us p99={result['latency_p99_us']:.1f}us"
+        )
@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-_version_ = '1.1'
+_version_ = '1.2'
 """Скользящая статистика интервалов между обновлениями ордербука.
 
 Модуль изолирует аналитику качества входящего стрима `watchOrderBook`.
@@ -27,6 +27,19 @@ _version_ = '1.1'
 - снимок публикуется либо в момент первого полного заполнения окна, либо по
   таймауту.
 
+Как считается статистика (стоимость `observe` не зависит от `N`):
+- `mean_dt`/`std_dt`: скользящие суммы `Σdt` и `Σdt²`, которые пересчитываются
+  целиком раз в `N` вытеснений, чтобы не копить ошибку округления;
+- `min_dt`/`max_dt`: монотонные очереди (минимум/максимум скользящего окна);
+- квантили (`percentile`): счётчики интервалов окна по фиксированным
+  интервалам гистограммы `LatencyHistogram` (относительная погрешность
+  около 3%, ответ не больше точного `max_dt`) и их суммы по октавам.
+  Поиск идёт по октавам, затем внутри одной октавы: стоимость ограничена
+  размером гистограммы и не растёт с `max_intervals`.
+
+Стоимость `observe` в зависимости от размера окна меряет
+`run_observe_benchmark` (`python -m modules.orderbook_interval_stats`).
+
 Почему используется `time.monotonic()`:
 - системные часы могут сдвигаться;
 - для интервалов важно монотонное время;
@@ -40,8 +53,16 @@ Notes:
 
 from collections import deque
 from math import sqrt
+import random
 import time
-from typing import Literal, TypedDict
+from typing import Any, Literal, TypedDict
+
+from modules.latency_trace import LatencyHistogram
+
+# Интервалы гистограммы, начиная с `_HALF_COUNT`, идут группами по
+# `_HALF_COUNT` на октаву `[2^e, 2^(e+1))`: номер октавы — `bucket >> _OCTAVE_SHIFT`.
+_OCTAVE_SHIFT = LatencyHistogram._HALF_COUNT.bit_length() - 1
+_OCTAVE_COUNT = ((LatencyHistogram._BUCKET_COUNT - 1) >> _OCTAVE_SHIFT) + 1
 
 
 class OrderbookIntervalStatsSnapshot(TypedDict):
@@ -115,6 +136,23 @@ class OrderbookIntervalStatsWindow:
         self._intervals: deque[float] = deque(maxlen=max_intervals)
         self._last_tick_ts: float | None = None
         self._last_emit_ts: float | None = None
+        self._reset_rolling_state()
+
+    def _reset_rolling_state(self) -> None:
+        """Сбросить скользящие суммы, монотонные очереди и гистограмму окна."""
+        self._sum: float = 0.0
+        self._sum_sq: float = 0.0
+        self._evicted_since_resum: int = 0
+        # Номер следующего интервала; окно — номера `[_seq - size, _seq)`.
+        self._seq: int = 0
+        # Кандидаты в минимум/максимум: `(seq, dt)` с возрастающими/убывающими `dt`.
+        self._min_candidates: deque[tuple[int, float]] = deque()
+        self._max_candidates: deque[tuple[int, float]] = deque()
+        # Интервал гистограммы каждого `Δt` окна и число `Δt` в каждом интервале.
+        self._buckets: deque[int] = deque()
+        self._bucket_counts: list[int] = [0] * LatencyHistogram._BUCKET_COUNT
+        # Число `Δt` окна в каждой октаве гистограммы.
+        self._octave_counts: list[int] = [0] * _OCTAVE_COUNT
 
     @property
     def size(self) -> int:
@@ -163,6 +201,96 @@ class OrderbookIntervalStatsWindow:
         self._intervals.clear()
         self._last_tick_ts = None
         self._last_emit_ts = None
+        self._reset_rolling_state()
+
+    def _append_interval(self, dt: float) -> None:
+        """Добавить интервал в окно, вытеснив самый старый при полном окне."""
+        intervals = self._intervals
+        if len(intervals) == self.max_intervals:
+            old_dt = intervals[0]
+            old_seq = self._seq - len(intervals)
+            self._sum -= old_dt
+            self._sum_sq -= old_dt * old_dt
+            old_bucket = self._buckets.popleft()
+            self._bucket_counts[old_bucket] -= 1
+            self._octave_counts[old_bucket >> _OCTAVE_SHIFT] -= 1
+            if self._min_candidates[0][0] == old_seq:
+                self._min_candidates.popleft()
+            if self._max_candidates[0][0] == old_seq:
+                self._max_candidates.popleft()
+            self._evicted_since_resum += 1
+        intervals.append(dt)
+
+        seq = self._seq
+        self._seq = seq + 1
+        self._sum += dt
+        self._sum_sq += dt * dt
+        min_candidates = self._min_candidates
+        while min_candidates and min_candidates[-1][1] >= dt:
+            min_candidates.pop()
+        min_candidates.append((seq, dt))
+        max_candidates = self._max_candidates
+        while max_candidates and max_candidates[-1][1] <= dt:
+            max_candidates.pop()
+        max_candidates.append((seq, dt))
+
+        value_us = int(dt * 1_000_000)
+        if value_us < 0:
+            value_us = 0
+        elif value_us > LatencyHistogram.MAX_VALUE_US:
+            value_us = LatencyHistogram.MAX_VALUE_US
+        bucket = LatencyHistogram._index(value_us)
+        self._buckets.append(bucket)
+        self._bucket_counts[bucket] += 1
+        self._octave_counts[bucket >> _OCTAVE_SHIFT] += 1
+
+        if self._evicted_since_resum >= self.max_intervals:
+            # Амортизированно O(1): полный пересчёт раз в `max_intervals` вытеснений.
+            self._sum = sum(intervals)
+            self._sum_sq = sum(value * value for value in intervals)
+            self._evicted_since_resum = 0
+
+    def percentile(self, q: float) -> float | None:
+        """Вернуть квантиль `q` интервалов текущего окна.
+
+        Квантиль берётся по гистограмме окна: это верхняя граница интервала
+        гистограммы, в который попал ранг `ceil(q * size)`, но не больше
+        `max_dt` окна. Просмотр идёт от `max_dt` вниз сначала по октавам,
+        затем по интервалам одной октавы, поэтому стоимость не зависит от
+        размера окна, а p90/p99 обходятся дешевле p50.
+
+        Args:
+            q: Уровень квантиля в диапазоне `[0, 1]`.
+
+        Returns:
+            `None`, если в окне ещё нет ни одного интервала.
+        """
+        size = len(self._intervals)
+        if not size:
+            return None
+        rank = min(size, max(1, int(q * size + 0.999999)))
+        max_dt = self._max_candidates[0][1]
+        # Верхние квантили ищем сверху вниз, начиная с интервала `max_dt`:
+        # интервалы гистограммы выше максимума окна пусты.
+        bucket = LatencyHistogram._index(min(int(max_dt * 1_000_000), LatencyHistogram.MAX_VALUE_US))
+        above = size - rank
+        seen = 0
+        # Сначала октава, в которую попал ранг...
+        octave = bucket >> _OCTAVE_SHIFT
+        octave_counts = self._octave_counts
+        while octave > 0 and seen + octave_counts[octave] <= above:
+            seen += octave_counts[octave]
+            octave -= 1
+        # ...затем интервал внутри неё.
+        bucket = min(bucket, ((octave + 1) << _OCTAVE_SHIFT) - 1)
+        octave_start = octave << _OCTAVE_SHIFT
+        bucket_counts = self._bucket_counts
+        while bucket > octave_start:
+            seen += bucket_counts[bucket]
+            if seen > above:
+                break
+            bucket -= 1
+        return min(LatencyHistogram._upper_bound(bucket) / 1_000_000, max_dt)
 
     def _build_snapshot(
         self,
@@ -182,12 +310,14 @@ class OrderbookIntervalStatsWindow:
         Предполагается, что к моменту вызова окно уже содержит как минимум
         один интервал.
         """
-        mean_dt = sum(self._intervals) / len(self._intervals)
-        variance = sum((dt - mean_dt) ** 2 for dt in self._intervals) / len(self._intervals)
+        size = len(self._intervals)
+        mean_dt = self._sum / size
+        # `max(0, ...)`: разность сумм может уйти чуть ниже нуля из-за округления.
+        variance = max(0.0, self._sum_sq / size - mean_dt * mean_dt)
         std_dt = sqrt(variance)
         cv_dt = std_dt / mean_dt if mean_dt > 0 else None
-        min_dt = min(self._intervals)
-        max_dt = max(self._intervals)
+        min_dt = self._min_candidates[0][1]
+        max_dt = self._max_candidates[0][1]
 
         return {
             "type": "orderbook_interval_stats",
@@ -235,7 +365,7 @@ class OrderbookIntervalStatsWindow:
             return None
 
         was_full_before_append = self.is_full
-        self._intervals.append(now - previous_tick_ts)
+        self._append_interval(now - previous_tick_ts)
 
         window_just_filled = not was_full_before_append and self.is_full
         timeout_reached = (
@@ -249,3 +379,50 @@ class OrderbookIntervalStatsWindow:
         self._last_emit_ts = now
         trigger: Literal["window_full", "timeout"] = "window_full" if window_just_filled else "timeout"
         return self._build_snapshot(now=now, trigger=trigger)
+
+
+def run_observe_benchmark(
+        max_intervals_values: tuple[int, ...] = (50, 500, 5_000, 50_000),
+        ticks: int = 100_000,
+        seed: int = 7,
+) -> list[dict[str, Any]]:
+    """Измерить стоимость `observe` в зависимости от размера окна.
+
+    Окно сначала заполняется целиком, затем меряются `ticks` вызовов
+    `observe` на логнормальных интервалах: отдельно и вместе со снимком и
+    p99 на каждом тике (худший случай публикации).
+
+    Returns:
+        Список словарей `max_intervals`, `observe_ns`, `observe_snapshot_p99_ns`
+        по каждому размеру окна.
+    """
+    rng = random.Random(seed)
+    results = []
+    for max_intervals in max_intervals_values:
+        dts = [rng.lognormvariate(-3.0, 1.0) for _ in range(max_intervals + 1 + ticks)]
+        result: dict[str, Any] = {"max_intervals": max_intervals}
+        for key, with_snapshot in (("observe_ns", False), ("observe_snapshot_p99_ns", True)):
+            window = OrderbookIntervalStatsWindow(max_intervals=max_intervals, emit_timeout_sec=1e9)
+            ts = 0.0
+            for dt in dts[:max_intervals + 1]:
+                ts += dt
+                window.observe(ts)
+            started = time.perf_counter()
+            for dt in dts[max_intervals + 1:]:
+                ts += dt
+                window.observe(ts)
+                if with_snapshot:
+                    window._build_snapshot(now=ts, trigger="timeout")
+                    window.percentile(0.99)
+            result[key] = (time.perf_counter() - started) / ticks * 1e9
+        results.append(result)
+    return results
+
+
+if __name__ == "__main__":
+    print(f"{'max_intervals':>14} {'observe ns':>11} {'observe+snapshot+p99 ns':>24}")
+    for result in run_observe_benchmark():
+        print(
+            f"{result['max_intervals']:>14} {result['observe_ns']:>11.0f} "
+            f"{result['observe_snapshot_p99_ns']:>24.0f}"
+        )
@@ -0,0 +1,121 @@
+_version_ = "1.0"
+"""Почтовый ящик событий символа с объединением устаревших стаканов.
+
+`OrderbookMailbox` заменяет неограниченную `asyncio.Queue` символа
+`ArbitrageManager.orderbook_queue`. Интерфейс совместим с очередью
+(`put_nowait`, `put`, `get`, `get_nowait`, `qsize`, `empty`), поэтому
+`ExchangeInstrument` и читатель общей памяти пишут в него без изменений.
+
+Правила доставки:
+- `orderbook_update` объединяется по `exchange_id`: пока предыдущее
+  обновление биржи не прочитано, новое замещает его на том же месте в
+  очереди, а счётчик `coalesced_count` растёт;
+- управляющие события (`exchange_paused`, `exchange_resumed`,
+  `exchange_stopped`, ...) не объединяются и доставляются в порядке
+  поступления. Управляющее событие биржи "запечатывает" её ожидающее
+  обновление: обновление, пришедшее позже, встаёт в очередь после него.
+
+Notes:
+    Так медленный цикл символа всегда видит последнее состояние каждой
+    биржи, а не разбирает накопленные устаревшие тики по порядку, при этом
+    пауза/возобновление/остановка источника никогда не теряются и не
+    переставляются относительно обновлений той же биржи.
+"""
+
+import asyncio
+from collections import deque
+from typing import Any, Optional
+
+
+class OrderbookMailbox:
+    """Очередь событий символа, хранящая одно последнее обновление на биржу."""
+
+    COALESCED_EVENT_TYPE = "orderbook_update"
+
+    def __init__(self):
+        # Элементы очереди: управляющее событие (dict) либо ячейка обновления
+        # биржи (list из одного события), которую можно заменить до чтения.
+        self._entries: deque = deque()
+        self._pending_update_dict: dict[str, list[dict[str, Any]]] = {}
+        self._not_empty = asyncio.Event()
+        self.coalesced_count = 0
+
+    def put_nowait(self, event: dict[str, Any]) -> None:
+        """Положить событие; обновление биржи замещает её непрочитанное обновление."""
+        exchange_id = event.get("exchange_id")
+        if event.get("type") == self.COALESCED_EVENT_TYPE:
+            cell = self._pending_update_dict.get(exchange_id)
+            if cell is not None:
+                cell[0] = event
+                self.coalesced_count += 1
+                return
+            cell = [event]
+            self._pending_update_dict[exchange_id] = cell
+            self._entries.append(cell)
+        else:
+            self._pending_update_dict.pop(exchange_id, None)
+            self._entries.append(event)
+        self._not_empty.set()
+
+    async def put(self, event: dict[str, Any]) -> None:
+        self.put_nowait(event)
+
+    def get_nowait(self) -> dict[str, Any]:
+        """Забрать следующее событие без ожидания.
+
+        Raises:
+            asyncio.QueueEmpty: Если событий нет.
+        """
+        if not self._entries:
+            raise asyncio.QueueEmpty
+        entry = self._entries.popleft()
+        if not self._entries:
+            self._not_empty.clear()
+        if isinstance(entry, list):
+            event = entry[0]
+            exchange_id = event.get("exchange_id")
+            if self._pending_update_dict.get(exchange_id) is entry:
+                del self._pending_update_dict[exchange_id]
+            return event
+        return entry
+
+    async def get(self) -> dict[str, Any]:
+        """Дождаться и забрать следующее событие."""
+        while not self._entries:
+            await self._not_empty.wait()
+        return self.get_nowait()
+
+    def qsize(self) -> int:
+        return len(self._entries)
+
+    def empty(self) -> bool:
+        return not self._entries
+
+    def pending_update(self, exchange_id: str) -> Optional[dict[str, Any]]:
+        """Вернуть непрочитанное обновление биржи (для диагностики)."""
+        cell = self._pending_update_dict.get(exchange_id)
+        return cell[0] if cell is not None else None
+
+
+if __name__ == "__main__":
+    async def _demo():
+        mailbox = OrderbookMailbox()
+        for count in range(5):
+            mailbox.put_nowait({"type": "orderbook_update", "exchange_id": "okx", "count": count})
+        mailbox.put_nowait({"type": "exchange_paused", "exchange_id": "okx", "reason": "stream_timeout"})
+        mailbox.put_nowait({"type": "orderbook_update", "exchange_id": "okx", "count": 5})
+        mailbox.put_nowait({"type": "orderbook_update", "exchange_id": "htx", "count": 0})
+        mailbox.put_nowait({"type": "orderbook_update", "exchange_id": "okx", "count": 6})
+        events = [await mailbox.get() for _ in range(mailbox.qsize())]
+        for event in events:
+            print(event)
+        print(f"coalesced={mailbox.coalesced_count}")
+        assert [(e["type"], e["exchange_id"], e.get("count")) for e in events] == [
+            ("orderbook_update", "okx", 4),
+            ("exchange_paused", "okx", None),
+            ("orderbook_update", "okx", 6),
+            ("orderbook_update", "htx", 0),
+        ]
+        assert mailbox.coalesced_count == 5
+
+    asyncio.run(_demo())
@@ -0,0 +1,433 @@
+_version_ = "1.0"
+"""Запись сырого потока стаканов в компактные бинарные сегменты.
+
+`OrderbookRecorder` сохраняет ровно то, что вернул `watchOrderBook`:
+биржу, символ, локальные `time.monotonic()`/`time.time()`, биржевой
+`timestamp` и уровни `asks`/`bids`. Событийный цикл только снимает копию
+уровней и кладёт её в очередь; упаковка, сжатие и запись на диск идут в
+фоновом потоке `OrderbookRecorderWriter`, поэтому цикл не блокируется на
+диске.
+
+Формат каталога записи:
+- `{prefix}-{YYYYmmdd-HHMMSS}-{NNNN}.obseg` — сегмент: только дописываемая
+  последовательность блоков `BLOCK_HEADER` + zlib-сжатые записи;
+- `{prefix}-...-{NNNN}.obidx` — индекс сегмента: массив `INDEX_DTYPE`
+  фиксированного размера по одной строке на блок (время первой/последней
+  записи, смещение и длина блока). Индекс читается через `np.memmap`, поиск
+  блока по времени — `np.searchsorted`, сам сегмент открывается через `mmap`.
+
+Сегмент закрывается и начинается новый по размеру (`SEGMENT_MAX_BYTES`) или
+возрасту (`SEGMENT_MAX_SEC`).
+
+Формат записи внутри блока (little-endian):
+`RECORD_HEADER` (mono_ts, wall_ts, exchange_ts_ms, len(exchange_id),
+len(symbol), n_asks, n_bids), строки utf-8, затем `float64[n_asks, 2]` и
+`float64[n_bids, 2]` (цена, объём).
+
+Notes:
+    Из каждого уровня берутся только элементы 0 и 1: так одинаково
+    обрабатываются уровни ccxt `[price, amount]`, тройки Coincatch
+    `[price, amount, ['price', 'amount']]` и Exmo `[price, amount, quote]`
+    (см. readme.txt). Строковые цены/объёмы приводятся к float.
+    Если фоновый поток не успевает, новые записи отбрасываются (счётчик
+    `stats["dropped"]`), а не копятся без ограничения.
+"""
+
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+from itertools import chain
+from typing import Any, Iterator, Optional
+
+import numpy as np
+
+
+SEGMENT_SUFFIX = ".obseg"
+INDEX_SUFFIX = ".obidx"
+BLOCK_MAGIC = b"OBK1"
+# magic, длина сжатых данных, число записей в блоке.
+BLOCK_HEADER = struct.Struct("<4sII")
+# mono_ts, wall_ts, exchange_ts_ms (-1 — нет), len(exchange_id), len(symbol), n_asks, n_bids.
+RECORD_HEADER = struct.Struct("<ddqHHII")
+INDEX_DTYPE = np.dtype([
+    ("first_mono", "<f8"),
+    ("last_mono", "<f8"),
+    ("first_wall", "<f8"),
+    ("last_wall", "<f8"),
+    ("offset", "<u8"),
+    ("length", "<u4"),
+    ("count", "<u4"),
+])
+
+DEFAULT_MAX_LEVELS = 50
+BLOCK_MAX_RECORDS = 512
+BLOCK_FLUSH_SEC = 1.0
+SEGMENT_MAX_BYTES = 64 * 1024 * 1024
+SEGMENT_MAX_SEC = 3600.0
+QUEUE_MAX_SIZE = 100_000
+COMPRESS_LEVEL = 1
+
+_EMPTY_LEVELS = np.empty((0, 2), dtype=np.float64)
+
+
+def snapshot_levels(side: Any, max_levels: Optional[int] = DEFAULT_MAX_LEVELS) -> list[tuple[Any, Any]]:
+    """Снять копию пар (цена, объём) уровней стакана.
+
+    Дешёвая часть, выполняемая в событийном цикле: ccxt меняет уровни на
+    месте, поэтому значения копируются сразу, а приведение к float64 идёт
+    в фоновом потоке (`levels_to_array`).
+
+    Args:
+        side: `asks` или `bids` в формате ccxt, в том числе с лишними
+            элементами уровня (Coincatch, Exmo).
+        max_levels: Сколько верхних уровней сохранить; `None` — все.
+    """
+    if not side:
+        return []
+    levels = side if max_levels is None else side[:max_levels]
+    return [(level[0], level[1]) for level in levels]
+
+
+def levels_to_array(levels: list[tuple[Any, Any]]) -> np.ndarray:
+    """Привести пары (цена, объём) к `float64[n, 2]`; строки разбираются как числа."""
+    if not levels:
+        return _EMPTY_LEVELS
+    try:
+        return np.fromiter(chain.from_iterable(levels), dtype=np.float64, count=2 * len(levels)).reshape(-1, 2)
+    except (TypeError, ValueError):
+        return np.array([(float(price), float(amount)) for price, amount in levels], dtype=np.float64)
+
+
+def pack_record(
+    exchange_id: str,
+    symbol: str,
+    mono_ts: float,
+    wall_ts: float,
+    exchange_ts: Optional[int],
+    asks: np.ndarray,
+    bids: np.ndarray,
+) -> bytes:
+    """Упаковать одну запись в бинарный формат блока."""
+    exchange_bytes = exchange_id.encode()
+    symbol_bytes = symbol.encode()
+    header = RECORD_HEADER.pack(
+        mono_ts,
+        wall_ts,
+        -1 if exchange_ts is None else int(exchange_ts),
+        len(exchange_bytes),
+        len(symbol_bytes),
+        len(asks),
+        len(bids),
+    )
+    return b"".join((
+        header,
+        exchange_bytes,
+        symbol_bytes,
+        np.ascontiguousarray(asks, dtype="<f8").tobytes(),
+        np.ascontiguousarray(bids, dtype="<f8").tobytes(),
+    ))
+
+
+def unpack_records(payload: bytes) -> Iterator[dict[str, Any]]:
+    """Разобрать распакованный блок на записи."""
+    view = memoryview(payload)
+    offset = 0
+    size = len(payload)
+    while offset < size:
+        mono_ts, wall_ts, exchange_ts, exchange_len, symbol_len, n_asks, n_bids = \
+            RECORD_HEADER.unpack_from(view, offset)
+        offset += RECORD_HEADER.size
+        exchange_id = bytes(view[offset:offset + exchange_len]).decode()
+        offset += exchange_len
+        symbol = bytes(view[offset:offset + symbol_len]).decode()
+        offset += symbol_len
+        asks = np.frombuffer(view, dtype="<f8", count=n_asks * 2, offset=offset).reshape(n_asks, 2)
+        offset += n_asks * 16
+        bids = np.frombuffer(view, dtype="<f8", count=n_bids * 2, offset=offset).reshape(n_bids, 2)
+        offset += n_bids * 16
+        yield {
+            "exchange_id": exchange_id,
+            "symbol": symbol,
+            "mono_ts": mono_ts,
+            "wall_ts": wall_ts,
+            "timestamp": None if exchange_ts < 0 else exchange_ts,
+            "asks": asks,
+            "bids": bids,
+        }
+
+
+class OrderbookRecorderWriter(threading.Thread):
+    """Фоновый поток: копит записи в блоки, сжимает и дописывает в сегменты."""
+
+    def __init__(self, recorder: "OrderbookRecorder"):
+        super().__init__(name=f"orderbook-recorder-{recorder.prefix}", daemon=True)
+        self.recorder = recorder
+        self._segment_file = None
+        self._index_file = None
+        self._segment_started_mono = 0.0
+        self._segment_number = 0
+        self._block: list[bytes] = []
+        self._block_times: list[float] = []
+        self._block_started = 0.0
+
+    def run(self) -> None:
+        recorder = self.recorder
+        try:
+            while True:
+                timeout = BLOCK_FLUSH_SEC if self._block else None
+                try:
+                    item = recorder.queue.get(timeout=timeout)
+                except queue.Empty:
+                    self._flush_block()
+                    continue
+                if item is None:
+                    break
+                exchange_id, symbol, mono_ts, wall_ts, exchange_ts, asks, bids = item
+                if not self._block:
+                    self._block_started = time.monotonic()
+                self._block.append(pack_record(
+                    exchange_id, symbol, mono_ts, wall_ts, exchange_ts,
+                    levels_to_array(asks), levels_to_array(bids),
+                ))
+                self._block_times.append((mono_ts, wall_ts))
+                if (
+                    len(self._block) >= BLOCK_MAX_RECORDS
+                    or time.monotonic() - self._block_started >= BLOCK_FLUSH_SEC
+                ):
+                    self._flush_block()
+        finally:
+            self._flush_block()
+            self._close_segment()
+
+    def _open_segment(self) -> None:
+        recorder = self.recorder
+        self._segment_number += 1
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        base = os.path.join(recorder.directory, f"{recorder.prefix}-{stamp}-{self._segment_number:04d}")
+        self._segment_file = open(base + SEGMENT_SUFFIX, "ab")
+        self._index_file = open(base + INDEX_SUFFIX, "ab")
+        self._segment_started_mono = time.monotonic()
+        recorder.stats["segments"] += 1
+
+    def _close_segment(self) -> None:
+        for file_obj in (self._segment_file, self._index_file):
+            if file_obj is not None:
+                file_obj.close()
+        self._segment_file = None
+        self._index_file = None
+
+    def _flush_block(self) -> None:
+        if not self._block:
+            return
+        if self._segment_file is not None and (
+            self._segment_file.tell() >= SEGMENT_MAX_BYTES
+            or time.monotonic() - self._segment_started_mono >= SEGMENT_MAX_SEC
+        ):
+            self._close_segment()
+        if self._segment_file is None:
+            self._open_segment()
+
+        compressed = zlib.compress(b"".join(self._block), COMPRESS_LEVEL)
+        offset = self._segment_file.tell()
+        self._segment_file.write(BLOCK_HEADER.pack(BLOCK_MAGIC, len(compressed), len(self._block)))
+        self._segment_file.write(compressed)
+        self._segment_file.flush()
+
+        index_row = np.zeros(1, dtype=INDEX_DTYPE)
+        mono_times = [mono for mono, _ in self._block_times]
+        wall_times = [wall for _, wall in self._block_times]
+        index_row["first_mono"] = min(mono_times)
+        index_row["last_mono"] = max(mono_times)
+        index_row["first_wall"] = min(wall_times)
+        index_row["last_wall"] = max(wall_times)
+        index_row["offset"] = offset
+        index_row["length"] = BLOCK_HEADER.size + len(compressed)
+        index_row["count"] = len(self._block)
+        self._index_file.write(index_row.tobytes())
+        self._index_file.flush()
+
+        stats = self.recorder.stats
+        stats["written"] += len(self._block)
+        stats["blocks"] += 1
+        stats["bytes"] += BLOCK_HEADER.size + len(compressed)
+        self._block = []
+        self._block_times = []
+
+
+class OrderbookRecorder:
+    """Запись потока стаканов процесса в каталог сегментов.
+
+    `record` вызывается из событийного цикла и не делает дискового I/O:
+    копия пар (цена, объём) уходит в очередь фонового
+    `OrderbookRecorderWriter`, где упаковывается и сжимается.
+    """
+
+    def __init__(
+            self,
+            directory: str,
+            prefix: str = "orderbooks",
+            max_levels: Optional[int] = DEFAULT_MAX_LEVELS,
+            queue_max_size: int = QUEUE_MAX_SIZE,
+    ):
+        """Создать каталог записи и запустить фоновый поток.
+
+        Args:
+            directory: Каталог сегментов; создаётся при необходимости.
+            prefix: Префикс имён сегментов (например, `worker0`, `feed-okx`).
+            max_levels: Сколько уровней каждой стороны сохранять; `None` — все.
+            queue_max_size: Предел очереди к фоновому потоку.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.prefix = prefix
+        self.max_levels = max_levels
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_max_size)
+        self.stats = {"recorded": 0, "dropped": 0, "written": 0, "blocks": 0, "segments": 0, "bytes": 0}
+        self._writer = OrderbookRecorderWriter(self)
+        self._writer.start()
+
+    def record(self, exchange_id: str, symbol: str, orderbook: Any) -> None:
+        """Поставить стакан в очередь записи.
+
+        Args:
+            exchange_id: Биржа.
+            symbol: Символ.
+            orderbook: Стакан в том виде, в каком его вернул `watchOrderBook`.
+        """
+        if not isinstance(orderbook, dict):
+            return
+        item = (
+            exchange_id,
+            symbol,
+            time.monotonic(),
+            time.time(),
+            orderbook.get("timestamp"),
+            snapshot_levels(orderbook.get("asks"), self.max_levels),
+            snapshot_levels(orderbook.get("bids"), self.max_levels),
+        )
+        try:
+            self.queue.put_nowait(item)
+            self.stats["recorded"] += 1
+        except queue.Full:
+            self.stats["dropped"] += 1
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Дописать накопленное и остановить фоновый поток."""
+        if not self._writer.is_alive():
+            return
+        while True:
+            try:
+                self.queue.put(None, timeout=timeout)
+                break
+            except queue.Full:
+                continue
+        self._writer.join(timeout=timeout)
+
+
+def list_segments(directory: str, prefix: Optional[str] = None) -> list[str]:
+    """Вернуть пути сегментов каталога (без суффикса) в порядке записи."""
+    bases = []
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(SEGMENT_SUFFIX):
+            continue
+        if prefix is not None and not name.startswith(f"{prefix}-"):
+            continue
+        bases.append(os.path.join(directory, name[:-len(SEGMENT_SUFFIX)]))
+    return bases
+
+
+def read_segment(
+        base: str,
+        start_mono: Optional[float] = None,
+        end_mono: Optional[float] = None,
+) -> Iterator[dict[str, Any]]:
+    """Прочитать записи сегмента в интервале локального monotonic-времени.
+
+    Блоки, целиком лежащие вне интервала, пропускаются по индексу без
+    распаковки.
+
+    Args:
+        base: Путь сегмента без суффикса.
+        start_mono: Нижняя граница `mono_ts` включительно; `None` — с начала.
+        end_mono: Верхняя граница `mono_ts` включительно; `None` — до конца.
+    """
+    index_path = base + INDEX_SUFFIX
+    if os.path.getsize(index_path) < INDEX_DTYPE.itemsize:
+        return
+    index = np.memmap(index_path, dtype=INDEX_DTYPE, mode="r")
+    # Блок дописывается в сегмент раньше строки индекса: строки индекса
+    # всегда указывают на полностью записанные блоки.
+    first_block = 0 if start_mono is None else int(np.searchsorted(index["last_mono"], start_mono, side="left"))
+    with open(base + SEGMENT_SUFFIX, "rb") as segment_file:
+        with mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ) as segment:
+            for block_index in range(first_block, len(index)):
+                row = index[block_index]
+                if end_mono is not None and row["first_mono"] > end_mono:
+                    break
+                offset = int(row["offset"])
+                magic, length, _count = BLOCK_HEADER.unpack_from(segment, offset)
+                if magic != BLOCK_MAGIC:
+                    raise ValueError(f"bad block magic at {base}{SEGMENT_SUFFIX}:{offset}")
+                start = offset + BLOCK_HEADER.size
+                payload = zlib.decompress(segment[start:start + length])
+                for record in unpack_records(payload):
+                    if start_mono is not None and record["mono_ts"] < start_mono:
+                        continue
+                    if end_mono is not None and record["mono_ts"] > end_mono:
+                        break
+                    yield record
+
+
+def read_records(
+        directory: str,
+        prefix: Optional[str] = None,
+        start_mono: Optional[float] = None,
+        end_mono: Optional[float] = None,
+) -> Iterator[dict[str, Any]]:
+    """Прочитать записи всех сегментов каталога по порядку (см. `read_segment`)."""
+    for base in list_segments(directory, prefix):
+        yield from read_segment(base, start_mono=start_mono, end_mono=end_mono)
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    def _run_demo() -> None:
+        directory = tempfile.mkdtemp(prefix="orderbook-recorder-")
+        recorder = OrderbookRecorder(directory, prefix="demo", max_levels=20)
+        layouts = {
+            "okx": lambda p, a: [p, a],
+            "coincatch": lambda p, a: [p, a, [repr(p), repr(a)]],
+            "exmo": lambda p, a: [p, a, p * a],
+        }
+        started = time.perf_counter()
+        total = 30_000
+        for n in range(total):
+            exchange_id = ("okx", "coincatch", "exmo")[n % 3]
+            make_level = layouts[exchange_id]
+            mid = 100.0 + (n % 50) * 0.01
+            orderbook = {
+                "timestamp": 1_700_000_000_000 + n,
+                "asks": [make_level(mid + i * 0.01, 1.0 + i) for i in range(40)],
+                "bids": [make_level(mid - 0.01 - i * 0.01, 1.0 + i) for i in range(40)],
+            }
+            recorder.record(exchange_id, "BTC/USDT:USDT", orderbook)
+        enqueue_sec = time.perf_counter() - started
+        recorder.close()
+        records = list(read_records(directory, prefix="demo"))
+        assert len(records) == recorder.stats["recorded"], (len(records), recorder.stats)
+        assert records[1]["exchange_id"] == "coincatch" and records[1]["asks"].shape == (20, 2)
+        assert records[2]["bids"][0, 1] == 1.0
+        middle = records[len(records) // 2]["mono_ts"]
+        tail = list(read_records(directory, prefix="demo", start_mono=middle))
+        print(
+            f"records={len(records)} enqueue={enqueue_sec / total * 1e6:.1f} us/record "
+            f"bytes={recorder.stats['bytes']} ({recorder.stats['bytes'] / len(records):.0f} B/record) "
+            f"blocks={recorder.stats['blocks']} dropped={recorder.stats['dropped']} tail={len(tail)}"
+        )
+
+    _run_demo()
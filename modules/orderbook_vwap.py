@@ -0,0 +1,404 @@
+from __future__ import annotations
+
+_version_ = "1.0"
+"""Быстрый расчёт средней цены исполнения по стакану.
+
+Модуль содержит быстрый путь для `get_average_orderbook_price`: уровни
+проходятся один раз во float до уровня, на котором заканчивается исполнение,
+а `Decimal` используется только на финальном округлении. Стоимость расчёта
+зависит от глубины исполнения, а не от глубины стакана.
+
+Основные сущности:
+- `get_average_orderbook_price_fast`: drop-in замена
+  `modules.utils.get_average_orderbook_price` с тем же контрактом;
+- `get_average_orderbook_price_ladder`: цены для нескольких объёмов сделки
+  за один проход по стакану.
+
+Вместо списка уровней функции принимают `CompactOrderbookSide`
+(`modules.compact_orderbook`): уровни уже переведены в float, поэтому
+проверки и конвертация уровня пропускаются.
+
+Notes:
+    Эталонная реализация в `modules.utils` остаётся источником истины.
+    Если float-арифметика не позволяет однозначно определить результат
+    (средняя цена попала на границу шага округления или накопленная стоимость
+    совпала с `money`), расчёт целиком делегируется эталонной функции.
+    Поэтому результат всегда совпадает с Decimal-путём, включая правило
+    округления: ask вверх, bid вниз. Сверка — `test_orderbook_vwap.py`.
+"""
+
+from decimal import Decimal, ROUND_UP, ROUND_DOWN
+import math
+from typing import Any, Optional, Sequence, Union
+
+from modules.compact_orderbook import CompactOrderbookSide
+from modules.exception_classes import InsufficientOrderBookVolumeError, InvalidOrEmptyOrderBookError
+from modules.logger import LoggerFactory
+from modules.utils import _count_decimal_places, get_average_orderbook_price
+
+logger = LoggerFactory.get_logger("app." + __name__)
+
+# Относительный допуск сравнения накопленной стоимости с `money`.
+# Внутри него результат считается неоднозначным и пересчитывается эталонной
+# Decimal-функцией.
+_FLOAT_REL_TOLERANCE = 1e-11
+
+# Кэш числа знаков после запятой для float-цен. Цены уровней повторяются от
+# тика к тику, поэтому разбор `repr` делается один раз на цену.
+_DECIMAL_PLACES_CACHE: dict[float, int] = {}
+_DECIMAL_PLACES_CACHE_LIMIT = 200_000
+
+# Оценка относительной ошибки средней цены на один задействованный уровень
+# (несколько ulp на конвертацию, произведение и накопление).
+_FLOAT_LEVEL_ERROR = 1e-15
+
+
+def _price_decimal_places(value: Any) -> int:
+    """Вернуть число знаков после запятой цены так же, как `_count_decimal_places`.
+
+    Для `float` и `str` без экспоненты разбирается строковое представление,
+    остальные случаи уходят в `Decimal`.
+    """
+    if isinstance(value, float):
+        cached = _DECIMAL_PLACES_CACHE.get(value)
+        if cached is not None:
+            return cached
+        text = repr(value)
+        if 'e' in text or 'E' in text:
+            return _count_decimal_places(value)
+        dot = text.find('.')
+        places = 0 if dot < 0 else len(text) - dot - 1
+        if len(_DECIMAL_PLACES_CACHE) >= _DECIMAL_PLACES_CACHE_LIMIT:
+            _DECIMAL_PLACES_CACHE.clear()
+        _DECIMAL_PLACES_CACHE[value] = places
+        return places
+    elif isinstance(value, str):
+        text = value.strip()
+    else:
+        return _count_decimal_places(value)
+
+    if 'e' in text or 'E' in text or not text:
+        return _count_decimal_places(value)
+    dot = text.find('.')
+    return 0 if dot < 0 else len(text) - dot - 1
+
+
+def _is_near(a: float, b: float) -> bool:
+    """Проверить, что два float совпадают в пределах допуска float-арифметики."""
+    return abs(a - b) <= _FLOAT_REL_TOLERANCE * max(abs(a), abs(b), 1.0)
+
+
+# Результат поиска уровня исполнения:
+# (fill_index, spent_before, spent_through, coins_before, fill_price)
+# - fill_index: первый уровень с частичным исполнением;
+# - spent_before / coins_before: стоимость и объём полностью взятых уровней;
+# - spent_through: накопленная стоимость с учётом уровня fill_index;
+# - fill_price: цена уровня fill_index или None, если объёма не хватило.
+_FillResult = tuple[int, float, Optional[float], float, Optional[float]]
+
+# Маркер "float не даёт однозначного ответа или расчёт дошёл до некорректного
+# уровня — нужен эталонный путь".
+_DELEGATE = object()
+
+
+def _list_fill(data: Sequence[Sequence[Any]], targets: Sequence[float]) -> Any:
+    """Найти уровни исполнения проходом по списку уровней.
+
+    Args:
+        data: Уровни стакана.
+        targets: Суммы исполнения в порядке возрастания.
+
+    Returns:
+        Список `_FillResult` в порядке `targets` или `_DELEGATE` при
+        некорректном уровне на пути исполнения.
+    """
+    results: list[_FillResult] = []
+    target_count = len(targets)
+    spent = 0.0
+    coins = 0.0
+    for i, item in enumerate(data):
+        if not isinstance(item, (list, tuple)) or len(item) < 2:
+            return _DELEGATE
+        try:
+            price = float(item[0])
+            volume = float(item[1])
+        except (TypeError, ValueError):
+            return _DELEGATE
+        if not (price > 0 and volume >= 0):
+            return _DELEGATE
+        spent_through = spent + price * volume
+        while len(results) < target_count and spent_through > targets[len(results)]:
+            results.append((i, spent, spent_through, coins, price))
+        if len(results) == target_count:
+            return results
+        spent = spent_through
+        coins += volume
+
+    results.extend((len(data), spent, None, coins, None) for _ in range(target_count - len(results)))
+    return results
+
+
+def _compact_fill(side: CompactOrderbookSide, targets: Sequence[float]) -> Any:
+    """Найти уровни исполнения по стороне `CompactOrderbookSide`.
+
+    То же, что `_list_fill`, но без проверки типов: массив стороны читается
+    парами `(price, volume)` лениво, только до уровня исполнения.
+    """
+    levels = side.levels
+    results: list[_FillResult] = []
+    target_count = len(targets)
+    spent = 0.0
+    coins = 0.0
+    values = iter(levels)
+    for i, (price, volume) in enumerate(zip(values, values)):
+        if not (price > 0 and volume >= 0):
+            return _DELEGATE
+        spent_through = spent + price * volume
+        while len(results) < target_count and spent_through > targets[len(results)]:
+            results.append((i, spent, spent_through, coins, price))
+        if len(results) == target_count:
+            return results
+        spent = spent_through
+        coins += volume
+
+    total = len(levels) >> 1
+    results.extend((total, spent, None, coins, None) for _ in range(target_count - len(results)))
+    return results
+
+
+def _level_prices(data: Any, count: int) -> Sequence[Any]:
+    """Цены первых `count` уровней списка уровней или `CompactOrderbookSide`.
+
+    У `CompactOrderbookSide` берутся исходные цены (`source_prices`), если они
+    сохранены: от них зависит число знаков округления.
+    """
+    if isinstance(data, CompactOrderbookSide):
+        if data.source_prices is not None:
+            return data.source_prices[:count]
+        return data.levels[0:count << 1:2].tolist()
+    return [data[i][0] for i in range(count)]
+
+
+def _reference_levels(data: Any) -> Any:
+    """Данные для эталонной функции: `CompactOrderbookSide` — списком уровней."""
+    return data.to_levels(original_prices=True) if isinstance(data, CompactOrderbookSide) else data
+
+
+def _find_fills(data: Sequence[Sequence[Any]], targets: Sequence[float]) -> Any:
+    """Найти уровни исполнения для возрастающих сумм `targets` за один проход."""
+    if isinstance(data, CompactOrderbookSide):
+        return _compact_fill(data, targets)
+    return _list_fill(data, targets)
+
+
+def _finalize_fill(data: Sequence[Sequence[Any]], money: Any, money_float: float, fill: _FillResult, is_ask: bool) -> Any:
+    """Превратить найденный уровень исполнения в округлённую среднюю цену.
+
+    Returns:
+        `Decimal` с ценой, `None`, если объёма стакана не хватило, или
+        `_DELEGATE`, если float не позволяет однозначно определить результат.
+    """
+    fill_index, spent_before, spent_through, coins_before, fill_price = fill
+    if (fill_index > 0 and _is_near(spent_before, money_float)) or (
+            spent_through is not None and _is_near(spent_through, money_float)):
+        return _DELEGATE
+
+    if fill_price is None:
+        return None
+
+    rounding = ROUND_UP if is_ask else ROUND_DOWN
+    if fill_index == 0:
+        # Исполнение целиком укладывается в лучший уровень — самый частый
+        # случай. Средняя цена совпадает с ценой уровня с точностью до
+        # последнего разряда контекста Decimal, поэтому float не может выбрать
+        # направление округления: повторяем операции эталона.
+        money_dec = Decimal(str(money))
+        best_price = _level_prices(data, 1)[0]
+        coins = money_dec / Decimal(str(best_price))
+        quantum = Decimal(1).scaleb(-_price_decimal_places(best_price))
+        return (money_dec / coins).quantize(quantum, rounding=rounding)
+
+    coins = coins_before + (money_float - spent_before) / fill_price
+    if coins <= 0:
+        return _DELEGATE
+
+    average_price = money_float / coins
+    max_decimal_places = max(map(_price_decimal_places, _level_prices(data, fill_index + 1)))
+
+    # Финализатор: если средняя цена лежит на границе шага округления,
+    # float не даёт однозначного направления — считаем точно в Decimal.
+    scaled = average_price * 10.0 ** max_decimal_places
+    rounding_error = (fill_index + 8) * _FLOAT_LEVEL_ERROR * abs(scaled) + _FLOAT_LEVEL_ERROR
+    if not math.isfinite(scaled) or abs(scaled - round(scaled)) <= rounding_error:
+        return _DELEGATE
+
+    quantum = Decimal(1).scaleb(-max_decimal_places)
+    return Decimal(repr(average_price)).quantize(quantum, rounding=rounding)
+
+
+def _parse_money(money: Any) -> float:
+    """Привести сумму сделки к float с теми же ошибками, что у эталона."""
+    try:
+        money_float = float(money)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Не удалось преобразовать money в Decimal: {money}, ошибка: {e}")
+    if not money_float > 0:
+        raise ValueError(f"Параметр 'money' должен быть > 0, получено: {money}")
+    return money_float
+
+
+def get_average_orderbook_price_fast(
+        data: Sequence[Sequence[Union[int, float, str, Decimal]]],
+        money: Union[float, str, Decimal],
+        is_ask: bool,
+        log: bool = False,
+        exchange: Optional[str] = None,
+        symbol: Optional[str] = None
+) -> Decimal:
+    """Рассчитать среднюю цену исполнения рыночного ордера во float.
+
+    Контракт, исключения и правило округления совпадают с
+    `modules.utils.get_average_orderbook_price`.
+
+    Args:
+        data: Уровни стакана `[(price, volume, ...), ...]`, от лучшей цены,
+            или `CompactOrderbookSide`.
+        money: Сумма в валюте котировки, которую нужно исполнить.
+        is_ask: `True` — покупка, округление вверх; `False` — продажа, вниз.
+        log: Если `True`, пишет итог расчёта в лог.
+        exchange: Биржа (для логов и ошибок).
+        symbol: Торговая пара (для логов и ошибок).
+
+    Returns:
+        Средняя цена исполнения как `Decimal`, округлённая до максимальной
+        точности цен на задействованных уровнях.
+
+    Raises:
+        InvalidOrEmptyOrderBookError: Если стакан пустой или не список.
+        ValueError: Если данные некорректны или `money <= 0`.
+        InsufficientOrderBookVolumeError: Если объёма стакана не хватает.
+
+    Notes:
+        Стоимость вызова зависит от глубины исполнения, а не от глубины
+        стакана: уровни глубже уровня исполнения не читаются.
+    """
+    if not isinstance(data, (list, CompactOrderbookSide)) or not data:
+        return get_average_orderbook_price(
+            _reference_levels(data), money, is_ask, log=log, exchange=exchange, symbol=symbol
+        )
+
+    money_float = _parse_money(money)
+    fills = _find_fills(data, [money_float])
+    final_price = _DELEGATE if fills is _DELEGATE else _finalize_fill(data, money, money_float, fills[0], is_ask)
+    if final_price is _DELEGATE:
+        return get_average_orderbook_price(
+            _reference_levels(data), money, is_ask, log=log, exchange=exchange, symbol=symbol
+        )
+
+    if final_price is None:
+        remains = money_float - fills[0][1]
+        msg = (
+            f"Недостаточно ликвидности в стакане: биржа={exchange}, пара={symbol}, "
+            f"запрошено={Decimal(str(money))}, не хватает={remains:.10f} USDT"
+        )
+        logger.warning(msg)
+        raise InsufficientOrderBookVolumeError(
+            exchange_id=exchange, symbol=symbol, orderbook_remains=Decimal(repr(remains)), money_usdt=money
+        )
+
+    if log:
+        logger.info(
+                f"[get_average_orderbook_price_fast] "
+                f"exchange={exchange}, symbol={symbol}, direction={'BUY' if is_ask else 'SELL'}, "
+                f"spend={money_float:.8f}, levels={fills[0][0] + 1}, final_price={final_price:.8f}"
+        )
+
+    return final_price
+
+
+def get_average_orderbook_price_ladder(
+        data: Sequence[Sequence[Union[int, float, str, Decimal]]],
+        money_values: Sequence[Union[float, str, Decimal]],
+        is_ask: bool,
+        log: bool = False,
+        exchange: Optional[str] = None,
+        symbol: Optional[str] = None,
+        with_depth: bool = False
+) -> Union[list[Optional[Decimal]], tuple[list[Optional[Decimal]], int]]:
+    """Рассчитать средние цены исполнения сразу для нескольких объёмов сделки.
+
+    Все объёмы ищутся за один проход по стакану, поэтому лестница
+    из нескольких номиналов стоит почти столько же, сколько один расчёт
+    на наибольший из них.
+
+    Args:
+        data: Уровни стакана `[(price, volume, ...), ...]`, от лучшей цены,
+            или `CompactOrderbookSide`.
+        money_values: Объёмы сделки в валюте котировки, в любом порядке.
+        is_ask: `True` — покупка, округление вверх; `False` — продажа, вниз.
+        log: Если `True`, пишет итог расчёта в лог.
+        exchange: Биржа (для логов и ошибок).
+        symbol: Торговая пара (для логов и ошибок).
+        with_depth: Вернуть вместе с ценами глубину исполнения.
+
+    Returns:
+        Список цен в порядке `money_values`. Для объёма, на который в стакане
+        не хватает ликвидности, вместо цены стоит `None`: нехватка на большом
+        номинале не мешает пользоваться меньшими.
+        При `with_depth=True` — кортеж `(цены, depth)`, где `depth` — сколько
+        первых уровней стакана влияет на результат. Изменения уровней глубже
+        `depth` не меняют ни одной цены лестницы. `depth` больше длины
+        стакана, если хотя бы на одной ступени не хватило ликвидности: тогда
+        на результат влияет и появление новых уровней.
+
+    Raises:
+        InvalidOrEmptyOrderBookError: Если стакан пустой или не список.
+        ValueError: Если данные некорректны или один из объёмов `<= 0`.
+
+    Notes:
+        Каждая цена совпадает с `get_average_orderbook_price` на том же
+        объёме, включая правило округления.
+    """
+    if not money_values:
+        return ([], 0) if with_depth else []
+    if not isinstance(data, (list, CompactOrderbookSide)) or not data:
+        get_average_orderbook_price(_reference_levels(data), money_values[0], is_ask, exchange=exchange, symbol=symbol)
+
+    money_floats = [_parse_money(money) for money in money_values]
+    order = sorted(range(len(money_floats)), key=money_floats.__getitem__)
+    fills = _find_fills(data, [money_floats[i] for i in order])
+
+    results: list[Optional[Decimal]] = [None] * len(money_floats)
+    reference_data = None
+    for position, index in enumerate(order):
+        if fills is _DELEGATE:
+            final_price = _DELEGATE
+        else:
+            final_price = _finalize_fill(data, money_values[index], money_floats[index], fills[position], is_ask)
+        if final_price is _DELEGATE:
+            if reference_data is None:
+                reference_data = _reference_levels(data)
+            try:
+                final_price = get_average_orderbook_price(
+                    reference_data, money_values[index], is_ask, exchange=exchange, symbol=symbol
+                )
+            except InsufficientOrderBookVolumeError:
+                final_price = None
+        results[index] = final_price
+
+    if fills is _DELEGATE or any(fill[4] is None for fill in fills):
+        depth = len(data) + 1
+    else:
+        depth = max(fill[0] for fill in fills) + 1
+
+    if log:
+        logger.info(
+                f"[get_average_orderbook_price_ladder] "
+                f"exchange={exchange}, symbol={symbol}, direction={'BUY' if is_ask else 'SELL'}, "
+                f"ladder={[(str(money), str(price)) for money, price in zip(money_values, results)]}, "
+                f"depth={depth}"
+        )
+
+    if with_depth:
+        return results, depth
+    return results
@@ -0,0 +1,927 @@
+_version_ = "1.0"
+"""Детерминированный повтор потока стаканов через поддельный ccxt.pro.
+
+Модуль позволяет запускать `run_arbitrage_worker` без живых бирж: вместо
+`ccxt.pro` в `ExchangeInstance` подставляется `ReplayCcxtModule`, чьи классы
+бирж (`ReplayExchange`) отдают `watchOrderBook`/`watchOrderBookForSymbols`,
+`watch_balance`, `fetch_balance`, `load_markets`, `fetch_time` из
+записанного (`modules.orderbook_recorder`) или синтетического потока.
+
+Основные сущности:
+- `ReplaySource`: источник событий `{exchange_id: поток (offset, symbol, ...)}`
+  с реестром реализаций `ReplaySource.source_class_dict`
+  (`recorded`, `synthetic`); конфигурация источника — сериализуемый словарь,
+  поэтому каждый процесс воркера строит свой экземпляр сам;
+- `ReplayClock`: общее для процессов начало повтора и скорость (`1`, `10`,
+  `None` — максимальная);
+- `ReplayExchange`: поддельная биржа. Задача-насос раскладывает события по
+  стаканам символов по расписанию часов и будит ожидающих `watchOrderBook`;
+- `run_replay_worker_process`: точка входа процесса воркера — подменяет
+  `EXCHANGE_CCXT_MODULE` и вызывает неизменённый `run_arbitrage_worker`;
+- `run_replay_benchmark`: запуск N воркеров, сбор отчёта: тиков/с и CPU на
+  воркер, задержка сигнала (от момента тика по расписанию до прихода
+  `upsert_row` в агрегатор); с `rebalance_interval_sec` — перенос символов
+  между воркерами по нагрузке (`SymbolRebalancer`), как в главном процессе.
+
+Формат события потока биржи: `(offset_sec, symbol, asks, bids, ts_lag_ms, kind)`,
+где `asks`/`bids` — списки `[price, amount]`, `ts_lag_ms` — сдвиг биржевого
+`timestamp` относительно локального времени получения (или `None`), `kind` —
+`"book"` либо `"disconnect"` (все ожидающие вызовы получают `NetworkError`).
+
+Notes:
+    Если символ не успел забрать предыдущий стакан, новый его замещает
+    (как и в ccxt.pro, где `watchOrderBook` отдаёт текущее состояние);
+    такие события считаются в `stats["coalesced"]`.
+    `limit` подписки обрезает выдаваемый стакан, а трафик сообщения
+    (оценка `REPLAY_LEVEL_BYTES` на уровень) учитывается в
+    `ExchangeTrafficMeter` по глубине подписки символа.
+    Задержка сигнала считается только при конечной скорости: при `max`
+    расписания нет, отчёт содержит лишь пропускную способность.
+"""
+
+import argparse
+import asyncio
+import bisect
+import heapq
+import multiprocessing
+import os
+import queue
+import random
+import sys
+import time
+from decimal import Decimal
+from typing import Any, Callable, Iterator, Optional
+
+import ccxt.pro as ccxt
+
+from modules.orderbook_depth import ExchangeTrafficMeter
+from modules.orderbook_recorder import list_segments, read_records
+from modules.spread_engine import SPREAD_ENGINE_MODES
+from modules.symbol_rebalancer import SymbolRebalancer
+
+
+DEFAULT_BALANCE = 10_000.0
+# Пауза насоса при максимальной скорости: отдавать управление циклу каждые N событий.
+MAX_SPEED_YIELD_EVERY = 1
+# Ожидания короче этого порога при конечной скорости не делаются: события
+# выдаются пачкой, чтобы не платить за `asyncio.sleep` на каждое событие.
+MIN_SLEEP_SEC = 0.001
+
+# Оценка размера сообщения стакана в JSON для `ExchangeTrafficMeter`.
+REPLAY_LEVEL_BYTES = 24
+REPLAY_MESSAGE_BYTES = 120
+
+BOOK_EVENT = "book"
+DISCONNECT_EVENT = "disconnect"
+
+
+def _percentile(sorted_values: list[float], q: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+class ReplaySource:
+    """Источник событий повтора.
+
+    Реализации регистрируются в `source_class_dict` по имени `kind`
+    и создаются из сериализуемой конфигурации через `from_config`.
+    """
+
+    source_class_dict: dict[str, type["ReplaySource"]] = {}
+    kind = ""
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.kind:
+            ReplaySource.source_class_dict[cls.kind] = cls
+
+    @classmethod
+    def from_config(cls, config: dict[str, Any]) -> "ReplaySource":
+        source_class = cls.source_class_dict.get(config.get("kind"))
+        if source_class is None:
+            raise ValueError(f"unknown replay source kind: {config.get('kind')!r}")
+        params = {key: value for key, value in config.items() if key != "kind"}
+        return source_class(**params)
+
+    @property
+    def exchange_symbols(self) -> dict[str, list[str]]:
+        """Символы каждой биржи `{exchange_id: [symbol, ...]}`."""
+        raise NotImplementedError
+
+    @property
+    def duration_sec(self) -> float:
+        """Длительность потока по расписанию (секунды при скорости 1x)."""
+        raise NotImplementedError
+
+    def listed_symbols(self, exchange_id: str, offset_sec: Optional[float]) -> list[str]:
+        """Символы в рынках биржи на момент `offset_sec` (`load_markets`).
+
+        Args:
+            offset_sec: Смещение потока; `None` — до начала повтора.
+        """
+        return self.exchange_symbols.get(exchange_id, [])
+
+    def iter_exchange(self, exchange_id: str, symbol_filter=None) -> Iterator[tuple]:
+        """События биржи по возрастанию `offset_sec`.
+
+        Args:
+            exchange_id: Биржа.
+            symbol_filter: Контейнер символов (проверяется через `in` на каждом
+                событии, поэтому может пополняться во время итерации); `None` —
+                все символы.
+        """
+        raise NotImplementedError
+
+    def iter_schedule(self) -> Iterator[tuple[float, str]]:
+        """Пары `(offset_sec, symbol)` всех стаканов всех бирж (для расчёта задержки)."""
+        for exchange_id in self.exchange_symbols:
+            for offset, symbol, _asks, _bids, _lag, kind in self.iter_exchange(exchange_id):
+                if kind == BOOK_EVENT:
+                    yield offset, symbol
+
+
+class RecordedReplaySource(ReplaySource):
+    """Повтор каталога записи `OrderbookRecorder`.
+
+    Сегменты разных префиксов (воркеры, процессы бирж) сливаются по
+    `mono_ts`; смещения считаются от самой ранней записи каталога.
+    """
+
+    kind = "recorded"
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.prefixes = sorted({
+            os.path.basename(base).rsplit("-", 3)[0] for base in list_segments(directory)
+        })
+        exchange_symbols: dict[str, set[str]] = {}
+        first_mono = None
+        last_mono = None
+        for record in self._iter_records():
+            exchange_symbols.setdefault(record["exchange_id"], set()).add(record["symbol"])
+            if first_mono is None:
+                first_mono = record["mono_ts"]
+            last_mono = record["mono_ts"]
+        self._exchange_symbols = {ex: sorted(symbols) for ex, symbols in exchange_symbols.items()}
+        self.first_mono = first_mono or 0.0
+        self._duration_sec = (last_mono or 0.0) - self.first_mono
+
+    def _iter_records(self) -> Iterator[dict[str, Any]]:
+        streams = [read_records(self.directory, prefix=prefix) for prefix in self.prefixes]
+        return heapq.merge(*streams, key=lambda record: record["mono_ts"])
+
+    @property
+    def exchange_symbols(self) -> dict[str, list[str]]:
+        return self._exchange_symbols
+
+    @property
+    def duration_sec(self) -> float:
+        return self._duration_sec
+
+    def iter_exchange(self, exchange_id: str, symbol_filter=None) -> Iterator[tuple]:
+        for record in self._iter_records():
+            if record["exchange_id"] != exchange_id:
+                continue
+            if symbol_filter is not None and record["symbol"] not in symbol_filter:
+                continue
+            timestamp = record["timestamp"]
+            lag_ms = None if timestamp is None else timestamp - record["wall_ts"] * 1000
+            yield (
+                record["mono_ts"] - self.first_mono,
+                record["symbol"],
+                record["asks"].tolist(),
+                record["bids"].tolist(),
+                lag_ms,
+                BOOK_EVENT,
+            )
+
+
+class SyntheticReplaySource(ReplaySource):
+    """Простой синтетический поток: случайное блуждание середины, равномерный темп.
+
+    Все биржи получают один и тот же набор символов; цена символа на каждой
+    бирже — общая середина плюс небольшой собственный шум, поэтому между
+    биржами возникают спреды. Поток детерминирован при одинаковом `seed`.
+    `listing_events` меняет рынки бирж во время повтора (листинги и
+    делистинги для `_market_watch_loop` воркера).
+    """
+
+    kind = "synthetic"
+
+    def __init__(
+            self,
+            symbols: int | list[str] = 20,
+            exchange_ids: tuple[str, ...] | list[str] = ("okx", "htx", "gateio"),
+            duration_sec: float = 30.0,
+            rate_hz: float = 10.0,
+            depth: int = 20,
+            noise: float = 0.001,
+            seed: int = 1,
+            listing_events: list | tuple = (),
+    ):
+        """
+        Args:
+            noise: Относительное СКО собственного шума цены биржи; при
+                значениях порядка `0.001` часть спредов превышает порог
+                `open_ratio` и в таблицу попадают строки.
+            listing_events: `[(offset_sec, symbol, listed), ...]` на всех
+                биржах; символ, чьё первое событие — листинг, до него не
+                торгуется.
+        """
+        if isinstance(symbols, int):
+            symbols = [f"S{index:04d}/USDT:USDT" for index in range(symbols)]
+        self.symbols = list(symbols)
+        self.exchange_ids = list(exchange_ids)
+        self._duration_sec = float(duration_sec)
+        self.rate_hz = float(rate_hz)
+        self.depth = int(depth)
+        self.noise = float(noise)
+        self.seed = int(seed)
+        self.listing_events = sorted((float(offset), symbol, bool(listed)) for offset, symbol, listed in listing_events)
+
+    @property
+    def exchange_symbols(self) -> dict[str, list[str]]:
+        return {exchange_id: list(self.symbols) for exchange_id in self.exchange_ids}
+
+    @property
+    def duration_sec(self) -> float:
+        return self._duration_sec
+
+    def listed_symbols(self, exchange_id: str, offset_sec: Optional[float]) -> list[str]:
+        listed_dict = {symbol: True for symbol in self.symbols}
+        for _, symbol, listed in reversed(self.listing_events):
+            listed_dict[symbol] = not listed
+        for offset, symbol, listed in self.listing_events:
+            if offset_sec is None or offset > offset_sec:
+                break
+            listed_dict[symbol] = listed
+        return [symbol for symbol in self.symbols if listed_dict[symbol]]
+
+    def iter_exchange(self, exchange_id: str, symbol_filter=None) -> Iterator[tuple]:
+        exchange_index = self.exchange_ids.index(exchange_id)
+        # Общая для всех бирж траектория середины и собственный шум биржи.
+        mid_rng = random.Random(self.seed)
+        noise_rng = random.Random(self.seed * 1_000_003 + exchange_index + 1)
+        step = 1.0 / self.rate_hz
+        mids = [100.0 + index for index in range(len(self.symbols))]
+        tick_count = int(self._duration_sec * self.rate_hz)
+        symbol_count = len(self.symbols)
+        for tick in range(tick_count):
+            for symbol_index, symbol in enumerate(self.symbols):
+                offset = tick * step + step * symbol_index / symbol_count
+                mids[symbol_index] *= 1.0 + mid_rng.gauss(0.0, 0.0002)
+                mid = mids[symbol_index] * (1.0 + noise_rng.gauss(0.0, self.noise))
+                if symbol_filter is not None and symbol not in symbol_filter:
+                    continue
+                half_spread = mid * 0.0001 * (1 + exchange_index)
+                tick_size = mid * 0.00005
+                asks = [[mid + half_spread + level * tick_size, 1.0 + level] for level in range(self.depth)]
+                bids = [[mid - half_spread - level * tick_size, 1.0 + level] for level in range(self.depth)]
+                yield offset, symbol, asks, bids, -5.0, BOOK_EVENT
+
+
+class ReplayClock:
+    """Общие часы повтора.
+
+    Начало повтора (`time.monotonic()`) хранится в `shared_values["replay_start"]`
+    и выставляется запускающим процессом, когда все воркеры готовы; на Linux
+    `CLOCK_MONOTONIC` общий для процессов хоста.
+    """
+
+    def __init__(self, speed: Optional[float], shared_values: dict[str, Any]):
+        self.speed = speed
+        self.shared_values = shared_values
+
+    async def wait_started(self, poll_interval_sec: float = 0.05) -> float:
+        start_value = self.shared_values.get("replay_start")
+        while start_value is not None and start_value.value <= 0:
+            await asyncio.sleep(poll_interval_sec)
+        return start_value.value if start_value is not None else time.monotonic()
+
+    def offset_now(self) -> Optional[float]:
+        """Текущее смещение потока; `None` — повтор не начался или скорость максимальная."""
+        start_value = self.shared_values.get("replay_start")
+        if self.speed is None or start_value is None or start_value.value <= 0:
+            return None
+        return (time.monotonic() - start_value.value) * self.speed
+
+    def due_time(self, start: float, offset_sec: float) -> Optional[float]:
+        if self.speed is None:
+            return None
+        return start + offset_sec / self.speed
+
+
+class ReplayExchange:
+    """Поддельная биржа ccxt.pro, отдающая стаканы из `ReplaySource`.
+
+    Подклассы с конкретным `id` создаёт `ReplayCcxtModule`.
+    """
+
+    id = "replay"
+    replay_module: "ReplayCcxtModule" = None
+
+    def __init__(self, params: Optional[dict[str, Any]] = None):
+        self.params = params or {}
+        self.options: dict[str, Any] = {}
+        self.has = {
+            "watchOrderBook": True,
+            "watchOrderBookForSymbols": self.replay_module.multi_symbol,
+            "fetchTime": True,
+        }
+        self.markets: dict[str, Any] = {}
+        self.orderbooks: dict[str, dict[str, Any]] = {}
+        self.stats = {"emitted": 0, "delivered": 0, "coalesced": 0, "disconnects": 0}
+        self._versions: dict[str, int] = {}
+        self._consumed_versions: dict[str, int] = {}
+        # Глубина подписки символа (`limit` последнего `watchOrderBook`).
+        self._limit_dict: dict[str, Optional[int]] = {}
+        self._waiter_dict: dict[str, list[asyncio.Future]] = {}
+        self._pump_task: Optional[asyncio.Task] = None
+        self._balance_event = asyncio.Event()
+        self.replay_module.exchange_list.append(self)
+
+    # --- служебные методы ccxt ---
+    @staticmethod
+    def milliseconds() -> int:
+        return int(time.time() * 1000)
+
+    async def fetch_time(self, params=None) -> int:
+        return self.milliseconds()
+
+    async def load_markets(self, reload: bool = False, params=None) -> dict[str, Any]:
+        if not self.markets or reload:
+            markets = {}
+            offset = self.replay_module.clock.offset_now()
+            for symbol in self.replay_module.source.listed_symbols(self.id, offset):
+                base = symbol.split("/")[0]
+                markets[symbol] = self._make_market(symbol, base, swap=True)
+                markets[f"{base}/USDT"] = self._make_market(f"{base}/USDT", base, swap=False)
+            self.markets = markets
+        return self.markets
+
+    @staticmethod
+    def _make_market(symbol: str, base: str, swap: bool) -> dict[str, Any]:
+        return {
+            "id": symbol.replace("/", "").replace(":", "_"),
+            "symbol": symbol,
+            "base": base,
+            "quote": "USDT",
+            "settle": "USDT" if swap else None,
+            "type": "swap" if swap else "spot",
+            "spot": not swap,
+            "swap": swap,
+            "linear": True if swap else None,
+            "inverse": False if swap else None,
+            "contractSize": 1.0 if swap else None,
+            "active": True,
+            "taker": 0.0005,
+            "maker": 0.0002,
+            "precision": {"amount": 0.001, "price": 0.0001},
+            "limits": {"amount": {"min": 0.001}, "cost": {"min": 1.0}},
+            "info": {},
+        }
+
+    async def fetch_balance(self, params=None) -> dict[str, Any]:
+        balance = self.replay_module.balance_dict.get(self.id, DEFAULT_BALANCE)
+        return {"free": {"USDT": balance}, "total": {"USDT": balance}}
+
+    async def watch_balance(self, params=None) -> dict[str, Any]:
+        # Баланс повтора не меняется: вызов ждёт до отмены задачи.
+        await self._balance_event.wait()
+        return await self.fetch_balance(params)
+
+    async def close(self) -> None:
+        if self._pump_task is not None:
+            self._pump_task.cancel()
+
+    # --- стаканы ---
+    def _ensure_pump(self) -> None:
+        if self._pump_task is None:
+            self._pump_task = asyncio.get_running_loop().create_task(self._pump())
+
+    async def _pump(self) -> None:
+        clock = self.replay_module.clock
+        start = await clock.wait_started()
+        self.replay_module.mark_started()
+        emitted_since_yield = 0
+        # Поток генерируется только для подписанных символов (`_consumed_versions`
+        # пополняется первым `watchOrderBook` символа), как у настоящей биржи.
+        events = self.replay_module.source.iter_exchange(self.id, self._consumed_versions)
+        for offset, symbol, asks, bids, lag_ms, kind in events:
+            due = clock.due_time(start, offset)
+            if due is None:
+                emitted_since_yield += 1
+                if emitted_since_yield >= MAX_SPEED_YIELD_EVERY:
+                    emitted_since_yield = 0
+                    await asyncio.sleep(0)
+            else:
+                delay = due - time.monotonic()
+                if delay >= MIN_SLEEP_SEC:
+                    await asyncio.sleep(delay)
+            if kind == DISCONNECT_EVENT:
+                self._disconnect()
+                continue
+            self._apply_book(symbol, asks, bids, lag_ms)
+        self.replay_module.mark_finished(self.id)
+
+    def _apply_book(self, symbol: str, asks: list, bids: list, lag_ms: Optional[float]) -> None:
+        now_ms = self.milliseconds()
+        orderbook = self.orderbooks.get(symbol)
+        if orderbook is None:
+            orderbook = {"symbol": symbol, "nonce": None}
+            self.orderbooks[symbol] = orderbook
+        orderbook["asks"] = asks
+        orderbook["bids"] = bids
+        orderbook["timestamp"] = None if lag_ms is None else int(now_ms + lag_ms)
+        orderbook["datetime"] = None
+        version = self._versions.get(symbol, 0) + 1
+        self._versions[symbol] = version
+        self.stats["emitted"] += 1
+        if symbol in self._consumed_versions:
+            limit = self._limit_dict.get(symbol)
+            levels = len(asks) + len(bids) if limit is None else min(len(asks), limit) + min(len(bids), limit)
+            ExchangeTrafficMeter.record(self.id, REPLAY_MESSAGE_BYTES + REPLAY_LEVEL_BYTES * levels)
+        waiters = self._waiter_dict.pop(symbol, None)
+        if waiters:
+            for future in waiters:
+                if not future.done():
+                    future.set_result(symbol)
+        elif symbol in self._consumed_versions and self._consumed_versions[symbol] < version - 1:
+            self.stats["coalesced"] += 1
+
+    def _disconnect(self) -> None:
+        self.stats["disconnects"] += 1
+        waiter_dict, self._waiter_dict = self._waiter_dict, {}
+        for waiters in waiter_dict.values():
+            for future in waiters:
+                if not future.done():
+                    # Текст как у ccxt.pro при обрыве сокета: по нему подписки
+                    # распознают временную ошибку (`is_transient_stream_error`).
+                    future.set_exception(ccxt.NetworkError(
+                        f"{self.id} replay disconnect: Connection closed by remote server, closing code 1006"
+                    ))
+
+    def _take(self, symbol: str) -> dict[str, Any]:
+        self._consumed_versions[symbol] = self._versions[symbol]
+        self.stats["delivered"] += 1
+        orderbook = self.orderbooks[symbol]
+        limit = self._limit_dict.get(symbol)
+        if limit is not None:
+            orderbook = {**orderbook, "asks": orderbook["asks"][:limit], "bids": orderbook["bids"][:limit]}
+        return orderbook
+
+    def _has_unconsumed(self, symbol: str) -> bool:
+        version = self._versions.get(symbol)
+        return version is not None and version != self._consumed_versions.get(symbol)
+
+    async def _wait_symbols(self, symbols: list[str]) -> str:
+        future = asyncio.get_running_loop().create_future()
+        for symbol in symbols:
+            self._waiter_dict.setdefault(symbol, []).append(future)
+        return await future
+
+    async def watchOrderBook(self, symbol: str, limit=None, params=None) -> dict[str, Any]:
+        self._ensure_pump()
+        self._consumed_versions.setdefault(symbol, 0)
+        self._limit_dict[symbol] = limit
+        if not self._has_unconsumed(symbol):
+            await self._wait_symbols([symbol])
+        return self._take(symbol)
+
+    async def watchOrderBookForSymbols(self, symbols: list[str], limit=None, params=None) -> dict[str, Any]:
+        self._ensure_pump()
+        for symbol in symbols:
+            self._consumed_versions.setdefault(symbol, 0)
+            self._limit_dict[symbol] = limit
+            if self._has_unconsumed(symbol):
+                return self._take(symbol)
+        symbol = await self._wait_symbols(list(symbols))
+        return self._take(symbol)
+
+    watch_order_book = watchOrderBook
+    watch_order_book_for_symbols = watchOrderBookForSymbols
+
+
+class ReplayCcxtModule:
+    """Замена модуля `ccxt.pro` для `ExchangeInstance`.
+
+    `getattr(module, exchange_id)` возвращает класс `ReplayExchange` для этой
+    биржи. Флаг `OFFLINE` сообщает `ExchangeInstance`, что реальные ключи
+    API не нужны.
+    """
+
+    OFFLINE = True
+
+    def __init__(
+            self,
+            source: ReplaySource,
+            clock: ReplayClock,
+            balance_dict: Optional[dict[str, float]] = None,
+            multi_symbol: bool = False,
+    ):
+        self.source = source
+        self.clock = clock
+        self.balance_dict = balance_dict or {}
+        self.multi_symbol = multi_symbol
+        self.exchange_list: list[ReplayExchange] = []
+        self.finished_exchange_ids: set[str] = set()
+        self.cpu_started: Optional[float] = None
+        self.wall_started: Optional[float] = None
+        self._class_dict: dict[str, type] = {}
+
+    def __getattr__(self, exchange_id: str) -> type:
+        if exchange_id.startswith("_"):
+            raise AttributeError(exchange_id)
+        if exchange_id not in self._class_dict:
+            self._class_dict[exchange_id] = type(
+                f"Replay_{exchange_id}",
+                (ReplayExchange,),
+                {"id": exchange_id, "replay_module": self},
+            )
+        return self._class_dict[exchange_id]
+
+    def mark_started(self) -> None:
+        if self.cpu_started is None:
+            self.cpu_started = time.process_time()
+            self.wall_started = time.monotonic()
+
+    def mark_finished(self, exchange_id: str) -> None:
+        self.finished_exchange_ids.add(exchange_id)
+
+    def report(self) -> dict[str, Any]:
+        totals = {"emitted": 0, "delivered": 0, "coalesced": 0, "disconnects": 0}
+        symbols: set[str] = set()
+        for exchange in self.exchange_list:
+            for key in totals:
+                totals[key] += exchange.stats[key]
+            symbols.update(exchange._consumed_versions)
+        totals["symbols"] = len(symbols)
+        cpu_sec = time.process_time() - self.cpu_started if self.cpu_started is not None else 0.0
+        wall_sec = time.monotonic() - self.wall_started if self.wall_started is not None else 0.0
+        return {**totals, "cpu_sec": cpu_sec, "wall_sec": wall_sec}
+
+
+def run_replay_worker_process(*, replay_config: dict[str, Any], **worker_kwargs) -> None:
+    """Процесс воркера повтора: `run_arbitrage_worker` поверх `ReplayCcxtModule`.
+
+    Args:
+        replay_config: `{"source": {...}, "speed": float | None,
+            "balances": {...}, "multi_symbol": bool, "quiet": bool,
+            "markets_interval": float | None}`; `quiet` отключает вывод
+            воркера в консоль, `markets_interval` — период обновления рынков
+            (`MARKETS_UPDATE_INTERVAL_SEC`).
+        **worker_kwargs: Аргументы `run_arbitrage_worker` без изменений.
+    """
+    from modules import arbitrage_manager
+
+    if replay_config.get("quiet"):
+        sys.stdout = open(os.devnull, "w")
+    shared_values = worker_kwargs["shared_values"]
+    module = ReplayCcxtModule(
+        source=ReplaySource.from_config(replay_config["source"]),
+        clock=ReplayClock(replay_config.get("speed"), shared_values),
+        balance_dict=replay_config.get("balances"),
+        multi_symbol=replay_config.get("multi_symbol", False),
+    )
+    arbitrage_manager.EXCHANGE_CCXT_MODULE = module
+    if replay_config.get("markets_interval") is not None:
+        arbitrage_manager.MARKETS_UPDATE_INTERVAL_SEC = replay_config["markets_interval"]
+    try:
+        asyncio.run(arbitrage_manager.run_arbitrage_worker(**worker_kwargs))
+    finally:
+        report = module.report()
+        report.update({"event": "replay_worker_report", "worker_id": worker_kwargs["process_index"]})
+        try:
+            worker_kwargs["control_queue"].put(report)
+        except Exception:
+            pass
+
+
+def run_replay_benchmark(
+        *,
+        source_config: dict[str, Any],
+        process_count: int = 1,
+        speed: Optional[float] = 1.0,
+        duration_sec: Optional[float] = None,
+        max_deal_slots: Decimal = Decimal("2"),
+        multi_symbol: bool = False,
+        ready_timeout_sec: float = 120.0,
+        grid_sink: Optional[Callable[[dict[str, Any]], None]] = None,
+        log: bool = True,
+        spread_engine_mode: str = "per_symbol",
+        grid_top_k: Optional[int] = None,
+        rebalance_interval_sec: Optional[float] = None,
+        markets_interval_sec: Optional[float] = None,
+) -> dict[str, Any]:
+    """Запустить воркеры на повторе и собрать отчёт.
+
+    Args:
+        source_config: Конфигурация `ReplaySource` (`{"kind": ..., ...}`).
+        process_count: Число процессов-воркеров.
+        speed: Множитель скорости (`1`, `10`, ...) или `None` — максимальная.
+        duration_sec: Сколько длится повтор; по умолчанию — длительность
+            источника с учётом скорости (для `None` обязателен).
+        max_deal_slots: Число слотов сделки.
+        multi_symbol: Отдавать `watchOrderBookForSymbols` (путь мультиплексора).
+        ready_timeout_sec: Сколько ждать `worker_ready` от всех воркеров.
+        grid_sink: Получатель всех событий таблицы воркеров после замера
+            задержки (например, агрегатор таблицы и веб-сервер под нагрузкой).
+        log: Оставлять вывод воркеров в консоли.
+        spread_engine_mode: Режим расчёта спреда воркера
+            (`run_arbitrage_worker`): `"per_symbol"` или `"vectorized"`.
+        grid_top_k: Лучших строк воркера для агрегатора
+            (`run_arbitrage_worker`); `None` — все строки.
+        rebalance_interval_sec: Период раундов `SymbolRebalancer`; `None` —
+            символы остаются на воркерах `split_symbols_between_processes`.
+        markets_interval_sec: Период обновления рынков в воркерах; `None` —
+            `MARKETS_UPDATE_INTERVAL_SEC`.
+
+    Returns:
+        Отчёт: по воркерам (`ticks_per_sec`, `cpu_sec`, `cpu_util`, ...),
+        задержка сигнала `latency_ms` (`p50`/`p90`/`p99`/`max`) и
+        `rebalance` — `SymbolRebalancer.summary()` или `None`.
+    """
+    source = ReplaySource.from_config(source_config)
+    if duration_sec is None:
+        if speed is None:
+            raise ValueError("duration_sec is required for max speed")
+        duration_sec = source.duration_sec / speed
+
+    shared_values = {
+        "shutdown": multiprocessing.Value('b', False),
+        "replay_start": multiprocessing.Value('d', 0.0),
+    }
+    worker_grid_queue: multiprocessing.Queue = multiprocessing.Queue()
+    control_queue: multiprocessing.Queue = multiprocessing.Queue()
+    replay_config = {
+        "source": source_config,
+        "speed": speed,
+        "multi_symbol": multi_symbol,
+        "quiet": not log,
+        "markets_interval": markets_interval_sec,
+    }
+    exchange_id_list = sorted(source.exchange_symbols)
+    rebalancer = (
+        SymbolRebalancer(range(process_count), interval_sec=rebalance_interval_sec)
+        if rebalance_interval_sec is not None and process_count > 1 else None
+    )
+    command_queues: list[multiprocessing.Queue] = (
+        [multiprocessing.Queue() for _ in range(process_count)] if rebalancer is not None else []
+    )
+
+    processes = []
+    for process_index in range(process_count):
+        process = multiprocessing.Process(
+            target=run_replay_worker_process,
+            kwargs={
+                "replay_config": replay_config,
+                "process_index": process_index,
+                "process_count": process_count,
+                "exchange_id_list": exchange_id_list,
+                "max_deal_slots": max_deal_slots,
+                "web_grid_queue": worker_grid_queue,
+                "control_queue": control_queue,
+                "shared_values": shared_values,
+                "spread_engine_mode": spread_engine_mode,
+                "grid_top_k": grid_top_k,
+                "command_queue": command_queues[process_index] if command_queues else None,
+            },
+            daemon=False,
+            name=f"replay-worker-{process_index}",
+        )
+        process.start()
+        processes.append(process)
+
+    # Расписание тиков для расчёта задержки сигнала: {symbol: [offset, ...]}.
+    schedule_dict: dict[str, list[float]] = {}
+    if speed is not None:
+        for offset, symbol in source.iter_schedule():
+            schedule_dict.setdefault(symbol, []).append(offset)
+        for offsets in schedule_dict.values():
+            offsets.sort()
+
+    control_events: list[dict[str, Any]] = []
+    ready_workers: set[int] = set()
+    deadline = time.monotonic() + ready_timeout_sec
+    while len(ready_workers) < process_count and time.monotonic() < deadline:
+        try:
+            event = control_queue.get(timeout=0.5)
+        except queue.Empty:
+            if not any(process.is_alive() for process in processes):
+                break
+            continue
+        control_events.append(event)
+        if event.get("event") in ("worker_ready", "worker_inactive"):
+            ready_workers.add(event.get("worker_id"))
+
+    start = time.monotonic()
+    shared_values["replay_start"].value = start
+    end = start + duration_sec
+
+    latencies: list[float] = []
+    upserts = 0
+    while time.monotonic() < end:
+        if rebalancer is not None:
+            _rebalance_replay_workers(rebalancer, control_queue, command_queues, control_events)
+        try:
+            item = worker_grid_queue.get(timeout=max(0.0, min(0.2, end - time.monotonic())))
+        except queue.Empty:
+            continue
+        if grid_sink is not None:
+            grid_sink(item)
+        # Строки, поднятые в лучшие K чужим изменением, — не сигнал.
+        if item.get("grid_event") != "upsert_row" or item.get("promoted"):
+            continue
+        upserts += 1
+        offsets = schedule_dict.get(item.get("symbol"))
+        if not offsets:
+            continue
+        received = time.monotonic()
+        position = bisect.bisect_right(offsets, (received - start) * speed) - 1
+        if position >= 0:
+            latencies.append(received - (start + offsets[position] / speed))
+
+    shared_values["shutdown"].value = True
+    reports: dict[int, dict[str, Any]] = {
+        event["worker_id"]: event for event in control_events if event.get("event") == "replay_worker_report"
+    }
+    deadline = time.monotonic() + 30.0
+    while len(reports) < len(processes) and time.monotonic() < deadline:
+        try:
+            event = control_queue.get(timeout=0.5)
+        except queue.Empty:
+            if not any(process.is_alive() for process in processes):
+                break
+            continue
+        if event.get("event") == "replay_worker_report":
+            reports[event["worker_id"]] = event
+    for process in processes:
+        process.join(timeout=10)
+        if process.is_alive():
+            process.terminate()
+            process.join(timeout=3)
+
+    latencies.sort()
+    workers = {}
+    for worker_id, report in sorted(reports.items()):
+        wall_sec = report["wall_sec"] or duration_sec
+        workers[worker_id] = {
+            "symbols": report["symbols"],
+            "delivered": report["delivered"],
+            "emitted": report["emitted"],
+            "coalesced": report["coalesced"],
+            "ticks_per_sec": report["delivered"] / wall_sec if wall_sec else 0.0,
+            "cpu_sec": report["cpu_sec"],
+            "cpu_util": report["cpu_sec"] / wall_sec if wall_sec else 0.0,
+        }
+    return {
+        "process_count": process_count,
+        "speed": speed,
+        "duration_sec": duration_sec,
+        "upserts": upserts,
+        "workers": workers,
+        "ticks_per_sec": sum(worker["ticks_per_sec"] for worker in workers.values()),
+        "latency_ms": {
+            "count": len(latencies),
+            "p50": _ms(_percentile(latencies, 0.5)),
+            "p90": _ms(_percentile(latencies, 0.9)),
+            "p99": _ms(_percentile(latencies, 0.99)),
+            "max": _ms(latencies[-1] if latencies else None),
+        },
+        "rebalance": rebalancer.summary() if rebalancer is not None else None,
+    }
+
+
+def _rebalance_replay_workers(
+        rebalancer: SymbolRebalancer,
+        control_queue: multiprocessing.Queue,
+        command_queues: list[multiprocessing.Queue],
+        control_events: list[dict[str, Any]],
+) -> None:
+    """Разобрать события воркеров и провести раунд переносов.
+
+    Тот же протокол, что у `app._status_monitor_loop`: `stop_symbols`
+    старому воркеру, `start_symbols` новому после `symbols_stopped`.
+    """
+    while True:
+        try:
+            event = control_queue.get_nowait()
+        except queue.Empty:
+            break
+        event_type = event.get("event")
+        worker_id = event.get("worker_id")
+        if event_type == "worker_heartbeat":
+            rebalancer.observe_heartbeat(worker_id, event.get("symbol_load"), event.get("cpu_load"))
+        elif event_type == "symbols_stopped":
+            if event.get("reason") != "rebalance":
+                continue
+            for to_worker, symbols in rebalancer.on_stopped(worker_id, event.get("symbols") or []).items():
+                command_queues[to_worker].put({"command": "start_symbols", "symbols": symbols})
+        elif event_type == "symbols_started":
+            rebalancer.on_started(worker_id, event.get("symbols") or [])
+        else:
+            control_events.append(event)
+    for symbol, migration in rebalancer.expire():
+        for worker_id, command in rebalancer.rollback_commands(symbol, migration):
+            command_queues[worker_id].put(command)
+    stop_dict: dict[int, list[str]] = {}
+    for symbol, from_worker, _ in rebalancer.plan():
+        stop_dict.setdefault(from_worker, []).append(symbol)
+    for from_worker, symbols in stop_dict.items():
+        command_queues[from_worker].put({"command": "stop_symbols", "symbols": symbols, "reason": "rebalance"})
+
+
+def _ms(value: Optional[float]) -> Optional[float]:
+    return None if value is None else round(value * 1000.0, 3)
+
+
+def print_replay_report(report: dict[str, Any]) -> None:
+    speed = "max" if report["speed"] is None else f"{report['speed']:g}x"
+    print(
+        f"processes={report['process_count']} speed={speed} duration={report['duration_sec']:.1f}s "
+        f"ticks/s={report['ticks_per_sec']:.0f} grid_upserts={report['upserts']}"
+    )
+    for worker_id, worker in report["workers"].items():
+        print(
+            f"  worker {worker_id}: symbols={worker['symbols']} ticks/s={worker['ticks_per_sec']:.0f} "
+            f"delivered={worker['delivered']} "
+            f"coalesced={worker['coalesced']} cpu={worker['cpu_sec']:.2f}s ({worker['cpu_util'] * 100:.0f}%)"
+        )
+    rebalance = report.get("rebalance")
+    if rebalance is not None:
+        last_round = rebalance["last_round"] or {}
+        print(
+            f"  rebalance: rounds={rebalance['rounds']} migrated={rebalance['migrated']} "
+            f"cpu spread {last_round.get('spread_before')}% -> {last_round.get('spread_after')}% "
+            f"(predicted {last_round.get('spread_predicted')}%, now {rebalance['spread']}%)"
+        )
+    latency = report["latency_ms"]
+    if latency["count"]:
+        print(
+            f"  signal latency ms: p50={latency['p50']} p90={latency['p90']} "
+            f"p99={latency['p99']} max={latency['max']} (n={latency['count']})"
+        )
+    else:
+        print("  signal latency: n/a")
+
+
+def _parse_speed(value: str) -> Optional[float]:
+    return None if value == "max" else float(value)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline replay benchmark for arbitrage workers")
+    parser.add_argument("--source", choices=sorted(ReplaySource.source_class_dict), default="synthetic")
+    parser.add_argument("--dir", help="recording directory for --source recorded")
+    parser.add_argument("--symbols", type=int, default=20)
+    parser.add_argument("--exchanges", default="okx,htx,gateio")
+    parser.add_argument("--rate", type=float, default=10.0, help="ticks per second per symbol and exchange")
+    parser.add_argument("--source-duration", type=float, default=30.0)
+    parser.add_argument("--speed", type=_parse_speed, default=1.0, help="1, 10, ... or max")
+    parser.add_argument("--duration", type=float, default=None)
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--multi-symbol", action="store_true", help="expose watchOrderBookForSymbols")
+    parser.add_argument("--spread-engine", choices=SPREAD_ENGINE_MODES, default="per_symbol")
+    parser.add_argument("--grid-top-k", type=int, default=None, help="best rows per worker sent to the aggregator")
+    parser.add_argument("--rebalance-interval", type=float, default=None, help="seconds between symbol rebalances")
+    parser.add_argument("--markets-interval", type=float, default=None, help="seconds between market reloads")
+    parser.add_argument(
+        "--listing-churn", type=int, default=0,
+        help="synthetic: list this many symbols at 1/3 and delist as many at 2/3 of the source",
+    )
+    args = parser.parse_args()
+
+    if args.source == "recorded":
+        source_config = {"kind": "recorded", "directory": args.dir}
+    else:
+        source_config = {
+            "kind": "synthetic",
+            "symbols": args.symbols,
+            "exchange_ids": args.exchanges.split(","),
+            "duration_sec": args.source_duration,
+            "rate_hz": args.rate,
+        }
+        if args.listing_churn:
+            symbols = [f"S{index:04d}/USDT:USDT" for index in range(args.symbols)]
+            source_config["listing_events"] = (
+                [(args.source_duration / 3, symbol, True) for symbol in symbols[-args.listing_churn:]]
+                + [(args.source_duration * 2 / 3, symbol, False) for symbol in symbols[:args.listing_churn]]
+            )
+    report = run_replay_benchmark(
+        source_config=source_config,
+        process_count=args.processes,
+        speed=args.speed,
+        duration_sec=args.duration,
+        multi_symbol=args.multi_symbol,
+        spread_engine_mode=args.spread_engine,
+        grid_top_k=args.grid_top_k,
+        rebalance_interval_sec=args.rebalance_interval,
+        markets_interval_sec=args.markets_interval,
+    )
+    print_replay_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,450 @@
+from __future__ import annotations
+
+_version_ = "1.0"
+"""Таблица стаканов в общей памяти для топологии "процесс на биржу".
+
+В топологии `shared_feeds` подключения к биржам держат отдельные процессы
+(по одному на биржу), а арбитражные воркеры читают готовые средние цены из
+`multiprocessing.shared_memory` вместо собственных WebSocket-подписок.
+
+Основные сущности:
+- `SharedOrderbookTable`: structured-массив numpy `(symbols, exchanges)` в
+  общей памяти плюс массив балансов бирж;
+- `SharedOrderbookPublisher`: адаптер с интерфейсом очереди событий
+  `ExchangeInstrument` (`put_nowait`/`put`), который пишет событие в свою
+  ячейку таблицы;
+- `SharedOrderbookReader`: опрос ячеек символов воркера и восстановление из
+  них событий `orderbook_update`/`exchange_paused`/... в прежнем формате.
+
+Формат ячейки `(symbol, exchange_id)`:
+- `seq`: счётчик seqlock, нечётный во время записи;
+- `event`/`reason`: коды `EVENT_TYPES`/`REASON_CODES` последнего события;
+- `ts`, `mean_dt`, `count`, `new_count`: поля события;
+- `ladder_notional`/`ladder_ask`/`ladder_bid`: лестница средних цен
+  (`NaN` — на ступени не хватило ликвидности);
+- `asks`/`bids`/`levels`: top-N уровней стакана и их фактическое число;
+- `trace`: отметки `receive`/`vwap` трассировки задержки
+  (`modules.latency_trace`), `NaN` — события без трассировки;
+- `feed_lag_ms`/`lagging`: задержка стакана по биржевому `timestamp` и
+  отметка отставания, `NaN` — биржа не передала `timestamp`.
+
+Notes:
+    В каждую ячейку пишет ровно один процесс (процесс своей биржи), поэтому
+    для согласованного чтения достаточно seqlock: читатель повторяет чтение,
+    если `seq` нечётный или изменился за время копирования.
+    Ячейка хранит только последнее событие. Читатель, опрашивающий таблицу
+    реже, чем приходят события, видит последнее состояние источника —
+    промежуточные события схлопываются.
+    Цены хранятся как float64 и восстанавливаются через `Decimal(repr(x))`:
+    округлённые до шага цены значения проходят этот путь без искажений.
+"""
+
+from decimal import Decimal
+import math
+from multiprocessing.shared_memory import SharedMemory
+import time
+from typing import Any, Optional, Sequence
+
+import numpy as np
+
+
+# Коды типов событий в поле `event`. Индекс 0 — ячейка ещё не заполнялась.
+EVENT_TYPES = ("", "orderbook_update", "exchange_paused", "exchange_resumed", "exchange_stopped")
+# Коды причин в поле `reason`. Неизвестная причина пишется как "other".
+REASON_CODES = (
+    "", "invalid_orderbook", "empty_orderbook", "insufficient_volume", "stream_timeout",
+    "stream_recovered", "data_recovered", "fatal_watch_orderbook_error", "stale_orderbook",
+    "connection_lost", "connection_recovered", "other",
+)
+DEFAULT_TOP_LEVELS = 10
+# Сколько раз читатель повторяет чтение ячейки, попавшей на запись.
+READ_RETRIES = 100
+
+_EVENT_CODE_DICT = {name: code for code, name in enumerate(EVENT_TYPES)}
+_REASON_CODE_DICT = {name: code for code, name in enumerate(REASON_CODES)}
+
+
+def make_book_dtype(ladder_size: int, top_levels: int) -> np.dtype:
+    """Собрать dtype ячейки таблицы для заданной лестницы и глубины top-N."""
+    return np.dtype([
+        ("seq", np.uint64),
+        ("event", np.int8),
+        ("reason", np.int8),
+        ("levels", np.int16, (2,)),
+        ("ts", np.float64),
+        ("mean_dt", np.float64),
+        ("count", np.uint64),
+        ("new_count", np.uint64),
+        ("ladder_notional", np.float64, (ladder_size,)),
+        ("ladder_ask", np.float64, (ladder_size,)),
+        ("ladder_bid", np.float64, (ladder_size,)),
+        ("asks", np.float64, (top_levels, 2)),
+        ("bids", np.float64, (top_levels, 2)),
+        ("trace", np.float64, (2,)),
+        ("feed_lag_ms", np.float64),
+        ("lagging", np.bool_),
+    ], align=True)
+
+
+BALANCE_DTYPE = np.dtype([("seq", np.uint64), ("balance", np.float64)], align=True)
+
+
+def _to_decimal_or_none(value: float) -> Optional[Decimal]:
+    """Восстановить `Decimal` из float ячейки, `NaN` → `None`."""
+    if math.isnan(value):
+        return None
+    return Decimal(repr(value))
+
+
+def _attach_shared_memory(name: str) -> SharedMemory:
+    """Подключиться к существующему сегменту без передачи владения.
+
+    Дочерние процессы `multiprocessing` делят resource_tracker с главным
+    процессом, поэтому повторная регистрация сегмента безопасна: удаляет его
+    только владелец через `unlink`. На Python 3.13+ регистрация отключается
+    явно (`track=False`).
+    """
+    try:
+        return SharedMemory(name=name, track=False)
+    except TypeError:
+        return SharedMemory(name=name)
+
+
+class SharedOrderbookTable:
+    """Таблица последних событий стаканов `(symbol, exchange_id)` в общей памяти.
+
+    Создаётся главным процессом через `create`, остальные процессы
+    подключаются через `attach(layout)`, где `layout` — сериализуемое
+    описание таблицы из свойства `layout`.
+    """
+
+    def __init__(self, layout: dict[str, Any], shm: SharedMemory, owner: bool):
+        """Обернуть сегмент общей памяти по описанию `layout`.
+
+        Используйте `create` или `attach` вместо прямого вызова.
+        """
+        self._layout = layout
+        self._shm = shm
+        self._owner = owner
+        self.symbols: list[str] = list(layout["symbols"])
+        self.exchange_ids: list[str] = list(layout["exchange_ids"])
+        self.ladder_multipliers: list[Decimal] = [Decimal(m) for m in layout["ladder_multipliers"]]
+        self.top_levels: int = int(layout["top_levels"])
+        self.symbol_index_dict = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self.exchange_index_dict = {exchange_id: j for j, exchange_id in enumerate(self.exchange_ids)}
+        self.base_ladder_index = self.ladder_multipliers.index(Decimal('1'))
+
+        book_dtype = make_book_dtype(len(self.ladder_multipliers), self.top_levels)
+        shape = (len(self.symbols), len(self.exchange_ids))
+        self.books = np.ndarray(shape, dtype=book_dtype, buffer=shm.buf)
+        self.balances = np.ndarray(
+            (len(self.exchange_ids),), dtype=BALANCE_DTYPE, buffer=shm.buf, offset=self.books.nbytes
+        )
+
+    @staticmethod
+    def _segment_size(symbols_count: int, exchanges_count: int, ladder_size: int, top_levels: int) -> int:
+        book_dtype = make_book_dtype(ladder_size, top_levels)
+        return max(1, book_dtype.itemsize * symbols_count * exchanges_count + BALANCE_DTYPE.itemsize * exchanges_count)
+
+    @classmethod
+    def create(
+            cls,
+            symbols: Sequence[str],
+            exchange_ids: Sequence[str],
+            ladder_multipliers: Sequence[Decimal],
+            top_levels: int = DEFAULT_TOP_LEVELS,
+    ) -> "SharedOrderbookTable":
+        """Создать новую таблицу в общей памяти.
+
+        Args:
+            symbols: Символы таблицы (строки).
+            exchange_ids: Биржи таблицы (столбцы).
+            ladder_multipliers: Ступени лестницы объёмов, в том же порядке,
+                что и в `ExchangeInstrument.VWAP_LADDER_MULTIPLIERS`.
+            top_levels: Сколько уровней стакана хранить по каждой стороне.
+
+        Returns:
+            Таблица-владелец: `unlink()` удаляет сегмент.
+        """
+        size = cls._segment_size(len(symbols), len(exchange_ids), len(ladder_multipliers), top_levels)
+        shm = SharedMemory(create=True, size=size)
+        layout = {
+            "name": shm.name,
+            "symbols": list(symbols),
+            "exchange_ids": list(exchange_ids),
+            "ladder_multipliers": [str(m) for m in ladder_multipliers],
+            "top_levels": int(top_levels),
+        }
+        table = cls(layout, shm, owner=True)
+        table.books.fill(0)
+        for field in ("mean_dt", "ladder_notional", "ladder_ask", "ladder_bid", "asks", "bids", "trace", "feed_lag_ms"):
+            table.books[field] = np.nan
+        table.balances["seq"] = 0
+        table.balances["balance"] = np.nan
+        return table
+
+    @classmethod
+    def attach(cls, layout: dict[str, Any]) -> "SharedOrderbookTable":
+        """Подключиться к таблице, созданной другим процессом."""
+        return cls(layout, _attach_shared_memory(layout["name"]), owner=False)
+
+    @property
+    def layout(self) -> dict[str, Any]:
+        """Сериализуемое описание таблицы для `attach` в других процессах."""
+        return dict(self._layout)
+
+    def write_event(self, symbol: str, exchange_id: str, event: dict[str, Any]) -> bool:
+        """Записать событие `ExchangeInstrument` в ячейку `(symbol, exchange_id)`.
+
+        Returns:
+            `False`, если символа или биржи нет в таблице.
+        """
+        i = self.symbol_index_dict.get(symbol)
+        j = self.exchange_index_dict.get(exchange_id)
+        if i is None or j is None:
+            return False
+
+        books = self.books
+        seq = books["seq"]
+        seq[i, j] += 1  # нечётный: идёт запись
+
+        event_type = event.get("type", "")
+        books["event"][i, j] = _EVENT_CODE_DICT.get(event_type, 0)
+        reason = event.get("reason")
+        books["reason"][i, j] = _REASON_CODE_DICT.get(reason, _REASON_CODE_DICT["other"]) if reason else 0
+        books["ts"][i, j] = event.get("ts", time.monotonic())
+        feed_lag_ms = event.get("feed_lag_ms")
+        books["feed_lag_ms"][i, j] = np.nan if feed_lag_ms is None else float(feed_lag_ms)
+        books["lagging"][i, j] = bool(event.get("lagging", False))
+
+        if event_type == "orderbook_update":
+            mean_dt = event.get("mean_dt")
+            books["mean_dt"][i, j] = np.nan if mean_dt is None else float(mean_dt)
+            books["count"][i, j] = event.get("count", 0)
+            books["new_count"][i, j] = event.get("new_count", 0)
+
+            ladder = event.get("ladder") or []
+            notional = books["ladder_notional"][i, j]
+            ladder_ask = books["ladder_ask"][i, j]
+            ladder_bid = books["ladder_bid"][i, j]
+            for k in range(len(self.ladder_multipliers)):
+                if k < len(ladder):
+                    step = ladder[k]
+                    notional[k] = float(step["notional"])
+                    ladder_ask[k] = np.nan if step["average_ask"] is None else float(step["average_ask"])
+                    ladder_bid[k] = np.nan if step["average_bid"] is None else float(step["average_bid"])
+                else:
+                    notional[k] = ladder_ask[k] = ladder_bid[k] = np.nan
+            if not ladder:
+                ladder_ask[self.base_ladder_index] = float(event["average_ask"])
+                ladder_bid[self.base_ladder_index] = float(event["average_bid"])
+
+            levels = books["levels"][i, j]
+            for side_index, side in enumerate(("asks", "bids")):
+                side_levels = event.get(side) or []
+                n = min(len(side_levels), self.top_levels)
+                if n:
+                    books[side][i, j, :n] = [(float(level[0]), float(level[1])) for level in side_levels[:n]]
+                levels[side_index] = n
+
+            trace = event.get("trace")
+            if trace is not None and len(trace) >= 2:
+                books["trace"][i, j] = trace[:2]
+            else:
+                books["trace"][i, j] = np.nan
+
+        seq[i, j] += 1  # чётный: запись завершена
+        return True
+
+    def read_slot(self, i: int, j: int) -> Optional[np.void]:
+        """Согласованно прочитать копию ячейки или `None`, если не удалось."""
+        seq = self.books["seq"]
+        for _ in range(READ_RETRIES):
+            before = int(seq[i, j])
+            if before & 1:
+                continue
+            row = self.books[i, j].copy()
+            if int(seq[i, j]) == before:
+                return row
+        return None
+
+    def slot_to_event(self, i: int, j: int, row: np.void) -> Optional[dict[str, Any]]:
+        """Восстановить событие `ExchangeInstrument` из прочитанной ячейки."""
+        event_type = EVENT_TYPES[int(row["event"])]
+        if not event_type:
+            return None
+        event: dict[str, Any] = {
+            "type": event_type,
+            "ts": float(row["ts"]),
+            "symbol": self.symbols[i],
+            "exchange_id": self.exchange_ids[j],
+        }
+        reason = REASON_CODES[int(row["reason"])]
+
+        if event_type == "orderbook_update":
+            ladder = [
+                {
+                    "multiplier": multiplier,
+                    "notional": _to_decimal_or_none(float(row["ladder_notional"][k])),
+                    "average_ask": _to_decimal_or_none(float(row["ladder_ask"][k])),
+                    "average_bid": _to_decimal_or_none(float(row["ladder_bid"][k])),
+                }
+                for k, multiplier in enumerate(self.ladder_multipliers)
+            ]
+            base = ladder[self.base_ladder_index]
+            mean_dt = float(row["mean_dt"])
+            event.update({
+                "count": int(row["count"]),
+                "new_count": int(row["new_count"]),
+                "average_ask": base["average_ask"],
+                "average_bid": base["average_bid"],
+                "ladder": ladder,
+                "stream_status": "ok",
+                "mean_dt": None if math.isnan(mean_dt) else mean_dt,
+                "lagging": bool(row["lagging"]),
+            })
+            ask_levels, bid_levels = (int(n) for n in row["levels"])
+            if ask_levels or bid_levels:
+                event["asks"] = row["asks"][:ask_levels].tolist()
+                event["bids"] = row["bids"][:bid_levels].tolist()
+            trace = row["trace"]
+            if not math.isnan(trace[0]):
+                event["trace"] = trace.tolist()
+        elif event_type == "exchange_paused":
+            event.update({"stream_status": "paused", "reason": reason})
+        elif event_type == "exchange_resumed":
+            event.update({"stream_status": "ok", "reason": reason})
+        else:
+            event["reason"] = reason
+        feed_lag_ms = float(row["feed_lag_ms"])
+        if event_type == "orderbook_update" or not math.isnan(feed_lag_ms):
+            event["feed_lag_ms"] = None if math.isnan(feed_lag_ms) else feed_lag_ms
+        return event
+
+    def write_balance(self, exchange_id: str, balance: Optional[Decimal]) -> None:
+        """Опубликовать свободный баланс биржи для расчёта общего объёма сделки."""
+        j = self.exchange_index_dict.get(exchange_id)
+        if j is None:
+            return
+        self.balances["seq"][j] += 1
+        self.balances["balance"][j] = np.nan if balance is None else float(balance)
+        self.balances["seq"][j] += 1
+
+    def read_balances(self) -> dict[str, Decimal]:
+        """Вернуть опубликованные балансы бирж `{exchange_id: Decimal}`."""
+        balances: dict[str, Decimal] = {}
+        seq = self.balances["seq"]
+        for j, exchange_id in enumerate(self.exchange_ids):
+            for _ in range(READ_RETRIES):
+                before = int(seq[j])
+                if before & 1:
+                    continue
+                value = float(self.balances["balance"][j])
+                if int(seq[j]) == before:
+                    if not math.isnan(value):
+                        balances[exchange_id] = Decimal(repr(value))
+                    break
+        return balances
+
+    def balances_version(self) -> int:
+        """Суммарный счётчик записей балансов: меняется при любой публикации."""
+        return int(self.balances["seq"].sum())
+
+    def close(self) -> None:
+        """Отключиться от сегмента в текущем процессе."""
+        # numpy-представления держат ссылки на буфер: их нужно отпустить
+        # до закрытия сегмента.
+        self.books = None
+        self.balances = None
+        self._shm.close()
+
+    def unlink(self) -> None:
+        """Удалить сегмент (только для владельца, после `close`)."""
+        if self._owner:
+            self._shm.unlink()
+
+
+class SharedOrderbookPublisher:
+    """Адаптер очереди событий `ExchangeInstrument` к ячейке таблицы.
+
+    `ExchangeInstrument` публикует события через `put_nowait`/`put`, поэтому
+    в процессе биржи вместо `asyncio.Queue` символа передаётся этот адаптер.
+    Запись синхронная и не блокируется: ячейка хранит последнее событие.
+    """
+
+    def __init__(self, table: SharedOrderbookTable, symbol: str, exchange_id: str):
+        self.table = table
+        self.symbol = symbol
+        self.exchange_id = exchange_id
+
+    def put_nowait(self, event: dict[str, Any]) -> None:
+        self.table.write_event(self.symbol, self.exchange_id, event)
+
+    async def put(self, event: dict[str, Any]) -> None:
+        self.put_nowait(event)
+
+
+class SharedOrderbookReader:
+    """Опрос ячеек заданных символов и выдача изменившихся событий."""
+
+    def __init__(self, table: SharedOrderbookTable, symbols: Sequence[str]):
+        """Подготовить опрос строк таблицы для символов воркера.
+
+        Args:
+            table: Подключённая таблица.
+            symbols: Символы воркера; отсутствующие в таблице пропускаются.
+        """
+        self.table = table
+        self.rows = np.array(
+            [table.symbol_index_dict[symbol] for symbol in symbols if symbol in table.symbol_index_dict],
+            dtype=np.intp,
+        )
+        self.last_seq = np.zeros((len(self.rows), len(table.exchange_ids)), dtype=np.uint64)
+        self.stats = {"polls": 0, "events": 0, "retries_exhausted": 0}
+
+    def add_symbol(self, symbol: str) -> bool:
+        """Начать опрос строки символа (перенос символа на воркер).
+
+        Returns:
+            `False`, если символа нет в таблице или он уже опрашивается.
+        """
+        row = self.table.symbol_index_dict.get(symbol)
+        if row is None or row in self.rows:
+            return False
+        self.rows = np.append(self.rows, np.intp(row))
+        # Нулевой `seq` — первое же чтение отдаст текущий стакан ячейки.
+        self.last_seq = np.vstack([self.last_seq, np.zeros((1, len(self.table.exchange_ids)), dtype=np.uint64)])
+        return True
+
+    def remove_symbol(self, symbol: str) -> bool:
+        """Прекратить опрос строки символа."""
+        row = self.table.symbol_index_dict.get(symbol)
+        if row is None:
+            return False
+        keep = self.rows != row
+        if keep.all():
+            return False
+        self.rows = self.rows[keep]
+        self.last_seq = self.last_seq[keep]
+        return True
+
+    def poll(self) -> list[dict[str, Any]]:
+        """Вернуть события ячеек, изменившихся с прошлого опроса."""
+        self.stats["polls"] += 1
+        if not len(self.rows):
+            return []
+        seq = self.table.books["seq"][self.rows]
+        changed = np.argwhere((seq != self.last_seq) & ((seq & 1) == 0))
+        events: list[dict[str, Any]] = []
+        for row_pos, j in changed.tolist():
+            i = int(self.rows[row_pos])
+            row = self.table.read_slot(i, j)
+            if row is None:
+                self.stats["retries_exhausted"] += 1
+                continue
+            self.last_seq[row_pos, j] = row["seq"]
+            event = self.table.slot_to_event(i, j, row)
+            if event is not None:
+                events.append(event)
+        self.stats["events"] += len(events)
+        return events
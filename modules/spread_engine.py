@@ -0,0 +1,483 @@
+_version_ = "1.0"
+"""Векторный расчёт спреда по всем символам воркера.
+
+`ArbitrageManager._select_best_ladder_step` на каждое `orderbook_update`
+перебирает биржи символа в Python со сравнением `Decimal`, а строка таблицы
+отправляется на каждое событие, даже если в ней ничего не изменилось.
+
+`CrossSymbolSpreadEngine` держит цены всех символов воркера в массиве NumPy
+`[строка символа, биржа, поле]` (поля — цены по ступеням лестницы):
+- `update` только запоминает цены биржи (float) и исходное событие;
+- `tick` раз в `TICK_INTERVAL_SEC` переносит накопленные ячейки в массивы
+  одной операцией и одним векторным шагом по изменённым строкам находит
+  min ask / max bid на каждой ступени, `open_ratio` и лучшую ступень;
+- цены в ячейках уже умножены на множители комиссии биржи символа
+  (`ask_fee_factor`/`bid_fee_factor` из `swap_processed_data_dict`),
+  поэтому min/max и `open_ratio` сразу чистые, как в
+  `_select_best_ladder_step`;
+- наружу возвращаются только строки, у которых изменилось показываемое
+  состояние (ступень, биржи, округлённый `open_ratio`, `mean_dt` или
+  видимость по порогу). Для них `open_ratio` пересчитывается точно, по
+  исходным `Decimal`.
+
+Последняя плоскость ступеней хранит `average_ask`/`average_bid` события:
+если какая-то биржа символа прислала событие без `ladder`, расчёт идёт по
+ней, как в `_select_best_ladder_step`.
+
+Notes:
+    Выбор ступени и бирж идёт по float64. При равных ценах на двух биржах
+    берётся биржа с меньшим номером столбца (порядок `exchange_ids`), а не
+    первая по порядку прихода событий. Отображаемый `open_ratio` всегда
+    считается по `Decimal`. Исключённая биржа (`remove`) убирается из строки
+    на ближайшем тике; цикл символа без движка оставлял строку до
+    следующего стакана.
+
+`run_spread_benchmark` (`python -m modules.spread_engine`) сравнивает оба
+режима `SPREAD_ENGINE_MODES` на одном потоке событий: CPU на тик движка и
+число событий таблицы.
+"""
+
+from decimal import Decimal
+import random
+import time
+from typing import Any, Iterable, Optional
+
+import numpy as np
+
+from modules.utils import round_down
+
+
+# Режимы расчёта спреда воркера (`run_arbitrage_worker(spread_engine_mode=...)`).
+SPREAD_ENGINE_MODES = ("per_symbol", "vectorized")
+
+
+class CrossSymbolSpreadEngine:
+    """Цены символов воркера в матрице и пакетный расчёт лучшей ступени.
+
+    Ячейка `(строка символа, биржа)` массива `_cells` — вектор полей:
+    ask по плоскостям, bid по плоскостям, длина лестницы, `mean_dt`,
+    признак активности биржи. Строки выделяются символам по мере первого
+    `update` и переиспользуются после `remove_symbol`; при нехватке места
+    массив растёт вдвое.
+    """
+
+    TICK_INTERVAL_SEC = 0.005
+    # Запас на погрешность float при округлении `open_ratio` (в процентах)
+    # до 0.01: без него 0.15 может стать 0.1499999... и уйти в 0.14.
+    ROUND_EPSILON = 1e-9
+    # Ступень в показанном состоянии строки, которой нет в таблице.
+    HIDDEN = -1.0
+
+    def __init__(
+            self, exchange_ids: Iterable[str], step_count: int, symbols: Iterable[str] = (),
+            min_open_ratio: float = 0.1,
+            fee_factor_dict: Optional[dict[str, dict[str, tuple[Decimal, Decimal]]]] = None,
+    ):
+        """
+        Args:
+            exchange_ids: Биржи воркера (столбцы матрицы).
+            step_count: Число ступеней лестницы (`VWAP_LADDER_MULTIPLIERS`).
+            symbols: Символы, под которые строки выделяются сразу.
+            min_open_ratio: Порог показа чистого `open_ratio`, % (строка
+                видна выше него).
+            fee_factor_dict: `{symbol: {exchange_id: (ask_fee_factor,
+                bid_fee_factor)}}`. Множители символа читаются при выделении
+                строки; без записи — 1 (без комиссии).
+        """
+        self.exchange_ids = list(exchange_ids)
+        self.col_index_dict = {exchange_id: col for col, exchange_id in enumerate(self.exchange_ids)}
+        self.step_count = step_count
+        # Плоскость `step_count` — `average_ask`/`average_bid` без лестницы.
+        self.plane_count = step_count + 1
+        self.min_open_ratio = min_open_ratio
+        self.fee_factor_dict = fee_factor_dict if fee_factor_dict is not None else {}
+        self.tick_interval_sec = self.TICK_INTERVAL_SEC
+        # Поля ячейки после цен.
+        self._ladder_len_field = 2 * self.plane_count
+        self._mean_dt_field = self._ladder_len_field + 1
+        self._active_field = self._ladder_len_field + 2
+        inf = float("inf")
+        self._empty_cell = [inf] * self.plane_count + [-inf] * self.plane_count + [0.0, float("nan"), 0.0]
+        # Показанное состояние строки: ступень, столбцы ask/bid, `open_ratio`,
+        # `mean_dt` ask/bid. У скрытой строки — `HIDDEN` и NaN.
+        self._hidden_state = np.array([self.HIDDEN] + [np.nan] * 5)
+
+        self.row_index_dict: dict[str, int] = {}
+        self.row_symbols: list[Optional[str]] = []
+        self._free_rows: list[int] = []
+        self._capacity = 0
+        self._cells = np.empty((0, len(self.exchange_ids), len(self._empty_cell)))
+        self._shown = np.empty((0, len(self._hidden_state)))
+        # {col: (ladder, average_ask, average_bid, mean_dt)} по строке —
+        # исходные `Decimal` для точного `open_ratio` выбранной ступени.
+        self._entries: list[dict[int, tuple]] = []
+        # Множители комиссии строки по столбцам: `(ask, bid)` в `Decimal` для
+        # точного `open_ratio` и во float для ячеек.
+        self._fees: list[list[tuple[Decimal, Decimal, float, float]]] = []
+        # {(row, col): ячейка} — изменённые с прошлого тика.
+        self._pending: dict[tuple[int, int], list[float]] = {}
+        self._trace_dict: dict[int, list[float]] = {}
+
+        # `emitted` считает `ArbitrageManager.run_spread_engine`: строки,
+        # реально отправленные в таблицу.
+        self.stats = {"ticks": 0, "rows": 0, "changed": 0, "emitted": 0, "tick_us_total": 0.0, "tick_us_max": 0.0}
+        symbols = list(symbols)
+        self._grow(max(len(symbols), 16))
+        for symbol in symbols:
+            self._row(symbol)
+
+    def _grow(self, capacity: int) -> None:
+        extra = capacity - self._capacity
+        if extra <= 0:
+            return
+        self._cells = np.concatenate([self._cells, np.tile(self._empty_cell, (extra, len(self.exchange_ids), 1))])
+        self._shown = np.concatenate([self._shown, np.tile(self._hidden_state, (extra, 1))])
+        self._entries.extend({} for _ in range(extra))
+        self._fees.extend([] for _ in range(extra))
+        self.row_symbols.extend(None for _ in range(extra))
+        self._free_rows.extend(range(capacity - 1, self._capacity - 1, -1))
+        self._capacity = capacity
+
+    def _row(self, symbol: str) -> int:
+        row = self.row_index_dict.get(symbol)
+        if row is None:
+            if not self._free_rows:
+                self._grow(self._capacity * 2)
+            row = self._free_rows.pop()
+            self.row_index_dict[symbol] = row
+            self.row_symbols[row] = symbol
+            symbol_fees = self.fee_factor_dict.get(symbol, {})
+            no_fee = (Decimal(1), Decimal(1))
+            self._fees[row] = [
+                (ask_factor, bid_factor, float(ask_factor), float(bid_factor))
+                for ask_factor, bid_factor in (symbol_fees.get(exchange_id, no_fee) for exchange_id in self.exchange_ids)
+            ]
+        return row
+
+    def update(
+            self, symbol: str, exchange_id: str, *, ladder: list[dict[str, Any]],
+            average_ask, average_bid, mean_dt: Optional[float], trace: Optional[list[float]] = None,
+    ) -> None:
+        """Запомнить цены биржи из `orderbook_update` до ближайшего тика.
+
+        Args:
+            ladder: Лестница события (`[]`, если её нет).
+            average_ask: Цена покупки на базовом объёме (`None` — нет объёма).
+            average_bid: Цена продажи на базовом объёме (`None` — нет объёма).
+            mean_dt: Средний интервал тиков биржи, для строки таблицы.
+            trace: Контекст трассировки задержки; в строку уходит последний.
+
+        Raises:
+            KeyError: Если биржи нет в `exchange_ids`.
+        """
+        row = self._row(symbol)
+        col = self.col_index_dict[exchange_id]
+        plane_count = self.plane_count
+        _, _, ask_factor, bid_factor = self._fees[row][col]
+        cell = self._empty_cell.copy()
+        for step, prices in enumerate(ladder[:self.step_count]):
+            ask = prices["average_ask"]
+            bid = prices["average_bid"]
+            if ask is not None:
+                cell[step] = float(ask) * ask_factor
+            if bid is not None:
+                cell[plane_count + step] = float(bid) * bid_factor
+        if average_ask is not None:
+            cell[plane_count - 1] = float(average_ask) * ask_factor
+        if average_bid is not None:
+            cell[2 * plane_count - 1] = float(average_bid) * bid_factor
+        cell[self._ladder_len_field] = len(ladder)
+        if mean_dt is not None:
+            cell[self._mean_dt_field] = mean_dt
+        cell[self._active_field] = 1.0
+        self._pending[(row, col)] = cell
+        self._entries[row][col] = (ladder, average_ask, average_bid, mean_dt)
+        if trace is not None:
+            self._trace_dict[row] = trace
+
+    def remove(self, symbol: str, exchange_id: str) -> None:
+        """Исключить биржу из расчёта символа (пауза, остановка, не `ok`)."""
+        row = self.row_index_dict.get(symbol)
+        col = self.col_index_dict.get(exchange_id)
+        if row is None or col is None or self._entries[row].pop(col, None) is None:
+            return
+        self._pending[(row, col)] = self._empty_cell
+
+    def remove_symbol(self, symbol: str) -> None:
+        """Освободить строку символа; в результатах `tick` он больше не появится."""
+        row = self.row_index_dict.pop(symbol, None)
+        if row is None:
+            return
+        for col in range(len(self.exchange_ids)):
+            self._pending.pop((row, col), None)
+        self._cells[row] = self._empty_cell
+        self._shown[row] = self._hidden_state
+        self._entries[row] = {}
+        self._fees[row] = []
+        self.row_symbols[row] = None
+        self._trace_dict.pop(row, None)
+        self._free_rows.append(row)
+
+    def tick(self) -> list[tuple[str, Optional[dict[str, Any]], Optional[list[float]]]]:
+        """Пересчитать строки с изменёнными ячейками.
+
+        Returns:
+            `(symbol, best_step, trace)` по символам, у которых изменилось
+            показываемое состояние. `best_step` того же вида, что у
+            `ArbitrageManager._select_best_ladder_step`, или `None`, если
+            строку нужно убрать (меньше двух бирж или чистый `open_ratio` не выше
+            `min_open_ratio`). Символы, где ни на одной ступени не нашлось
+            пары цен, не возвращаются: их строка остаётся как есть.
+        """
+        if not self._pending:
+            return []
+        started = time.perf_counter()
+        pending = self._pending
+        self._pending = {}
+        cell_index = np.array(list(pending), dtype=np.intp)
+        self._cells[cell_index[:, 0], cell_index[:, 1]] = list(pending.values())
+        rows = np.array(sorted({row for row, _ in pending}), dtype=np.intp)
+
+        plane_count = self.plane_count
+        cells = self._cells[rows]
+        asks = cells[:, :, :plane_count]
+        bids = cells[:, :, plane_count:2 * plane_count]
+        ladder_len = cells[:, :, self._ladder_len_field]
+        active = cells[:, :, self._active_field] > 0
+        enough = active.sum(axis=1) >= 2
+        ask_col = asks.argmin(axis=1)
+        bid_col = bids.argmax(axis=1)
+        min_ask = asks.min(axis=1)
+        max_bid = bids.max(axis=1)
+
+        # Ступени лестницы — до самой короткой лестницы активных бирж;
+        # если у кого-то лестницы нет, одна плоскость средних цен.
+        step_len = np.where(active, ladder_len, self.step_count).min(axis=1)
+        planes = np.arange(plane_count)
+        plane_mask = np.where(
+            (active & (ladder_len == 0)).any(axis=1)[:, None],
+            planes == self.step_count,
+            planes < np.minimum(step_len, self.step_count)[:, None],
+        )
+        plane_mask &= enough[:, None]
+        with np.errstate(invalid="ignore", divide="ignore", over="ignore"):
+            # `round_down(100 * (bid - ask) / ask, 2)`: ROUND_DOWN — к нулю.
+            ratio = 10_000 * (max_bid - min_ask) / min_ask
+            ratio = np.trunc(ratio + np.copysign(self.ROUND_EPSILON, ratio)) / 100
+        ratio[~(plane_mask & np.isfinite(ratio))] = -np.inf
+        # При равном `open_ratio` — большая ступень (больший объём).
+        best = plane_count - 1 - ratio[:, ::-1].argmax(axis=1)
+        index = np.arange(len(rows))
+        best_ratio = ratio[index, best]
+        found = best_ratio > -np.inf
+        best_ask_col = ask_col[index, best]
+        best_bid_col = bid_col[index, best]
+        mean_dt = cells[:, :, self._mean_dt_field]
+
+        # Показываемое состояние сравнивается с последним возвращённым.
+        visible = best_ratio > self.min_open_ratio
+        state = np.empty((len(rows), len(self._hidden_state)))
+        state[:, 0] = best
+        state[:, 1] = best_ask_col
+        state[:, 2] = best_bid_col
+        state[:, 3] = best_ratio
+        state[:, 4] = mean_dt[index, best_ask_col]
+        state[:, 5] = mean_dt[index, best_bid_col]
+        state[~visible] = self._hidden_state
+        shown = self._shown[rows]
+        changed = ((state != shown) & ~(np.isnan(state) & np.isnan(shown))).any(axis=1)
+        # Без пары цен при двух и более биржах строка остаётся как была.
+        changed &= found | ~enough
+        self._shown[rows[changed]] = state[changed]
+
+        trace_dict = self._trace_dict
+        result = []
+        for i in np.flatnonzero(changed).tolist():
+            row = int(rows[i])
+            symbol = self.row_symbols[row]
+            trace = trace_dict.pop(row, None)
+            if not visible[i]:
+                result.append((symbol, None, trace))
+                continue
+            step = int(best[i])
+            entries = self._entries[row]
+            ask_exchange_col = int(best_ask_col[i])
+            bid_exchange_col = int(best_bid_col[i])
+            ask_entry = entries[ask_exchange_col]
+            bid_entry = entries[bid_exchange_col]
+            if step == self.step_count:
+                ask = ask_entry[1]
+                bid = bid_entry[2]
+                notional = None
+            else:
+                ask = ask_entry[0][step]["average_ask"]
+                bid = bid_entry[0][step]["average_bid"]
+                notional = ask_entry[0][step].get("notional")
+            ask *= self._fees[row][ask_exchange_col][0]
+            bid *= self._fees[row][bid_exchange_col][1]
+            result.append((symbol, {
+                "open_ratio": round_down(100 * (bid - ask) / ask, 2),
+                "notional": notional,
+                "ask_exchange": self.exchange_ids[ask_exchange_col],
+                "ask_mean_dt": ask_entry[3],
+                "bid_exchange": self.exchange_ids[bid_exchange_col],
+                "bid_mean_dt": bid_entry[3],
+            }, trace))
+        if trace_dict:
+            for row in rows[~changed].tolist():
+                trace_dict.pop(row, None)
+
+        elapsed_us = (time.perf_counter() - started) * 1e6
+        stats = self.stats
+        stats["ticks"] += 1
+        stats["rows"] += len(rows)
+        stats["changed"] += len(result)
+        stats["tick_us_total"] += elapsed_us
+        stats["tick_us_max"] = max(stats["tick_us_max"], elapsed_us)
+        return result
+
+    def summary(self) -> dict[str, Any]:
+        """Сводка для heartbeat: тики, строк на тик, время тика в мкс."""
+        stats = self.stats
+        ticks = stats["ticks"]
+        return {
+            "symbols": len(self.row_index_dict),
+            "ticks": ticks,
+            "rows_per_tick": round(stats["rows"] / ticks, 1) if ticks else None,
+            "changed": stats["changed"],
+            "emitted": stats["emitted"],
+            "tick_us_mean": round(stats["tick_us_total"] / ticks, 1) if ticks else None,
+            "tick_us_max": round(stats["tick_us_max"], 1),
+        }
+
+
+class _GridSink(list):
+    """Очередь таблицы для бенчмарка: события только копятся."""
+    put = list.append
+
+
+def _benchmark_event(rng: random.Random, mid: float, exchange_index: int, multipliers: tuple) -> dict[str, Any]:
+    """Событие `orderbook_update` биржи: лестница VWAP и средние цены."""
+    offset = (exchange_index - 1) * 0.0015 + rng.uniform(-0.001, 0.001)
+    ladder = []
+    for step, multiplier in enumerate(multipliers):
+        slip = 0.0002 * step
+        ask = Decimal(str(round(mid * (1 + offset + 0.0003 + slip), 4)))
+        bid = Decimal(str(round(mid * (1 + offset - 0.0003 - slip), 4)))
+        if step == len(multipliers) - 1 and rng.random() < 0.2:
+            ask = None
+        ladder.append({"multiplier": multiplier, "notional": Decimal(25) * multiplier,
+                       "average_ask": ask, "average_bid": bid})
+    if rng.random() < 0.01:
+        ladder = []
+    return {"ladder": ladder, "average_ask": Decimal(str(round(mid * (1 + offset + 0.0004), 4))),
+            "average_bid": Decimal(str(round(mid * (1 + offset - 0.0004), 4))),
+            "mean_dt": rng.choice((0.1, 0.1, 0.1, 0.2))}
+
+
+def run_spread_benchmark(
+        symbols_count: int = 500,
+        exchange_ids: tuple[str, ...] = ("gateio", "htx", "okx"),
+        events_count: int = 60_000,
+        rate_hz: float = 10.0,
+        seed: int = 1,
+) -> list[dict[str, Any]]:
+    """Сравнить режимы `SPREAD_ENGINE_MODES` на одном потоке событий.
+
+    - `per_symbol`: на каждое событие выбор ступени символа
+      (`ArbitrageManager._select_best_ladder_step`) и отправка строки, как в
+      `symbol_arbitrage`;
+    - `vectorized`: событие пишется в `CrossSymbolSpreadEngine`, тик движка —
+      через столько событий, сколько приходит за `TICK_INTERVAL_SEC` при
+      `rate_hz` стаканов в секунду на символ и биржу.
+
+    Общая для режимов часть цикла символа (окна `ArbitragePair`, очередь
+    событий) не меряется. Таблица — в режиме `event` без лучших K: каждое
+    событие таблицы попадает в счётчик.
+
+    Returns:
+        Список словарей `mode`, `events`, `ticks`, `cpu_sec`,
+        `cpu_us_per_event`, `cpu_us_per_tick`, `grid_events` по режимам.
+    """
+    from modules.arbitrage_manager import ArbitrageManager, _fee_factors
+
+    multipliers = (Decimal("0.25"), Decimal("0.5"), Decimal("1"), Decimal("2"))
+    rng = random.Random(seed)
+    symbols = [f"S{index}/USDT:USDT" for index in range(symbols_count)]
+    fee_dict = {
+        symbol: {exchange_id: _fee_factors({"taker_fee": rng.choice((0.0002, 0.0005, 0.0007))})
+                 for exchange_id in exchange_ids}
+        for symbol in symbols
+    }
+    mids = [rng.uniform(0.5, 500.0) for _ in symbols]
+    stream = []
+    for _ in range(events_count):
+        index = rng.randrange(symbols_count)
+        mids[index] *= 1 + rng.gauss(0, 0.0005)
+        exchange_index = rng.randrange(len(exchange_ids))
+        stream.append((symbols[index], exchange_ids[exchange_index],
+                       _benchmark_event(rng, mids[index], exchange_index, multipliers)))
+    events_per_tick = max(1, int(symbols_count * len(exchange_ids) * rate_hz * CrossSymbolSpreadEngine.TICK_INTERVAL_SEC))
+    ticks = -(-events_count // events_per_tick)
+
+    saved = {name: getattr(ArbitrageManager, name)
+             for name in ("web_grid_table_queue", "web_grid_event_mode", "web_grid_rows", "top_opportunities")}
+    results = []
+    try:
+        for mode in SPREAD_ENGINE_MODES:
+            sink = _GridSink()
+            ArbitrageManager.web_grid_table_queue = sink
+            ArbitrageManager.web_grid_event_mode = "event"
+            ArbitrageManager.web_grid_rows = {}
+            ArbitrageManager.top_opportunities = None
+            if mode == "per_symbol":
+                manager_dict = {
+                    symbol: ArbitrageManager(symbol, {
+                        exchange_id: {"ask_fee_factor": ask_fee_factor, "bid_fee_factor": bid_fee_factor}
+                        for exchange_id, (ask_fee_factor, bid_fee_factor) in fee_dict[symbol].items()
+                    })
+                    for symbol in symbols
+                }
+                started = time.process_time()
+                for symbol, exchange_id, event in stream:
+                    manager = manager_dict[symbol]
+                    manager.symbol_average_price_dict[exchange_id] = event
+                    if len(manager.symbol_average_price_dict) < 2:
+                        continue
+                    best_step = manager._select_best_ladder_step()
+                    if best_step is not None:
+                        ArbitrageManager._apply_best_step(symbol, best_step)
+                cpu_sec = time.process_time() - started
+            else:
+                engine = CrossSymbolSpreadEngine(exchange_ids, len(multipliers), symbols, fee_factor_dict=fee_dict)
+                started = time.process_time()
+                for index, (symbol, exchange_id, event) in enumerate(stream, start=1):
+                    engine.update(symbol, exchange_id, ladder=event["ladder"], average_ask=event["average_ask"],
+                                  average_bid=event["average_bid"], mean_dt=event["mean_dt"])
+                    if index % events_per_tick == 0 or index == events_count:
+                        for row_symbol, best_step, trace in engine.tick():
+                            ArbitrageManager._apply_best_step(row_symbol, best_step, trace=trace, only_changed=True)
+                cpu_sec = time.process_time() - started
+            results.append({
+                "mode": mode,
+                "events": events_count,
+                "ticks": ticks,
+                "cpu_sec": cpu_sec,
+                "cpu_us_per_event": cpu_sec / events_count * 1e6,
+                "cpu_us_per_tick": cpu_sec / ticks * 1e6,
+                "grid_events": len(sink),
+            })
+    finally:
+        for name, value in saved.items():
+            setattr(ArbitrageManager, name, value)
+    return results
+
+
+if __name__ == "__main__":
+    for symbols_count in (500, 1000, 2000):
+        for result in run_spread_benchmark(symbols_count=symbols_count):
+            print(
+                f"symbols={symbols_count} {result['mode']:>10}: events={result['events']} ticks={result['ticks']} "
+                f"cpu={result['cpu_sec']:.3f}s ({result['cpu_us_per_event']:.1f}us/event, "
+                f"{result['cpu_us_per_tick']:.0f}us/tick) grid_events={result['grid_events']}"
+            )
@@ -0,0 +1,396 @@
+_version_ = "1.0"
+"""Перераспределение символов между воркерами по измеренной нагрузке.
+
+`split_symbols_between_processes` раскладывает отсортированные символы по
+кругу, не зная их нагрузки: одному воркеру могут достаться BTC, ETH и SOL,
+другому — неторгуемые альткоины.
+
+Нагрузка измеряется в воркерах и передаётся в heartbeat:
+- `SymbolLoadMeter` копит по символам число тиков (`orderbook_update` в
+  цикле символа) и процессорное время (`time.thread_time`: на общем ядре
+  время вытеснения процесса не попадает в символ) разбора стакана и цикла
+  символа;
+- `SymbolLoadMeter.collect` раз в heartbeat отдаёт `{symbol: (тиков/с,
+  CPU %)}` за интервал и `cpu_load` процесса (`time.process_time`);
+- CPU разбора сообщений бирж до `process_orderbook` не измерить по символу,
+  он делится между символами воркера по тикам (`effective_load`).
+
+`SymbolRebalancer` живёт в главном процессе (`app._status_monitor_loop`):
+1. по heartbeat ведёт владельца символа, EMA нагрузки символа и CPU воркера;
+2. раз в `REBALANCE_INTERVAL_SEC`, если разброс CPU воркеров не меньше
+   `MIN_CPU_SPREAD_PCT`, строит новое распределение жадной упаковкой: символы
+   от тяжёлых к лёгким остаются на своём воркере, пока он не выше средней
+   нагрузки с допуском `TARGET_TOLERANCE`, иначе уходят на наименее
+   загруженный; переносов за раунд не больше `MAX_MIGRATIONS`;
+3. перенос — чистая передача: команда `stop_symbols` старому воркеру, и
+   только после его `symbols_stopped` — `start_symbols` новому;
+4. перенос без ответа дольше `MIGRATION_TIMEOUT_SEC` откатывается
+   (`expire`, `rollback_commands`): символ возвращается на старый воркер.
+
+Разброс CPU воркеров (max − min, % одного ядра) публикуется до переноса,
+прогноз после и измеренный по первому полному интервалу heartbeat всех
+воркеров после завершения переносов (`summary`).
+"""
+
+import time
+from typing import Any, Optional
+
+
+class SymbolLoadMeter:
+    """Счётчики нагрузки символов воркера между двумя heartbeat."""
+
+    # {symbol: [ticks, cpu_sec]}
+    load_dict: dict[str, list] = {}
+    _collected_at: Optional[float] = None
+    _process_time_at: Optional[float] = None
+
+    @classmethod
+    def record(cls, symbol: str, cpu_sec: float, ticks: int = 0) -> None:
+        load = cls.load_dict.get(symbol)
+        if load is None:
+            load = cls.load_dict[symbol] = [0, 0.0]
+        load[0] += ticks
+        load[1] += cpu_sec
+
+    @classmethod
+    def collect(cls, symbols) -> tuple[dict[str, tuple[float, float]], Optional[float]]:
+        """Нагрузка за интервал с прошлого вызова; счётчики обнуляются.
+
+        Args:
+            symbols: Символы воркера; символ без тиков попадает с нулями.
+
+        Returns:
+            `({symbol: (тиков в секунду, CPU % одного ядра)}, cpu_load)`,
+            где `cpu_load` — CPU % процесса за интервал. На первом вызове
+            интервала ещё нет: `({}, None)`.
+        """
+        now = time.monotonic()
+        process_time = time.process_time()
+        collected_at = cls._collected_at
+        process_time_at = cls._process_time_at
+        load_dict = cls.load_dict
+        cls.load_dict = {}
+        cls._collected_at = now
+        cls._process_time_at = process_time
+        if collected_at is None:
+            return {}, None
+        elapsed = max(now - collected_at, 1e-9)
+        result = {}
+        for symbol in symbols:
+            ticks, cpu_sec = load_dict.get(symbol) or (0, 0.0)
+            result[symbol] = (round(ticks / elapsed, 2), round(100 * cpu_sec / elapsed, 3))
+        return result, round(100 * (process_time - process_time_at) / elapsed, 1)
+
+    @classmethod
+    def reset(cls) -> None:
+        cls.load_dict = {}
+        cls._collected_at = None
+        cls._process_time_at = None
+
+
+def cpu_spread(cpu_dict: dict[Any, float]) -> Optional[float]:
+    """Разброс CPU воркеров: max − min; `None`, если воркеров меньше двух."""
+    if len(cpu_dict) < 2:
+        return None
+    return round(max(cpu_dict.values()) - min(cpu_dict.values()), 1)
+
+
+def pack_symbols(
+        owner_dict: dict[str, Any],
+        load_dict: dict[str, float],
+        base_load_dict: dict[Any, float],
+        tolerance: float,
+) -> dict[str, Any]:
+    """Жадная упаковка символов по воркерам с предпочтением текущего.
+
+    Args:
+        owner_dict: `{symbol: worker_id}` — текущее распределение.
+        load_dict: `{symbol: нагрузка}`.
+        base_load_dict: `{worker_id: нагрузка вне символов}`; ключи — все
+            воркеры, между которыми раскладываются символы.
+        tolerance: Допуск над средней нагрузкой воркера, доля.
+
+    Returns:
+        `{symbol: worker_id}` — новое распределение.
+    """
+    total = sum(base_load_dict.values()) + sum(load_dict.get(symbol, 0.0) for symbol in owner_dict)
+    limit = total / len(base_load_dict) * (1 + tolerance)
+    bins = dict(base_load_dict)
+    assignment = {}
+    for symbol in sorted(owner_dict, key=lambda item: (-load_dict.get(item, 0.0), item)):
+        load = load_dict.get(symbol, 0.0)
+        worker_id = owner_dict[symbol]
+        if worker_id not in bins or bins[worker_id] + load > limit:
+            worker_id = min(bins, key=lambda key: (bins[key], str(key)))
+        bins[worker_id] += load
+        assignment[symbol] = worker_id
+    return assignment
+
+
+class SymbolRebalancer:
+    """Распределение символов по воркерам в главном процессе."""
+
+    REBALANCE_INTERVAL_SEC = 60.0
+    # Не переносить, пока разброс CPU воркеров меньше порога (% ядра) или
+    # прогноз улучшает его меньше чем на `MIN_GAIN_PCT`.
+    MIN_CPU_SPREAD_PCT = 10.0
+    MIN_GAIN_PCT = 5.0
+    MAX_MIGRATIONS = 20
+    TARGET_TOLERANCE = 0.05
+    LOAD_EMA_ALPHA = 0.3
+    # Перенос без ответа воркера дольше этого считается потерянным.
+    MIGRATION_TIMEOUT_SEC = 30.0
+
+    def __init__(self, worker_ids, *, interval_sec: Optional[float] = None):
+        self.worker_ids = list(worker_ids)
+        self.interval_sec = self.REBALANCE_INTERVAL_SEC if interval_sec is None else interval_sec
+        self.owner_dict: dict[str, Any] = {}
+        # EMA по heartbeat: CPU % и тиков в секунду символа.
+        self.symbol_cpu_dict: dict[str, float] = {}
+        self.symbol_tick_rate_dict: dict[str, float] = {}
+        self.worker_cpu_dict: dict[Any, float] = {}
+        # Heartbeat воркеров с начала работы или с конца последнего раунда.
+        self._heartbeat_count_dict: dict[Any, int] = {}
+        # {symbol: {"from", "to", "state": "stopping" | "starting", "ts"}}
+        self.migration_dict: dict[str, dict[str, Any]] = {}
+        self._last_plan_at: Optional[float] = None
+        self.rounds = 0
+        self.migrated = 0
+        self.last_round: Optional[dict[str, Any]] = None
+
+    def observe_heartbeat(
+            self, worker_id: Any, symbol_load: Optional[dict[str, Any]], cpu_load: Optional[float],
+            now: Optional[float] = None,
+    ) -> None:
+        """Учесть нагрузку из `worker_heartbeat`.
+
+        Args:
+            symbol_load: `{symbol: (тиков/с, CPU %)}` (`SymbolLoadMeter.collect`).
+            cpu_load: CPU % процесса воркера за интервал.
+        """
+        if symbol_load is None or cpu_load is None:
+            return
+        now = time.monotonic() if now is None else now
+        alpha = self.LOAD_EMA_ALPHA
+        for symbol, (tick_rate, cpu) in symbol_load.items():
+            if symbol in self.migration_dict:
+                continue
+            self.owner_dict[symbol] = worker_id
+            previous = self.symbol_cpu_dict.get(symbol)
+            self.symbol_cpu_dict[symbol] = cpu if previous is None else previous + alpha * (cpu - previous)
+            previous = self.symbol_tick_rate_dict.get(symbol)
+            self.symbol_tick_rate_dict[symbol] = (
+                tick_rate if previous is None else previous + alpha * (tick_rate - previous)
+            )
+        # Символы, которых воркер больше не ведёт (и не переносятся).
+        for symbol in [
+            symbol for symbol, owner in self.owner_dict.items()
+            if owner == worker_id and symbol not in symbol_load and symbol not in self.migration_dict
+        ]:
+            self.forget(symbol)
+        self.worker_cpu_dict[worker_id] = cpu_load
+        self._heartbeat_count_dict[worker_id] = self._heartbeat_count_dict.get(worker_id, 0) + 1
+        if self._last_plan_at is None:
+            self._last_plan_at = now
+        self._measure_after()
+
+    def forget(self, symbol: str) -> None:
+        self.owner_dict.pop(symbol, None)
+        self.symbol_cpu_dict.pop(symbol, None)
+        self.symbol_tick_rate_dict.pop(symbol, None)
+
+    def hot_symbols(self, limit: int = 5) -> list[tuple[str, Any, float, float]]:
+        """Самые нагруженные символы: `(symbol, worker_id, CPU %, тиков/с)`."""
+        symbols = sorted(self.symbol_cpu_dict, key=lambda symbol: -self.symbol_cpu_dict[symbol])[:limit]
+        return [
+            (symbol, self.owner_dict.get(symbol), round(self.symbol_cpu_dict[symbol], 2),
+             round(self.symbol_tick_rate_dict.get(symbol, 0.0), 1))
+            for symbol in symbols
+        ]
+
+    def _settled(self) -> bool:
+        """У всех воркеров есть полный интервал heartbeat без переносов.
+
+        Первый heartbeat после раунда меряет интервал, внутри которого шёл
+        перенос, поэтому нужны два.
+        """
+        return not self.migration_dict and all(
+            self._heartbeat_count_dict.get(worker_id, 0) >= 2 for worker_id in self.worker_ids
+        )
+
+    def plan(self, now: Optional[float] = None) -> list[tuple[str, Any, Any]]:
+        """Новый раунд переносов, если пора и есть что улучшать.
+
+        Returns:
+            `[(symbol, from_worker, to_worker), ...]`; переносы запомнены как
+            `stopping` — вызывающий отправляет `stop_symbols` старым воркерам.
+        """
+        now = time.monotonic() if now is None else now
+        if (len(self.worker_ids) < 2 or self._last_plan_at is None or now - self._last_plan_at < self.interval_sec
+                or not self._settled()):
+            return []
+        self._last_plan_at = now
+        before = cpu_spread(self.worker_cpu_dict)
+        if before is None or before < self.MIN_CPU_SPREAD_PCT:
+            return []
+
+        # Часть CPU воркера вне символов (тик движка, таблица, heartbeat)
+        # остаётся на воркере.
+        load_dict = self.effective_load()
+        base_load_dict = {worker_id: self.worker_cpu_dict.get(worker_id, 0.0) for worker_id in self.worker_ids}
+        for symbol, worker_id in self.owner_dict.items():
+            if worker_id in base_load_dict:
+                base_load_dict[worker_id] -= load_dict.get(symbol, 0.0)
+        base_load_dict = {worker_id: max(0.0, load) for worker_id, load in base_load_dict.items()}
+        assignment = pack_symbols(self.owner_dict, load_dict, base_load_dict, self.TARGET_TOLERANCE)
+        moves = sorted(
+            ((symbol, self.owner_dict[symbol], worker_id)
+             for symbol, worker_id in assignment.items() if worker_id != self.owner_dict[symbol]),
+            key=lambda move: (-load_dict.get(move[0], 0.0), move[0]),
+        )[:self.MAX_MIGRATIONS]
+
+        predicted = self.predict(moves, load_dict)
+        predicted_spread = cpu_spread(predicted)
+        if not moves or predicted_spread is None or before - predicted_spread < self.MIN_GAIN_PCT:
+            return []
+        for symbol, from_worker, to_worker in moves:
+            self.migration_dict[symbol] = {"from": from_worker, "to": to_worker, "state": "stopping", "ts": now}
+        self.rounds += 1
+        self.last_round = {
+            "round": self.rounds,
+            "moves": len(moves),
+            "cpu_before": dict(self.worker_cpu_dict),
+            "spread_before": before,
+            "spread_predicted": predicted_spread,
+            "cpu_after": None,
+            "spread_after": None,
+            "ts": time.time(),
+        }
+        return moves
+
+    def effective_load(self) -> dict[str, float]:
+        """CPU % символа вместе с его долей неизмеренного CPU воркера.
+
+        Разбор сообщений биржи (ccxt) идёт до `process_orderbook` и не
+        попадает в `SymbolLoadMeter`, но растёт с тиками символа: остаток
+        CPU воркера сверх суммы символов делится между ними по тикам.
+        """
+        symbols_by_worker: dict[Any, list[str]] = {}
+        for symbol, worker_id in self.owner_dict.items():
+            symbols_by_worker.setdefault(worker_id, []).append(symbol)
+        load_dict: dict[str, float] = {}
+        for worker_id, symbols in symbols_by_worker.items():
+            measured = sum(self.symbol_cpu_dict.get(symbol, 0.0) for symbol in symbols)
+            residual = max(0.0, self.worker_cpu_dict.get(worker_id, 0.0) - measured)
+            tick_rate = sum(self.symbol_tick_rate_dict.get(symbol, 0.0) for symbol in symbols)
+            for symbol in symbols:
+                share = self.symbol_tick_rate_dict.get(symbol, 0.0) / tick_rate if tick_rate else 0.0
+                load_dict[symbol] = self.symbol_cpu_dict.get(symbol, 0.0) + residual * share
+        return load_dict
+
+    def predict(self, moves: list[tuple[str, Any, Any]], load_dict: Optional[dict[str, float]] = None) -> dict[Any, float]:
+        """CPU воркеров после переносов: измеренный CPU ± нагрузка символов."""
+        load_dict = self.effective_load() if load_dict is None else load_dict
+        predicted = dict(self.worker_cpu_dict)
+        for symbol, from_worker, to_worker in moves:
+            load = load_dict.get(symbol, 0.0)
+            predicted[from_worker] = predicted.get(from_worker, 0.0) - load
+            predicted[to_worker] = predicted.get(to_worker, 0.0) + load
+        return {worker_id: round(cpu, 1) for worker_id, cpu in predicted.items()}
+
+    def on_stopped(self, worker_id: Any, symbols: list[str], now: Optional[float] = None) -> dict[Any, list[str]]:
+        """Старый воркер остановил символы.
+
+        Returns:
+            `{to_worker: [symbol, ...]}` для команд `start_symbols`.
+        """
+        now = time.monotonic() if now is None else now
+        start_dict: dict[Any, list[str]] = {}
+        for symbol in symbols:
+            migration = self.migration_dict.get(symbol)
+            if migration is None or migration["from"] != worker_id or migration["state"] != "stopping":
+                continue
+            migration["state"] = "starting"
+            migration["ts"] = now
+            start_dict.setdefault(migration["to"], []).append(symbol)
+        return start_dict
+
+    def on_started(self, worker_id: Any, symbols: list[str], now: Optional[float] = None) -> None:
+        """Новый воркер запустил символы."""
+        now = time.monotonic() if now is None else now
+        for symbol in symbols:
+            migration = self.migration_dict.get(symbol)
+            if migration is None or migration["to"] != worker_id:
+                continue
+            del self.migration_dict[symbol]
+            self.owner_dict[symbol] = worker_id
+            self.migrated += 1
+        self._finish_round()
+
+    def expire(self, now: Optional[float] = None) -> list[tuple[str, dict[str, Any]]]:
+        """Снять переносы без ответа дольше `MIGRATION_TIMEOUT_SEC`.
+
+        Returns:
+            `[(symbol, migration), ...]` — снятые переносы; команды отката
+            для них строит `rollback_commands`.
+        """
+        now = time.monotonic() if now is None else now
+        expired = [
+            (symbol, migration) for symbol, migration in self.migration_dict.items()
+            if now - migration["ts"] > self.MIGRATION_TIMEOUT_SEC
+        ]
+        for symbol, _ in expired:
+            del self.migration_dict[symbol]
+            self.forget(symbol)
+        if expired:
+            self._finish_round()
+        return expired
+
+    @staticmethod
+    def rollback_commands(symbol: str, migration: dict[str, Any]) -> list[tuple[Any, dict[str, Any]]]:
+        """Команды отката просроченного переноса.
+
+        Ответ воркера мог потеряться или опоздать, поэтому откат не зависит
+        от того, где символ сейчас: очереди команд воркера упорядочены, и
+        команды отката выполняются после опоздавших команд переноса.
+        - `starting`: `stop_symbols` новому воркеру (запуск мог опоздать) и
+          `start_symbols` старому;
+        - `stopping`: `start_symbols` старому воркеру — если остановка не
+          дошла, символ там уже ведётся и запуск ничего не делает, если
+          дошла позже — символ запускается снова.
+
+        Returns:
+            `[(worker_id, command), ...]` в порядке отправки.
+        """
+        commands = []
+        if migration["state"] == "starting":
+            commands.append(
+                (migration["to"], {"command": "stop_symbols", "symbols": [symbol], "reason": "rebalance_rollback"})
+            )
+        commands.append((migration["from"], {"command": "start_symbols", "symbols": [symbol]}))
+        return commands
+
+    def _finish_round(self) -> None:
+        if not self.migration_dict:
+            self._heartbeat_count_dict = {}
+
+    def _measure_after(self) -> None:
+        """Разброс после раунда — по первому полному интервалу после переносов."""
+        last_round = self.last_round
+        if last_round is None or last_round["spread_after"] is not None or not self._settled():
+            return
+        last_round["cpu_after"] = dict(self.worker_cpu_dict)
+        last_round["spread_after"] = cpu_spread(self.worker_cpu_dict)
+
+    def summary(self) -> dict[str, Any]:
+        """Сводка для страницы статусов."""
+        return {
+            "spread": cpu_spread(self.worker_cpu_dict),
+            "worker_cpu": dict(self.worker_cpu_dict),
+            "symbols": len(self.owner_dict),
+            "in_flight": len(self.migration_dict),
+            "rounds": self.rounds,
+            "migrated": self.migrated,
+            "hot_symbols": self.hot_symbols(),
+            "last_round": self.last_round,
+        }
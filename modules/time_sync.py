@@ -1,4 +1,9 @@
-__version__ = "1.1"
+__version__ = "1.2"
+
+import asyncio
+from collections import deque
+import time
+from typing import Any, Optional
 
 import ccxt.async_support as ccxt
 from modules.colored_console import cprint
@@ -44,6 +49,15 @@ def calculate_time_difference(exchange_time: int, local_time: int) -> int:
     return exchange_time - local_time
 
 
+def exchange_time_offset_ms(exchange) -> int:
+    """Смещение часов биржи относительно локальных, мс (`exchange - local`).
+
+    ccxt хранит `options['timeDifference']` как `local - exchange` и считает
+    время биржи как `milliseconds() - timeDifference`.
+    """
+    return -int(exchange.options.get('timeDifference') or 0)
+
+
 async def sync_time_with_exchange(exchange: ccxt.Exchange, auto_adjust=True):
     try:
         local_time_before = exchange.milliseconds()
@@ -56,8 +70,9 @@ async def sync_time_with_exchange(exchange: ccxt.Exchange, auto_adjust=True):
         time_diff = calculate_time_difference(exchange_time, local_time)
 
         if auto_adjust:
+            # Знак по соглашению ccxt: `local - exchange`.
             exchange.options['adjustForTimeDifference'] = True
-            exchange.options['timeDifference'] = time_diff
+            exchange.options['timeDifference'] = -time_diff
 
         cprint.success(f"[{exchange.id}] Время синхронизировано. Разница: {time_diff} мс")
         logger.debug(f"Биржа [{exchange.id}]: Время синхронизировано. Разница: {time_diff} мс")
@@ -65,4 +80,183 @@ async def sync_time_with_exchange(exchange: ccxt.Exchange, auto_adjust=True):
     except Exception as e:
         # cprint.error_b(f"[{exchange.id}] Ошибка при синхронизации времени: {e}")
         logger.error(f"Биржа [{exchange.id}]: Ошибка при синхронизации времени: {e}")
-        return None
\ No newline at end of file
+        return None
+
+
+class ClockSyncService:
+    """Периодическая синхронизация часов с биржей с фильтром по RTT.
+
+    Раз в `SYNC_INTERVAL_SEC` сервис делает серию из `BURST_SAMPLES` запросов
+    `fetch_time` и оставляет замер с минимальным RTT: смещение
+    `exchange - (t0 + t1) / 2` у него точнее всего, погрешность — не больше
+    `RTT / 2`. По лучшим замерам последних `WINDOW_SIZE` серий строится
+    прямая смещения от локального времени (МНК): её наклон — дрейф часов, а
+    значение на текущий момент — смещение.
+
+    Результат пишется в `exchange.options['timeDifference']` (соглашение ccxt,
+    `local - exchange`) и публикуется через `summary()`: смещение, его
+    погрешность, RTT и дрейф. Погрешность учитывают проверки свежести стаканов
+    (`exchange_clock_uncertainty_ms`).
+
+    Экземпляры хранятся в `clock_sync_instance_dict` по `exchange_id`.
+    """
+
+    clock_sync_instance_dict: dict[str, "ClockSyncService"] = {}
+
+    SYNC_INTERVAL_SEC: float = 60.0
+    BURST_SAMPLES: int = 5
+    BURST_SPACING_SEC: float = 0.2
+    WINDOW_SIZE: int = 30
+    RETRY_DELAY: float = 10.0
+    # Дрейф считается, когда лучшие замеры окна охватывают хотя бы столько.
+    MIN_DRIFT_SPAN_SEC: float = 120.0
+    # Разрешение времени биржи (целые мс) добавляется к погрешности.
+    EXCHANGE_RESOLUTION_MS: float = 1.0
+
+    @classmethod
+    def get_clock_sync_instance(cls, exchange_id: str) -> Optional["ClockSyncService"]:
+        return cls.clock_sync_instance_dict.get(exchange_id)
+
+    @classmethod
+    def summary(cls) -> dict[str, dict[str, Any]]:
+        """`{exchange_id: snapshot()}` по всем сервисам процесса."""
+        return {exchange_id: service.snapshot() for exchange_id, service in cls.clock_sync_instance_dict.items()}
+
+    @classmethod
+    def reset(cls) -> None:
+        cls.clock_sync_instance_dict = {}
+
+    def __init__(self, exchange):
+        self.exchange = exchange
+        self.exchange_id = exchange.id
+        self.enable: bool = True
+
+        # Лучший замер каждой серии: (local_ms, offset_ms, rtt_ms).
+        self.samples: deque[tuple[float, float, float]] = deque(maxlen=self.WINDOW_SIZE)
+        self.offset_ms: Optional[float] = None
+        self.uncertainty_ms: Optional[float] = None
+        self.rtt_ms: Optional[float] = None
+        self.drift_ppm: Optional[float] = None
+        self.updated_ts: Optional[float] = None
+        self.error_count: int = 0
+
+        self.__class__.clock_sync_instance_dict[exchange.id] = self
+
+    async def _sample(self) -> tuple[float, float, float]:
+        """Один замер: `(local_ms, offset_ms, rtt_ms)` в середине запроса."""
+        started = time.perf_counter()
+        local_before = self.exchange.milliseconds()
+        exchange_time = await fetch_exchange_time(self.exchange)
+        local_after = self.exchange.milliseconds()
+        rtt_ms = (time.perf_counter() - started) * 1000.0
+        local_ms = (local_before + local_after) / 2.0
+        return local_ms, calculate_time_difference(exchange_time, local_ms), rtt_ms
+
+    async def _sample_burst(self) -> Optional[tuple[float, float, float]]:
+        """Серия замеров, из которой остаётся замер с минимальным RTT."""
+        best = None
+        for index in range(self.BURST_SAMPLES):
+            if index:
+                await asyncio.sleep(self.BURST_SPACING_SEC)
+            try:
+                sample = await self._sample()
+            except NotImplementedError:
+                raise
+            except Exception as e:
+                self.error_count += 1
+                logger.error(f"Биржа [{self.exchange_id}]: замер времени не удался: {e}")
+                continue
+            if best is None or sample[2] < best[2]:
+                best = sample
+        return best
+
+    def _fit_drift(self) -> Optional[tuple[float, float, float]]:
+        """Прямая смещения по лучшим замерам окна: `(slope, intercept, residual_ms)` или `None`.
+
+        Берётся половина окна с наименьшим RTT: очереди в сети дают выбросы.
+        `residual_ms` — СКО остатков, разброс смещения вокруг прямой.
+        """
+        if len(self.samples) < 3:
+            return None
+        rtt_cutoff = sorted(sample[2] for sample in self.samples)[(len(self.samples) - 1) // 2]
+        points = [(local_ms, offset_ms) for local_ms, offset_ms, rtt_ms in self.samples if rtt_ms <= rtt_cutoff]
+        if len(points) < 3 or points[-1][0] - points[0][0] < self.MIN_DRIFT_SPAN_SEC * 1000.0:
+            return None
+        mean_x = sum(x for x, _ in points) / len(points)
+        mean_y = sum(y for _, y in points) / len(points)
+        var_x = sum((x - mean_x) ** 2 for x, _ in points)
+        if not var_x:
+            return None
+        slope = sum((x - mean_x) * (y - mean_y) for x, y in points) / var_x
+        intercept = mean_y - slope * mean_x
+        residual_ms = (sum((y - intercept - slope * x) ** 2 for x, y in points) / (len(points) - 2)) ** 0.5
+        return slope, intercept, residual_ms
+
+    def update_estimate(self, now_ms: Optional[float] = None) -> None:
+        """Пересчитать смещение и погрешность по окну и записать `timeDifference`.
+
+        Пока дрейф не оценён, смещение — замер окна с минимальным RTT, а
+        погрешность — половина его RTT. С оценённым дрейфом смещение берётся
+        с прямой на текущий момент, к погрешности добавляется разброс остатков.
+        """
+        if not self.samples:
+            return
+        now_ms = self.exchange.milliseconds() if now_ms is None else now_ms
+        best_rtt_ms = min(sample[2] for sample in self.samples)
+        fit = self._fit_drift()
+        if fit is None:
+            offset_ms = min(self.samples, key=lambda sample: sample[2])[1]
+            uncertainty_ms = best_rtt_ms / 2.0 + self.EXCHANGE_RESOLUTION_MS
+            self.drift_ppm = None
+        else:
+            slope, intercept, residual_ms = fit
+            offset_ms = intercept + slope * now_ms
+            uncertainty_ms = best_rtt_ms / 2.0 + self.EXCHANGE_RESOLUTION_MS + residual_ms
+            self.drift_ppm = slope * 1e6
+
+        self.offset_ms = offset_ms
+        self.uncertainty_ms = uncertainty_ms
+        self.rtt_ms = best_rtt_ms
+        self.updated_ts = time.time()
+
+        self.exchange.options['adjustForTimeDifference'] = True
+        self.exchange.options['timeDifference'] = -int(round(offset_ms))
+
+    def snapshot(self) -> dict[str, Any]:
+        """Опубликованная оценка: смещение `exchange - local`, погрешность, RTT (мс), дрейф (ppm)."""
+        return {
+            "offset_ms": None if self.offset_ms is None else round(self.offset_ms, 1),
+            "uncertainty_ms": None if self.uncertainty_ms is None else round(self.uncertainty_ms, 1),
+            "rtt_ms": None if self.rtt_ms is None else round(self.rtt_ms, 1),
+            "drift_ppm": None if self.drift_ppm is None else round(self.drift_ppm, 2),
+            "samples": len(self.samples),
+            "errors": self.error_count,
+            "updated_ts": self.updated_ts,
+        }
+
+    async def run(self) -> None:
+        """Цикл синхронизации до `enable = False` или отмены задачи."""
+        while self.enable:
+            try:
+                best = await self._sample_burst()
+            except NotImplementedError as e:
+                logger.warning(f"Биржа [{self.exchange_id}]: синхронизация времени остановлена: {e}")
+                return
+            if best is None:
+                await asyncio.sleep(self.RETRY_DELAY)
+                continue
+            self.samples.append(best)
+            self.update_estimate()
+            logger.debug(
+                f"Биржа [{self.exchange_id}]: смещение {self.offset_ms:.1f} ± {self.uncertainty_ms:.1f} мс, "
+                f"RTT {best[2]:.1f} мс, дрейф {self.drift_ppm} ppm"
+            )
+            await asyncio.sleep(self.SYNC_INTERVAL_SEC)
+
+
+def exchange_clock_uncertainty_ms(exchange_id: str) -> float:
+    """Погрешность смещения часов биржи (мс); 0, если сервис не запущен."""
+    service = ClockSyncService.clock_sync_instance_dict.get(exchange_id)
+    if service is None or service.uncertainty_ms is None:
+        return 0.0
+    return service.uncertainty_ms
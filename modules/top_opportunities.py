@@ -0,0 +1,198 @@
+_version_ = "1.0"
+"""Лучшие K строк таблицы воркера, поддерживаемые инкрементально.
+
+Раньше воркер отправлял в агрегатор каждую строку выше `MIN_OPEN_RATIO`, а
+`app._build_grid_snapshot` пересортировывал их все на каждое событие. При
+сотнях символов чуть выше порога почти весь поток — строки, которых
+оператор не видит.
+
+`TopOpportunityBook` делит строки воркера на две индексированные кучи:
+- `_top` — не больше `k` лучших, в корне худшая из них;
+- `_rest` — остальные, в корне лучшая из них.
+
+Изменение или удаление строки — O(log n): строка переставляется в своей
+куче, затем при необходимости одна строка меняется местами между кучами.
+Наружу возвращается, какие строки вошли в лучшие K и какие вышли, поэтому
+в агрегатор уходят только события по лучшим K. Агрегатор объединяет лучшие
+K всех воркеров (символы воркеров не пересекаются) и показывает лучшие N.
+
+Порядок строк тот же, что в таблице: больше `open_ratio_value`, при
+равенстве — меньше `symbol`.
+"""
+
+from typing import Callable, Optional
+
+
+def outranks(a: tuple[float, str], b: tuple[float, str]) -> bool:
+    """Строка `a = (value, symbol)` выше строки `b` в таблице."""
+    return a[0] > b[0] or (a[0] == b[0] and a[1] < b[1])
+
+
+class IndexedHeap:
+    """Двоичная куча `(value, key)` с индексом позиций по ключу.
+
+    В корне элемент, для которого `first(корень, любой)` истинно. `set` и
+    `remove` по ключу — O(log n).
+    """
+
+    __slots__ = ("_first", "_items", "_position_dict")
+
+    def __init__(self, first: Callable[[tuple[float, str], tuple[float, str]], bool]):
+        self._first = first
+        self._items: list[tuple[float, str]] = []
+        # {key: индекс в `_items`}
+        self._position_dict: dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._position_dict
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def peek(self) -> tuple[float, str]:
+        return self._items[0]
+
+    def pop(self) -> tuple[float, str]:
+        item = self._items[0]
+        self.remove(item[1])
+        return item
+
+    def set(self, key: str, value: float) -> None:
+        """Добавить ключ или изменить его значение."""
+        item = (value, key)
+        position = self._position_dict.get(key)
+        if position is None:
+            self._items.append(item)
+            position = self._position_dict[key] = len(self._items) - 1
+            self._sift_up(position)
+            return
+        previous = self._items[position]
+        self._items[position] = item
+        if self._first(item, previous):
+            self._sift_up(position)
+        else:
+            self._sift_down(position)
+
+    def remove(self, key: str) -> bool:
+        position = self._position_dict.pop(key, None)
+        if position is None:
+            return False
+        last = self._items.pop()
+        if position < len(self._items):
+            self._items[position] = last
+            self._position_dict[last[1]] = position
+            self._sift_up(position)
+            self._sift_down(self._position_dict[last[1]])
+        return True
+
+    def _place(self, position: int, item: tuple[float, str]) -> None:
+        self._items[position] = item
+        self._position_dict[item[1]] = position
+
+    def _sift_up(self, position: int) -> None:
+        items = self._items
+        item = items[position]
+        while position:
+            parent = (position - 1) >> 1
+            if not self._first(item, items[parent]):
+                break
+            self._place(position, items[parent])
+            position = parent
+        self._place(position, item)
+
+    def _sift_down(self, position: int) -> None:
+        items = self._items
+        size = len(items)
+        item = items[position]
+        while True:
+            child = 2 * position + 1
+            if child >= size:
+                break
+            if child + 1 < size and self._first(items[child + 1], items[child]):
+                child += 1
+            if not self._first(items[child], item):
+                break
+            self._place(position, items[child])
+            position = child
+        self._place(position, item)
+
+
+class TopOpportunityBook:
+    """Лучшие `k` строк воркера по `open_ratio_value`."""
+
+    def __init__(self, k: int):
+        if k <= 0:
+            raise ValueError("k must be positive")
+        self.k = k
+        # В корне `_top` — худшая из лучших, в корне `_rest` — лучшая из остальных.
+        self._top = IndexedHeap(lambda a, b: outranks(b, a))
+        self._rest = IndexedHeap(outranks)
+
+    def __len__(self) -> int:
+        return len(self._top) + len(self._rest)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._top or key in self._rest
+
+    def is_top(self, key: str) -> bool:
+        return key in self._top
+
+    def upsert(self, key: str, value: float) -> tuple[list[str], list[str]]:
+        """Добавить строку или изменить её значение.
+
+        Returns:
+            `(entered, left)` — ключи, вошедшие в лучшие K и вышедшие из них
+            (сам `key` попадает в `entered` только при входе).
+        """
+        if key in self._top:
+            self._top.set(key, value)
+        elif key in self._rest or len(self._top) >= self.k:
+            self._rest.set(key, value)
+        else:
+            self._top.set(key, value)
+            return [key], []
+        return self._rebalance()
+
+    def remove(self, key: str) -> tuple[list[str], list[str]]:
+        """Убрать строку.
+
+        Returns:
+            `(entered, left)`, как у `upsert`; сам `key` попадает в `left`,
+            если был в лучших K.
+        """
+        if self._top.remove(key):
+            entered, left = self._rebalance()
+            return entered, [key] + left
+        self._rest.remove(key)
+        return [], []
+
+    def _rebalance(self) -> tuple[list[str], list[str]]:
+        top = self._top
+        rest = self._rest
+        entered: list[str] = []
+        left: list[str] = []
+        while rest and len(top) < self.k:
+            value, key = rest.pop()
+            top.set(key, value)
+            entered.append(key)
+        while rest and top and outranks(rest.peek(), top.peek()):
+            best_value, best_key = rest.pop()
+            worst_value, worst_key = top.pop()
+            top.set(best_key, best_value)
+            rest.set(worst_key, worst_value)
+            entered.append(best_key)
+            left.append(worst_key)
+        # Строка могла выйти и тут же вернуться (или наоборот).
+        both = set(entered) & set(left)
+        if both:
+            entered = [key for key in entered if key not in both]
+            left = [key for key in left if key not in both]
+        return entered, left
+
+    def top(self, limit: Optional[int] = None) -> list[tuple[float, str]]:
+        """Лучшие строки `(value, key)` по порядку таблицы."""
+        items = sorted(self._top, key=lambda item: (-item[0], item[1]))
+        return items if limit is None else items[:limit]
@@ -3,6 +3,7 @@ __version__ = "1.14"
 from decimal import Decimal,  ROUND_UP, ROUND_DOWN, InvalidOperation,  ConversionSyntax
 from modules.colored_console import cprint
 from modules.exception_classes import InsufficientOrderBookVolumeError, InvalidOrEmptyOrderBookError
+from modules.compact_orderbook import CompactOrderbookSide
 
 import math
 from typing import  Optional, Union, List, Tuple
@@ -193,7 +194,7 @@ def get_average_orderbook_price(
     - Возвращает среднюю цену: total_money / total_coins
 
     Args:
-        data: Список ордеров в формате [(price, volume, ...), ...]
+        data: Список ордеров в формате [(price, volume, ...), ...] или `CompactOrderbookSide`
               price и volume могут быть int, float, str, Decimal
         money: Сумма в валюте котировки (напр. USDT), которую нужно потратить (при покупке) или получить (при продаже)
                Может быть float, str, Decimal
@@ -209,6 +210,10 @@ def get_average_orderbook_price(
         ValueError: Если данные некорректны (не числа, отрицательные объёмы, money <= 0)
         InsufficientOrderBookVolumeError: Если в стакане недостаточно объёма для покрытия `money`
     """
+    # Сторона `CompactOrderbook` считается по тем же уровням, что и список
+    if isinstance(data, CompactOrderbookSide):
+        data = data.to_levels(original_prices=True)
+
     # Обработка ваианта получения некорректного стакана
     if not isinstance(data, list) or not data:
         msg = f"Пустой или некорректный стакан: exchange={exchange}, symbol={symbol}"
@@ -0,0 +1,61 @@
+"""Проверки скользящего окна спреда `SpreadWindow` и пары бирж `ArbitragePair`.
+
+Запуск: `python -m pytest -q test_arbitrage_pair.py`.
+"""
+
+import random
+from math import sqrt
+
+from modules.arbitrage_pair import ArbitragePair, SpreadWindow
+
+
+def _naive_snapshot(data: list[float]) -> dict[str, float | None]:
+    mu = sum(data) / len(data)
+    sigma = sqrt(sum((x - mu) ** 2 for x in data) / len(data)) if len(data) >= 2 else None
+    return {"mean": mu, "std": sigma, "min": min(data), "max": max(data)}
+
+
+def test_window_stats_match_full_recompute():
+    # Плоские участки и смена уровня: большие значения с малым разбросом
+    # чередуются с постоянным малым спредом.
+    rng = random.Random(5)
+    for size in (2, 7, 120):
+        window = SpreadWindow(size)
+        history: list[float] = []
+        for index in range(20_000):
+            value = 1_000.0 + rng.gauss(0, 0.01) if index % 3000 < 2000 else 0.25
+            window.append(value)
+            history.append(value)
+            tail = history[-size:]
+            expected = _naive_snapshot(tail)
+            assert window.get_all() == tail
+            assert window.min() == expected["min"] and window.max() == expected["max"]
+            assert abs(window.mean() - expected["mean"]) <= 1e-9 * max(1.0, abs(expected["mean"]))
+            if expected["std"] is not None:
+                assert abs(window.std() - expected["std"]) <= 1e-7 * max(expected["std"], 1e-3), (size, index)
+            if len(tail) >= 3:
+                assert abs(window.mean(period=3) - sum(tail[-3:]) / 3) <= 1e-9 * max(1.0, abs(expected["mean"]))
+
+
+def test_flat_window_has_zero_std_and_zscore():
+    flat = SpreadWindow(5)
+    for _ in range(7):
+        flat.append(0.3)
+    assert flat.std() == 0.0 and flat.zscore_last() == 0.0
+
+
+def test_pair_ratio_spreads_and_directions():
+    pair = ArbitragePair("okx", "htx", window_size=3, ratio=True)
+    assert pair.spread_calc({"okx": {"average_ask": 100.0, "average_bid": 99.0}}) is None
+    result = pair.spread_calc({"htx": {"average_ask": 101.0, "average_bid": 100.5}})
+    assert result["pair"] == ("okx", "htx")
+    # Direct: покупка okx по 100, продажа htx по 100.5.
+    assert abs(result["direct_spread"] - 0.5) < 1e-12
+    assert abs(result["reverse_spread"] - 100.0 * (99.0 - 101.0) / 101.0) < 1e-12
+    assert result["direct"]["ema"] == pair.direct_state.ema.value
+    assert pair.direction_state("okx") is pair.direct_state
+    assert pair.direction_state("htx") is pair.reverse_state
+
+    pair.push_prices(100.0, 99.0, 101.0, 101.0)
+    assert pair.direct_state.spread_window.get_all() == [result["direct_spread"], 1.0]
+    assert pair.direct_state.tick_count() == 2
@@ -0,0 +1,137 @@
+"""Проверки нормализатора стаканов (`modules.compact_orderbook`) и пропуска
+неизменившихся стаканов в `ExchangeInstrument`.
+
+Запуск: `python -m pytest -q test_compact_orderbook.py`.
+"""
+
+import asyncio
+from decimal import Decimal
+from typing import Any
+
+from modules.arbitrage_manager import ExchangeInstrument
+from modules.balance_manager import BalanceSnapshot
+from modules.compact_orderbook import OrderbookNormalizer
+from modules.orderbook_vwap import get_average_orderbook_price_fast, get_average_orderbook_price_ladder
+from modules.utils import get_average_orderbook_price
+
+
+def _book(levels: int = 400) -> dict[str, Any]:
+    return {
+        "asks": [[100.0 + i * 0.01, 1.0 + i] for i in range(levels)],
+        "bids": [[99.99 - i * 0.01, 1.0 + i] for i in range(levels)],
+        "timestamp": 1,
+    }
+
+
+def test_normalize_truncates_top_levels():
+    normalizer = OrderbookNormalizer("test")
+    compact = normalizer.normalize(_book(), "X/USDT:USDT", 8)
+    assert len(compact.asks) == 8 and compact.asks.truncated and compact.asks.total_levels == 400
+    assert compact.asks.to_levels(2) == [[100.0, 1.0], [100.01, 2.0]]
+    assert compact.asks.source_prices is None
+    assert normalizer.normalize(_book(), "X/USDT:USDT").seq == 2
+
+
+def test_levels_with_extra_fields():
+    coincatch = OrderbookNormalizer("coincatch")
+    book = coincatch.normalize(
+        {"asks": [[0.935799, 7382.96, ["0.935799", "7382.960"]]], "bids": [[0.9357, 10.0, ["0.9357", "10"]]]},
+        "C/USDT:USDT",
+    )
+    assert coincatch.level_format == "extra_fields"
+    assert book.asks.to_levels() == [[0.935799, 7382.96]]
+    assert coincatch.fingerprint([[0.935799, 7382.96, ["0.935799", "7382.960"]]], 1) == (-1, [0.935799, 7382.96])
+
+
+def test_string_prices_keep_rounding_precision():
+    # "0.10" — два знака цены: средняя цена округляется до 0.01, а не до 0.1.
+    book = {
+        "asks": [["0.10", "100"], ["0.20", "100"], ["0.30", "100"]],
+        "bids": [["0.10", "100"], ["0.090", "100"], ["0.080", "100"]],
+    }
+    compact = OrderbookNormalizer("strings").normalize(book, "S/USDT:USDT")
+    assert compact.asks.source_prices == ["0.10", "0.20", "0.30"]
+    for side, is_ask in (("asks", True), ("bids", False)):
+        money_values = [5, 15, "25.5"]
+        expected = [get_average_orderbook_price(book[side], money, is_ask) for money in money_values]
+        assert [get_average_orderbook_price_fast(getattr(compact, side), money, is_ask) for money in money_values] == expected
+        assert [str(price) for price in get_average_orderbook_price_ladder(getattr(compact, side), money_values, is_ask)] \
+            == [str(price) for price in expected]
+
+
+def test_int_and_decimal_prices_keep_rounding_precision():
+    book = {"asks": [[10, 1], [11, 1], [12, 1]], "bids": [[Decimal("9.50"), 1], [Decimal("9.00"), 1]]}
+    compact = OrderbookNormalizer("ints").normalize(book, "I/USDT:USDT")
+    assert compact.asks.source_prices == [10, 11, 12]
+    for side, is_ask, money in (("asks", True, 15), ("bids", False, 14)):
+        expected = get_average_orderbook_price(book[side], money, is_ask)
+        assert str(get_average_orderbook_price_fast(getattr(compact, side), money, is_ask)) == str(expected)
+    # Публикуемые уровни остаются float.
+    assert compact.asks.to_levels(1) == [[10.0, 1.0]]
+
+
+def test_fingerprint_copies_levels():
+    normalizer = OrderbookNormalizer("fingerprint")
+    asks = [[1.0, 2.0], [1.1, 3.0]]
+    before = normalizer.fingerprint(asks, 1)
+    # ccxt обновляет объём уровня на месте.
+    asks[0][1] = 5.0
+    assert normalizer.fingerprint(asks, 1) != before
+    assert normalizer.fingerprint(asks, 3) == (2, [1.0, 5.0, 1.1, 3.0])
+    assert normalizer.fingerprint([1.0, 2.0], 1) is None
+
+
+class _Exchange:
+    id = "fingerprint-test"
+
+
+class _Balance:
+    snapshot = BalanceSnapshot(version=1, balance=Decimal(1000), is_valid=True, max_deal_volume=Decimal(100))
+
+    def get_balance_snapshot(self, exchange_id: str) -> BalanceSnapshot:
+        return self.snapshot
+
+    def get_balance_instance(self, exchange_id: str) -> "_Balance":
+        return self
+
+    async def wait_initialized(self) -> None:
+        pass
+
+
+class _Queue:
+    def __init__(self):
+        self.events: list[dict[str, Any]] = []
+
+    def put_nowait(self, event: dict[str, Any]) -> None:
+        self.events.append(event)
+
+
+def test_unchanged_book_is_skipped_before_normalize(monkeypatch):
+    monkeypatch.setattr(ExchangeInstrument, "balance_manager", _Balance())
+    queue = _Queue()
+    instrument = ExchangeInstrument(_Exchange(), "F/USDT:USDT", queue)
+    normalizer = OrderbookNormalizer.get_normalizer(_Exchange.id)
+    normalized = []
+    normalize = normalizer.normalize
+    monkeypatch.setattr(normalizer, "normalize", lambda *args: normalized.append(args[1]) or normalize(*args))
+
+    async def scenario() -> None:
+        await instrument.start_stream()
+        book = _book(50)
+        del book["timestamp"]
+        await instrument.process_orderbook(book)
+        # Уровни глубже исполнения меняются, верхние — нет.
+        book["asks"][40][1] = 99.0
+        await instrument.process_orderbook(book)
+        book["asks"][0][1] = 0.5
+        await instrument.process_orderbook(book)
+        await instrument.stop_stream("test finished")
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        OrderbookNormalizer.normalizers_dict.pop(_Exchange.id, None)
+    updates = [event for event in queue.events if event["type"] == "orderbook_update"]
+    assert len(updates) == 2
+    assert len(normalized) == 2
+    assert instrument._recompute_stats["skipped"] == 1
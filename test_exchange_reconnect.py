@@ -0,0 +1,85 @@
+"""Проверки супервизора переподключения `ExchangeConnectionSupervisor`.
+
+Запуск: `python -m pytest -q test_exchange_reconnect.py`.
+"""
+
+import asyncio
+import random
+
+from modules.exchange_reconnect import ExchangeConnectionSupervisor
+
+
+class _Instrument:
+    def __init__(self, symbol: str):
+        self.symbol = symbol
+        self.paused = 0
+
+    async def handle_connection_lost(self) -> None:
+        self.paused += 1
+
+
+def _supervisor(count: int) -> tuple[ExchangeConnectionSupervisor, list[_Instrument]]:
+    supervisor = ExchangeConnectionSupervisor("test", rng=random.Random(1))
+    instruments = [_Instrument(f"S{index}/USDT:USDT") for index in range(count)]
+    for instrument in instruments:
+        supervisor.register(instrument)
+    return supervisor, instruments
+
+
+def _fail(supervisor: ExchangeConnectionSupervisor, subscriber) -> int:
+    return asyncio.run(supervisor.report_failure(subscriber, ConnectionError("Connection closed by remote server")))
+
+
+def test_silent_symbol_does_not_hold_outage_open():
+    supervisor, instruments = _supervisor(3)
+    _fail(supervisor, instruments[0])
+    for instrument in instruments[:2]:
+        supervisor.report_recovered(instrument.symbol)
+    # Третий символ молчит: обрыв открыт до срока.
+    assert supervisor.outage is not None
+    supervisor.outage.first_data_at -= supervisor.OUTAGE_STRAGGLER_TIMEOUT_SEC
+    assert supervisor.snapshot()["state"] == "ok"
+    assert supervisor.stats["recovered"] == 1
+    assert supervisor.stats["waiting_at_close"] == 1
+
+    # Следующий обрыв снова ставит на паузу все символы.
+    _fail(supervisor, instruments[1])
+    assert supervisor.stats["outages"] == 2
+    assert [instrument.paused for instrument in instruments] == [2, 2, 2]
+
+
+def test_outage_closes_when_most_symbols_recovered():
+    supervisor, instruments = _supervisor(10)
+    _fail(supervisor, instruments[0])
+    for instrument in instruments[:8]:
+        supervisor.report_recovered(instrument.symbol)
+    assert supervisor.outage is not None
+    supervisor.report_recovered(instruments[8].symbol)
+    assert supervisor.outage is None
+    assert supervisor.stats["waiting_at_close"] == 1
+
+
+def test_stopped_symbols_do_not_hold_outage_open():
+    supervisor, instruments = _supervisor(2)
+    _fail(supervisor, instruments[0])
+    supervisor.report_recovered(instruments[0].symbol)
+    supervisor.unregister(instruments[1])
+    assert supervisor.outage is None
+
+
+def test_attempts_are_counted_per_subscriber():
+    supervisor, instruments = _supervisor(2)
+    batch = {"symbols": [instrument.symbol for instrument in instruments]}
+    assert _fail(supervisor, batch) == 1
+    assert _fail(supervisor, batch) == 2
+    # Другая подписка биржи начинает свой счёт.
+    assert _fail(supervisor, instruments[0]) == 1
+    # Первый стакан батча после переподписки обнуляет его счётчик.
+    supervisor.report_resubscribed(batch)
+    assert _fail(supervisor, batch) == 1
+
+
+def test_subscriber_gives_up_after_consecutive_failures():
+    supervisor, instruments = _supervisor(1)
+    attempts = [_fail(supervisor, instruments[0]) for _ in range(supervisor.MAX_RECONNECT_ATTEMPTS + 1)]
+    assert attempts[-1] > supervisor.MAX_RECONNECT_ATTEMPTS
@@ -0,0 +1,218 @@
+"""Сверка целочисленного выбора ступени (`ArbitrageManager._select_best_ladder_step`,
+`modules.fixed_point`) с эталонным расчётом в `Decimal`.
+
+Запуск: `python -m pytest -q test_fixed_point.py`.
+Процессорное время на тик обоих путей: `python test_fixed_point.py`.
+"""
+
+import random
+import time
+from decimal import Decimal
+from typing import Any
+
+from modules.arbitrage_manager import ArbitrageManager, _fee_factors
+from modules.fixed_point import SymbolFixedPoint, truncated_ratio
+from modules.utils import round_down
+
+EXCHANGE_IDS = ("gateio", "htx", "okx", "binance")
+MULTIPLIERS = (Decimal("0.25"), Decimal("0.5"), Decimal("1"), Decimal("2"))
+TAKER_FEES = (0.0002, 0.0005, 0.0007, 0.00045, "0.000375")
+
+
+def _select_best_ladder_step_decimal(manager: ArbitrageManager) -> dict[str, Any] | None:
+    """Эталон `_select_best_ladder_step`: тот же выбор ступени в `Decimal`.
+
+    Цены с комиссией — `Decimal`-произведения на `fee_factor_dict`,
+    `open_ratio` — `round_down(100 * (bid - ask) / ask, 2)`. Порядок бирж и
+    строгие сравнения те же: при равных ценах остаётся первая биржа, при
+    равном `open_ratio` — больший объём.
+    """
+    price_items = list(manager.symbol_average_price_dict.items())
+    fee_factor_dict = manager.fee_factor_dict
+    no_fee = (Decimal(1), Decimal(1))
+    if all(data.get("ladder") for _, data in price_items):
+        step_count = min(len(data["ladder"]) for _, data in price_items)
+        steps = [
+            [
+                (ex_id, data["ladder"][step], data.get("mean_dt"), fee_factor_dict.get(ex_id, no_fee))
+                for ex_id, data in price_items
+            ]
+            for step in range(step_count)
+        ]
+    else:
+        steps = [[
+            (ex_id, data, data.get("mean_dt"), fee_factor_dict.get(ex_id, no_fee)) for ex_id, data in price_items
+        ]]
+
+    best_step = None
+    for step_prices in steps:
+        min_ask = Decimal('+Infinity')
+        max_bid = Decimal('-Infinity')
+        min_ask_ex = max_bid_ex = None
+        min_ask_mean_dt = max_bid_mean_dt = None
+        for ex_id, prices, mean_dt, (ask_fee_factor, bid_fee_factor) in step_prices:
+            ask = prices["average_ask"]
+            bid = prices["average_bid"]
+            if ask is not None:
+                ask *= ask_fee_factor
+            if bid is not None:
+                bid *= bid_fee_factor
+            if ask is not None and ask < min_ask:
+                min_ask, min_ask_ex, min_ask_mean_dt = ask, ex_id, mean_dt
+            if bid is not None and bid > max_bid:
+                max_bid, max_bid_ex, max_bid_mean_dt = bid, ex_id, mean_dt
+        if not min_ask_ex or not max_bid_ex:
+            continue
+
+        open_ratio = round_down(100 * (max_bid - min_ask) / min_ask, 2)
+        if best_step is None or open_ratio >= best_step["open_ratio"]:
+            best_step = {
+                "open_ratio": open_ratio,
+                "notional": step_prices[0][1].get("notional"),
+                "ask_exchange": min_ask_ex,
+                "ask_mean_dt": min_ask_mean_dt,
+                "bid_exchange": max_bid_ex,
+                "bid_mean_dt": max_bid_mean_dt,
+            }
+    return best_step
+
+
+def _make_manager(rng: random.Random, price_decimals: int) -> ArbitrageManager:
+    return ArbitrageManager("S/USDT:USDT", {
+        exchange_id: {
+            **dict(zip(("ask_fee_factor", "bid_fee_factor"), _fee_factors({"taker_fee": rng.choice(TAKER_FEES)}))),
+            "price_decimals": price_decimals,
+        }
+        for exchange_id in EXCHANGE_IDS
+    })
+
+
+def _make_price(mid: float, offset: float, decimals: int) -> Decimal:
+    return round(Decimal(repr(mid * (1 + offset))), decimals)
+
+
+def _make_entry(rng: random.Random, mid: float, decimals: int) -> dict[str, Any]:
+    """Запись `symbol_average_price_dict`: цены VWAP с `decimals` знаками,
+    иногда на знак точнее (масштаб символа растёт), равные цены и `None`."""
+    offset = rng.uniform(-0.002, 0.002)
+    ladder = []
+    for step, multiplier in enumerate(MULTIPLIERS):
+        step_decimals = decimals + (rng.random() < 0.02)
+        slip = 0.0002 * step
+        ask = _make_price(mid, offset + 0.0003 + slip, step_decimals)
+        bid = _make_price(mid, offset - 0.0003 - slip, step_decimals)
+        if rng.random() < 0.05:
+            ask = None
+        if rng.random() < 0.05:
+            bid = None
+        ladder.append({"multiplier": multiplier, "notional": Decimal(25) * multiplier,
+                       "average_ask": ask, "average_bid": bid})
+    if rng.random() < 0.05:
+        ladder = []
+    elif rng.random() < 0.05:
+        ladder = ladder[:2]
+    return {"average_ask": _make_price(mid, offset + 0.0004, decimals),
+            "average_bid": _make_price(mid, offset - 0.0004, decimals),
+            "ladder": ladder, "mean_dt": rng.choice((0.1, 0.2, None))}
+
+
+def _assert_same_step(result: dict[str, Any] | None, expected: dict[str, Any] | None) -> None:
+    if expected is not None and expected["open_ratio"].is_zero():
+        # `ROUND_DOWN` отрицательного спреда даёт `-0.00`, целый путь — `0.00`.
+        assert result["open_ratio"].is_zero()
+        expected = {**expected, "open_ratio": result["open_ratio"]}
+    assert result == expected
+    # `open_ratio` совпадает и по записи (число знаков).
+    assert result is None or str(result["open_ratio"]) == str(expected["open_ratio"])
+
+
+def test_fixed_point_matches_decimal_selection():
+    # Цены от 1e-6 до 1e5 с разной точностью; на каждом событии обе
+    # реализации возвращают одинаковый результат.
+    rng = random.Random(11)
+    checks = 0
+    for _ in range(300):
+        decimals = rng.randint(0, 10)
+        mid = rng.choice((1e-6, 0.003, 0.5, 7.0, 250.0, 60_000.0, 100_000.0)) * rng.uniform(0.8, 1.2)
+        decimals = max(decimals, len(str(int(1 / mid))) if mid < 1 else 0)
+        manager = _make_manager(rng, rng.choice((0, decimals)))
+        for _ in range(200):
+            mid *= 1 + rng.gauss(0, 0.0005)
+            exchange_id = rng.choice(EXCHANGE_IDS)
+            manager.symbol_average_price_dict[exchange_id] = _make_entry(rng, mid, decimals)
+            if rng.random() < 0.1 and len(manager.symbol_average_price_dict) > 2:
+                manager.symbol_average_price_dict.pop(rng.choice(EXCHANGE_IDS), None)
+            if len(manager.symbol_average_price_dict) < 2:
+                continue
+            _assert_same_step(manager._select_best_ladder_step(), _select_best_ladder_step_decimal(manager))
+            checks += 1
+    assert checks > 50_000
+
+
+def test_price_scale_grows_with_finer_price():
+    fixed_point = SymbolFixedPoint({"a": (Decimal("1.0005"), Decimal("0.9995"))}, price_decimals=2)
+    assert fixed_point.fee_prices("a", [{"average_ask": Decimal("1.25"), "average_bid": None}]) == [(125 * 10005, None)]
+    manager = _make_manager(random.Random(1), 2)
+    manager.symbol_average_price_dict = {
+        "gateio": {"average_ask": Decimal("1.25"), "average_bid": Decimal("1.24"), "ladder": [], "mean_dt": None},
+        "htx": {"average_ask": Decimal("1.2612"), "average_bid": Decimal("1.2601"), "ladder": [], "mean_dt": None},
+    }
+    _assert_same_step(manager._select_best_ladder_step(), _select_best_ladder_step_decimal(manager))
+    assert manager.fixed_point.price_decimals == 4
+
+
+def test_truncated_ratio_rounds_toward_zero():
+    assert truncated_ratio(10_000, 10_123) == 123
+    assert truncated_ratio(10_000, 9_876) == -124
+    assert truncated_ratio(7, 6) == -1428
+    assert truncated_ratio(3, 4) == 3333
+    assert truncated_ratio(3, 2) == -3333
+
+
+def run_tick_benchmark(
+        exchange_counts: tuple[int, ...] = (2, 3, 4), events_count: int = 20_000, seed: int = 5,
+) -> list[dict[str, Any]]:
+    """Процессорное время на тик: `Decimal`-эталон против целочисленного пути.
+
+    Тик — как в `symbol_arbitrage`: событие заменяет запись одной биржи,
+    затем выбор ступени по всем биржам символа. Оба пути проходят один и
+    тот же поток событий.
+
+    Returns:
+        Список словарей `exchanges`, `decimal_us`, `fixed_point_us` по числу
+        бирж символа.
+    """
+    results = []
+    for exchange_count in exchange_counts:
+        rng = random.Random(seed)
+        manager = _make_manager(rng, 4)
+        exchange_ids = EXCHANGE_IDS[:exchange_count]
+        mid = 12.5
+        events = []
+        for _ in range(events_count):
+            mid *= 1 + rng.gauss(0, 0.0005)
+            entry = _make_entry(rng, mid, 4)
+            if not entry["ladder"]:
+                entry["ladder"] = _make_entry(rng, mid, 4)["ladder"] or entry["ladder"]
+            events.append((rng.choice(exchange_ids), entry))
+        for exchange_id in exchange_ids:
+            manager.symbol_average_price_dict[exchange_id] = dict(events[0][1])
+        result: dict[str, Any] = {"exchanges": exchange_count}
+        for key, select in (("decimal_us", lambda: _select_best_ladder_step_decimal(manager)),
+                            ("fixed_point_us", manager._select_best_ladder_step)):
+            started = time.process_time()
+            for exchange_id, entry in events:
+                manager.symbol_average_price_dict[exchange_id] = dict(entry)
+                select()
+            result[key] = (time.process_time() - started) / len(events) * 1e6
+        results.append(result)
+    return results
+
+
+if __name__ == "__main__":
+    for result in run_tick_benchmark():
+        print(
+            f"exchanges={result['exchanges']} steps={len(MULTIPLIERS)}: "
+            f"decimal {result['decimal_us']:.1f} us/tick, fixed_point {result['fixed_point_us']:.1f} us/tick "
+            f"({result['decimal_us'] / result['fixed_point_us']:.1f}x)"
+        )
@@ -0,0 +1,169 @@
+"""Проверки мультиплексора стаканов `ExchangeOrderbookFeed`.
+
+Запуск: `python -m pytest -q test_orderbook_feed.py`.
+"""
+
+import asyncio
+import time
+from typing import Any, Optional
+
+import ccxt.pro as ccxt
+
+from modules.orderbook_feed import ExchangeOrderbookFeed, _BenchmarkExchange
+from modules.task_manager import TaskManager
+
+
+class _Instrument:
+    """Обработчик символа, который, как `ExchangeInstrument`, падает на
+    стакане до `start_stream()`."""
+
+    def __init__(self, symbol: str, fail_on_book: bool = False):
+        self.symbol = symbol
+        self.last_orderbook_ts: Optional[float] = None
+        self.stream_pause_timeout_sec = 30.0
+        self.started = 0
+        self.books: list[dict[str, Any]] = []
+        self.stop_reasons: list[Optional[str]] = []
+        self._fail_on_book = fail_on_book
+
+    async def start_stream(self) -> None:
+        self.started += 1
+        self.last_orderbook_ts = time.monotonic()
+
+    async def process_orderbook(self, orderbook: dict[str, Any]) -> None:
+        if not self.started:
+            raise AttributeError(f"{self.symbol}: orderbook before start_stream()")
+        if self._fail_on_book:
+            raise ValueError(f"{self.symbol}: broken orderbook")
+        self.last_orderbook_ts = time.monotonic()
+        self.books.append(orderbook)
+
+    async def handle_stream_timeout(self) -> None:
+        pass
+
+    async def stop_stream(self, reason: Optional[str] = None) -> None:
+        self.stop_reasons.append(reason)
+
+
+async def _settle() -> None:
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def _book(symbol: str) -> dict[str, Any]:
+    return {"symbol": symbol, "asks": [], "bids": []}
+
+
+class _UnwatchExchange(_BenchmarkExchange):
+    """Биржа с `un_watch_order_book`: как ccxt, отписка отклоняет ожидание
+    подписки, в которую входит символ, с `UnsubscribeError`."""
+
+    def __init__(self, exchange_id: str):
+        super().__init__(exchange_id)
+        self.unwatched: list[tuple[str, dict[str, Any]]] = []
+
+    async def un_watch_order_book(self, symbol: str, params: dict[str, Any]) -> None:
+        self.unwatched.append((symbol, params))
+        for key in self._symbol_keys.get(symbol, ()):
+            future = self._futures[key]
+            if not future.done():
+                future.set_exception(ccxt.UnsubscribeError(f"{symbol} unsubscribed"))
+
+
+async def _with_feed(scenario, exchange: Optional[_BenchmarkExchange] = None) -> None:
+    exchange = exchange or _BenchmarkExchange("test")
+    feed = ExchangeOrderbookFeed(exchange, batch_size=20)
+    feed.task_manager = TaskManager()
+    try:
+        await scenario(feed, exchange)
+    finally:
+        for batch in feed.batches:
+            batch["symbols"].clear()
+            await feed.task_manager.cancel_task(name=batch["task_name"], reason="test finished")
+
+
+def test_reregistered_symbol_is_started_again():
+    async def scenario(feed: ExchangeOrderbookFeed, exchange: _BenchmarkExchange) -> None:
+        first, other = _Instrument("A/USDT:USDT"), _Instrument("B/USDT:USDT")
+        feed.register(first)
+        feed.register(other)
+        await _settle()
+        exchange.publish("A/USDT:USDT", _book("A/USDT:USDT"))
+        await _settle()
+        assert len(first.books) == 1
+
+        # Рестарт символа: unregister -> register нового обработчика.
+        await feed.unregister("A/USDT:USDT")
+        second = _Instrument("A/USDT:USDT")
+        feed.register(second)
+        await _settle()
+        exchange.publish("A/USDT:USDT", _book("A/USDT:USDT"))
+        await _settle()
+        exchange.publish("B/USDT:USDT", _book("B/USDT:USDT"))
+        await _settle()
+
+        assert first.stop_reasons == [None]
+        assert second.started == 1
+        assert len(second.books) == 1
+        assert len(other.books) == 1
+        assert other.stop_reasons == []
+        assert feed.batches[0]["running"]
+
+    asyncio.run(_with_feed(scenario))
+
+
+def test_replaced_instrument_is_started():
+    async def scenario(feed: ExchangeOrderbookFeed, exchange: _BenchmarkExchange) -> None:
+        feed.register(_Instrument("A/USDT:USDT"))
+        await _settle()
+        replacement = _Instrument("A/USDT:USDT")
+        feed.register(replacement)
+        await _settle()
+        exchange.publish("A/USDT:USDT", _book("A/USDT:USDT"))
+        await _settle()
+        assert replacement.started == 1
+        assert len(replacement.books) == 1
+
+    asyncio.run(_with_feed(scenario))
+
+
+def test_handler_error_stops_only_its_symbol():
+    async def scenario(feed: ExchangeOrderbookFeed, exchange: _BenchmarkExchange) -> None:
+        broken, healthy = _Instrument("A/USDT:USDT", fail_on_book=True), _Instrument("B/USDT:USDT")
+        feed.register(broken)
+        feed.register(healthy)
+        await _settle()
+        exchange.publish("A/USDT:USDT", _book("A/USDT:USDT"))
+        await _settle()
+        exchange.publish("B/USDT:USDT", _book("B/USDT:USDT"))
+        await _settle()
+
+        assert broken.stop_reasons == ["fatal_watch_orderbook_error"]
+        assert "A/USDT:USDT" not in feed.instruments
+        assert feed.batches[0]["symbols"] == ["B/USDT:USDT"]
+        assert healthy.stop_reasons == []
+        assert len(healthy.books) == 1
+        assert feed.stats["failed_symbols"] == 1
+
+    asyncio.run(_with_feed(scenario))
+
+
+def test_unregister_unwatches_symbol():
+    async def scenario(feed: ExchangeOrderbookFeed, exchange: _UnwatchExchange) -> None:
+        removed, kept = _Instrument("A/USDT:USDT"), _Instrument("B/USDT:USDT")
+        feed.register(removed)
+        feed.register(kept)
+        await _settle()
+        await feed.unregister("A/USDT:USDT")
+        await _settle()
+        exchange.publish("B/USDT:USDT", _book("B/USDT:USDT"))
+        await _settle()
+
+        assert exchange.unwatched == [("A/USDT:USDT", {})]
+        # Отклонённое отпиской ожидание не считается обрывом подписки.
+        assert feed.stats["reconnects"] == 0
+        assert kept.stop_reasons == []
+        assert len(kept.books) == 1
+        assert feed.batches[0]["running"]
+
+    asyncio.run(_with_feed(scenario, _UnwatchExchange("test")))
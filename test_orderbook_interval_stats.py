@@ -0,0 +1,72 @@
+"""Проверки скользящей статистики интервалов `OrderbookIntervalStatsWindow`.
+
+Запуск: `python -m pytest -q test_orderbook_interval_stats.py`.
+"""
+
+import random
+from statistics import pstdev
+
+from modules.orderbook_interval_stats import OrderbookIntervalStatsWindow
+
+
+def _exact_percentile(values: list[float], q: float) -> float:
+    return sorted(values)[min(len(values), max(1, int(q * len(values) + 0.999999))) - 1]
+
+
+def _filled_window(max_intervals: int, ticks: int, seed: int = 7) -> tuple[OrderbookIntervalStatsWindow, float]:
+    rng = random.Random(seed)
+    window = OrderbookIntervalStatsWindow(max_intervals=max_intervals, emit_timeout_sec=1e9)
+    ts = 0.0
+    for _ in range(ticks):
+        ts += rng.lognormvariate(-3.0, 1.0)
+        window.observe(ts)
+    return window, ts
+
+
+def test_rolling_stats_match_direct_calculation():
+    window, ts = _filled_window(200, 5000)
+    values = list(window._intervals)
+    snapshot = window._build_snapshot(now=ts, trigger="timeout")
+    assert abs(snapshot["mean_dt"] - sum(values) / len(values)) < 1e-9
+    assert abs(snapshot["std_dt"] - pstdev(values)) < 1e-6
+    assert snapshot["min_dt"] == min(values) and snapshot["max_dt"] == max(values)
+
+
+def test_percentiles_within_histogram_error():
+    for max_intervals, ticks in ((50, 40), (50, 5000), (500, 5000), (5000, 20000)):
+        window, _ = _filled_window(max_intervals, ticks, seed=max_intervals)
+        values = list(window._intervals)
+        for q in (0.0, 0.1, 0.5, 0.9, 0.99, 1.0):
+            exact = _exact_percentile(values, q)
+            assert exact <= window.percentile(q) <= exact * 1.04, (max_intervals, q)
+    # Равные интервалы: ответ — точное значение (не выше `max_dt`).
+    window = OrderbookIntervalStatsWindow(max_intervals=10, emit_timeout_sec=1e9)
+    for tick in range(20):
+        window.observe(tick * 0.25)
+    assert window.percentile(0.5) == window.percentile(0.99) == 0.25
+
+
+def test_percentile_follows_evictions():
+    window = OrderbookIntervalStatsWindow(max_intervals=100, emit_timeout_sec=1e9)
+    ts = 0.0
+    for _ in range(101):
+        ts += 1.0
+        window.observe(ts)
+    for _ in range(100):
+        ts += 0.001
+        window.observe(ts)
+    # Секундные интервалы вытеснены: ни квантили, ни октавы их не помнят.
+    assert window.percentile(0.99) <= 0.00104
+    assert sum(window._octave_counts) == window.size == 100
+
+
+def test_snapshot_triggers():
+    window = OrderbookIntervalStatsWindow(max_intervals=3, emit_timeout_sec=10.0)
+    assert window.observe(0.0) is None
+    assert window.observe(1.0) is None
+    assert window.observe(2.0) is None
+    assert window.observe(3.0)["trigger"] == "window_full"
+    assert window.observe(4.0) is None
+    assert window.observe(13.5)["trigger"] == "timeout"
+    window.reset()
+    assert window.size == 0 and window.percentile(0.5) is None
@@ -0,0 +1,124 @@
+"""Сверка быстрого расчёта средней цены (`modules.orderbook_vwap`) с
+эталонным `modules.utils.get_average_orderbook_price`.
+
+Запуск: `python -m pytest -q test_orderbook_vwap.py`.
+"""
+
+import random
+from decimal import Decimal
+from typing import Any, Sequence, Union
+
+from modules.compact_orderbook import OrderbookNormalizer
+from modules.exception_classes import InsufficientOrderBookVolumeError, InvalidOrEmptyOrderBookError
+from modules.orderbook_vwap import get_average_orderbook_price_fast, get_average_orderbook_price_ladder
+from modules.utils import asks as sample_asks, bids as sample_bids, get_average_orderbook_price
+
+MONEY_VALUES = [1, 10, "55.5", Decimal("100"), 1000, 5400, 25000]
+
+
+def _call_average_price(func, data, money, is_ask) -> Any:
+    """Вызвать функцию расчёта и вернуть либо цену, либо тип исключения."""
+    try:
+        return func(data, money, is_ask)
+    except (ValueError, InsufficientOrderBookVolumeError, InvalidOrEmptyOrderBookError) as e:
+        return type(e)
+
+
+def _parity_mismatches(
+        books: Sequence[dict[str, list]],
+        money_values: Sequence[Union[float, str, Decimal]],
+) -> list[dict[str, Any]]:
+    """Расхождения быстрого пути и лестницы с эталоном, на списках уровней
+    и на `CompactOrderbookSide` (пути `compact`, `compact_ladder`)."""
+    mismatches: list[dict[str, Any]] = []
+    normalizer = OrderbookNormalizer("parity")
+    for book_index, book in enumerate(books):
+        try:
+            compact = normalizer.normalize(book, "parity")
+        except ValueError:
+            compact = None
+        for side, is_ask in (("asks", True), ("bids", False)):
+            compact_side = None if compact is None else getattr(compact, side)
+            ladders = {"ladder": _call_average_price(get_average_orderbook_price_ladder, book[side], money_values, is_ask)}
+            if compact_side is not None:
+                ladders["compact_ladder"] = _call_average_price(
+                    get_average_orderbook_price_ladder, compact_side, money_values, is_ask
+                )
+            for position, money in enumerate(money_values):
+                expected = _call_average_price(get_average_orderbook_price, book[side], money, is_ask)
+                paths = {"fast": _call_average_price(get_average_orderbook_price_fast, book[side], money, is_ask)}
+                if compact_side is not None:
+                    paths["compact"] = _call_average_price(get_average_orderbook_price_fast, compact_side, money, is_ask)
+                for name, ladder in ladders.items():
+                    if isinstance(ladder, list):
+                        paths[name] = InsufficientOrderBookVolumeError if ladder[position] is None else ladder[position]
+                    else:
+                        paths[name] = ladder
+                for name, value in paths.items():
+                    if expected != value or type(expected) is not type(value):
+                        mismatches.append({
+                            "book": book_index, "side": side, "money": money,
+                            "path": name, "expected": expected, "actual": value,
+                        })
+    return mismatches
+
+
+def _random_book(rng: random.Random, levels: int = 50, decimals: int = 4) -> dict[str, list]:
+    mid = round(rng.uniform(0.01, 50000.0), decimals)
+    step = 10 ** -decimals
+    asks, bids = [], []
+    ask_price, bid_price = mid + step, mid
+    for _ in range(levels):
+        ask_price = round(ask_price + step * rng.randint(1, 5), decimals)
+        bid_price = round(max(step, bid_price - step * rng.randint(1, 5)), decimals)
+        asks.append([ask_price, round(rng.uniform(0.001, 500.0) / max(mid, 1.0) * 100, 3)])
+        bids.append([bid_price, round(rng.uniform(0.001, 500.0) / max(mid, 1.0) * 100, 3)])
+    return {"asks": asks, "bids": bids}
+
+
+def test_sample_book_parity():
+    assert _parity_mismatches([{"asks": sample_asks, "bids": sample_bids}], MONEY_VALUES) == []
+
+
+def test_random_books_parity():
+    rng = random.Random(42)
+    books = [_random_book(rng, levels=rng.randint(1, 200), decimals=rng.randint(0, 8)) for _ in range(300)]
+    assert _parity_mismatches(books, MONEY_VALUES) == []
+
+
+def test_deep_fill_parity():
+    # Исполнение на сотнях уровней: объём каждого уровня мал относительно суммы.
+    rng = random.Random(7)
+    book = _random_book(rng, levels=400, decimals=6)
+    for side in book.values():
+        for level in side:
+            level[1] = 0.001
+    deep_money = book["asks"][0][0] * 0.001 * 300
+    assert _parity_mismatches([book], [deep_money] + MONEY_VALUES[:3]) == []
+
+
+def test_invalid_levels_match_reference():
+    books = [
+        {"asks": [[1.5, 2.0], [0, 1.0], [1.7, 3.0]], "bids": [[1.4, 2.0], ["x", 1.0]]},
+        {"asks": [[1.5, -1.0]], "bids": [[1.4]]},
+        {"asks": [["1.50", "2"], ["1.60", "3"]], "bids": [["1.40", "2"], ["1.30", "3"]]},
+    ]
+    for book in books:
+        for side, is_ask in (("asks", True), ("bids", False)):
+            for money in MONEY_VALUES:
+                expected = _call_average_price(get_average_orderbook_price, book[side], money, is_ask)
+                assert _call_average_price(get_average_orderbook_price_fast, book[side], money, is_ask) == expected
+    # Лестница падает целиком, если хотя бы одна ступень дошла до плохого уровня.
+    ladder = _call_average_price(get_average_orderbook_price_ladder, books[0]["asks"], MONEY_VALUES, True)
+    assert ladder is ValueError
+
+
+def test_ladder_depth_covers_fill_levels():
+    asks = [[10.0, 1.0], [11.0, 1.0], [12.0, 1.0], [13.0, 1.0]]
+    money_values = [25, 5, 15]
+    prices, depth = get_average_orderbook_price_ladder(asks, money_values, True, with_depth=True)
+    assert prices == [get_average_orderbook_price(asks, money, True) for money in money_values]
+    assert depth == 3
+    prices, depth = get_average_orderbook_price_ladder(asks, [5, 100], True, with_depth=True)
+    assert prices[1] is None
+    assert depth == len(asks) + 1
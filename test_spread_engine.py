@@ -0,0 +1,197 @@
+"""Сверка векторного расчёта спреда `CrossSymbolSpreadEngine` с циклом
+символа (`ArbitrageManager._select_best_ladder_step`).
+
+Запуск: `python -m pytest -q test_spread_engine.py`.
+"""
+
+import random
+from decimal import Decimal
+from typing import Any, Optional
+
+from modules.arbitrage_manager import ArbitrageManager, _fee_factors
+from modules.spread_engine import CrossSymbolSpreadEngine
+
+EXCHANGE_IDS = ("gateio", "htx", "okx")
+MULTIPLIERS = (Decimal("0.25"), Decimal("0.5"), Decimal("1"), Decimal("2"))
+TAKER_FEES = (0.0002, 0.0005, 0.0007)
+
+
+def _make_event(rng: random.Random, mid: float, exchange_index: int) -> dict[str, Any]:
+    offset = (exchange_index - 1) * 0.0015 + rng.uniform(-0.001, 0.001)
+    ladder = []
+    for step, multiplier in enumerate(MULTIPLIERS):
+        slip = 0.0002 * step
+        ask = Decimal(str(round(mid * (1 + offset + 0.0003 + slip), 4)))
+        bid = Decimal(str(round(mid * (1 + offset - 0.0003 - slip), 4)))
+        if step == 3 and rng.random() < 0.2:
+            ask = None
+        ladder.append({"multiplier": multiplier, "notional": Decimal(25) * multiplier,
+                       "average_ask": ask, "average_bid": bid})
+    if rng.random() < 0.01:
+        ladder = []
+    return {"ladder": ladder, "average_ask": Decimal(str(round(mid * (1 + offset + 0.0004), 4))),
+            "average_bid": Decimal(str(round(mid * (1 + offset - 0.0004), 4))),
+            "mean_dt": rng.choice((0.1, 0.1, 0.1, 0.2))}
+
+
+def _make_fees(symbol_count: int, seed: int = 1) -> dict[str, dict[str, tuple[Decimal, Decimal]]]:
+    rng = random.Random(seed)
+    return {
+        f"S{index}/USDT:USDT": {
+            exchange_id: _fee_factors({"taker_fee": rng.choice(TAKER_FEES)}) for exchange_id in EXCHANGE_IDS
+        }
+        for index in range(symbol_count)
+    }
+
+
+def _make_stream(symbol_count: int, event_count: int, seed: int = 1) -> list[tuple[str, str, dict[str, Any]]]:
+    rng = random.Random(seed)
+    mids = [rng.uniform(0.5, 500.0) for _ in range(symbol_count)]
+    stream = []
+    for _ in range(event_count):
+        index = rng.randrange(symbol_count)
+        mids[index] *= 1 + rng.gauss(0, 0.0005)
+        exchange_index = rng.randrange(len(EXCHANGE_IDS))
+        stream.append((f"S{index}/USDT:USDT", EXCHANGE_IDS[exchange_index], _make_event(rng, mids[index], exchange_index)))
+    return stream
+
+
+class _GridSink(list):
+    put = list.append
+
+
+def _use_grid(monkeypatch, rows: dict[str, Any]) -> _GridSink:
+    sink = _GridSink()
+    monkeypatch.setattr(ArbitrageManager, "web_grid_table_queue", sink)
+    monkeypatch.setattr(ArbitrageManager, "web_grid_event_mode", "event")
+    monkeypatch.setattr(ArbitrageManager, "web_grid_rows", rows)
+    return sink
+
+
+def _per_symbol_update(
+        manager_dict: dict[str, ArbitrageManager], fee_dict: dict, symbol: str, exchange_id: str,
+        event: Optional[dict[str, Any]],
+) -> None:
+    """Путь `symbol_arbitrage` без очереди: кэш цен, выбор ступени, строка.
+
+    `event=None` — пауза биржи с пересчётом строки, как в движке.
+    """
+    manager = manager_dict.get(symbol)
+    if manager is None:
+        manager = manager_dict[symbol] = ArbitrageManager(symbol, {
+            ex_id: {"ask_fee_factor": ask_fee_factor, "bid_fee_factor": bid_fee_factor}
+            for ex_id, (ask_fee_factor, bid_fee_factor) in fee_dict[symbol].items()
+        })
+    symbol_prices = manager.symbol_average_price_dict
+    if event is None:
+        symbol_prices.pop(exchange_id, None)
+    else:
+        symbol_prices[exchange_id] = event
+    if len(symbol_prices) < 2:
+        ArbitrageManager._remove_web_grid_row(symbol)
+        return
+    best_step = manager._select_best_ladder_step()
+    if best_step is not None:
+        ArbitrageManager._apply_best_step(symbol, best_step)
+
+
+def _engine_update(engine: CrossSymbolSpreadEngine, symbol: str, exchange_id: str, event: dict[str, Any]) -> None:
+    engine.update(symbol, exchange_id, ladder=event["ladder"], average_ask=event["average_ask"],
+                  average_bid=event["average_bid"], mean_dt=event["mean_dt"])
+
+
+def _engine_tick(engine: CrossSymbolSpreadEngine) -> None:
+    for symbol, best_step, trace in engine.tick():
+        if ArbitrageManager._apply_best_step(symbol, best_step, trace=trace, only_changed=True):
+            engine.stats["emitted"] += 1
+
+
+def test_engine_rows_match_per_symbol_rows(monkeypatch):
+    # После каждого события строки таблицы совпадают, кроме выбора биржи при
+    # равных ценах. Комиссии бирж у символов разные, поэтому лучшая пара по
+    # чистым ценам не всегда совпадает с лучшей по исходным.
+    fee_dict = _make_fees(200)
+    engine = CrossSymbolSpreadEngine(EXCHANGE_IDS, len(MULTIPLIERS), fee_factor_dict=fee_dict)
+    reference_rows: dict[str, Any] = {}
+    engine_rows: dict[str, Any] = {}
+    manager_dict: dict[str, ArbitrageManager] = {}
+    mismatches = []
+    for symbol, exchange_id, event in _make_stream(200, 20_000, seed=7):
+        _use_grid(monkeypatch, reference_rows)
+        _per_symbol_update(manager_dict, fee_dict, symbol, exchange_id, event)
+        _use_grid(monkeypatch, engine_rows)
+        _engine_update(engine, symbol, exchange_id, event)
+        symbol_prices = manager_dict[symbol].symbol_average_price_dict
+        if exchange_id == "htx" and len(symbol_prices) > 2 and event["mean_dt"] == 0.2:
+            # Пауза биржи. Цикл символа оставляет строку до следующего
+            # стакана, движок пересчитывает её на ближайшем тике.
+            _use_grid(monkeypatch, reference_rows)
+            _per_symbol_update(manager_dict, fee_dict, symbol, exchange_id, None)
+            _use_grid(monkeypatch, engine_rows)
+            engine.remove(symbol, exchange_id)
+        _engine_tick(engine)
+        reference_row = reference_rows.get(symbol)
+        engine_row = engine_rows.get(symbol)
+        if reference_row == engine_row:
+            continue
+        if not (reference_row and engine_row and reference_row["open_ratio"] == engine_row["open_ratio"]
+                and reference_row["deal_notional"] == engine_row["deal_notional"]):
+            mismatches.append((symbol, reference_row, engine_row))
+    assert mismatches == []
+    assert engine.stats["emitted"] > 0
+
+
+def test_net_open_ratio_filter_shows_fewer_rows(monkeypatch):
+    volume = {}
+    for label, fees in (("gross", {}), ("net", _make_fees(200))):
+        rows: dict[str, Any] = {}
+        sink = _use_grid(monkeypatch, rows)
+        engine = CrossSymbolSpreadEngine(EXCHANGE_IDS, len(MULTIPLIERS), fee_factor_dict=fees)
+        visible_total = 0
+        for symbol, exchange_id, event in _make_stream(200, 5_000, seed=7):
+            _engine_update(engine, symbol, exchange_id, event)
+            _engine_tick(engine)
+            visible_total += len(rows)
+        volume[label] = (visible_total, len(sink))
+    assert volume["net"][0] < volume["gross"][0]
+    assert volume["net"][1] < volume["gross"][1]
+
+
+def _ladder_event(ask: str, bid: str) -> dict[str, Any]:
+    return {
+        "ladder": [{"multiplier": Decimal(1), "notional": Decimal(25),
+                    "average_ask": Decimal(ask), "average_bid": Decimal(bid)}],
+        "average_ask": Decimal(ask), "average_bid": Decimal(bid), "mean_dt": 0.1,
+    }
+
+
+def test_tick_returns_only_changed_rows():
+    engine = CrossSymbolSpreadEngine(("a", "b"), 1, min_open_ratio=0.1)
+    _engine_update(engine, "X/USDT:USDT", "a", _ladder_event("100", "99.9"))
+    # Одна биржа — строки нет, состояние скрытое, как и было.
+    assert engine.tick() == []
+    _engine_update(engine, "X/USDT:USDT", "b", _ladder_event("101", "100.5"))
+    [(symbol, best_step, _)] = engine.tick()
+    assert symbol == "X/USDT:USDT"
+    assert best_step["open_ratio"] == Decimal("0.50")
+    assert (best_step["ask_exchange"], best_step["bid_exchange"]) == ("a", "b")
+    assert best_step["notional"] == Decimal(25)
+    # Те же цены — показанное состояние не изменилось.
+    _engine_update(engine, "X/USDT:USDT", "b", _ladder_event("101", "100.5"))
+    assert engine.tick() == []
+    # Биржа снята — строка убирается.
+    engine.remove("X/USDT:USDT", "b")
+    assert engine.tick() == [("X/USDT:USDT", None, None)]
+
+
+def test_removed_symbol_row_is_reused():
+    engine = CrossSymbolSpreadEngine(("a", "b"), 1, symbols=[f"S{index}" for index in range(16)])
+    row = engine.row_index_dict["S3"]
+    _engine_update(engine, "S3", "a", _ladder_event("100", "99.9"))
+    engine.remove_symbol("S3")
+    assert engine.tick() == []
+    _engine_update(engine, "N", "a", _ladder_event("100", "99.9"))
+    assert engine.row_index_dict["N"] == row
+    # Свободных строк нет — массив растёт вдвое.
+    _engine_update(engine, "M", "a", _ladder_event("100", "99.9"))
+    assert engine._capacity == 32
@@ -0,0 +1,55 @@
+"""Проверки повторного допуска остановленных символов
+(`ArbitrageManager.readmit_due_symbols`, `_market_watch_loop`).
+
+Запуск: `python -m pytest -q test_symbol_readmit.py`.
+"""
+
+import asyncio
+from typing import Any
+
+from modules.arbitrage_manager import ArbitrageManager, _market_watch_loop
+
+
+class _ControlQueue(list):
+    put = list.append
+
+
+def test_readmit_cooldown_doubles_after_quick_retirement(monkeypatch):
+    monkeypatch.setattr(ArbitrageManager, "retired_symbol_dict", {})
+    monkeypatch.setattr(ArbitrageManager, "_readmitted_symbol_dict", {})
+    cooldown = ArbitrageManager.SYMBOL_READMIT_COOLDOWN_SEC
+    ArbitrageManager.retired_symbol_dict["A/USDT:USDT"] = {"retired_at": 0.0, "retries": 0, "reason": "test"}
+    assert ArbitrageManager.readmit_due_symbols(now=cooldown - 1) == []
+    assert ArbitrageManager.readmit_due_symbols(now=cooldown) == ["A/USDT:USDT"]
+    # Символ снова остановлен вскоре после допуска: пауза вдвое длиннее.
+    ArbitrageManager.retired_symbol_dict["A/USDT:USDT"] = {"retired_at": cooldown + 1, "retries": 1, "reason": "test"}
+    assert ArbitrageManager.readmit_due_symbols(now=2 * cooldown + 1) == []
+    assert ArbitrageManager.readmit_due_symbols(now=3 * cooldown + 1) == ["A/USDT:USDT"]
+
+
+def test_market_watch_readmits_without_exchanges(monkeypatch):
+    # Топология `shared_feeds`: у воркера нет бирж, а допуск всё равно идёт.
+    monkeypatch.setattr(ArbitrageManager, "retired_symbol_dict", {})
+    monkeypatch.setattr(ArbitrageManager, "_readmitted_symbol_dict", {})
+    monkeypatch.setattr(ArbitrageManager, "SYMBOL_READMIT_COOLDOWN_SEC", 0.0)
+    started: list[str] = []
+    monkeypatch.setattr(ArbitrageManager, "start_symbol", lambda symbol, *args: started.append(symbol) or True)
+    for symbol in ("A/USDT:USDT", "GONE/USDT:USDT"):
+        ArbitrageManager.retired_symbol_dict[symbol] = {"retired_at": 0.0, "retries": 0, "reason": "test"}
+    control_queue = _ControlQueue()
+    processed: dict[str, Any] = {"A/USDT:USDT": {"okx": {}, "htx": {}}}
+
+    async def scenario() -> None:
+        task = asyncio.create_task(_market_watch_loop(
+            exchange_instance_dict={}, control_queue=control_queue, process_index=0, process_count=1, pid=1,
+            swap_raw_data_dict={}, swap_processed_data_dict=processed, poll_interval_sec=0.0,
+        ))
+        for _ in range(5):
+            await asyncio.sleep(0)
+        task.cancel()
+
+    asyncio.run(scenario())
+    # Символ, которого больше нет в рынках, не запускается.
+    assert started == ["A/USDT:USDT"]
+    assert [(event["event"], event["reason"]) for event in control_queue] == [("symbols_started", "readmit")]
+    assert ArbitrageManager.retired_symbol_dict == {}
@@ -0,0 +1,308 @@
+"""Проверки переноса символов между воркерами (`SymbolRebalancer`).
+
+Запуск: `python -m pytest -q test_symbol_rebalancer.py`.
+"""
+
+import random
+from typing import Any
+
+from modules.symbol_rebalancer import SymbolRebalancer, cpu_spread, pack_symbols
+
+
+class _Cluster:
+    """Воркеры с упорядоченными очередями команд, как `_execute_worker_command`."""
+
+    def __init__(self, owner_dict: dict[str, int], worker_ids):
+        self.running = {worker_id: {s for s, owner in owner_dict.items() if owner == worker_id} for worker_id in worker_ids}
+        self.queues: dict[int, list[dict[str, Any]]] = {worker_id: [] for worker_id in worker_ids}
+
+    def send(self, worker_id: int, command: dict[str, Any]) -> None:
+        self.queues[worker_id].append(command)
+
+    def deliver(self, worker_id: int) -> list[dict[str, Any]]:
+        """Выполнить очередь воркера; вернуть события `symbols_stopped`/`symbols_started`."""
+        events = []
+        commands, self.queues[worker_id] = self.queues[worker_id], []
+        for command in commands:
+            running = self.running[worker_id]
+            if command["command"] == "stop_symbols":
+                done = [symbol for symbol in command["symbols"] if symbol in running]
+                running.difference_update(done)
+                event = "symbols_stopped"
+            else:
+                done = [symbol for symbol in command["symbols"] if symbol not in running]
+                running.update(done)
+                event = "symbols_started"
+            events.append({"event": event, "worker_id": worker_id, "symbols": done, "reason": command.get("reason")})
+        return events
+
+    def owners(self, symbol: str) -> list[int]:
+        return [worker_id for worker_id, running in self.running.items() if symbol in running]
+
+
+# Воркер 0 перегружен двумя тяжёлыми символами, воркер 1 почти простаивает.
+_LOAD = {"HOT1": 20.0, "HOT2": 18.0, "COLD": 1.0}
+_OWNERS = {"HOT1": 0, "HOT2": 0, "COLD": 1}
+
+
+def _heartbeats(rebalancer: SymbolRebalancer, cluster: _Cluster, now: float) -> None:
+    for worker_id, running in cluster.running.items():
+        symbol_load = {symbol: (10.0, _LOAD[symbol]) for symbol in running}
+        rebalancer.observe_heartbeat(worker_id, symbol_load, 1.0 + sum(_LOAD[s] for s in running), now=now)
+
+
+def _planned_round():
+    rebalancer = SymbolRebalancer([0, 1], interval_sec=0.0)
+    cluster = _Cluster(_OWNERS, [0, 1])
+    for now in (5.0, 10.0):
+        _heartbeats(rebalancer, cluster, now)
+    moves = rebalancer.plan(now=10.0)
+    assert len(moves) == 1
+    symbol, from_worker, to_worker = moves[0]
+    assert (from_worker, to_worker) == (0, 1)
+    cluster.send(from_worker, {"command": "stop_symbols", "symbols": [symbol], "reason": "rebalance"})
+    return rebalancer, cluster, symbol
+
+
+def _handle(rebalancer: SymbolRebalancer, cluster: _Cluster, events: list[dict[str, Any]], now: float) -> None:
+    """Протокол `app._status_monitor_loop` для событий воркеров."""
+    for event in events:
+        if event["event"] == "symbols_stopped" and event["reason"] == "rebalance":
+            for to_worker, symbols in rebalancer.on_stopped(event["worker_id"], event["symbols"], now=now).items():
+                cluster.send(to_worker, {"command": "start_symbols", "symbols": symbols})
+        elif event["event"] == "symbols_started":
+            rebalancer.on_started(event["worker_id"], event["symbols"], now=now)
+
+
+def _expire(rebalancer: SymbolRebalancer, cluster: _Cluster, now: float) -> list[tuple[str, dict[str, Any]]]:
+    expired = rebalancer.expire(now=now)
+    for symbol, migration in expired:
+        for worker_id, command in rebalancer.rollback_commands(symbol, migration):
+            cluster.send(worker_id, command)
+    return expired
+
+
+def _deliver_all(rebalancer: SymbolRebalancer, cluster: _Cluster, now: float) -> None:
+    for worker_id in cluster.queues:
+        _handle(rebalancer, cluster, cluster.deliver(worker_id), now)
+
+
+def test_migration_completes():
+    rebalancer, cluster, symbol = _planned_round()
+    _handle(rebalancer, cluster, cluster.deliver(0), now=11.0)
+    _handle(rebalancer, cluster, cluster.deliver(1), now=12.0)
+    assert cluster.owners(symbol) == [1]
+    assert rebalancer.owner_dict[symbol] == 1
+    assert not rebalancer.migration_dict
+    assert rebalancer.migrated == 1
+
+
+def test_stop_acknowledged_start_lost():
+    rebalancer, cluster, symbol = _planned_round()
+    _handle(rebalancer, cluster, cluster.deliver(0), now=11.0)
+    assert rebalancer.migration_dict[symbol]["state"] == "starting"
+    cluster.queues[1].clear()  # `start_symbols` потерялся
+
+    expired = _expire(rebalancer, cluster, now=11.0 + SymbolRebalancer.MIGRATION_TIMEOUT_SEC + 1)
+    assert [item[0] for item in expired] == [symbol]
+    _deliver_all(rebalancer, cluster, now=50.0)
+    assert cluster.owners(symbol) == [0]
+    assert not rebalancer.migration_dict
+
+
+def test_stop_acknowledged_start_late():
+    rebalancer, cluster, symbol = _planned_round()
+    _handle(rebalancer, cluster, cluster.deliver(0), now=11.0)
+    # `start_symbols` ещё в очереди воркера 1, когда перенос просрочен.
+    _expire(rebalancer, cluster, now=11.0 + SymbolRebalancer.MIGRATION_TIMEOUT_SEC + 1)
+    _deliver_all(rebalancer, cluster, now=50.0)
+    assert cluster.owners(symbol) == [0]
+
+
+def test_stop_lost():
+    rebalancer, cluster, symbol = _planned_round()
+    cluster.queues[0].clear()  # `stop_symbols` потерялся
+    expired = _expire(rebalancer, cluster, now=10.0 + SymbolRebalancer.MIGRATION_TIMEOUT_SEC + 1)
+    assert expired[0][1]["state"] == "stopping"
+    _deliver_all(rebalancer, cluster, now=50.0)
+    assert cluster.owners(symbol) == [0]
+
+
+def test_stop_late_after_expiry():
+    rebalancer, cluster, symbol = _planned_round()
+    # `stop_symbols` выполняется только после отката: опоздавший
+    # `symbols_stopped` не запускает символ на новом воркере.
+    _expire(rebalancer, cluster, now=10.0 + SymbolRebalancer.MIGRATION_TIMEOUT_SEC + 1)
+    _deliver_all(rebalancer, cluster, now=50.0)
+    _deliver_all(rebalancer, cluster, now=51.0)
+    assert cluster.owners(symbol) == [0]
+
+
+def test_symbol_vanishes_from_heartbeat_mid_migration():
+    rebalancer, cluster, symbol = _planned_round()
+    # Символ снят со старого воркера (делистинг), ответ на перенос потерян.
+    cluster.queues[0].clear()
+    cluster.running[0].discard(symbol)
+    _heartbeats(rebalancer, cluster, now=15.0)
+    # Перенос не забыт по heartbeat и не даёт начать новый раунд.
+    assert symbol in rebalancer.migration_dict
+    assert rebalancer.plan(now=16.0) == []
+
+    _expire(rebalancer, cluster, now=10.0 + SymbolRebalancer.MIGRATION_TIMEOUT_SEC + 1)
+    assert not rebalancer.migration_dict
+    assert symbol not in rebalancer.owner_dict
+    # Воркер без символа в рынках `start_symbols` не выполняет.
+    cluster.queues[0].clear()
+    _heartbeats(rebalancer, cluster, now=45.0)
+    assert symbol not in rebalancer.owner_dict
+    assert cluster.owners(symbol) == []
+
+
+def test_round_trip_returns_symbol():
+    rebalancer, cluster, symbol = _planned_round()
+    _deliver_all(rebalancer, cluster, now=11.0)
+    _deliver_all(rebalancer, cluster, now=12.0)
+    assert cluster.owners(symbol) == [1]
+
+    # Обратный перенос на воркер 0.
+    rebalancer.migration_dict[symbol] = {"from": 1, "to": 0, "state": "stopping", "ts": 20.0}
+    cluster.send(1, {"command": "stop_symbols", "symbols": [symbol], "reason": "rebalance"})
+    _deliver_all(rebalancer, cluster, now=21.0)
+    _deliver_all(rebalancer, cluster, now=22.0)
+    assert cluster.owners(symbol) == [0]
+    assert rebalancer.owner_dict[symbol] == 0
+    assert rebalancer.migrated == 2
+
+
+def test_pack_symbols_prefers_current_owner():
+    load_dict = {"A": 5.0, "B": 4.0, "C": 3.0, "D": 1.0}
+    # Нагрузка уже ровная: все символы остаются на своих воркерах.
+    owner_dict = {"A": 0, "B": 1, "C": 1, "D": 0}
+    assert pack_symbols(owner_dict, load_dict, {0: 0.0, 1: 0.0}, 0.05) == owner_dict
+    # Всё на воркере 0: символ, не влезающий в среднюю с допуском, уходит
+    # на наименее загруженный воркер.
+    assignment = pack_symbols(dict.fromkeys(load_dict, 0), load_dict, {0: 0.0, 1: 0.0}, 0.05)
+    assert assignment == {"A": 0, "B": 1, "C": 1, "D": 0}
+    # Нагрузка воркера вне символов учитывается, символ снятого воркера
+    # переезжает.
+    assignment = pack_symbols({"A": 0, "B": 2}, load_dict, {0: 6.0, 1: 0.0}, 0.05)
+    assert assignment == {"A": 1, "B": 1}
+
+
+def test_plan_waits_for_interval_and_settled_heartbeats():
+    rebalancer = SymbolRebalancer([0, 1], interval_sec=30.0)
+    cluster = _Cluster(_OWNERS, [0, 1])
+    _heartbeats(rebalancer, cluster, now=5.0)
+    # Один heartbeat — интервал ещё не полный; раунд не раньше `interval_sec`.
+    assert rebalancer.plan(now=40.0) == []
+    _heartbeats(rebalancer, cluster, now=10.0)
+    assert rebalancer.plan(now=20.0) == []
+    assert len(rebalancer.plan(now=40.0)) == 1
+
+
+def test_plan_skips_small_spread_and_gain():
+    rebalancer = SymbolRebalancer([0, 1], interval_sec=0.0)
+    # Разброс CPU ниже `MIN_CPU_SPREAD_PCT`.
+    for now in (5.0, 10.0):
+        rebalancer.observe_heartbeat(0, {"A": (10.0, 5.0)}, 6.0, now=now)
+        rebalancer.observe_heartbeat(1, {"B": (10.0, 1.0)}, 2.0, now=now)
+    assert rebalancer.plan(now=10.0) == []
+
+    # Разброс большой, но единственный символ целиком: перенос лишь меняет
+    # воркеры местами, выигрыша нет.
+    rebalancer = SymbolRebalancer([0, 1], interval_sec=0.0)
+    for now in (5.0, 10.0):
+        rebalancer.observe_heartbeat(0, {"A": (10.0, 30.0)}, 31.0, now=now)
+        rebalancer.observe_heartbeat(1, {}, 1.0, now=now)
+    assert rebalancer.plan(now=10.0) == []
+    assert rebalancer.rounds == 0
+
+
+def test_plan_limits_migrations_per_round(monkeypatch):
+    monkeypatch.setattr(SymbolRebalancer, "MAX_MIGRATIONS", 2)
+    rebalancer = SymbolRebalancer([0, 1], interval_sec=0.0)
+    symbol_load = {f"S{index}": (10.0, 5.0 + index) for index in range(6)}
+    for now in (5.0, 10.0):
+        rebalancer.observe_heartbeat(0, symbol_load, 1.0 + sum(cpu for _, cpu in symbol_load.values()), now=now)
+        rebalancer.observe_heartbeat(1, {}, 1.0, now=now)
+    moves = rebalancer.plan(now=10.0)
+    # Упаковка оставляет S5, S4 и S0 на воркере 0 и сдвигает S3, S2 и S1;
+    # за раунд переносятся два самых тяжёлых из них.
+    assert moves == [("S3", 0, 1), ("S2", 0, 1)]
+    assert all(rebalancer.migration_dict[symbol]["state"] == "stopping" for symbol, _, _ in moves)
+    assert rebalancer.last_round["spread_predicted"] < rebalancer.last_round["spread_before"]
+
+
+def test_on_stopped_ignores_unexpected_reports():
+    rebalancer, _, symbol = _planned_round()
+    # Не тот воркер и не переносимый символ — команд нет.
+    assert rebalancer.on_stopped(1, [symbol], now=11.0) == {}
+    assert rebalancer.on_stopped(0, ["COLD"], now=11.0) == {}
+    assert rebalancer.on_stopped(0, [symbol], now=11.0) == {1: [symbol]}
+    # Повторный `symbols_stopped` не запускает символ второй раз.
+    assert rebalancer.on_stopped(0, [symbol], now=12.0) == {}
+    assert rebalancer.migration_dict[symbol] == {"from": 0, "to": 1, "state": "starting", "ts": 11.0}
+
+
+def test_expire_keeps_fresh_migrations():
+    rebalancer, _, symbol = _planned_round()
+    rebalancer.on_stopped(0, [symbol], now=25.0)
+    # Срок отсчитывается от последнего шага переноса.
+    assert rebalancer.expire(now=10.0 + SymbolRebalancer.MIGRATION_TIMEOUT_SEC + 1) == []
+    assert [item[0] for item in rebalancer.expire(now=25.0 + SymbolRebalancer.MIGRATION_TIMEOUT_SEC + 1)] == [symbol]
+    assert rebalancer.summary()["in_flight"] == 0
+
+
+def test_rebalance_narrows_round_robin_spread():
+    # Распределение по кругу против упаковки на нагрузке с тяжёлым хвостом:
+    # несколько символов дают большую часть тиков. CPU символа растёт с его
+    # тиками; `SymbolLoadMeter` видит только 60% (остальное — разбор
+    # сообщений биржи), у воркера ещё 1% постоянной нагрузки.
+    rng = random.Random(7)
+    worker_ids = list(range(4))
+    symbols = sorted(f"S{index:03d}" for index in range(600))
+    load_dict = {symbol: round(rng.paretovariate(1.2) * 0.05, 3) for symbol in symbols}
+    owner_dict = {symbol: worker_ids[index % len(worker_ids)] for index, symbol in enumerate(symbols)}
+
+    def send_heartbeats(rebalancer: SymbolRebalancer, now: float) -> None:
+        cpu = {worker_id: 1.0 for worker_id in worker_ids}
+        for symbol, worker_id in owner_dict.items():
+            cpu[worker_id] += load_dict[symbol]
+        for worker_id in worker_ids:
+            rebalancer.observe_heartbeat(
+                worker_id,
+                {
+                    symbol: (200.0 * load_dict[symbol], 0.6 * load_dict[symbol])
+                    for symbol, owner in owner_dict.items() if owner == worker_id
+                },
+                round(cpu[worker_id], 1),
+                now=now,
+            )
+
+    rebalancer = SymbolRebalancer(worker_ids, interval_sec=0.0)
+    rebalancer.MAX_MIGRATIONS = len(symbols)
+    now = 0.0
+    for _ in range(2):
+        now += 5.0
+        send_heartbeats(rebalancer, now)
+    moves = rebalancer.plan(now=now)
+    assert moves
+    for worker_id in worker_ids:
+        stopped = [symbol for symbol, from_worker, _ in moves if from_worker == worker_id]
+        for to_worker, started in rebalancer.on_stopped(worker_id, stopped, now=now).items():
+            rebalancer.on_started(to_worker, started, now=now)
+            owner_dict.update({symbol: to_worker for symbol in started})
+    assert not rebalancer.migration_dict
+    # Первый heartbeat после переноса меряет интервал с переносом внутри.
+    now += 5.0
+    send_heartbeats(rebalancer, now)
+    assert rebalancer.last_round["spread_after"] is None
+    now += 5.0
+    send_heartbeats(rebalancer, now)
+    last_round = rebalancer.summary()["last_round"]
+    assert last_round["spread_after"] == cpu_spread(last_round["cpu_after"])
+    assert last_round["spread_after"] < last_round["spread_before"] - SymbolRebalancer.MIN_GAIN_PCT
+    assert rebalancer.migrated == len(moves)
+
+    # Повторный раунд на сбалансированной нагрузке ничего не переносит.
+    assert rebalancer.plan(now=now + 1.0) == []
@@ -0,0 +1,66 @@
+"""Проверки инкрементальных лучших K строк `TopOpportunityBook`.
+
+Запуск: `python -m pytest -q test_top_opportunities.py`.
+"""
+
+import random
+
+import pytest
+
+from modules.top_opportunities import IndexedHeap, TopOpportunityBook, outranks
+
+
+def test_top_k_matches_full_sort():
+    # После каждой операции лучшие K совпадают с полной сортировкой, а
+    # таблица, собранная только из `entered`/`left`, равна лучшим K.
+    rng = random.Random(3)
+    book = TopOpportunityBook(10)
+    values: dict[str, float] = {}
+    view: set[str] = set()
+    for _ in range(50_000):
+        key = f"S{rng.randrange(200)}"
+        if key in values and rng.random() < 0.2:
+            del values[key]
+            entered, left = book.remove(key)
+        else:
+            values[key] = round(rng.uniform(0.1, 2.0), 2)
+            entered, left = book.upsert(key, values[key])
+            if book.is_top(key):
+                entered = entered + [key]
+        view.difference_update(left)
+        view.update(entered)
+        expected = sorted(values, key=lambda k: (-values[k], k))[:book.k]
+        assert [k for _, k in book.top()] == expected
+        assert view == set(expected)
+    assert len(book) == len(values)
+
+
+def test_entered_and_left_on_swap():
+    book = TopOpportunityBook(2)
+    assert book.upsert("A", 1.0) == (["A"], [])
+    assert book.upsert("B", 0.5) == (["B"], [])
+    # Третья строка хуже лучших двух — никто не вошёл и не вышел.
+    assert book.upsert("C", 0.2) == ([], [])
+    assert book.upsert("C", 0.8) == (["C"], ["B"])
+    # При равном значении выше строка с меньшим `symbol`.
+    assert book.upsert("B", 0.8) == (["B"], ["C"])
+    assert book.remove("A") == (["C"], ["A"])
+    assert book.remove("Z") == ([], [])
+    assert book.top() == [(0.8, "B"), (0.8, "C")]
+    assert book.top(1) == [(0.8, "B")]
+
+
+def test_indexed_heap_set_and_remove():
+    heap = IndexedHeap(outranks)
+    for key, value in (("A", 0.3), ("B", 0.9), ("C", 0.5), ("D", 0.1)):
+        heap.set(key, value)
+    assert heap.peek() == (0.9, "B")
+    heap.set("D", 1.0)
+    assert heap.peek() == (1.0, "D")
+    assert heap.remove("D") and not heap.remove("D")
+    assert [heap.pop() for _ in range(len(heap))] == [(0.9, "B"), (0.5, "C"), (0.3, "A")]
+
+
+def test_k_must_be_positive():
+    with pytest.raises(ValueError):
+        TopOpportunityBook(0)